@@ -0,0 +1,117 @@
+# ai_engine/dedup.py
+"""
+Near-duplicate detection for chunks with MinHash + LSH.
+
+MoH RK protocols repeat long boilerplate ("Организационные аспекты…",
+disclaimers, drug tables) with tiny variations across diseases.  Exact
+content-hash dedup misses those, so they bloat the index and crowd the
+top-k with near-identical hits.
+
+  1. Each text → set of character 5-gram shingles
+  2. Shingles → MinHash signature (NUM_PERM universal hash functions)
+  3. Signature split into BANDS bands; texts sharing any band bucket are
+     candidate pairs
+  4. Candidates verified with exact Jaccard ≥ threshold, merged with
+     union-find into clusters
+"""
+
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+
+SHINGLE  = 5
+NUM_PERM = 64
+BANDS    = 16
+_PRIME   = np.uint64(4294967311)      # smallest prime > 2**32
+
+
+def _shingles(text: str) -> set[int]:
+    t = re.sub(r"\s+", " ", text.lower()).strip()
+    if len(t) <= SHINGLE:
+        return {zlib.crc32(t.encode("utf-8"))}
+    return {
+        zlib.crc32(t[i : i + SHINGLE].encode("utf-8"))
+        for i in range(len(t) - SHINGLE + 1)
+    }
+
+
+class MinHasher:
+    """MinHash signatures with a fixed, seeded family of hash functions."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self._a = rng.integers(1, 2**32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2**32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingles: set[int]) -> np.ndarray:
+        x = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+        # a, x < 2**32 → a*x + b fits in uint64
+        h = (self._a[:, None] * x[None, :] + self._b[:, None]) % _PRIME
+        return h.min(axis=1)
+
+
+def _jaccard(a: set[int], b: set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def near_duplicate_clusters(texts: list[str], threshold: float = 0.85,
+                            num_perm: int = NUM_PERM,
+                            bands: int = BANDS) -> list[list[int]]:
+    """
+    Group indices of *texts* whose shingle Jaccard similarity is at least
+    *threshold*.  Only clusters with two or more members are returned;
+    each cluster is sorted, so its first index is the earliest text.
+    """
+    if len(texts) < 2:
+        return []
+    rows = num_perm // bands
+    hasher = MinHasher(num_perm)
+    shingle_sets = [_shingles(t) for t in texts]
+    sigs = [hasher.signature(s) for s in shingle_sets]
+
+    parent = list(range(len(texts)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    checked: set[tuple[int, int]] = set()
+    for band in range(bands):
+        buckets: dict[bytes, list[int]] = defaultdict(list)
+        lo, hi = band * rows, (band + 1) * rows
+        for i, sig in enumerate(sigs):
+            buckets[sig[lo:hi].tobytes()].append(i)
+
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            # Compare each member against the bucket's representatives only,
+            # so a bucket of n near-copies costs O(n) Jaccard checks, not O(n²)
+            reps: list[int] = [members[0]]
+            for other in members[1:]:
+                for rep in reps:
+                    if find(rep) == find(other):
+                        break
+                    pair = (rep, other)
+                    if pair in checked:
+                        continue
+                    checked.add(pair)
+                    if _jaccard(shingle_sets[rep], shingle_sets[other]) >= threshold:
+                        ra, rb = find(rep), find(other)
+                        parent[max(ra, rb)] = min(ra, rb)
+                        break
+                else:
+                    reps.append(other)
+
+    clusters: dict[int, list[int]] = defaultdict(list)
+    for i in range(len(texts)):
+        clusters[find(i)].append(i)
+    return [sorted(c) for c in clusters.values() if len(c) > 1]
@@ -0,0 +1,24 @@
+# ai_engine/deferred.py
+"""
+Prompt inputs the caller may still be computing.
+
+answer_question takes the medical context either as a string or as a
+Future the chat route fills in while retrieval runs.  resolve() waits
+for it only when the prompt is assembled, and degrades to the default
+when it fails or is not ready in time.
+"""
+
+import logging
+from concurrent.futures import Future
+
+logger = logging.getLogger("deferred")
+
+
+def resolve(value: "str | Future", timeout: float, default: str = "") -> str:
+    if not isinstance(value, Future):
+        return value or default
+    try:
+        return value.result(timeout=timeout) or default
+    except Exception:
+        logger.exception("Medical context unavailable; answering without it")
+        return default
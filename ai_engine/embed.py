@@ -8,6 +8,8 @@ Key improvements:
   3. Each chunk carries rich metadata: disease name, section type, source file
   4. Uses a multilingual model that actually understands Russian
   5. Deduplicates chunks by content hash
+  6. Measures chunks in model tokens so nothing is silently truncated
+  7. Collapses near-duplicate chunks (MinHash/LSH) into one shared vector
 
 Reads:  data/scraped_json/*.json  +  data/docs/*.{txt,pdf,docx}
 Writes: data/embeddings/embeddings.npy  +  data/embeddings/metadata.pkl
@@ -21,14 +23,15 @@ import pickle
 import hashlib
 import logging
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Callable, Optional
 
 import yaml
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from pypdf import PdfReader
 from docx import Document as DocxDocument
 
+from dedup import near_duplicate_clusters
+
 
 # ── Config ────────────────────────────────────────────────────────────────────
 
@@ -62,6 +65,28 @@ MIN_LEN     = cfg["embed"]["min_chunk_len"]
 BATCH_SIZE  = cfg["embed"]["batch_size"]
 EMB_MODEL   = cfg["embed"]["model_name"]
 
+# Token budget per embedded text (prefix + chunk).  0 → model.max_seq_length.
+CHUNK_TOKENS   = cfg["embed"].get("chunk_tokens", 0)
+OVERLAP_TOKENS = cfg["embed"].get("chunk_overlap_tokens", 24)
+
+# Jaccard threshold for near-duplicate collapsing (0 disables)
+NEAR_DUP_THRESHOLD = cfg["embed"].get("near_dup_threshold", 0.85)
+
+# Section labels for enriched embedding text
+SECTION_LABELS = {
+    "definition": "Определение",
+    "symptoms": "Симптомы",
+    "diagnostics": "Диагностика",
+    "treatment": "Лечение",
+    "prevention": "Профилактика",
+    "classification": "Классификация",
+    "etiology": "Этиология",
+    "general": "Общая информация",
+}
+
+# count_tokens(texts) -> token count per text, without special tokens
+TokenCounter = Callable[[list[str]], list[int]]
+
 
 # ── Data class ────────────────────────────────────────────────────────────────
 
@@ -74,9 +99,12 @@ class Chunk:
     url:        str                     # original page URL
     chunk_id:   int
     content_hash: str = field(init=False)
+    diseases:   list[str] = field(default_factory=list)   # all diseases sharing this text
 
     def __post_init__(self):
         self.content_hash = hashlib.md5(self.text.encode("utf-8")).hexdigest()
+        if not self.diseases:
+            self.diseases = [self.disease]
 
     def to_meta(self) -> dict:
         return {
@@ -87,6 +115,7 @@ class Chunk:
             "url":        self.url,
             "chunk_id":   self.chunk_id,
             "hash":       self.content_hash,
+            "diseases":   self.diseases,
         }
 
 
@@ -101,18 +130,108 @@ def _clean(text: str) -> str:
     return text.strip()
 
 
+def _prefix(disease: str, section: str) -> str:
+    """Contextual prefix prepended to every chunk before embedding."""
+    return f"{disease}. {SECTION_LABELS.get(section, section)}: "
+
+
 # ── Chunking (boundary-aware) ─────────────────────────────────────────────────
 
+_SENT_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def _split_sentences(text: str) -> list[str]:
+    return [s.strip() for s in _SENT_SPLIT.split(text) if s.strip()]
+
+
+def _chunk_by_tokens(text: str, disease: str, section: str, source: str,
+                     url: str, count_tokens: TokenCounter,
+                     max_tokens: int) -> list[Chunk]:
+    """
+    Pack whole sentences into chunks whose embedded text (prefix included)
+    fits in *max_tokens*.  Sentences longer than the budget are split on
+    word boundaries; consecutive chunks share up to OVERLAP_TOKENS of
+    trailing sentences.
+    """
+    # 2 tokens for the model's [CLS]/[SEP]
+    prefix_tokens = count_tokens([_prefix(disease, section)])[0]
+    budget = max_tokens - prefix_tokens - 2
+    if budget <= 0:
+        logger.warning(f"Skipped {source} [{section}]: prefix '{disease}' alone takes "
+                       f"{prefix_tokens} of {max_tokens} tokens")
+        return []
+
+    sentences = _split_sentences(text)
+    lengths   = count_tokens(sentences)
+
+    # Break up sentences that alone exceed the budget
+    units: list[tuple[str, int]] = []
+    for sent, n in zip(sentences, lengths):
+        if n <= budget:
+            units.append((sent, n))
+            continue
+        words = sent.split()
+        word_lens = count_tokens(words)
+        piece, piece_len = [], 0
+        for w, wl in zip(words, word_lens):
+            if piece and piece_len + wl > budget:
+                units.append((" ".join(piece), piece_len))
+                piece, piece_len = [], 0
+            piece.append(w)
+            piece_len += wl
+        if piece:
+            units.append((" ".join(piece), piece_len))
+
+    chunks: list[Chunk] = []
+    window: list[tuple[str, int]] = []
+    window_len = 0
+
+    def _emit():
+        part = " ".join(u for u, _ in window)
+        if len(part) >= MIN_LEN:
+            chunks.append(Chunk(
+                text=part, disease=disease, section=section,
+                source=source, url=url, chunk_id=len(chunks),
+            ))
+
+    for unit, n in units:
+        if window and window_len + n > budget:
+            _emit()
+            # Carry trailing sentences over as overlap
+            carry, carry_len = [], 0
+            for u, ul in reversed(window):
+                if carry_len + ul > OVERLAP_TOKENS or carry_len + ul + n > budget:
+                    break
+                carry.insert(0, (u, ul))
+                carry_len += ul
+            window, window_len = carry, carry_len
+        window.append((unit, n))
+        window_len += n
+
+    if window:
+        _emit()
+    return chunks
+
+
 def _chunk_text(text: str, disease: str, section: str,
-                source: str, url: str) -> list[Chunk]:
+                source: str, url: str,
+                count_tokens: Optional[TokenCounter] = None,
+                max_tokens: int = 0) -> list[Chunk]:
     """
     Split *text* into overlapping chunks that respect sentence boundaries.
     Every chunk inherits the same disease / section / source metadata.
+
+    With *count_tokens* the chunks are packed by model tokens; otherwise
+    the character-based CHUNK_SIZE / OVERLAP settings are used.
     """
     text = _clean(text)
     if not text or len(text) < MIN_LEN:
         return []
 
+    if count_tokens is not None:
+        return _chunk_by_tokens(text, disease, section, source, url,
+                                count_tokens, max_tokens)
+
     # If the entire text fits in one chunk, just return it
     if len(text) <= CHUNK_SIZE:
         return [Chunk(
@@ -191,9 +310,30 @@ def _read_docx(path: str) -> str:
 
 # ── Load all chunks ──────────────────────────────────────────────────────────
 
-def load_all_chunks() -> list[Chunk]:
-    all_chunks:  list[Chunk] = []
-    seen_hashes: set[str]    = set()
+def _merge_diseases(canonical: Chunk, duplicate: Chunk) -> None:
+    for name in duplicate.diseases:
+        if name not in canonical.diseases:
+            canonical.diseases.append(name)
+
+
+def _keep_unique(new: list[Chunk], seen: dict[str, Chunk], out: list[Chunk]) -> int:
+    """Append chunks with unseen text; an exact duplicate only adds its diseases to the kept copy."""
+    added = 0
+    for c in new:
+        kept = seen.get(c.content_hash)
+        if kept is None:
+            seen[c.content_hash] = c
+            out.append(c)
+            added += 1
+        else:
+            _merge_diseases(kept, c)
+    return added
+
+
+def load_all_chunks(count_tokens: Optional[TokenCounter] = None,
+                    max_tokens: int = 0) -> list[Chunk]:
+    all_chunks:  list[Chunk]      = []
+    seen_hashes: dict[str, Chunk] = {}
 
     # ── 1. Structured JSON files from the new scraper ─────────────────────
     if os.path.isdir(SCRAPED_DIR):
@@ -215,24 +355,18 @@ def load_all_chunks() -> list[Chunk]:
                     new = _chunk_text(
                         section_text, disease=disease, section=section_name,
                         source=fname, url=url,
+                        count_tokens=count_tokens, max_tokens=max_tokens,
                     )
-                    for c in new:
-                        if c.content_hash not in seen_hashes:
-                            seen_hashes.add(c.content_hash)
-                            all_chunks.append(c)
-                            file_chunks += 1
+                    file_chunks += _keep_unique(new, seen_hashes, all_chunks)
 
                 # Fallback: if no named sections, chunk _full as "general"
                 if file_chunks == 0 and "_full" in sections:
                     new = _chunk_text(
                         sections["_full"], disease=disease, section="general",
                         source=fname, url=url,
+                        count_tokens=count_tokens, max_tokens=max_tokens,
                     )
-                    for c in new:
-                        if c.content_hash not in seen_hashes:
-                            seen_hashes.add(c.content_hash)
-                            all_chunks.append(c)
-                            file_chunks += 1
+                    file_chunks += _keep_unique(new, seen_hashes, all_chunks)
 
                 logger.info(f"JSON  {fname}: {file_chunks} chunks")
 
@@ -252,12 +386,10 @@ def load_all_chunks() -> list[Chunk]:
                     new = _chunk_text(
                         raw, disease=fname, section="general",
                         source=fname, url="",
+                        count_tokens=count_tokens, max_tokens=max_tokens,
                     )
-                    deduped = [c for c in new if c.content_hash not in seen_hashes]
-                    for c in deduped:
-                        seen_hashes.add(c.content_hash)
-                    all_chunks.extend(deduped)
-                    logger.info(f"DOC   {fname}: {len(deduped)} chunks")
+                    added = _keep_unique(new, seen_hashes, all_chunks)
+                    logger.info(f"DOC   {fname}: {added} chunks")
                 except Exception:
                     logger.exception(f"Failed to read doc: {fname}")
 
@@ -265,66 +397,173 @@ def load_all_chunks() -> list[Chunk]:
     return all_chunks
 
 
-# ── Main ──────────────────────────────────────────────────────────────────────
+# ── Near-duplicate collapsing ─────────────────────────────────────────────────
 
-def main() -> None:
-    chunks = load_all_chunks()
+def collapse_near_duplicates(chunks: list[Chunk],
+                             threshold: float = NEAR_DUP_THRESHOLD) -> tuple[list[Chunk], dict]:
+    """
+    Keep one canonical chunk per near-duplicate cluster (within a section),
+    recording every disease the text belongs to on the canonical chunk.
+    Returns (kept chunks in original order, stats).
+    """
+    stats = {"before": len(chunks), "clusters": 0, "removed": 0}
+    if not threshold or len(chunks) < 2:
+        stats["after"] = len(chunks)
+        return chunks, stats
+
+    by_section: dict[str, list[int]] = {}
+    for i, c in enumerate(chunks):
+        by_section.setdefault(c.section, []).append(i)
+
+    drop: set[int] = set()
+    for positions in by_section.values():
+        clusters = near_duplicate_clusters([chunks[i].text for i in positions], threshold)
+        for cluster in clusters:
+            members = [positions[j] for j in cluster]
+            canonical = chunks[members[0]]
+            for m in members[1:]:
+                _merge_diseases(canonical, chunks[m])
+                drop.add(m)
+            stats["clusters"] += 1
+
+    kept = [c for i, c in enumerate(chunks) if i not in drop]
+    stats["removed"] = len(drop)
+    stats["after"] = len(kept)
+    return kept, stats
+
+
+# ── Tokenizer helpers ─────────────────────────────────────────────────────────
+
+def _token_counter(model: "SentenceTransformer") -> TokenCounter:
+    tokenizer = model.tokenizer
+
+    def count(texts: list[str]) -> list[int]:
+        if not texts:
+            return []
+        enc = tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in enc]
+
+    return count
+
+
+def truncation_stats(lengths: list[int], max_tokens: int) -> dict:
+    """How many embedded texts exceed *max_tokens* and how much is cut off."""
+    over = [n - max_tokens for n in lengths if n > max_tokens]
+    total = len(lengths)
+    return {
+        "chunks":          total,
+        "max_tokens":      max_tokens,
+        "truncated":       len(over),
+        "truncated_pct":   round(100 * len(over) / total, 2) if total else 0.0,
+        "tokens_dropped":  sum(over),
+        "longest":         max(lengths, default=0),
+        "mean":            round(sum(lengths) / total, 1) if total else 0.0,
+    }
+
+
+# ── Stages (also used by pipeline.py) ────────────────────────────────────────
+
+def load_model() -> "SentenceTransformer":
+    # Imported here so the chunking helpers load without the model stack
+    from sentence_transformers import SentenceTransformer
+    logger.info(f"Loading multilingual embedding model: {EMB_MODEL}")
+    return SentenceTransformer(EMB_MODEL)
+
+
+def build_chunks(model: "SentenceTransformer") -> tuple[list[Chunk], dict]:
+    """Token-bounded, near-deduplicated chunks of the whole corpus + dedup stats."""
+    count_tokens = _token_counter(model)
+    max_tokens = CHUNK_TOKENS or model.max_seq_length
+    if max_tokens > model.max_seq_length:
+        logger.warning(f"embed.chunk_tokens={max_tokens} exceeds the model's max_seq_length; "
+                       f"using {model.max_seq_length}")
+        max_tokens = model.max_seq_length
+    logger.info(f"Chunking to {max_tokens} tokens (model max_seq_length={model.max_seq_length})")
+
+    chunks = load_all_chunks(count_tokens=count_tokens, max_tokens=max_tokens)
     if not chunks:
         raise RuntimeError(
             f"No chunks found. Ensure files exist in '{SCRAPED_DIR}' or '{DOCS_DIR}'."
         )
 
-    # Section labels for enriched embedding text
-    SECTION_LABELS = {
-        "definition": "Определение",
-        "symptoms": "Симптомы",
-        "diagnostics": "Диагностика",
-        "treatment": "Лечение",
-        "prevention": "Профилактика",
-        "classification": "Классификация",
-        "etiology": "Этиология",
-        "general": "Общая информация",
-    }
+    chunks, dup_stats = collapse_near_duplicates(chunks)
+    dim = model.get_sentence_embedding_dimension()
+    dup_stats["bytes_saved"] = dup_stats["removed"] * dim * 4
+    logger.info(
+        f"Near-duplicates: {dup_stats['removed']} chunks folded into "
+        f"{dup_stats['clusters']} clusters ({dup_stats['before']} → {dup_stats['after']}, "
+        f"{dup_stats['bytes_saved'] / 1_048_576:.2f} MB of vectors saved)"
+    )
+    return chunks, dup_stats
+
 
+def embedding_texts(chunks: list[Chunk]) -> list[str]:
     # Contextual enrichment: prepend disease name + section to each chunk
     # so the embedding captures WHICH disease the text belongs to.
     # Without this, "боль, рвота, температура" matches any abdominal disease.
     # With this, "Острый панкреатит. Симптомы: боль, рвота, температура"
     # matches pancreatitis specifically.
-    texts = [
-        f"{c.disease}. {SECTION_LABELS.get(c.section, c.section)}: {c.text}"
-        for c in chunks
-    ]
+    return [_prefix(c.disease, c.section) + c.text for c in chunks]
+
+
+def encode_texts(model: "SentenceTransformer", texts: list[str]) -> tuple[np.ndarray, dict]:
+    """Normalized embeddings of *texts* (input order) + truncation stats."""
+    count_tokens = _token_counter(model)
+    dim = model.get_sentence_embedding_dimension()
     total = len(texts)
 
-    logger.info(f"Loading multilingual embedding model: {EMB_MODEL}")
-    model = SentenceTransformer(EMB_MODEL)
+    # +2 for [CLS]/[SEP]; anything above max_seq_length is cut by the model
+    lengths = [n + 2 for n in count_tokens(texts)]
+    stats = truncation_stats(lengths, model.max_seq_length)
+    logger.info(
+        f"Truncation: {stats['truncated']}/{stats['chunks']} chunks "
+        f"({stats['truncated_pct']}%) exceed {stats['max_tokens']} tokens, "
+        f"{stats['tokens_dropped']} tokens dropped; "
+        f"longest={stats['longest']} mean={stats['mean']}"
+    )
+
+    # Encode in length-sorted order so each batch pads to similar lengths
+    order = np.argsort(lengths, kind="stable")
 
-    logger.info(f"Encoding {total} chunks (batch_size={BATCH_SIZE}) …")
-    all_embs: list[np.ndarray] = []
+    logger.info(f"Encoding {total} chunks (batch_size={BATCH_SIZE}, length-sorted) …")
+    embeddings = np.empty((total, dim), dtype="float32")
     for start in range(0, total, BATCH_SIZE):
-        batch = texts[start : start + BATCH_SIZE]
-        emb   = model.encode(
-            batch, convert_to_numpy=True,
+        batch_idx = order[start : start + BATCH_SIZE]
+        emb = model.encode(
+            [texts[i] for i in batch_idx], convert_to_numpy=True,
             normalize_embeddings=True, show_progress_bar=False,
         )
-        all_embs.append(emb)
+        embeddings[batch_idx] = emb
         done = min(start + BATCH_SIZE, total)
         logger.info(f"  {done}/{total} ({int(done / total * 100)}%)")
+    return embeddings, stats
 
-    embeddings = np.vstack(all_embs).astype("float32")
 
-    emb_path  = os.path.join(EMB_DIR, "embeddings.npy")
-    meta_path = os.path.join(EMB_DIR, "metadata.pkl")
+def save(out_dir: str, embeddings: np.ndarray, chunks: list[Chunk], stats: dict) -> None:
+    """embeddings.npy + metadata.pkl + chunk_stats.json, the layout indexer.py reads."""
+    emb_path   = os.path.join(out_dir, "embeddings.npy")
+    meta_path  = os.path.join(out_dir, "metadata.pkl")
+    stats_path = os.path.join(out_dir, "chunk_stats.json")
 
     np.save(emb_path, embeddings)
     meta = [c.to_meta() for c in chunks]
     with open(meta_path, "wb") as f:
         pickle.dump(meta, f)
+    with open(stats_path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=2)
 
     logger.info(f"Saved embeddings {embeddings.shape} → {emb_path}")
     logger.info(f"Saved metadata ({len(meta)} entries) → {meta_path}")
 
 
+# ── Main ──────────────────────────────────────────────────────────────────────
+
+def main() -> None:
+    model = load_model()
+    chunks, dup_stats = build_chunks(model)
+    embeddings, stats = encode_texts(model, embedding_texts(chunks))
+    save(EMB_DIR, embeddings, chunks, {"truncation": stats, "near_duplicates": dup_stats})
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
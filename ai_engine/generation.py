@@ -0,0 +1,55 @@
+# ai_engine/generation.py
+"""
+Published index generation.
+
+pipeline.py builds every index into its own content-addressed directory
+and publishes it by rewriting a one-line pointer file:
+
+    data/faiss_index/CURRENT   → ../pipeline/objects/index/<digest>
+
+The pointer is replaced atomically (write temp file, fsync, rename), so a
+reader sees either the old generation or the new one, never a half-built
+index. Without a pointer the index files in data/faiss_index itself are
+served, which is what a standalone indexer.py run writes.
+
+Read by retriever.py at start-up; workers pick up a new generation on restart.
+"""
+
+import os
+
+
+POINTER = "CURRENT"
+
+
+def current_dir(index_dir: str) -> str:
+    """Directory holding the index files to serve."""
+    try:
+        with open(os.path.join(index_dir, POINTER), encoding="utf-8") as f:
+            target = f.read().strip()
+    except FileNotFoundError:
+        return index_dir
+    path = os.path.normpath(os.path.join(index_dir, target))
+    return path if os.path.isdir(path) else index_dir
+
+
+def publish(index_dir: str, generation_dir: str) -> str:
+    """Point *index_dir* at *generation_dir*. Returns the pointer's contents."""
+    os.makedirs(index_dir, exist_ok=True)
+    target = os.path.relpath(generation_dir, index_dir)
+    pointer = os.path.join(index_dir, POINTER)
+    tmp = f"{pointer}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(target + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, pointer)
+    return target
+
+
+def clear(index_dir: str) -> bool:
+    """Drop the pointer so *index_dir* itself is served. Returns True if one existed."""
+    try:
+        os.remove(os.path.join(index_dir, POINTER))
+        return True
+    except FileNotFoundError:
+        return False
@@ -2,7 +2,11 @@
 """
 Builds a FAISS index from precomputed embeddings.
 Reads:  data/embeddings/embeddings.npy + metadata.pkl
-Writes: data/faiss_index/index.faiss   + metadata.pkl
+Writes: data/faiss_index/index.faiss   + metadata.pkl + partitions.pkl
+        data/faiss_index/centroids.faiss + centroids.pkl
+        data/faiss_index/coarse.faiss    + vectors.npy [+ pca.npy]   (index.refine.mode set)
+
+pipeline.py calls build() with its own output directory instead.
 """
 
 import os
@@ -13,6 +17,10 @@ import yaml
 import numpy as np
 import faiss
 
+import generation
+import refine
+from partitions import build_partitions, build_centroids
+
 
 # ── Config ────────────────────────────────────────────────────────────────────
 
@@ -38,30 +46,20 @@ ROOT = _project_root()
 EMB_DIR   = os.path.join(ROOT, cfg["data"]["embeddings_dir"])
 INDEX_DIR = os.path.join(ROOT, cfg["data"]["faiss_index_dir"])
 FACTORY   = cfg["index"]["factory_string"]
+REFINE    = cfg["index"].get("refine") or {}
 os.makedirs(INDEX_DIR, exist_ok=True)
 
-EMB_PATH  = os.path.join(EMB_DIR,   "embeddings.npy")
-META_IN   = os.path.join(EMB_DIR,   "metadata.pkl")
-IDX_PATH  = os.path.join(INDEX_DIR, "index.faiss")
-META_OUT  = os.path.join(INDEX_DIR, "metadata.pkl")
 
 
-# ── Main ──────────────────────────────────────────────────────────────────────
+# ── Build ─────────────────────────────────────────────────────────────────────
 
-def main() -> None:
-    if not os.path.exists(EMB_PATH):
-        raise FileNotFoundError(
-            f"Embeddings not found: {EMB_PATH}. Run embed.py first."
-        )
-
-    logger.info(f"Loading embeddings from {EMB_PATH}")
-    emb = np.load(EMB_PATH).astype("float32")
-    emb = np.ascontiguousarray(emb)
-    logger.info(f"Shape: {emb.shape}")
-
-    with open(META_IN, "rb") as f:
-        meta = pickle.load(f)
-    logger.info(f"Metadata entries: {len(meta)}")
+def build(emb: np.ndarray, meta: list[dict], out_dir: str) -> None:
+    """Write the index, metadata, partitions, centroids (and refine files) to *out_dir*."""
+    idx_path  = os.path.join(out_dir, "index.faiss")
+    meta_out  = os.path.join(out_dir, "metadata.pkl")
+    part_out  = os.path.join(out_dir, "partitions.pkl")
+    cent_idx  = os.path.join(out_dir, "centroids.faiss")
+    cent_meta = os.path.join(out_dir, "centroids.pkl")
 
     d = emb.shape[1]
     logger.info(f"Building FAISS index [{FACTORY}] dim={d} metric=InnerProduct")
@@ -74,14 +72,69 @@ def main() -> None:
     idx.add(emb)
     logger.info(f"Vectors in index: {idx.ntotal}")
 
-    faiss.write_index(idx, IDX_PATH)
-    with open(META_OUT, "wb") as f:
+    faiss.write_index(idx, idx_path)
+    with open(meta_out, "wb") as f:
         pickle.dump(meta, f)
 
-    size_mb = os.path.getsize(IDX_PATH) / 1_048_576
-    logger.info(f"Saved index ({size_mb:.1f} MB) → {IDX_PATH}")
-    logger.info(f"Saved metadata → {META_OUT}")
+    # Per-disease / per-section ID lists for filtered search
+    partitions = build_partitions(meta)
+    with open(part_out, "wb") as f:
+        pickle.dump(partitions, f)
+
+    # Coarse index: one centroid per disease section
+    centroids, centroid_names = build_centroids(emb, meta)
+    cidx = faiss.IndexFlatIP(d)
+    cidx.add(centroids)
+    faiss.write_index(cidx, cent_idx)
+    with open(cent_meta, "wb") as f:
+        pickle.dump(centroid_names, f)
+
+    # Optional compressed first stage + mmap-able float32 vectors for refinement
+    mode = REFINE.get("mode") or ""
+    if mode:
+        logger.info(f"Building refine first stage [{mode}] …")
+        coarse, proj = refine.build_coarse(emb, mode, REFINE.get("pca_dim", 128))
+        refine.save(out_dir, emb, coarse, proj)
+        coarse_mb = os.path.getsize(os.path.join(out_dir, refine.COARSE_FILE)) / 1_048_576
+        logger.info(f"Saved refine first stage ({coarse_mb:.1f} MB) → {out_dir}")
+
+    size_mb = os.path.getsize(idx_path) / 1_048_576
+    logger.info(f"Saved index ({size_mb:.1f} MB) → {idx_path}")
+    logger.info(f"Saved metadata → {meta_out}")
+    logger.info(
+        f"Saved partitions ({len(partitions['disease'])} diseases, "
+        f"{len(partitions['section'])} sections) → {part_out}"
+    )
+    logger.info(f"Saved centroid index ({cidx.ntotal} centroids) → {cent_idx}")
+
+
+def load_embeddings(emb_dir: str) -> tuple[np.ndarray, list[dict]]:
+    emb_path = os.path.join(emb_dir, "embeddings.npy")
+    if not os.path.exists(emb_path):
+        raise FileNotFoundError(
+            f"Embeddings not found: {emb_path}. Run embed.py first."
+        )
+
+    logger.info(f"Loading embeddings from {emb_path}")
+    emb = np.load(emb_path).astype("float32")
+    emb = np.ascontiguousarray(emb)
+    logger.info(f"Shape: {emb.shape}")
+
+    with open(os.path.join(emb_dir, "metadata.pkl"), "rb") as f:
+        meta = pickle.load(f)
+    logger.info(f"Metadata entries: {len(meta)}")
+    return emb, meta
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+
+def main() -> None:
+    emb, meta = load_embeddings(EMB_DIR)
+    build(emb, meta, INDEX_DIR)
+    # A hand-built index in data/faiss_index replaces any pipeline generation
+    if generation.clear(INDEX_DIR):
+        logger.info(f"Cleared published pipeline generation; serving {INDEX_DIR}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
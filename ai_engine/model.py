@@ -1,12 +1,27 @@
 # ai_engine/model.py
 """
-Groq LLM client for RAG pipeline.
-Exposes generate_answer(prompt) and set_model(name).
+LLM client for RAG pipeline.
+Exposes generate_answer(prompt, model) and set_model(name).  `model` picks
+a Groq model for one request (see router.py); set_model only changes the
+process-wide default.  Both accept ALLOWED_MODELS only.
+
+Backends are tried in the order of `model.backends` in config.yaml
+(override per deployment with LLM_BACKENDS=local,groq):
+  groq   — Groq cloud API
+  github — GitHub Models (OpenAI-compatible), gpt-4o-mini
+  local  — on-box OpenAI-compatible server (Ollama / llama.cpp server);
+           model.local.models maps routed Groq models to local ones
 """
 
 import os
+import time
 import logging
+from contextlib import nullcontext
+from typing import Callable, ContextManager
+
 import yaml
+import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from groq import Groq
 from openai import OpenAI
@@ -48,30 +63,75 @@ ALLOWED_MODELS = [
 
 CURRENT_MODEL: str = DEFAULT_MODEL
 
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-# Initialize OpenAI client for GitHub Models fallback
-github_fallback_client = OpenAI(
-    base_url="https://models.inference.ai.azure.com",
-    api_key=os.getenv("GITHUB_TOKEN", "paste_your_github_token_here")
-)
+_LOCAL_CFG = cfg["model"].get("local") or {}
+LOCAL_URL     = (_LOCAL_CFG.get("url") or cfg["model"]["ollama_url"]).rstrip("/")
+LOCAL_MODEL   = _LOCAL_CFG.get("model") or cfg["model"]["default_model"]
+LOCAL_TIMEOUT = _LOCAL_CFG.get("timeout", 60)
+LOCAL_MODELS  = _LOCAL_CFG.get("models") or {}    # routed Groq model -> local model
 
+BACKEND_ORDER = [
+    b.strip() for b in
+    (os.getenv("LLM_BACKENDS") or ",".join(cfg["model"].get("backends", ["groq", "github"]))).split(",")
+    if b.strip()
+]
 
-# -- Public API ----------------------------------------------------------------
 
-def set_model(name: str) -> None:
-    """Switch the active model. Raises ValueError for unknown names."""
-    global CURRENT_MODEL
-    if name not in ALLOWED_MODELS:
-        raise ValueError(f"Unknown model '{name}'. Allowed: {ALLOWED_MODELS}")
-    CURRENT_MODEL = name
-    logger.info(f"Model switched to: {CURRENT_MODEL}")
+# -- Admission control ---------------------------------------------------------
+
+class AdmissionRejected(RuntimeError):
+    """Raised by the admission hook when a provider has no capacity right now."""
+
+    def __init__(self, provider: str, retry_after: float):
+        self.provider = provider
+        self.retry_after = retry_after
+        super().__init__(f"{provider} saturated; retry after {retry_after}s")
+
+
+# hook(provider, prompt, max_tokens) -> context manager held for the call.
+# The web app installs its rate-limit scheduler here (main/utils/med_bot_wrapper.py).
+_admission_hook: Callable[[str, str, int], ContextManager] | None = None
+
+
+def set_admission_hook(hook: Callable[[str, str, int], ContextManager] | None) -> None:
+    global _admission_hook
+    _admission_hook = hook
 
 
-def generate_answer(prompt: str) -> str:
-    """Send prompt to Groq API and return the response. Fallbacks to OpenRouter if Groq fails or times out."""
-    try:
-        response = client.chat.completions.create(
-            model=CURRENT_MODEL,
+def _admit(provider: str, prompt: str) -> ContextManager:
+    if _admission_hook is None:
+        return nullcontext()
+    return _admission_hook(provider, prompt, MAX_TOKENS)
+
+
+# -- Backends ------------------------------------------------------------------
+
+class Backend:
+    """
+    One LLM provider. `model` is the routed Groq model (one of ALLOWED_MODELS)
+    or None for CURRENT_MODEL; other providers map it to a model they serve.
+    """
+
+    name = ""
+
+    def generate(self, prompt: str, model: str | None = None) -> str:
+        raise NotImplementedError
+
+
+class GroqBackend(Backend):
+    name = "groq"
+
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self) -> Groq:
+        if self._client is None:
+            self._client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        return self._client
+
+    def generate(self, prompt: str, model: str | None = None) -> str:
+        response = self.client.chat.completions.create(
+            model=model or CURRENT_MODEL,
             messages=[{"role": "user", "content": prompt}],
             max_tokens=MAX_TOKENS,
             temperature=TEMPERATURE,
@@ -79,17 +139,139 @@ def generate_answer(prompt: str) -> str:
         )
         answer = response.choices[0].message.content
         return answer.strip() if answer else ""
-    except Exception as e:
-        logger.warning(f"Groq request failed or timed out ({e}). Switching to GitHub Models fallback.")
-        try:
-            fallback_response = github_fallback_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=MAX_TOKENS,
-                temperature=TEMPERATURE,
+
+
+class GitHubBackend(Backend):
+    name = "github"
+    model = "gpt-4o-mini"
+
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self) -> OpenAI:
+        if self._client is None:
+            self._client = OpenAI(
+                base_url="https://models.inference.ai.azure.com",
+                api_key=os.getenv("GITHUB_TOKEN", "paste_your_github_token_here"),
             )
-            answer = fallback_response.choices[0].message.content
-            return answer.strip() if answer else ""
-        except Exception as fallback_e:
-            logger.error(f"GitHub fallback also failed: {fallback_e}")
-            raise
+        return self._client
+
+    def generate(self, prompt: str, model: str | None = None) -> str:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+        )
+        answer = response.choices[0].message.content
+        return answer.strip() if answer else ""
+
+
+class LocalBackend(Backend):
+    """
+    OpenAI-compatible HTTP server on the box (Ollama, llama.cpp `server`).
+    One pooled keep-alive session is reused for every request.
+    """
+
+    name = "local"
+
+    def __init__(self, base_url: str = LOCAL_URL, model: str = LOCAL_MODEL,
+                 timeout: float = LOCAL_TIMEOUT, models: dict[str, str] | None = None):
+        self.base_url = base_url.rstrip("/")
+        self.model    = model
+        self.models   = LOCAL_MODELS if models is None else models
+        self.timeout  = timeout
+        self.session  = requests.Session()
+        self.session.mount("http://",  HTTPAdapter(pool_connections=1, pool_maxsize=8))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=8))
+
+    def generate(self, prompt: str, model: str | None = None) -> str:
+        r = self.session.post(
+            f"{self.base_url}/v1/chat/completions",
+            json={
+                "model":       self.models.get(model or CURRENT_MODEL, self.model),
+                "messages":    [{"role": "user", "content": prompt}],
+                "max_tokens":  MAX_TOKENS,
+                "temperature": TEMPERATURE,
+            },
+            timeout=self.timeout,
+        )
+        r.raise_for_status()
+        answer = r.json()["choices"][0]["message"]["content"]
+        return answer.strip() if answer else ""
+
+
+BACKENDS: dict[str, Backend] = {
+    b.name: b for b in (GroqBackend(), GitHubBackend(), LocalBackend())
+}
+
+
+def _chain() -> list[Backend]:
+    chain = [BACKENDS[name] for name in BACKEND_ORDER if name in BACKENDS]
+    if not chain:
+        raise RuntimeError(f"No usable LLM backends in {BACKEND_ORDER}. Known: {list(BACKENDS)}")
+    return chain
+
+
+# -- Public API ----------------------------------------------------------------
+
+def _check_model(name: str) -> None:
+    if name not in ALLOWED_MODELS:
+        raise ValueError(f"Unknown model '{name}'. Allowed: {ALLOWED_MODELS}")
+
+
+def set_model(name: str) -> None:
+    """Switch the active model. Raises ValueError for unknown names."""
+    global CURRENT_MODEL
+    _check_model(name)
+    CURRENT_MODEL = name
+    logger.info(f"Model switched to: {CURRENT_MODEL}")
+
+
+def _all_failed(last_error: Exception, rejected: list[AdmissionRejected]) -> Exception:
+    """
+    Error to raise once every backend failed.  If any of them was refused by
+    admission, the caller gets AdmissionRejected (retry after the soonest
+    provider frees up) rather than whatever the last backend raised, so the
+    chat endpoint can still answer 429 when e.g. the local server is down.
+    """
+    logger.error(f"All LLM backends failed: {last_error}")
+    if rejected:
+        soonest = min(rejected, key=lambda e: e.retry_after)
+        return AdmissionRejected(soonest.provider, soonest.retry_after)
+    return last_error
+
+
+# on_attempt(backend name, seconds, error or None) after each call a backend
+# actually made (admission refusals are not calls)
+AttemptCallback = Callable[[str, float, "Exception | None"], None]
+
+
+def generate_answer(prompt: str, model: str | None = None,
+                    on_attempt: AttemptCallback | None = None) -> str:
+    """
+    Send prompt to the first backend that answers; later backends are fallbacks.
+    A backend refused by the admission hook also falls through to the next one.
+    """
+    if model:
+        _check_model(model)
+    last_error: Exception | None = None
+    rejected: list[AdmissionRejected] = []
+    for backend in _chain():
+        start = None
+        try:
+            with _admit(backend.name, prompt):
+                start = time.perf_counter()
+                answer = backend.generate(prompt, model)
+            if on_attempt:
+                on_attempt(backend.name, time.perf_counter() - start, None)
+            return answer
+        except Exception as e:
+            if on_attempt and start is not None:
+                on_attempt(backend.name, time.perf_counter() - start, e)
+            logger.warning(f"{backend.name} request failed or timed out ({e}). Trying next backend.")
+            last_error = e
+            if isinstance(e, AdmissionRejected):
+                rejected.append(e)
+    raise _all_failed(last_error, rejected)
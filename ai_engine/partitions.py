@@ -0,0 +1,121 @@
+# ai_engine/partitions.py
+"""
+Metadata partitions for filtered FAISS search.
+
+At index time every vector ID is filed under its disease and its section.
+At query time those ID lists become FAISS IDSelectors, so a disease- or
+intent-scoped search only scans the matching vectors instead of fetching
+from the whole index and boosting afterwards.
+
+A small centroid index (one vector per disease section) supports
+coarse-to-fine retrieval: pick the closest diseases first, then search
+only their chunks.
+
+Written by indexer.py → data/faiss_index/partitions.pkl
+                       data/faiss_index/centroids.faiss + centroids.pkl
+Read by retriever.py
+"""
+
+from collections import defaultdict
+from typing import Iterable
+
+import numpy as np
+import faiss
+
+
+def entry_diseases(entry: dict) -> list[str]:
+    """Lower-cased disease names a metadata entry belongs to."""
+    names = entry.get("diseases") or [entry.get("disease", "")]
+    return [n.lower() for n in names if n]
+
+
+def build_partitions(meta: list[dict]) -> dict[str, dict[str, np.ndarray]]:
+    """
+    Group vector IDs (= positions in *meta*) by disease and by section.
+    Returns {"disease": {name: ids}, "section": {name: ids}} with sorted int64 ids.
+    """
+    by_disease: dict[str, list[int]] = defaultdict(list)
+    by_section: dict[str, list[int]] = defaultdict(list)
+
+    for vid, entry in enumerate(meta):
+        for name in entry_diseases(entry):
+            by_disease[name].append(vid)
+        by_section[entry.get("section", "general")].append(vid)
+
+    def _pack(groups: dict[str, list[int]]) -> dict[str, np.ndarray]:
+        return {k: np.asarray(sorted(set(v)), dtype="int64") for k, v in groups.items()}
+
+    return {"disease": _pack(by_disease), "section": _pack(by_section)}
+
+
+def select_ids(partitions: dict,
+               diseases: Iterable[str] | None = None,
+               sections: Iterable[str] | None = None) -> np.ndarray:
+    """
+    IDs in the union of *diseases*, intersected with the union of *sections*.
+    Either filter may be None (= no restriction on that axis).
+    """
+    ids: np.ndarray | None = None
+
+    if diseases is not None:
+        parts = [partitions["disease"][d] for d in diseases if d in partitions["disease"]]
+        ids = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype="int64")
+
+    if sections is not None:
+        parts = [partitions["section"][s] for s in sections if s in partitions["section"]]
+        sec_ids = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype="int64")
+        ids = sec_ids if ids is None else np.intersect1d(ids, sec_ids, assume_unique=True)
+
+    return ids if ids is not None else np.empty(0, dtype="int64")
+
+
+def search_params(ids: np.ndarray) -> faiss.SearchParameters:
+    """FAISS search parameters restricting a search to *ids*."""
+    sel = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype="int64"))
+    params = faiss.SearchParameters(sel=sel)
+    params._sel_ref = sel   # keep the selector alive as long as the params
+    return params
+
+
+def build_centroids(emb: np.ndarray, meta: list[dict]) -> tuple[np.ndarray, list[str]]:
+    """
+    One centroid per (disease, section): the normalised mean of that
+    section's chunk embeddings.  A disease therefore gets a few vectors,
+    which keeps heterogeneous protocols findable from any of their sections.
+    Returns (centroids float32 [n, d], disease name per centroid row).
+    """
+    groups: dict[tuple[str, str], list[int]] = defaultdict(list)
+    for vid, entry in enumerate(meta):
+        for name in entry_diseases(entry):
+            groups[(name, entry.get("section", "general"))].append(vid)
+
+    names: list[str] = []
+    rows:  list[np.ndarray] = []
+    for (name, _section), ids in sorted(groups.items()):
+        c = emb[ids].mean(axis=0)
+        norm = np.linalg.norm(c)
+        if norm > 0:
+            c = c / norm
+        rows.append(c)
+        names.append(name)
+
+    centroids = np.vstack(rows).astype("float32") if rows else np.empty((0, emb.shape[1]), "float32")
+    return np.ascontiguousarray(centroids), names
+
+
+def top_diseases(centroid_index, centroid_names: list[str], qv, n: int) -> list[str]:
+    """The *n* distinct diseases whose centroids are closest to *qv*."""
+    fetch = min(n * 4, centroid_index.ntotal)
+    if fetch <= 0:
+        return []
+    _, I = centroid_index.search(qv, fetch)
+    picked: list[str] = []
+    for i in I[0]:
+        if i < 0:
+            continue
+        name = centroid_names[i]
+        if name not in picked:
+            picked.append(name)
+            if len(picked) >= n:
+                break
+    return picked
@@ -0,0 +1,492 @@
+# ai_engine/pipeline.py
+"""
+Knowledge refresh pipeline: scrape → chunk → embed → index → publish.
+
+Stage outputs are content-addressed. A stage's input digest hashes its
+name, its fingerprint (the config it reads and the source of the code
+that runs it) and the output digests of its dependencies; the stage
+writes into a temp directory that is renamed to
+
+    data/pipeline/objects/<stage>/<input digest>/
+
+so an object directory that exists is complete. A stage whose object
+directory already exists is not run again: a run on an unchanged corpus
+does nothing, and a run after a failure resumes at the stage that failed.
+
+Two stages write to fixed places instead. scrape updates data/scraped_json
+(the crawler is incremental, so it always runs unless --skip'ped) and
+publish swaps the generation pointer (generation.py). Their output digest
+is a hash of what they wrote, so an unchanged crawl leaves every later
+stage cached.
+
+The embed stage reuses the previous generation's vector of every chunk
+whose text is unchanged and only encodes new text.
+
+Stages run on a bounded thread pool (pipeline.max_parallel) as soon as
+their dependencies are done; a failed stage blocks its dependents only.
+Status, digests and timings per stage are kept in data/pipeline/state.json.
+Object directories beyond the newest pipeline.keep_generations per stage
+are removed after each run, except the ones in use or published.
+
+Usage:
+    python ai_engine/pipeline.py                   # full refresh
+    python ai_engine/pipeline.py --skip scrape     # rebuild from what is already scraped
+    python ai_engine/pipeline.py --force embed     # re-run a stage even if its output exists
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional
+
+import yaml
+
+import generation
+
+
+# ── Config ────────────────────────────────────────────────────────────────────
+
+def _load_config() -> dict:
+    src  = os.path.dirname(os.path.abspath(__file__))
+    root = os.path.dirname(src)
+    with open(os.path.join(root, "config.yaml"), encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+def _project_root() -> str:
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+logger = logging.getLogger("pipeline")
+
+cfg  = _load_config()
+ROOT = _project_root()
+SRC  = os.path.dirname(os.path.abspath(__file__))
+
+PIPE             = cfg.get("pipeline") or {}
+STATE_DIR        = os.path.join(ROOT, PIPE.get("state_dir", "data/pipeline"))
+MAX_PARALLEL     = PIPE.get("max_parallel", 2)
+KEEP_GENERATIONS = PIPE.get("keep_generations", 3)
+
+SCRAPED_DIR = os.path.join(ROOT, cfg["data"]["scraped_dir"])
+DOCS_DIR    = os.path.join(ROOT, cfg["data"]["docs_dir"])
+INDEX_DIR   = os.path.join(ROOT, cfg["data"]["faiss_index_dir"])
+CRAWL_STATE = os.path.join(ROOT, cfg["data"].get("crawl_state", "data/scrape_state/crawl.sqlite"))
+
+RUN_HISTORY = 20     # run reports kept in state.json
+
+
+# ── Digests ───────────────────────────────────────────────────────────────────
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def tree_digest(path: str) -> str:
+    """sha256 over the relative paths and contents of every file under *path*."""
+    h = hashlib.sha256()
+    if os.path.isfile(path):
+        h.update(_file_digest(path).encode())
+    elif os.path.isdir(path):
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                full = os.path.join(dirpath, name)
+                rel  = os.path.relpath(full, path).replace(os.sep, "/")
+                h.update(f"{rel}\0{_file_digest(full)}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _write_json(path: str, data: dict) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# ── Runner ────────────────────────────────────────────────────────────────────
+
+@dataclass
+class Stage:
+    """
+    run(inputs, out_dir, previous) builds the stage output in out_dir and
+    may return a dict of stats for the report. inputs maps each dependency
+    to its output path; previous is this stage's last output path or None.
+    """
+    name: str
+    run: Callable[[dict[str, str], str, Optional[str]], Optional[dict]]
+    deps: tuple[str, ...] = ()
+    fingerprint: Callable[[], str] = lambda: ""
+    output: Optional[str] = None     # fixed output path; None → content-addressed object dir
+    always_run: bool = False
+
+
+class Pipeline:
+
+    def __init__(self, stages: list[Stage], state_dir: str,
+                 max_parallel: int = MAX_PARALLEL, keep_generations: int = KEEP_GENERATIONS,
+                 protected: Callable[[], list[str]] = lambda: []):
+        self.stages = {}
+        for stage in stages:
+            missing = [d for d in stage.deps if d not in self.stages]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on {missing}, which must be listed before it")
+            self.stages[stage.name] = stage
+        self.state_dir        = state_dir
+        self.objects_dir      = os.path.join(state_dir, "objects")
+        self.state_path       = os.path.join(state_dir, "state.json")
+        self.max_parallel     = max(1, max_parallel)
+        self.keep_generations = max(1, keep_generations)
+        self.protected        = protected
+        self._lock            = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.state = self._load_state()
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"stages": {}, "runs": []}
+
+    def _save_state(self) -> None:
+        with self._lock:
+            _write_json(self.state_path, self.state)
+
+    def input_digest(self, stage: Stage, outputs: dict[str, str]) -> str:
+        h = hashlib.sha256(stage.name.encode("utf-8"))
+        h.update(b"\0" + stage.fingerprint().encode("utf-8"))
+        for dep in stage.deps:
+            h.update(f"\0{dep}={outputs[dep]}".encode("utf-8"))
+        return h.hexdigest()
+
+    # ── One stage ────────────────────────────────────────────────────────────
+
+    def _build(self, stage: Stage, digest: str, inputs: dict, previous: Optional[str],
+               force: bool) -> tuple[str, str, str, dict]:
+        """(status, output digest, output path, info) for a stage that is not skipped."""
+        prev = self.state["stages"].get(stage.name, {})
+
+        if stage.output is not None:
+            if (not stage.always_run and not force and prev.get("status") in ("done", "cached")
+                    and prev.get("input") == digest and prev.get("output") == tree_digest(stage.output)):
+                return "cached", prev["output"], stage.output, {}
+            info = stage.run(inputs, stage.output, previous)
+            return "done", tree_digest(stage.output), stage.output, info or {}
+
+        out = os.path.join(self.objects_dir, stage.name, digest)
+        if os.path.isdir(out) and not force:
+            os.utime(out)                   # most recently used, for garbage collection
+            output = prev["output"] if prev.get("input") == digest and prev.get("output") else tree_digest(out)
+            return "cached", output, out, {}
+
+        tmp = f"{out}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        try:
+            info = stage.run(inputs, tmp, previous)
+            output = tree_digest(tmp)
+            if os.path.isdir(out):          # forced re-run: swap, then drop the old copy
+                old = f"{out}.old-{os.getpid()}"
+                os.replace(out, old)
+                os.replace(tmp, out)
+                shutil.rmtree(old, ignore_errors=True)
+            else:
+                os.replace(tmp, out)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        return "done", output, out, info or {}
+
+    def _execute(self, stage: Stage, outputs: dict, paths: dict, skip: bool, force: bool) -> dict:
+        start = time.perf_counter()
+        entry = {"stage": stage.name}
+        prev = self.state["stages"].get(stage.name, {})
+        previous = prev.get("path") if prev.get("path") and os.path.exists(prev["path"]) else None
+        try:
+            if skip:
+                if stage.output is not None:
+                    result = ("skipped", tree_digest(stage.output), stage.output, {})
+                elif previous and prev.get("output"):
+                    result = ("skipped", prev["output"], previous, {})
+                else:
+                    raise RuntimeError(f"Cannot skip '{stage.name}': it has no previous output")
+            else:
+                entry["input"] = self.input_digest(stage, outputs)
+                inputs = {dep: paths[dep] for dep in stage.deps}
+                result = self._build(stage, entry["input"], inputs, previous, force)
+            entry["status"], entry["output"], entry["path"], entry["info"] = result
+        except Exception as e:
+            logger.exception(f"Stage '{stage.name}' failed")
+            entry["status"], entry["error"] = "failed", f"{type(e).__name__}: {e}"
+        entry["seconds"] = round(time.perf_counter() - start, 3)
+        logger.info(f"[{stage.name}] {entry['status']} in {entry['seconds']:.2f}s")
+        return entry
+
+    def _record(self, entry: dict) -> None:
+        with self._lock:
+            stages = self.state["stages"]
+            if entry["status"] == "failed":
+                # Keep the last good output so the next run can reuse it as `previous`
+                stages.setdefault(entry["stage"], {}).update(
+                    status="failed", error=entry["error"], input=entry.get("input"),
+                    finished_at=datetime.utcnow().isoformat(timespec="seconds"),
+                )
+            elif entry["status"] != "skipped":
+                stages[entry["stage"]] = {
+                    "status":      entry["status"],
+                    "input":       entry.get("input"),
+                    "output":      entry["output"],
+                    "path":        entry["path"],
+                    "seconds":     entry["seconds"],
+                    "finished_at": datetime.utcnow().isoformat(timespec="seconds"),
+                }
+        self._save_state()
+
+    # ── Run ──────────────────────────────────────────────────────────────────
+
+    def run(self, skip: tuple[str, ...] = (), force: tuple[str, ...] = ()) -> list[dict]:
+        """Run every stage that is out of date. Returns one report entry per stage, in order."""
+        unknown = (set(skip) | set(force)) - set(self.stages)
+        if unknown:
+            raise ValueError(f"Unknown stages: {sorted(unknown)}. Stages: {list(self.stages)}")
+
+        started = time.time()
+        outputs, paths, entries = {}, {}, {}
+        pending = dict(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix="stage") as pool:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if any(entries.get(d, {}).get("status") in ("failed", "blocked") for d in stage.deps):
+                        del pending[name]
+                        entries[name] = {"stage": name, "status": "blocked", "seconds": 0.0}
+                    elif all(d in outputs for d in stage.deps):
+                        del pending[name]
+                        future = pool.submit(self._execute, stage, dict(outputs), dict(paths),
+                                             name in skip, name in force)
+                        running[future] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    entry = entries[name] = future.result()
+                    self._record(entry)
+                    if entry["status"] != "failed":
+                        outputs[name], paths[name] = entry["output"], entry["path"]
+
+        report = [entries[name] for name in self.stages]
+        with self._lock:
+            self.state["runs"] = (self.state.get("runs", []) + [{
+                "started_at": datetime.utcfromtimestamp(started).isoformat(timespec="seconds"),
+                "seconds":    round(time.time() - started, 3),
+                "stages":     [{k: e.get(k) for k in ("stage", "status", "seconds", "error") if k in e}
+                               for e in report],
+            }])[-RUN_HISTORY:]
+        self._save_state()
+        removed = self.collect_garbage()
+        if removed:
+            logger.info(f"Removed {removed} old object directories")
+        return report
+
+    def collect_garbage(self) -> int:
+        """Keep the newest keep_generations object dirs per stage, plus those in use. Returns dirs removed."""
+        keep = {os.path.realpath(p) for p in self.protected()}
+        keep |= {os.path.realpath(s["path"]) for s in self.state["stages"].values() if s.get("path")}
+        removed = 0
+        for name, stage in self.stages.items():
+            root = os.path.join(self.objects_dir, name)
+            if stage.output is not None or not os.path.isdir(root):
+                continue
+            generations = []
+            for entry in os.listdir(root):
+                path = os.path.join(root, entry)
+                if ".tmp-" in entry or ".old-" in entry:
+                    shutil.rmtree(path, ignore_errors=True)     # left behind by a killed run
+                else:
+                    generations.append(path)
+            generations.sort(key=os.path.getmtime, reverse=True)
+            for path in generations[self.keep_generations:]:
+                if os.path.realpath(path) not in keep:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+        return removed
+
+
+def format_report(report: list[dict]) -> str:
+    lines = [f"{'stage':<10}{'status':<9}{'seconds':>9}  output"]
+    for e in report:
+        detail = (e.get("output") or "")[:12] or e.get("error", "")
+        lines.append(f"{e['stage']:<10}{e['status']:<9}{e['seconds']:>9.2f}  {detail}")
+    lines.append(f"{'total':<19}{sum(e['seconds'] for e in report):>9.2f}")
+    return "\n".join(lines)
+
+
+# ── Knowledge stages ──────────────────────────────────────────────────────────
+#
+# embed/indexer/scraper are imported lazily: cached stages never load the
+# embedding model or FAISS.
+
+_model      = None
+_model_lock = threading.Lock()
+
+
+def _embedding_model():
+    global _model
+    with _model_lock:
+        if _model is None:
+            import embed
+            _model = embed.load_model()
+        return _model
+
+
+def _fingerprint(sections: dict, sources: tuple[str, ...], dirs: tuple[str, ...] = ()) -> Callable[[], str]:
+    """Config values + source files (+ input directories the stage reads outside the pipeline)."""
+    def fingerprint() -> str:
+        parts = [json.dumps(sections, sort_keys=True, ensure_ascii=False)]
+        parts += [_file_digest(os.path.join(SRC, f"{m}.py")) for m in sources]
+        parts += [tree_digest(d) for d in dirs]
+        return "\n".join(parts)
+    return fingerprint
+
+
+def _scrape(inputs: dict, out_dir: str, previous: Optional[str], max_pages: int = 0) -> dict:
+    from scraper import ProtocolScraper
+    crawler = ProtocolScraper(cfg["scrape"], out_dir, CRAWL_STATE)
+    try:
+        return crawler.crawl(max_pages=max_pages)
+    finally:
+        crawler.close()
+
+
+def _chunk(inputs: dict, out_dir: str, previous: Optional[str]) -> dict:
+    import embed
+    chunks, dup_stats = embed.build_chunks(_embedding_model())
+    with open(os.path.join(out_dir, "chunks.pkl"), "wb") as f:
+        pickle.dump(chunks, f)
+    _write_json(os.path.join(out_dir, "near_duplicates.json"), dup_stats)
+    return {"chunks": len(chunks)}
+
+
+def _previous_vectors(previous: Optional[str]):
+    """(embeddings, {text key: row}) of the last embed output made with the same model."""
+    import numpy as np
+    if not previous:
+        return None, {}
+    try:
+        with open(os.path.join(previous, "keys.json"), encoding="utf-8") as f:
+            keys = json.load(f)
+        if keys["model"] != cfg["embed"]["model_name"]:
+            return None, {}
+        emb = np.load(os.path.join(previous, "embeddings.npy"), mmap_mode="r")
+    except (FileNotFoundError, KeyError, ValueError):
+        return None, {}
+    return emb, {k: i for i, k in enumerate(keys["keys"])}
+
+
+def _embed(inputs: dict, out_dir: str, previous: Optional[str]) -> dict:
+    import numpy as np
+    import embed
+    with open(os.path.join(inputs["chunk"], "chunks.pkl"), "rb") as f:
+        chunks = pickle.load(f)
+    with open(os.path.join(inputs["chunk"], "near_duplicates.json"), encoding="utf-8") as f:
+        dup_stats = json.load(f)
+
+    texts = embed.embedding_texts(chunks)
+    keys  = [hashlib.sha1(t.encode("utf-8")).hexdigest() for t in texts]
+    old, old_rows = _previous_vectors(previous)
+    reuse   = [i for i, k in enumerate(keys) if k in old_rows]
+    missing = [i for i, k in enumerate(keys) if k not in old_rows]
+    logger.info(f"Embedding {len(texts)} chunks: {len(reuse)} reused, {len(missing)} to encode")
+
+    dim = old.shape[1] if old is not None else _embedding_model().get_sentence_embedding_dimension()
+    embeddings = np.empty((len(texts), dim), dtype="float32")
+    if reuse:
+        embeddings[reuse] = old[[old_rows[keys[i]] for i in reuse]]
+    stats = {"near_duplicates": dup_stats, "reused": len(reuse), "encoded": len(missing)}
+    if missing:
+        # Truncation stats cover the newly encoded texts only
+        new, stats["truncation"] = embed.encode_texts(_embedding_model(), [texts[i] for i in missing])
+        embeddings[missing] = new
+
+    embed.save(out_dir, embeddings, chunks, stats)
+    _write_json(os.path.join(out_dir, "keys.json"), {"model": cfg["embed"]["model_name"], "keys": keys})
+    return {"reused": len(reuse), "encoded": len(missing)}
+
+
+def _index(inputs: dict, out_dir: str, previous: Optional[str]) -> dict:
+    import indexer
+    emb, meta = indexer.load_embeddings(inputs["embed"])
+    indexer.build(emb, meta, out_dir)
+    return {"vectors": len(emb)}
+
+
+def _publish(inputs: dict, out_dir: str, previous: Optional[str]) -> dict:
+    target = generation.publish(INDEX_DIR, inputs["index"])
+    logger.info(f"Published {target}")
+    return {"generation": os.path.basename(inputs["index"])}
+
+
+def build_pipeline(max_parallel: int = MAX_PARALLEL, max_pages: int = 0) -> Pipeline:
+    stages = [
+        Stage("scrape", lambda i, o, p: _scrape(i, o, p, max_pages), output=SCRAPED_DIR, always_run=True),
+        Stage("chunk", _chunk, deps=("scrape",),
+              fingerprint=_fingerprint(cfg["embed"], ("embed", "dedup"), dirs=(DOCS_DIR,))),
+        Stage("embed", _embed, deps=("chunk",),
+              fingerprint=_fingerprint({"model_name": cfg["embed"]["model_name"]}, ("embed",))),
+        Stage("index", _index, deps=("embed",),
+              fingerprint=_fingerprint(cfg["index"], ("indexer", "refine", "partitions"))),
+        Stage("publish", _publish, deps=("index",), output=os.path.join(INDEX_DIR, generation.POINTER)),
+    ]
+    return Pipeline(stages, STATE_DIR, max_parallel=max_parallel,
+                    protected=lambda: [generation.current_dir(INDEX_DIR)])
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+
+def main() -> None:
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s:%(name)s: %(message)s",
+        level=logging.INFO,
+    )
+    parser = argparse.ArgumentParser(description="Refresh the knowledge base: scrape → chunk → embed → index → publish")
+    stages = ("scrape", "chunk", "embed", "index", "publish")
+    parser.add_argument("--skip", action="append", default=[], choices=stages,
+                        help="reuse the stage's last output without running it")
+    parser.add_argument("--force", action="append", default=[], choices=stages,
+                        help="run the stage even if its output is cached")
+    parser.add_argument("--max-parallel", type=int, default=MAX_PARALLEL, help="stages run at once")
+    parser.add_argument("--max-pages", type=int, default=0, help="scrape: stop after this many pages (0 = all)")
+    args = parser.parse_args()
+
+    pipeline = build_pipeline(max_parallel=args.max_parallel, max_pages=args.max_pages)
+    report = pipeline.run(skip=tuple(args.skip), force=tuple(args.force))
+    print(format_report(report))
+
+    failed = [e["stage"] for e in report if e["status"] in ("failed", "blocked")]
+    if failed:
+        print(f"failed: {', '.join(failed)}")
+        sys.exit(1)
+    publish = report[-1]
+    print(f"published {publish['info']['generation']}" if publish["status"] == "done" else "up to date")
+
+
+if __name__ == "__main__":
+    main()
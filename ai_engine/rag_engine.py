@@ -10,13 +10,17 @@ Handles three types of queries:
 
 import os
 import logging
+import itertools
 from collections import defaultdict
+from concurrent.futures import Future
 from datetime import datetime
 
 import yaml
 
 from retriever import retrieve, detect_intent
-from model     import generate_answer
+from model     import generate_answer, AdmissionRejected, ALLOWED_MODELS, DEFAULT_MODEL
+from router    import ModelRouter, Route
+from deferred  import resolve
 
 
 # ── Config ────────────────────────────────────────────────────────────────────
@@ -155,6 +159,13 @@ FOLLOWUP_QUESTIONS = [
 ]
 
 MAX_CONTEXT_CHARS = 3000
+CONTEXT_TIMEOUT   = 10  # seconds to wait for a medical_context Future
+
+ROUTING = cfg["model"].get("routing") or {}
+router  = (ModelRouter.from_config(ROUTING, DEFAULT_MODEL, ALLOWED_MODELS)
+           if ROUTING.get("enabled") else None)
+REPORT_EVERY = 50
+_routed_calls = itertools.count(1)     # next() is atomic, safe across request threads
 
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
@@ -261,6 +272,36 @@ def _fallback_answer(docs: list[dict]) -> str:
             f"{SAFETY_TEXT}"
         )
 
+def _generate(prompt: str, question: str, docs: list[dict],
+              intent: str, lang: str) -> str:
+        """Generate with the routed model (if routing is enabled) and record how Groq did with it."""
+        if router is None:
+            return generate_answer(prompt)
+
+        route = Route(
+            intent=intent,
+            question_len=len(question),
+            lang=lang,
+            context_chars=min(sum(len(d["text"]) for d in docs), MAX_CONTEXT_CHARS),
+        )
+        model_name = router.choose(route)
+        logger.info(f"Routed {route} → {model_name}")
+
+        def record(backend: str, seconds: float, error: Exception | None) -> None:
+            # Fallback backends don't run model_name: their time says nothing about it
+            if backend != "groq":
+                return
+            if error is None:
+                router.record(model_name, seconds)
+            else:
+                router.record_failure(model_name, seconds)
+
+        answer = generate_answer(prompt, model=model_name, on_attempt=record)
+
+        if next(_routed_calls) % REPORT_EVERY == 0:
+            logger.info(f"Routing report: {router.report()}")
+        return answer
+
     # ── Public API ────────────────────────────────────────────────────────────────
 
 def _detect_lang(text: str) -> str:
@@ -274,8 +315,18 @@ def _detect_lang(text: str) -> str:
         return "en"
     return "ru"
 
-def answer_question(question: str, medical_context: str = "") -> str:
+def _resolve_context(medical_context) -> str:
+        """
+        medical_context may be a Future still being built by the caller
+        (see assistant_route.chat); wait for it only when the prompt needs it.
         """
+        return resolve(medical_context, CONTEXT_TIMEOUT)
+
+def answer_question(question: str, medical_context: "str | Future" = "") -> str:
+        """
+        medical_context: the user's medical card text, or a Future resolving to
+        it so the caller can load it while retrieval runs.
+
         Full RAG pipeline:
           1. Red-flag check → emergency message
           2. Detect intent (symptoms / treatment / info)
@@ -313,10 +364,12 @@ def answer_question(question: str, medical_context: str = "") -> str:
 
         # 5. Generate with intent-specific prompt (include medical card context)
         prompt = _build_prompt(question, docs[:TOP_DOCS], intent,
-                               medical_context=medical_context, lang=lang)
+                               medical_context=_resolve_context(medical_context), lang=lang)
 
         try:
-            answer = generate_answer(prompt)
+            answer = _generate(prompt, question, docs[:TOP_DOCS], intent, lang)
+        except AdmissionRejected:
+            raise   # every provider is saturated: let the caller answer 429
         except Exception:
             logger.exception("Generation failed")
             answer = ""
@@ -0,0 +1,120 @@
+# ai_engine/refine.py
+"""
+Two-stage reduced-precision search with exact refinement.
+
+Stage 1 scans a compressed copy of the corpus:
+  pca  — vectors projected onto their top principal directions (no centring,
+         so inner products are preserved as far as the kept directions allow)
+  sq8  — 8-bit scalar quantisation, 4× smaller than float32
+  sq4  — 4-bit scalar quantisation, 8× smaller
+and over-fetches `oversample × k` candidates.
+
+Stage 2 re-scores those candidates exactly against the original float32
+vectors, which are memory-mapped from disk instead of held in RAM.
+
+Written by indexer.py → data/faiss_index/coarse.faiss + vectors.npy [+ pca.npy]
+Read by retriever.py (and scripts/bench_refine.py)
+"""
+
+import os
+
+import numpy as np
+import faiss
+
+
+MODES = ("pca", "sq8", "sq4")
+
+COARSE_FILE  = "coarse.faiss"
+VECTORS_FILE = "vectors.npy"
+PCA_FILE     = "pca.npy"
+
+_SQ_TYPES = {
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+    "sq4": faiss.ScalarQuantizer.QT_4bit,
+}
+
+
+def fit_pca(emb: np.ndarray, dim: int, sample: int = 20_000) -> np.ndarray:
+    """Projection matrix [d, dim] from the top right singular vectors of *emb*."""
+    if len(emb) > sample:
+        rng = np.random.default_rng(0)
+        emb = emb[rng.choice(len(emb), sample, replace=False)]
+    _, _, vt = np.linalg.svd(emb, full_matrices=False)
+    return np.ascontiguousarray(vt[:dim].T, dtype="float32")
+
+
+def build_coarse(emb: np.ndarray, mode: str, pca_dim: int = 128):
+    """Build the first-stage index. Returns (index, projection or None)."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown refine mode '{mode}'. Allowed: {MODES}")
+    d = emb.shape[1]
+
+    if mode == "pca":
+        proj = fit_pca(emb, min(pca_dim, d))
+        index = faiss.IndexFlatIP(proj.shape[1])
+        index.add(np.ascontiguousarray(emb @ proj))
+        return index, proj
+
+    index = faiss.IndexScalarQuantizer(d, _SQ_TYPES[mode], faiss.METRIC_INNER_PRODUCT)
+    index.train(emb)
+    index.add(emb)
+    return index, None
+
+
+def save(index_dir: str, emb: np.ndarray, index, proj: np.ndarray | None) -> None:
+    faiss.write_index(index, os.path.join(index_dir, COARSE_FILE))
+    np.save(os.path.join(index_dir, VECTORS_FILE), np.ascontiguousarray(emb, dtype="float32"))
+    pca_path = os.path.join(index_dir, PCA_FILE)
+    if proj is not None:
+        np.save(pca_path, proj)
+    elif os.path.exists(pca_path):
+        os.remove(pca_path)
+
+
+def exists(index_dir: str) -> bool:
+    return (os.path.exists(os.path.join(index_dir, COARSE_FILE))
+            and os.path.exists(os.path.join(index_dir, VECTORS_FILE)))
+
+
+class RefinedSearcher:
+    """Coarse search + exact re-scoring against memory-mapped float32 vectors."""
+
+    def __init__(self, coarse, vectors: np.ndarray,
+                 proj: np.ndarray | None = None, oversample: int = 4):
+        self.coarse     = coarse
+        self.vectors    = vectors
+        self.proj       = proj
+        self.oversample = max(1, oversample)
+
+    @classmethod
+    def load(cls, index_dir: str, oversample: int = 4) -> "RefinedSearcher":
+        coarse  = faiss.read_index(os.path.join(index_dir, COARSE_FILE))
+        vectors = np.load(os.path.join(index_dir, VECTORS_FILE), mmap_mode="r")
+        pca_path = os.path.join(index_dir, PCA_FILE)
+        proj = np.load(pca_path) if os.path.exists(pca_path) else None
+        return cls(coarse, vectors, proj, oversample)
+
+    @property
+    def ntotal(self) -> int:
+        return self.coarse.ntotal
+
+    def search(self, qv: np.ndarray, k: int, params=None) -> tuple[np.ndarray, np.ndarray]:
+        """Same contract as faiss Index.search: (D, I) of shape [nq, k], -1 padded."""
+        qv = np.ascontiguousarray(qv, dtype="float32")
+        cq = np.ascontiguousarray(qv @ self.proj) if self.proj is not None else qv
+        fetch = min(k * self.oversample, self.ntotal)
+        _, cand = self.coarse.search(cq, fetch, params=params)
+
+        D = np.full((len(qv), k), -np.inf, dtype="float32")
+        I = np.full((len(qv), k), -1, dtype="int64")
+        for row, ids in enumerate(cand):
+            ids = ids[ids >= 0]
+            if not len(ids):
+                continue
+            order = np.argsort(ids)                   # sorted reads from the mmap
+            ids = ids[order]
+            scores = np.asarray(self.vectors[ids]) @ qv[row]
+            top = np.argsort(-scores)[:k]
+            D[row, : len(top)] = scores[top]
+            I[row, : len(top)] = ids[top]
+        return D, I
@@ -5,6 +5,9 @@ Smart retriever with:
   2. Query intent detection — symptoms vs treatment vs disease info
   3. Section-aware boosting per intent type
   4. Diversity filtering — max 2 chunks per disease
+  5. Filtered search — disease-scoped queries scan only that disease's vectors
+  6. Coarse-to-fine search — symptom queries pick diseases via centroids first
+  7. Optional compressed first stage with exact re-scoring (index.refine)
 """
 
 import os
@@ -17,6 +20,10 @@ import yaml
 import faiss
 from sentence_transformers import SentenceTransformer, CrossEncoder
 
+import generation
+import refine
+from partitions import entry_diseases, select_ids, search_params, top_diseases
+
 
 # ── Config ────────────────────────────────────────────────────────────────────
 
@@ -39,15 +46,21 @@ logger = logging.getLogger("retriever")
 cfg  = _load_config()
 ROOT = _project_root()
 
-IDX_DIR   = os.path.join(ROOT, cfg["data"]["faiss_index_dir"])
+# Published pipeline generation (generation.py), else data/faiss_index itself
+IDX_DIR   = generation.current_dir(os.path.join(ROOT, cfg["data"]["faiss_index_dir"]))
 IDX_PATH  = os.path.join(IDX_DIR, "index.faiss")
 META_PATH = os.path.join(IDX_DIR, "metadata.pkl")
+PART_PATH = os.path.join(IDX_DIR, "partitions.pkl")
+CENT_IDX  = os.path.join(IDX_DIR, "centroids.faiss")
+CENT_META = os.path.join(IDX_DIR, "centroids.pkl")
 
 TOP_K      = cfg["retrieve"]["top_k"]
 RR_K       = cfg["retrieve"]["rerank_k"]
 CE_MODEL   = cfg["retrieve"]["cross_encoder_model"]
 EMB_MODEL  = cfg["embed"]["model_name"]
 MIN_LEN    = cfg["embed"]["min_chunk_len"]
+TOP_D      = cfg["retrieve"].get("centroid_top_d", 0)
+REFINE     = cfg["index"].get("refine") or {}
 
 SECTION_BOOST = 0.08
 MIN_RELEVANCE_SCORE = 0.75   # below this, results are considered irrelevant
@@ -92,12 +105,37 @@ logger.info(f"Loading FAISS index from {IDX_PATH}")
 if not os.path.exists(IDX_PATH):
     raise FileNotFoundError(f"Index not found: {IDX_PATH}. Run indexer.py first.")
 
-index = faiss.read_index(IDX_PATH)
+# With index.refine.mode set, the full-precision index is not loaded: the
+# compressed first stage lives in RAM and float32 vectors are memory-mapped.
+if REFINE.get("mode") and refine.exists(IDX_DIR):
+    index = refine.RefinedSearcher.load(IDX_DIR, REFINE.get("oversample", 4))
+    logger.info(f"Using refined search [{REFINE['mode']}] oversample={index.oversample}")
+else:
+    if REFINE.get("mode"):
+        logger.warning("Refine files missing — falling back to the full index. Re-run indexer.py.")
+    index = faiss.read_index(IDX_PATH)
+
 with open(META_PATH, "rb") as f:
     metadata = pickle.load(f)
 logger.info(f"Loaded index: {len(metadata)} entries")
 
-ALL_DISEASES = {m.get("disease", "").lower() for m in metadata if m.get("disease")}
+ALL_DISEASES = {name for m in metadata for name in entry_diseases(m)}
+
+partitions = None
+if os.path.exists(PART_PATH):
+    with open(PART_PATH, "rb") as f:
+        partitions = pickle.load(f)
+    logger.info(f"Loaded partitions: {len(partitions['disease'])} diseases")
+else:
+    logger.warning(f"Partitions not found: {PART_PATH}. Filtered search disabled — re-run indexer.py.")
+
+centroid_index = None
+centroid_names: list[str] = []
+if partitions and TOP_D and os.path.exists(CENT_IDX):
+    centroid_index = faiss.read_index(CENT_IDX)
+    with open(CENT_META, "rb") as f:
+        centroid_names = pickle.load(f)
+    logger.info(f"Loaded centroid index: {centroid_index.ntotal} centroids")
 
 logger.info(f"Loading embedder: {EMB_MODEL}")
 embedder = SentenceTransformer(EMB_MODEL)
@@ -129,6 +167,30 @@ def _find_disease_in_query(query: str) -> str | None:
     return best_match
 
 
+# ── Search ────────────────────────────────────────────────────────────────────
+
+def _search(qv, n: int, ids=None) -> list[tuple[float, int]]:
+    """Inner-product search; restricted to *ids* when given."""
+    if n <= 0:
+        return []
+    params = search_params(ids) if ids is not None else None
+    D, I = index.search(qv, n, params=params)
+    return [(float(d), int(i)) for d, i in zip(D[0], I[0]) if i >= 0]
+
+
+def _scoped_ids(disease_match: str, sections: set[str]):
+    """Vector IDs of the matched disease(s), narrowed to *sections* when possible."""
+    if not partitions:
+        return None
+    matched = [d for d in partitions["disease"] if disease_match in d]
+    if not matched:
+        return None
+    ids = select_ids(partitions, diseases=matched, sections=sections)
+    if not len(ids):
+        ids = select_ids(partitions, diseases=matched)
+    return ids
+
+
 # ── Core ──────────────────────────────────────────────────────────────────────
 def retrieve(query: str, top_k: int | None = None, lang: str = "ru") -> list[dict]:
 
@@ -147,16 +209,36 @@ def retrieve(query: str, top_k: int | None = None, lang: str = "ru") -> list[dic
     if disease_match:
         logger.info(f"Disease name detected: {disease_match}")
 
-    fetch_k = min(k * 4, index.ntotal)
     qv = embedder.encode([query], normalize_embeddings=True)
-    D, I = index.search(qv, fetch_k)
+
+    # Named disease → scan that disease's vectors directly, then a smaller
+    # global pass so other diseases can still surface.
+    hits: list[tuple[float, int]] = []
+    scoped = _scoped_ids(disease_match, boost_sections) if disease_match else None
+    if scoped is not None and len(scoped):
+        hits += _search(qv, min(k * 2, len(scoped)), scoped)
+        hits += _search(qv, min(k * 2, index.ntotal))
+    elif intent == "symptoms" and centroid_index is not None:
+        # Coarse-to-fine: closest diseases by centroid, then only their chunks
+        candidates = top_diseases(centroid_index, centroid_names, qv, TOP_D)
+        logger.info(f"Centroid stage picked {len(candidates)} diseases")
+        ids = select_ids(partitions, diseases=candidates) if candidates and partitions else None
+        if ids is not None and len(ids):
+            hits += _search(qv, min(k * 4, len(ids)), ids)
+        # No centroid close enough, or too few chunks behind it: search everything
+        if ids is None or len(ids) < k:
+            hits += _search(qv, min(k * 4, index.ntotal))
+    else:
+        hits += _search(qv, min(k * 4, index.ntotal))
 
     raw_docs: list[dict] = []
+    seen_ids:   set[int] = set()
     seen_texts: set[str] = set()
 
-    for dist, idx in zip(D[0], I[0]):
-        if idx < 0:
+    for dist, idx in hits:
+        if idx in seen_ids:
             continue
+        seen_ids.add(idx)
         entry = metadata[idx].copy()
         text  = entry.pop("text", "")
         if len(text.strip()) < MIN_LEN:
@@ -173,7 +255,7 @@ def retrieve(query: str, top_k: int | None = None, lang: str = "ru") -> list[dic
         if section in boost_sections:
             score += SECTION_BOOST
 
-        if disease_match and disease_match in entry.get("disease", "").lower():
+        if disease_match and any(disease_match in d for d in entry_diseases(entry)):
             score += 0.15
 
         raw_docs.append({"score": score, "text": text, **entry})
@@ -195,9 +277,11 @@ def retrieve(query: str, top_k: int | None = None, lang: str = "ru") -> list[dic
     docs: list[dict] = []
 
     for d in raw_docs:
-        disease = d.get("disease", "unknown")
+        # Chunks shared by the named disease count against its larger allowance
+        matched = disease_match and any(disease_match in name for name in entry_diseases(d))
+        disease = disease_match if matched else d.get("disease", "unknown")
         count = disease_count.get(disease, 0)
-        max_allowed = MAX_FOR_MATCHED if (disease_match and disease_match in disease.lower()) else MAX_PER_DISEASE
+        max_allowed = MAX_FOR_MATCHED if matched else MAX_PER_DISEASE
         if count >= max_allowed:
             continue
         disease_count[disease] = count + 1
@@ -223,7 +307,9 @@ def retrieve_grouped(query: str, top_k: int | None = None) -> dict[str, list[dic
     docs = retrieve(query, top_k)
     grouped: dict[str, list[dict]] = defaultdict(list)
     for d in docs:
-        grouped[d.get("disease", "unknown")].append(d)
+        # A chunk shared by several diseases is listed under each (lower-cased names)
+        for name in entry_diseases(d) or ["unknown"]:
+            grouped[name].append(d)
     return dict(grouped)
 
 
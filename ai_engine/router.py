@@ -0,0 +1,172 @@
+# ai_engine/router.py
+"""
+Per-request model routing across ALLOWED_MODELS.
+
+Picks a Groq model from the query analysis — intent, question length,
+language and retrieved-context size — using the ordered rules in
+`model.routing` (config.yaml), first match wins.  Live latency stats
+(EWMA per model) veto a cheaper model while it is slower than the
+default, e.g. when 8b-instant is rate-limited.  Every `probe_every`-th
+vetoed request still goes to that model, so its EWMA keeps moving and
+the veto lifts once it recovers.  Only calls Groq itself answered are
+recorded (a fallback backend's time says nothing about the model); a
+failed call enters the EWMA as at least `failure_penalty_s`.
+
+Nothing here mutates model.CURRENT_MODEL: the chosen name is passed
+to generate_answer(prompt, model=...) for this request only.
+"""
+
+import threading
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Route:
+    """Query features the router decides on."""
+    intent:        str
+    question_len:  int
+    lang:          str
+    context_chars: int
+
+
+@dataclass
+class Rule:
+    model:              str
+    intents:            list[str] = field(default_factory=list)   # empty = any
+    langs:              list[str] = field(default_factory=list)   # empty = any
+    max_question_chars: int = 0                                  # 0 = no limit
+    max_context_chars:  int = 0
+
+    def matches(self, r: Route) -> bool:
+        if self.intents and r.intent not in self.intents:
+            return False
+        if self.langs and r.lang not in self.langs:
+            return False
+        if self.max_question_chars and r.question_len > self.max_question_chars:
+            return False
+        if self.max_context_chars and r.context_chars > self.max_context_chars:
+            return False
+        return True
+
+
+class LatencyStats:
+    """Thread-safe exponentially weighted latency per model."""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._ewma:  dict[str, float] = {}
+        self._count: dict[str, int]   = {}
+        self._total: dict[str, float] = {}
+        self._failures: dict[str, int] = {}
+
+    def _update(self, model: str, seconds: float) -> None:
+        prev = self._ewma.get(model)
+        self._ewma[model] = seconds if prev is None else prev + self.alpha * (seconds - prev)
+
+    def record(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._update(model, seconds)
+            self._count[model] = self._count.get(model, 0) + 1
+            self._total[model] = self._total.get(model, 0.0) + seconds
+
+    def record_failure(self, model: str, penalty: float) -> None:
+        """Counts in the EWMA only: mean/total stay about answered calls."""
+        with self._lock:
+            self._update(model, penalty)
+            self._failures[model] = self._failures.get(model, 0) + 1
+
+    def ewma(self, model: str) -> float | None:
+        with self._lock:
+            return self._ewma.get(model)
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                m: {
+                    "calls":    self._count.get(m, 0),
+                    "failures": self._failures.get(m, 0),
+                    "ewma_s":   round(self._ewma[m], 3),
+                    "mean_s":   round(self._total[m] / self._count[m], 3) if m in self._count else None,
+                    "total_s":  round(self._total.get(m, 0.0), 3),
+                }
+                for m in self._ewma
+            }
+
+
+class ModelRouter:
+
+    def __init__(self, default: str, rules: list[Rule] | None = None,
+                 allowed: list[str] | None = None, latency_aware: bool = True,
+                 slowdown_tolerance: float = 1.2, probe_every: int = 10,
+                 failure_penalty_s: float = 10.0):
+        if allowed:
+            unknown = [r.model for r in (rules or []) if r.model not in allowed]
+            if unknown:
+                raise ValueError(f"Routing rules use unknown models {unknown}. Allowed: {allowed}")
+        self.default   = default
+        self.rules     = rules or []
+        self.latency_aware      = latency_aware
+        self.slowdown_tolerance = slowdown_tolerance
+        self.probe_every        = probe_every
+        self.failure_penalty_s  = failure_penalty_s
+        self.stats = LatencyStats()
+        self._lock   = threading.Lock()
+        self._vetoed: dict[str, int] = {}
+
+    @classmethod
+    def from_config(cls, routing: dict, default: str, allowed: list[str]) -> "ModelRouter":
+        rules = [Rule(**r) for r in routing.get("rules", [])]
+        return cls(
+            default=routing.get("default") or default,
+            rules=rules,
+            allowed=allowed,
+            latency_aware=routing.get("latency_aware", True),
+            slowdown_tolerance=routing.get("slowdown_tolerance", 1.2),
+            probe_every=routing.get("probe_every", 10),
+            failure_penalty_s=routing.get("failure_penalty_s", 10.0),
+        )
+
+    def choose(self, route: Route) -> str:
+        for rule in self.rules:
+            if not rule.matches(route):
+                continue
+            if rule.model != self.default and self.latency_aware and self._slower_than_default(rule.model):
+                return rule.model if self._probe(rule.model) else self.default
+            return rule.model
+        return self.default
+
+    def _slower_than_default(self, model: str) -> bool:
+        ours, base = self.stats.ewma(model), self.stats.ewma(self.default)
+        if ours is None or base is None:
+            return False
+        return ours > base * self.slowdown_tolerance
+
+    def _probe(self, model: str) -> bool:
+        """True for every probe_every-th vetoed request to *model*."""
+        if self.probe_every <= 0:
+            return False
+        with self._lock:
+            n = self._vetoed[model] = self._vetoed.get(model, 0) + 1
+        return n % self.probe_every == 0
+
+    def record(self, model: str, seconds: float) -> None:
+        self.stats.record(model, seconds)
+
+    def record_failure(self, model: str, seconds: float) -> None:
+        self.stats.record_failure(model, max(seconds, self.failure_penalty_s))
+
+    def report(self) -> dict:
+        """
+        Per-model latency plus the estimated time saved versus sending every
+        routed request to the default model (at its observed mean latency).
+        """
+        snap = self.stats.snapshot()
+        base = snap.get(self.default)
+        saved = None
+        if base and base["mean_s"] is not None:
+            saved = round(sum(
+                s["calls"] * base["mean_s"] - s["total_s"]
+                for m, s in snap.items() if m != self.default
+            ), 3)
+        return {"default": self.default, "models": snap, "latency_saved_s": saved}
@@ -0,0 +1,523 @@
+# ai_engine/scraper.py
+"""
+Clinical protocol scraper → data/scraped_json/*.json for embed.py.
+
+Driven by the `scrape:` section of config.yaml:
+  base_url            first list page of the crawl
+  list_pattern        links matching it are list pages (followed for links only)
+  detail_pattern      links matching it are protocol pages (parsed and saved)
+  content_selectors   content root, first selector that yields text wins
+  section_map         heading text → canonical section (definition, symptoms, …)
+  junk_phrases        lines containing any of these are dropped
+  max_workers         parallel fetch workers
+  page_pause          pause between two requests of one worker, seconds
+  request_timeout     per-request timeout, seconds
+
+Pages are parsed while they download: a stdlib HTMLParser consumes the
+response in chunks, keeps no DOM, and files each text line under the
+section of the last mapped heading.
+
+The crawl frontier lives in SQLite (data.crawl_state, default
+data/scrape_state/crawl.sqlite): every known URL with its status and the
+hash of its extracted content. An interrupted crawl resumes with the
+pages still pending. Once a crawl has finished, the next run is an
+incremental re-crawl: every page is fetched again, but a JSON file is
+only rewritten when the extracted content hash changed.
+
+Output (one file per protocol page):
+  {"title": ..., "url": ..., "sections": {"symptoms": ..., ..., "_full": ...},
+   "content_hash": ..., "scraped_at": ...}
+
+Usage:
+  python ai_engine/scraper.py                  # resume, or re-crawl incrementally
+  python ai_engine/scraper.py --fresh          # forget the frontier and hashes
+  python ai_engine/scraper.py --max-pages 50 --workers 4
+"""
+
+import os
+import re
+import json
+import time
+import codecs
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urldefrag, urlparse
+
+import yaml
+import requests
+
+
+# ── Config ────────────────────────────────────────────────────────────────────
+
+def _load_config() -> dict:
+    src  = os.path.dirname(os.path.abspath(__file__))
+    root = os.path.dirname(src)
+    with open(os.path.join(root, "config.yaml"), encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+def _project_root() -> str:
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+logger = logging.getLogger("scraper")
+
+USER_AGENT   = "Mozilla/5.0 (compatible; digitalnomads-protocol-scraper/1.0)"
+CHUNK_BYTES  = 16 * 1024
+MAX_ATTEMPTS = 3
+
+_BLOCK_TAGS = {
+    "p", "div", "li", "ul", "ol", "tr", "td", "th", "table", "section", "article",
+    "main", "header", "h1", "h2", "h3", "h4", "h5", "h6", "dt", "dd", "dl",
+    "blockquote", "br", "hr", "figcaption",
+}
+_HEADING_TAGS  = {"h1", "h2", "h3", "h4", "h5", "h6"}
+_EMPHASIS_TAGS = _HEADING_TAGS | {"strong", "b"}
+_SKIP_TAGS     = {"script", "style", "noscript", "svg", "nav", "footer", "form", "button", "select", "iframe"}
+_VOID_TAGS     = {"br", "hr", "img", "input", "meta", "link", "area", "base", "col", "embed",
+                  "source", "track", "wbr", "param"}
+
+
+# ── Streaming extraction ──────────────────────────────────────────────────────
+
+def _selector_matches(selector: str, tag: str, attrs: dict) -> bool:
+    """Simple selectors only: tag, .class, #id, tag.class."""
+    m = re.fullmatch(r"([\w-]*)(?:([.#])([\w-]+))?", selector.strip())
+    if not m:
+        return False
+    name, kind, value = m.groups()
+    if name and name != tag:
+        return False
+    if kind == ".":
+        return value in (attrs.get("class") or "").split()
+    if kind == "#":
+        return attrs.get("id") == value
+    return bool(name)
+
+
+class _Capture:
+    """Section-mapped lines under the first element matching one content selector."""
+
+    def __init__(self, selector: str, section_of, is_junk):
+        self.selector   = selector
+        self.section_of = section_of
+        self.is_junk    = is_junk
+        self.depth: int | None = None     # stack depth of the matched element while open
+        self.closed     = False
+        self.current: str | None = None   # canonical section of the last mapped heading
+        self.sections: dict[str, list[str]] = defaultdict(list)
+        self.full: list[str] = []
+
+    @property
+    def open(self) -> bool:
+        return self.depth is not None and not self.closed
+
+    def add(self, line: str, heading: bool) -> None:
+        if self.is_junk(line):
+            return
+        self.full.append(line)
+        section = self.section_of(line) if heading else None
+        if section:
+            self.current = section
+        elif self.current:
+            self.sections[self.current].append(line)
+
+
+class PageParser(HTMLParser):
+    """
+    Incremental HTML → {title, sections, links}. Feed it text chunks as
+    they arrive; call close() at the end.
+    """
+
+    def __init__(self, page_url: str, content_selectors: list[str],
+                 section_map: dict[str, list[str]], junk_phrases: list[str]):
+        super().__init__(convert_charrefs=True)
+        self.page_url = page_url
+        patterns = [(p.lower(), name) for name, ps in section_map.items() for p in ps]
+        patterns.sort(key=lambda item: -len(item[0]))       # "медикаментозное лечение" before "лечение"
+        junk = [j.lower() for j in junk_phrases]
+
+        def section_of(line: str) -> str | None:
+            low = line.lower()
+            return next((name for pattern, name in patterns if pattern in low), None)
+
+        def is_junk(line: str) -> bool:
+            low = line.lower()
+            return any(j in low for j in junk)
+
+        self.captures = [_Capture(s, section_of, is_junk) for s in content_selectors]
+        self.captures.append(_Capture("body", section_of, is_junk))   # last resort
+        self.stack: list[str] = []
+        self.skip_depth: int | None = None
+        self.emphasis   = 0
+        self.parts: list[tuple[str, bool]] = []    # (text, emphasised) of the current line
+        self.title_h1: list[str] = []
+        self.title_tag: list[str] = []
+        self.h1_depth: int | None = None
+        self.h1_seen    = False
+        self.in_title   = False
+        self.links: set[str] = set()
+
+    # -- line assembly --
+
+    def _flush(self) -> None:
+        if not self.parts:
+            return
+        text = re.sub(r"\s+", " ", "".join(t for t, _ in self.parts)).strip()
+        heading = all(emph for t, emph in self.parts if t.strip())
+        self.parts = []
+        if len(text) < 2:
+            return
+        for capture in self.captures:
+            if capture.open:
+                capture.add(text, heading)
+
+    def _pop_to(self, index: int) -> None:
+        """Close stack[index:] (the element at `index` and anything left open inside it)."""
+        for capture in self.captures:
+            if capture.open and capture.depth - 1 >= index:
+                capture.closed = True
+        if self.skip_depth is not None and self.skip_depth - 1 >= index:
+            self.skip_depth = None
+        if self.h1_depth is not None and self.h1_depth - 1 >= index:
+            self.h1_depth = None
+        for tag in self.stack[index:]:
+            if tag in _EMPHASIS_TAGS:
+                self.emphasis = max(0, self.emphasis - 1)
+        del self.stack[index:]
+
+    # -- HTMLParser callbacks --
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "a" and attrs.get("href"):
+            self.links.add(urldefrag(urljoin(self.page_url, attrs["href"]))[0])
+        if tag == "title":
+            self.in_title = True
+        if tag in _BLOCK_TAGS:
+            self._flush()
+        if tag in _VOID_TAGS:
+            return
+
+        self.stack.append(tag)
+        depth = len(self.stack)
+        if tag in _SKIP_TAGS and self.skip_depth is None:
+            self.skip_depth = depth
+        if tag in _EMPHASIS_TAGS:
+            self.emphasis += 1
+        if tag == "h1" and not self.h1_seen:
+            self.h1_seen, self.h1_depth = True, depth
+        for capture in self.captures:
+            if capture.depth is None and _selector_matches(capture.selector, tag, attrs):
+                capture.depth = depth
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self.in_title = False
+        if tag not in self.stack:
+            return
+        index = len(self.stack) - 1 - self.stack[::-1].index(tag)
+        if tag in _BLOCK_TAGS or any(c.open and c.depth - 1 >= index for c in self.captures):
+            self._flush()
+        self._pop_to(index)
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title_tag.append(data)
+        if self.skip_depth is not None:
+            return
+        if self.h1_depth is not None:
+            self.title_h1.append(data)
+        self.parts.append((data, self.emphasis > 0))
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    # -- result --
+
+    @property
+    def title(self) -> str:
+        return " ".join("".join(self.title_h1 or self.title_tag).split())
+
+    def document(self) -> dict:
+        """{"title", "sections"} from the highest-priority selector that captured text."""
+        capture = next((c for c in self.captures if c.full), self.captures[-1])
+        sections = {name: "\n".join(lines) for name, lines in capture.sections.items() if lines}
+        if capture.full:
+            sections["_full"] = "\n".join(capture.full)
+        return {"title": self.title, "sections": sections}
+
+
+def content_hash(doc: dict) -> str:
+    payload = json.dumps({"title": doc["title"], "sections": doc["sections"]},
+                         ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ── Frontier ──────────────────────────────────────────────────────────────────
+
+class Frontier:
+    """
+    SQLite-backed crawl state shared by the worker threads.
+
+    pages.status: pending → fetching → done | failed. Rows left in
+    "fetching" by a crash are pending again on the next start.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url          TEXT PRIMARY KEY,
+                kind         TEXT NOT NULL,          -- list / detail
+                status       TEXT NOT NULL DEFAULT 'pending',
+                attempts     INTEGER NOT NULL DEFAULT 0,
+                content_hash TEXT,
+                out_file     TEXT,
+                fetched_at   TEXT,
+                changed_at   TEXT,
+                error        TEXT
+            );
+            CREATE INDEX IF NOT EXISTS ix_pages_status ON pages (status);
+        """)
+        self._db.execute("UPDATE pages SET status = 'pending' WHERE status = 'fetching'")
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def add(self, urls: list[tuple[str, str]]) -> int:
+        """Queue (url, kind) pairs not seen before. Returns how many were new."""
+        with self._lock:
+            before = self._db.total_changes
+            self._db.executemany("INSERT OR IGNORE INTO pages (url, kind) VALUES (?, ?)", urls)
+            return self._db.total_changes - before
+
+    def pending(self) -> int:
+        return self._execute("SELECT count(*) FROM pages WHERE status IN ('pending', 'fetching')")[0][0]
+
+    def start_round(self) -> int:
+        """Queue every known page again (hashes are kept). Returns the page count."""
+        self._execute("UPDATE pages SET status = 'pending', attempts = 0, error = NULL")
+        return self._execute("SELECT count(*) FROM pages")[0][0]
+
+    def forget(self) -> None:
+        self._execute("DELETE FROM pages")
+
+    def claim(self) -> tuple[str, str, str | None, str | None] | None:
+        """Next pending page as (url, kind, content_hash, out_file), marked fetching."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url, kind, content_hash, out_file FROM pages WHERE status = 'pending' "
+                "ORDER BY kind = 'detail', attempts, rowid LIMIT 1"     # list pages first: they feed the frontier
+            ).fetchone()
+            if row:
+                self._db.execute("UPDATE pages SET status = 'fetching' WHERE url = ?", (row[0],))
+            return row
+
+    def done(self, url: str, content_hash: str | None, out_file: str | None, changed: bool) -> None:
+        now = datetime.utcnow().isoformat()
+        self._execute(
+            "UPDATE pages SET status = 'done', content_hash = ?, out_file = ?, fetched_at = ?, "
+            "changed_at = CASE WHEN ? THEN ? ELSE changed_at END, error = NULL WHERE url = ?",
+            (content_hash, out_file, now, changed, now, url),
+        )
+
+    def failed(self, url: str, error: str) -> None:
+        self._execute(
+            "UPDATE pages SET attempts = attempts + 1, error = ?, "
+            "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END WHERE url = ?",
+            (error[:500], MAX_ATTEMPTS, url),
+        )
+
+    def close(self) -> None:
+        self._db.close()
+
+
+# ── Scraper ───────────────────────────────────────────────────────────────────
+
+def _file_name(url: str) -> str:
+    parts = urlparse(url)
+    slug = re.sub(r"[^\w-]+", "_", f"{parts.path}_{parts.query}", flags=re.UNICODE).strip("_")[-80:]
+    return f"{slug or 'page'}_{hashlib.md5(url.encode('utf-8')).hexdigest()[:8]}.json"
+
+
+class ProtocolScraper:
+
+    def __init__(self, scrape_cfg: dict, out_dir: str, state_path: str,
+                 workers: int | None = None, base_url: str | None = None):
+        self.cfg        = scrape_cfg
+        self.base_url   = base_url or scrape_cfg["base_url"]
+        self.out_dir    = out_dir
+        self.workers    = max(1, workers or scrape_cfg.get("max_workers", 3))
+        self.timeout    = scrape_cfg.get("request_timeout", 30)
+        self.page_pause = scrape_cfg.get("page_pause", 0)
+        self.selectors  = scrape_cfg.get("content_selectors") or []
+        self.section_map  = scrape_cfg.get("section_map") or {}
+        self.junk_phrases = scrape_cfg.get("junk_phrases") or []
+        self.detail_re  = re.compile(scrape_cfg.get("detail_pattern") or r"$^")
+        self.list_re    = re.compile(scrape_cfg.get("list_pattern") or r"$^")
+        self.host       = urlparse(self.base_url).netloc
+        self.frontier   = Frontier(state_path)
+        self._local     = threading.local()
+        os.makedirs(out_dir, exist_ok=True)
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+            self._local.session.headers["User-Agent"] = USER_AGENT
+        return self._local.session
+
+    def _classify(self, url: str) -> str | None:
+        if urlparse(url).netloc != self.host:
+            return None
+        if self.detail_re.search(url):
+            return "detail"
+        if self.list_re.search(url):
+            return "list"
+        return None
+
+    def parse_stream(self, url: str, chunks) -> PageParser:
+        parser = PageParser(url, self.selectors, self.section_map, self.junk_phrases)
+        for text in chunks:
+            parser.feed(text)
+        parser.close()
+        return parser
+
+    def _fetch(self, url: str) -> PageParser:
+        with self._session().get(url, timeout=self.timeout, stream=True) as r:
+            r.raise_for_status()
+            # requests assumes ISO-8859-1 for text/* without a charset; these sites are UTF-8
+            encoding = r.encoding if "charset" in r.headers.get("Content-Type", "").lower() else "utf-8"
+            decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+            chunks = (decoder.decode(b) for b in r.iter_content(CHUNK_BYTES))
+            return self.parse_stream(url, chunks)
+
+    def _write(self, path: str, doc: dict) -> None:
+        tmp = os.path.join(self.out_dir, f".{os.path.basename(path)}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(doc, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    def _process(self, url: str, kind: str, old_hash: str | None, out_file: str | None, stats: dict) -> None:
+        parser = self._fetch(url)
+        links = [(link, k) for link in parser.links if (k := self._classify(link))]
+        stats["discovered"] += self.frontier.add(links)
+        if kind != "detail":
+            self.frontier.done(url, None, None, changed=False)
+            return
+
+        doc = parser.document()
+        if not doc["sections"]:
+            raise ValueError("no text extracted")
+        digest = content_hash(doc)
+        out_file = out_file or _file_name(url)
+        path = os.path.join(self.out_dir, out_file)
+        changed = digest != old_hash or not os.path.exists(path)
+        if changed:
+            self._write(path, {"title": doc["title"] or out_file, "url": url, "sections": doc["sections"],
+                               "content_hash": digest, "scraped_at": datetime.utcnow().isoformat()})
+            stats["written"] += 1
+        else:
+            stats["unchanged"] += 1
+        self.frontier.done(url, digest, out_file, changed=changed)
+
+    def crawl(self, max_pages: int = 0, fresh: bool = False) -> dict:
+        """
+        Fetch pending pages with `workers` threads until the frontier is
+        empty or `max_pages` pages were fetched. Returns page counts.
+        """
+        if fresh:
+            self.frontier.forget()
+        if self.frontier.pending():
+            logger.info(f"Resuming crawl: {self.frontier.pending()} pages pending")
+        else:
+            known = self.frontier.start_round()
+            if known:
+                logger.info(f"Re-crawling {known} known pages")
+        self.frontier.add([(self.base_url, "list")])
+
+        stats = {"fetched": 0, "written": 0, "unchanged": 0, "failed": 0, "discovered": 0}
+        lock = threading.Lock()
+        in_flight = [0]
+
+        def worker():
+            while True:
+                with lock:
+                    if max_pages and stats["fetched"] >= max_pages:
+                        return
+                    page = self.frontier.claim()
+                    if page is None:
+                        if in_flight[0] == 0:
+                            return
+                    else:
+                        stats["fetched"] += 1
+                        in_flight[0] += 1
+                if page is None:
+                    time.sleep(0.05)        # another worker may still add links
+                    continue
+                url = page[0]
+                try:
+                    self._process(*page, stats)
+                except Exception as e:
+                    logger.warning(f"{url}: {e}")
+                    stats["failed"] += 1
+                    self.frontier.failed(url, str(e))
+                finally:
+                    with lock:
+                        in_flight[0] -= 1
+                if self.page_pause:
+                    time.sleep(self.page_pause)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scrape") as pool:
+            for future in [pool.submit(worker) for _ in range(self.workers)]:
+                future.result()
+
+        stats["pending"] = self.frontier.pending()
+        logger.info(f"Crawl finished: {stats}")
+        return stats
+
+    def close(self) -> None:
+        self.frontier.close()
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+
+def main() -> None:
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s:%(name)s: %(message)s",
+        level=logging.INFO,
+    )
+    parser = argparse.ArgumentParser(description="Scrape clinical protocols into data/scraped_json")
+    parser.add_argument("--max-pages", type=int, default=0, help="stop after this many pages (0 = all)")
+    parser.add_argument("--workers", type=int, help="override scrape.max_workers")
+    parser.add_argument("--fresh", action="store_true", help="forget the frontier and content hashes")
+    parser.add_argument("--base-url", help="override scrape.base_url")
+    args = parser.parse_args()
+
+    cfg  = _load_config()
+    root = _project_root()
+    scraper = ProtocolScraper(
+        cfg["scrape"],
+        out_dir=os.path.join(root, cfg["data"]["scraped_dir"]),
+        state_path=os.path.join(root, cfg["data"].get("crawl_state", "data/scrape_state/crawl.sqlite")),
+        workers=args.workers,
+        base_url=args.base_url,
+    )
+    try:
+        scraper.crawl(max_pages=args.max_pages, fresh=args.fresh)
+    finally:
+        scraper.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,12 @@ Medical information management with authentication, anatomy education, and AI as
 import logging
 import os
 import sys
-import threading
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from flask import Flask, render_template, send_from_directory, redirect, url_for, flash, request
 from flask_login import LoginManager
+from sqlalchemy import inspect, text
 
 from main.config import config
 from main.models import db, User
@@ -18,35 +18,26 @@ from main.i18n import init_i18n, t
 
 logger = logging.getLogger(__name__)
 
-_SYNC_INTERVAL = 12 * 60 * 60  # 12 hours in seconds
 
-
-def _start_iteka_scheduler(app):
-    """Run i-teka.kz sync in a background thread, repeating every 12 hours."""
-    from main.utils.iteka_scraper import sync_iteka_data
-
-    def _run():
-        try:
-            logger.info("Starting scheduled i-teka.kz data sync...")
-            sync_iteka_data(app)
-        except Exception as e:
-            logger.error(f"i-teka sync failed: {e}")
-        finally:
-            timer = threading.Timer(_SYNC_INTERVAL, _run)
-            timer.daemon = True
-            timer.start()
-
-    # Initial sync after 10 seconds (let the app start first)
-    timer = threading.Timer(10, _run)
-    timer.daemon = True
-    timer.start()
-
-from flask import Flask, render_template, send_from_directory, redirect, url_for, flash, request
-from flask_login import LoginManager
-
-from main.config import config
-from main.models import db, User
-from main.i18n import init_i18n, t
+def _add_missing_columns():
+    """
+    create_all() only creates missing tables. Add columns that were added to
+    existing models since the database was created (all such columns are
+    nullable, so a plain ADD COLUMN is safe on SQLite and PostgreSQL).
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=db.engine.dialect)
+            logger.info(f"Adding column {table.name}.{column.name} ({col_type})")
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
 
 
 def create_app(config_name='development'):
@@ -77,8 +68,13 @@ def create_app(config_name='development'):
     # Create database tables and seed data
     with app.app_context():
         db.create_all()
+        _add_missing_columns()
+        from main.utils import migrations
+        migrations.create_missing_unique_keys()
         from main.seed_data import seed_database
         seed_database(db)
+        from main.utils import med_search
+        med_search.setup(app)
 
     # Create uploads directory
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -87,6 +83,14 @@ def create_app(config_name='development'):
     from main.utils.email_otp import set_app as set_email_app
     set_email_app(app)
 
+    # Configure LLM rate limits / admission control
+    from main.utils import llm_scheduler
+    llm_scheduler.init_app(app)
+
+    # Register conversation memory (background summary updates)
+    from main.utils.conversation_memory import set_app as set_memory_app
+    set_memory_app(app)
+
     # Core routes
     @app.route('/')
     def home():
@@ -125,15 +129,37 @@ def create_app(config_name='development'):
     app.register_blueprint(medical_bp)
     app.register_blueprint(assistant_bp)
 
-    # Start background i-teka.kz sync scheduler (every 12 hours)
-    if not app.config.get('TESTING'):
-        _start_iteka_scheduler(app)
+    # Async chat job workers (jobs left pending by a restart are resumed
+    # by start_background_workers, not here)
+    from main.routes.assistant_route import run_chat_turn
+    from main.utils import chat_jobs
+    chat_jobs.init_app(app, run_chat_turn)
 
     return app
 
 
+def start_background_workers(app):
+    """
+    Resume chat jobs left pending by a restart, build the medication
+    typeahead index in the background and start the background job
+    scheduler (i-teka sync, index rebuild, cache warming; one instance runs
+    each job, see main/utils/job_scheduler.py). Called by the server entry
+    point only: scripts and tests import main.app without running jobs or
+    taking scheduler leases.
+    """
+    from main.utils import chat_jobs, med_suggest
+    with app.app_context():
+        chat_jobs.resume_unfinished()
+    med_suggest.start_build(app)
+
+    if app.config.get('SCHEDULER_ENABLED') and not app.config.get('TESTING'):
+        from main.utils.job_scheduler import start_scheduler
+        start_scheduler(app)
+
+
 app = create_app(os.environ.get('FLASK_ENV', 'development'))
 
 
 if __name__ == '__main__':
+    start_background_workers(app)
     app.run(host="0.0.0.0", port=5000, debug=False)
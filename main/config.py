@@ -38,6 +38,60 @@ class Config:
     GROQ_API_KEY = os.environ.get('GROQ_API_KEY', '')
     GROQ_MODEL = os.environ.get('GROQ_MODEL', 'llama-3.3-70b-versatile')
 
+    # Async chat jobs: POST /assistant/api/chat returns a job id instead of
+    # blocking the web worker (per request: {"async": true})
+    CHAT_ASYNC_DEFAULT = os.environ.get('CHAT_ASYNC_DEFAULT', '').lower() in ('1', 'true', 'yes')
+    CHAT_JOB_WORKERS = int(os.environ.get('CHAT_JOB_WORKERS', 4))
+
+    # LLM admission control (main/utils/llm_scheduler.py). rpm/tpm of 0 = unlimited;
+    # providers not listed (e.g. the local model) are not limited.
+    LLM_RATE_LIMITS = {
+        'groq': {
+            'rpm': int(os.environ.get('GROQ_RPM', 30)),
+            'tpm': int(os.environ.get('GROQ_TPM', 6000)),
+        },
+        'github': {
+            'rpm': int(os.environ.get('GITHUB_MODELS_RPM', 15)),
+            'tpm': int(os.environ.get('GITHUB_MODELS_TPM', 0)),
+        },
+    }
+    LLM_QUEUE_LIMITS = {'chat': 32, 'tips': 16, 'extraction': 8}   # waiting callers per class
+    LLM_MAX_WAIT = {'chat': 10, 'tips': 20, 'extraction': 60}      # seconds before 429
+
+    # Background job scheduler (main/utils/job_scheduler.py); started by the
+    # server entry point (run.py) in every worker, a DB lease keeps each job
+    # on one instance
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    SCHEDULER_TICK = int(os.environ.get('SCHEDULER_TICK', 15))   # seconds
+
+    # i-teka.kz sync fetcher (main/utils/iteka_fetcher.py): pool size, polite
+    # per-host limits, and live / record / replay (offline) mode
+    ITEKA_FETCH_WORKERS = int(os.environ.get('ITEKA_FETCH_WORKERS', 8))
+    ITEKA_FETCH_PER_HOST = int(os.environ.get('ITEKA_FETCH_PER_HOST', 4))      # concurrent requests
+    ITEKA_FETCH_RATE = float(os.environ.get('ITEKA_FETCH_RATE', 4))            # requests/second
+    ITEKA_FETCH_RETRIES = int(os.environ.get('ITEKA_FETCH_RETRIES', 3))
+    ITEKA_FETCH_MODE = os.environ.get('ITEKA_FETCH_MODE', 'live')
+    ITEKA_CASSETTE_DIR = os.environ.get('ITEKA_CASSETTE_DIR', '')
+
+    # Multi-city i-teka sync: cities to keep fresh (comma-separated i-teka
+    # slugs, empty = all), how many a scheduler run takes, how many of those
+    # run side by side on the shared fetcher, and pages per checkpoint
+    ITEKA_CITIES = [c.strip() for c in os.environ.get('ITEKA_CITIES', '').split(',') if c.strip()]
+    ITEKA_CITIES_PER_RUN = int(os.environ.get('ITEKA_CITIES_PER_RUN', 4))
+    ITEKA_SYNC_SHARDS = int(os.environ.get('ITEKA_SYNC_SHARDS', 2))
+    ITEKA_CHECKPOINT_PAGES = int(os.environ.get('ITEKA_CHECKPOINT_PAGES', 10))
+
+    # Price history (main/utils/price_history.py): raw per-pharmacy price
+    # changes, then daily rollups, then monthly rollups, in days
+    PRICE_RAW_RETENTION_DAYS = int(os.environ.get('PRICE_RAW_RETENTION_DAYS', 90))
+    PRICE_DAILY_RETENTION_DAYS = int(os.environ.get('PRICE_DAILY_RETENTION_DAYS', 180))
+    PRICE_ROLLUP_RETENTION_DAYS = int(os.environ.get('PRICE_ROLLUP_RETENTION_DAYS', 3 * 365))
+
+    # Medication search index (main/utils/med_search.py): '' picks pg_trgm on
+    # PostgreSQL and fts5 on SQLite; 'memory' forces the in-process index
+    MEDICATION_SEARCH_BACKEND = os.environ.get('MEDICATION_SEARCH_BACKEND', '')
+    MEDICATION_SEARCH_LIMIT = int(os.environ.get('MEDICATION_SEARCH_LIMIT', 1000))   # ranked matches per search
+
 
 class DevelopmentConfig(Config):
     """Development configuration"""
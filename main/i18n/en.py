@@ -439,6 +439,7 @@ translations = {
     "delete_chat": "Delete chat",
     "delete_chat_confirm": "Delete this conversation?",
     "assistant_error": "Sorry, an error occurred. Please try again later.",
+    "assistant_busy": "The assistant is busy right now. Please try again in {seconds} s.",
     "connection_error": "Connection error. Check your internet connection.",
 
     # --- Lab Upload ---
@@ -550,6 +551,8 @@ translations = {
     "flash_upload_required": "Please upload a PDF or paste your lab report text.",
     "flash_not_enough_text": "Could not extract enough text. Please try pasting the text directly.",
     "flash_duplicate_doc": "This document has already been uploaded.",
+    "flash_llm_busy": "The AI service is busy. Lab values will be extracted when you reopen this page in a minute.",
+    "flash_extraction_in_progress": "Lab values are being extracted in another window. Refresh in a moment.",
     "flash_access_denied": "Access denied.",
     "flash_lab_confirmed": "Lab results confirmed and saved!",
     "flash_doc_deleted": "Document deleted.",
@@ -439,6 +439,7 @@ translations = {
     "delete_chat": "Чатты жою",
     "delete_chat_confirm": "Бұл сұхбатты жою керек пе?",
     "assistant_error": "Кешіріңіз, қате орын алды. Кейінірек қайталап көріңіз.",
+    "assistant_busy": "Ассистент қазір бос емес. {seconds} с кейін қайталап көріңіз.",
     "connection_error": "Байланыс қатесі. Интернет байланысын тексеріңіз.",
 
     # --- Lab Upload ---
@@ -550,6 +551,8 @@ translations = {
     "flash_upload_required": "PDF жүктеңіз немесе талдау мәтінін қойыңыз.",
     "flash_not_enough_text": "Жеткілікті мәтін шығарылмады. Мәтінді тікелей қоюды қолданып көріңіз.",
     "flash_duplicate_doc": "Бұл құжат бұрын жүктелген.",
+    "flash_llm_busy": "ЖИ қызметі бос емес. Көрсеткіштер осы бетті бір минуттан кейін ашқанда алынады.",
+    "flash_extraction_in_progress": "Көрсеткіштер басқа терезеде алынуда. Бетті біраздан кейін жаңартыңыз.",
     "flash_access_denied": "Қол жеткізу тыйым салынған.",
     "flash_lab_confirmed": "Талдау нәтижелері расталып, сақталды!",
     "flash_doc_deleted": "Құжат жойылды.",
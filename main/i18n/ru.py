@@ -439,6 +439,7 @@ translations = {
     "delete_chat": "Удалить чат",
     "delete_chat_confirm": "Удалить этот разговор?",
     "assistant_error": "Извините, произошла ошибка. Пожалуйста, попробуйте позже.",
+    "assistant_busy": "Ассистент сейчас перегружен. Повторите попытку через {seconds} с.",
     "connection_error": "Ошибка подключения. Проверьте интернет-соединение.",
 
     # --- Lab Upload ---
@@ -550,6 +551,8 @@ translations = {
     "flash_upload_required": "Пожалуйста, загрузите PDF или вставьте текст анализов.",
     "flash_not_enough_text": "Не удалось извлечь достаточно текста. Попробуйте вставить текст напрямую.",
     "flash_duplicate_doc": "Этот документ уже был загружен.",
+    "flash_llm_busy": "Сервис ИИ перегружен. Показатели будут извлечены, когда вы откроете эту страницу через минуту.",
+    "flash_extraction_in_progress": "Показатели извлекаются в другом окне. Обновите страницу через минуту.",
     "flash_access_denied": "Доступ запрещён.",
     "flash_lab_confirmed": "Результаты анализов подтверждены и сохранены!",
     "flash_doc_deleted": "Документ удалён.",
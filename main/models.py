@@ -28,6 +28,9 @@ class User(UserMixin, db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Bumped on every medical card write; checked by each worker's context cache
+    medical_context_version = db.Column(db.Integer, default=0)
     
     def set_password(self, password: str) -> None:
         """Hash and set password"""
@@ -354,6 +357,9 @@ class Medication(db.Model):
 class Pharmacy(db.Model):
     """Pharmacy model"""
     __tablename__ = 'pharmacies'
+    __table_args__ = (
+        db.UniqueConstraint('name', 'address', 'city', name='uq_pharmacy_name_address_city'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
@@ -395,6 +401,9 @@ class Pharmacy(db.Model):
 class PharmacyStock(db.Model):
     """Medication stock in pharmacies"""
     __tablename__ = 'pharmacy_stocks'
+    __table_args__ = (
+        db.UniqueConstraint('pharmacy_id', 'medication_id', name='uq_stock_pharmacy_medication'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     pharmacy_id = db.Column(db.Integer, db.ForeignKey('pharmacies.id'), nullable=False)
@@ -413,6 +422,59 @@ class PharmacyStock(db.Model):
         return f'<PharmacyStock {self.pharmacy.name} - {self.medication.name}>'
 
 
+class PriceObservation(db.Model):
+    """A pharmacy's price for a medication, stored only on days it changed (see main/utils/price_history.py)"""
+    __tablename__ = 'price_observations'
+
+    medication_id = db.Column(db.Integer, db.ForeignKey('medications.id'), primary_key=True)
+    pharmacy_id = db.Column(db.Integer, db.ForeignKey('pharmacies.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    price = db.Column(db.Integer, nullable=False)  # KZT
+
+    def __repr__(self) -> str:
+        return f'<PriceObservation {self.medication_id}@{self.pharmacy_id} {self.day}: {self.price}>'
+
+
+class PriceRollup(db.Model):
+    """Daily (later monthly) price statistics per medication and city, served by the price-history API"""
+    __tablename__ = 'price_rollups'
+
+    medication_id = db.Column(db.Integer, db.ForeignKey('medications.id'), primary_key=True)
+    city = db.Column(db.String(120), primary_key=True)  # Pharmacy.city
+    day = db.Column(db.Date, primary_key=True)  # first day of the month for monthly rows
+    period = db.Column(db.String(5), default='day')  # day/month
+    samples = db.Column(db.Integer, default=1)  # daily rows merged into this one
+
+    # From our pharmacy_stocks, KZT
+    min_price = db.Column(db.Integer)
+    max_price = db.Column(db.Integer)
+    avg_price = db.Column(db.Integer)
+    pharmacy_count = db.Column(db.Integer)
+
+    # i-teka.kz price statistics for the whole city
+    site_min = db.Column(db.Integer)
+    site_max = db.Column(db.Integer)
+    site_avg = db.Column(db.Integer)
+    site_pharmacy_count = db.Column(db.Integer)
+
+    def to_dict(self):
+        return {
+            'date': self.day.isoformat(),
+            'period': self.period,
+            'min': self.min_price,
+            'max': self.max_price,
+            'avg': self.avg_price,
+            'pharmacies': self.pharmacy_count,
+            'site_min': self.site_min,
+            'site_max': self.site_max,
+            'site_avg': self.site_avg,
+            'site_pharmacies': self.site_pharmacy_count,
+        }
+
+    def __repr__(self) -> str:
+        return f'<PriceRollup {self.medication_id} {self.city} {self.day}>'
+
+
 class UserPrescriptionOrder(db.Model):
     """User prescription orders from pharmacies"""
     __tablename__ = 'user_prescription_orders'
@@ -510,7 +572,8 @@ class MedicalDocument(db.Model):
     raw_text = db.Column(db.Text)
     content_hash = db.Column(db.String(64), index=True)  # SHA-256 hash for duplicate detection
 
-    status = db.Column(db.String(20), default='pending')  # pending/extracted/confirmed/failed
+    status = db.Column(db.String(20), default='pending')  # pending/extracting/extracted/confirmed/failed
+    extraction_started_at = db.Column(db.DateTime)  # set when a request claims the extraction
     error_message = db.Column(db.Text)
     ai_summary = db.Column(db.Text)
 
@@ -532,6 +595,9 @@ class ChatConversation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     title = db.Column(db.String(255), default='New Chat')
+    # Rolling summary of older turns (see main/utils/conversation_memory.py)
+    summary = db.Column(db.Text)
+    summary_message_count = db.Column(db.Integer, default=0)  # messages folded into summary
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -546,12 +612,17 @@ class ChatConversation(db.Model):
 class ChatMessage(db.Model):
     """Persistent chat messages between user and AI assistant"""
     __tablename__ = 'chat_messages'
+    __table_args__ = (
+        # A retried POST stores its turn once; NULL keys never collide
+        db.UniqueConstraint('user_id', 'idempotency_key', name='uq_chat_message_user_idempotency'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     conversation_id = db.Column(db.Integer, db.ForeignKey('chat_conversations.id'), nullable=True)
     role = db.Column(db.String(20), nullable=False)  # 'user' or 'assistant'
     content = db.Column(db.Text, nullable=False)
+    idempotency_key = db.Column(db.String(64), index=True)  # client key of the POST that asked it
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship('User', backref='chat_messages', lazy=True)
@@ -560,6 +631,37 @@ class ChatMessage(db.Model):
         return f'<ChatMessage {self.id} ({self.role})>'
 
 
+class ChatJob(db.Model):
+    """Queued assistant answer (async chat mode, see main/utils/chat_jobs.py)"""
+    __tablename__ = 'chat_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('chat_conversations.id'), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    idempotency_key = db.Column(db.String(64), index=True)
+    status = db.Column(db.String(20), default='pending', index=True)  # pending/running/done/failed
+    response = db.Column(db.Text)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'conversation_id': self.conversation_id,
+            'status': self.status,
+            'response': self.response,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f'<ChatJob {self.id} ({self.status})>'
+
+
 class LabResult(db.Model):
     """Individual lab result extracted from a medical document"""
     __tablename__ = 'lab_results'
@@ -584,4 +686,104 @@ class LabResult(db.Model):
     user = db.relationship('User', backref='lab_results', lazy=True)
 
     def __repr__(self):
-        return f'<LabResult {self.test_name}: {self.value} {self.unit}>'
\ No newline at end of file
+        return f'<LabResult {self.test_name}: {self.value} {self.unit}>'
+
+class ScheduledJob(db.Model):
+    """Persistent state of a background job (see main/utils/job_scheduler.py)"""
+    __tablename__ = 'scheduled_jobs'
+
+    name = db.Column(db.String(64), primary_key=True)
+    interval_seconds = db.Column(db.Integer, nullable=False)
+    enabled = db.Column(db.Boolean, default=True)
+    next_run_at = db.Column(db.DateTime)
+    last_run_at = db.Column(db.DateTime)
+    last_status = db.Column(db.String(20))  # ok/failed
+    last_error = db.Column(db.Text)
+    last_duration_s = db.Column(db.Float)
+
+    # Leader lease: the instance currently running the job
+    lease_owner = db.Column(db.String(128))
+    lease_expires_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'interval_seconds': self.interval_seconds,
+            'enabled': self.enabled,
+            'next_run_at': self.next_run_at.isoformat() if self.next_run_at else None,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'last_status': self.last_status,
+            'last_error': self.last_error,
+            'last_duration_s': self.last_duration_s,
+            'lease_owner': self.lease_owner,
+        }
+
+    def __repr__(self):
+        return f'<ScheduledJob {self.name}>'
+
+
+class JobRun(db.Model):
+    """One execution of a background job (history)"""
+    __tablename__ = 'job_runs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_name = db.Column(db.String(64), nullable=False, index=True)
+    owner = db.Column(db.String(128))
+    status = db.Column(db.String(20), default='running')  # running/ok/failed
+    missed_runs = db.Column(db.Integer, default=0)  # intervals skipped while no instance ran the job
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    finished_at = db.Column(db.DateTime)
+    duration_s = db.Column(db.Float)
+
+    def __repr__(self):
+        return f'<JobRun {self.job_name} #{self.id} ({self.status})>'
+
+
+class FetchState(db.Model):
+    """Per-URL change validators for the i-teka.kz sync (see main/utils/iteka_scraper.py)"""
+    __tablename__ = 'fetch_states'
+
+    url = db.Column(db.String(512), primary_key=True)
+    etag = db.Column(db.String(255))
+    last_modified = db.Column(db.String(64))
+    content_hash = db.Column(db.String(64))  # sha256 of the relevant page fragment
+    checked_at = db.Column(db.DateTime)  # last fetch
+    changed_at = db.Column(db.DateTime)  # last fetch that found new content
+
+    def validators(self):
+        return {'etag': self.etag, 'last_modified': self.last_modified, 'content_hash': self.content_hash}
+
+    def __repr__(self):
+        return f'<FetchState {self.url}>'
+
+
+class ItekaSyncCheckpoint(db.Model):
+    """Per-city progress of the i-teka.kz sync, so an interrupted city resumes where it stopped"""
+    __tablename__ = 'iteka_sync_checkpoints'
+
+    city = db.Column(db.String(64), primary_key=True)  # i-teka slug, or 'global-search' for the search phase
+    phase = db.Column(db.String(16))  # search/detail while a round is in progress, done after it
+    position = db.Column(db.Integer, default=0)  # pages of the phase already written
+    stats = db.Column(db.Text)  # JSON page counts of the current round
+    round_started_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)  # end of the last full round
+    updated_at = db.Column(db.DateTime)
+
+    # Lease: the process currently syncing the city
+    lease_owner = db.Column(db.String(128))
+    lease_expires_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'city': self.city,
+            'phase': self.phase,
+            'position': self.position,
+            'round_started_at': self.round_started_at.isoformat() if self.round_started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'lease_owner': self.lease_owner,
+        }
+
+    def __repr__(self):
+        return f'<ItekaSyncCheckpoint {self.city} {self.phase}:{self.position}>'
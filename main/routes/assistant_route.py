@@ -1,15 +1,24 @@
 import sys
 import os
+import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
-from flask import Blueprint, render_template, request, jsonify, session
+from flask import Blueprint, render_template, request, jsonify, session, current_app, url_for, Response, stream_with_context
 from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
 
 from main.i18n import t
-from main.models import db, ChatMessage, ChatConversation, MedicalMetrics, UserHealthCondition, Prescription, Visit, Diagnosis
+from main.models import db, ChatMessage, ChatConversation, ChatJob
 
 # Use safe wrapper for med_bot
 from main.utils.med_bot_wrapper import answer_question, is_rag_available
+from main.utils.conversation_memory import build_history, schedule_summary_update
+from main.utils.medical_context import get_medical_context
+from main.utils import chat_jobs, llm_scheduler
+from main.utils.llm_scheduler import SchedulerSaturated
+from main.utils.singleflight import Group, request_key
 
 # Create blueprint
 assistant_bp = Blueprint('assistant', __name__, url_prefix='/assistant')
@@ -18,69 +27,174 @@ logger = logging.getLogger('assistant')
 
 RAG_AVAILABLE = is_rag_available()
 
+# Medical context is loaded here while answer_question runs retrieval
+_context_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='chat-context')
+
+# Identical chat requests in flight at the same time share one answer
+_chat_flight = Group('chat')
+
+# SSE job stream: heartbeat every 15 s, give up after 10 minutes
+JOB_STREAM_HEARTBEAT = 15
+JOB_STREAM_MAX_WAITS = 40
+
+
+def _flag(value, default=False):
+    """JSON/query flag: true/false, 1/0 or "true"/"false"/"yes"/"no"; None keeps the default."""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
 
 def _build_user_medical_context(user_id: int, conversation_id: int = None) -> str:
     """Build a medical context string from the user's medical card data."""
     parts = []
 
-    # 1. Medical metrics (allergies, chronic conditions, current medications)
-    metrics = MedicalMetrics.query.filter_by(user_id=user_id).first()
-    if metrics:
-        if metrics.allergies:
-            parts.append(f"Аллергии пациента: {metrics.allergies}")
-        if metrics.chronic_conditions:
-            parts.append(f"Хронические заболевания: {metrics.chronic_conditions}")
-        if metrics.medications:
-            parts.append(f"Текущие лекарства: {metrics.medications}")
-        if metrics.blood_type:
-            parts.append(f"Группа крови: {metrics.blood_type}")
-
-    # 2. Active health conditions
-    conditions = UserHealthCondition.query.filter_by(
-        user_id=user_id, status='active'
-    ).all()
-    if conditions:
-        cond_names = [c.disease.name for c in conditions if c.disease]
-        if cond_names:
-            parts.append(f"Активные заболевания: {', '.join(cond_names)}")
-
-    # 3. Recent diagnoses (last 5)
-    recent_visits = Visit.query.filter_by(user_id=user_id).order_by(
-        Visit.visit_date.desc()
-    ).limit(5).all()
-    diag_names = []
-    rx_items = []
-    for v in recent_visits:
-        for d in v.diagnoses:
-            diag_names.append(d.disease_name)
-        for p in v.prescriptions:
-            rx_items.append(f"{p.medication_name} ({p.dosage or ''} {p.frequency or ''})".strip())
-    if diag_names:
-        parts.append(f"Недавние диагнозы: {', '.join(diag_names[:10])}")
-    if rx_items:
-        parts.append(f"Назначенные препараты: {', '.join(rx_items[:10])}")
-
-    # 4. Recent messages in this conversation (for continuity)
+    # 1-3. Medical card snapshot (cached, invalidated on medical card writes)
+    card = get_medical_context(user_id)
+    if card:
+        parts.append(card)
+
+    # 4. Conversation memory: rolling summary + last turn (for continuity)
     if conversation_id:
-        recent_msgs = ChatMessage.query.filter_by(
-            user_id=user_id, conversation_id=conversation_id
-        ).order_by(ChatMessage.created_at.desc()).limit(6).all()
-    else:
-        recent_msgs = ChatMessage.query.filter_by(user_id=user_id).order_by(
-            ChatMessage.created_at.desc()
-        ).limit(6).all()
-    if recent_msgs:
-        recent_msgs.reverse()
-        history_lines = []
-        for m in recent_msgs:
-            role_label = "Пациент" if m.role == "user" else "Ассистент"
-            content = m.content[:300] + "..." if len(m.content) > 300 else m.content
-            history_lines.append(f"{role_label}: {content}")
-        parts.append("Последние сообщения:\n" + "\n".join(history_lines))
+        history = build_history(conversation_id)
+        if history:
+            parts.append(history)
 
     return "\n".join(parts) if parts else ""
 
 
+def _load_medical_context(app, user_id: int, conversation_id: int) -> str:
+    """_build_user_medical_context in a worker thread with its own app context."""
+    with app.app_context():
+        return _build_user_medical_context(user_id, conversation_id)
+
+
+def _open_conversation(user_id: int, conversation_id, user_message: str):
+    """
+    Resolve or create the conversation in its own short transaction.
+    Returns (conversation_id, title the conversation will have).
+    """
+    convo = None
+    if conversation_id:
+        convo = ChatConversation.query.filter_by(
+            id=conversation_id, user_id=user_id
+        ).first()
+    if not convo:
+        convo = ChatConversation(user_id=user_id, title=user_message[:60])
+        db.session.add(convo)
+        db.session.flush()
+    convo_id, convo_title = convo.id, convo.title
+    db.session.commit()
+
+    # Auto-title: if conversation still has default title, use first message
+    if convo_title == 'New Chat':
+        convo_title = user_message[:60]
+    return convo_id, convo_title
+
+
+def _process_chat(app, user_id: int, conversation_id, user_message: str,
+                  run_async: bool, idempotency_key: str = None):
+    """Open the conversation and answer (or queue) the message. Returns (status, payload)."""
+    convo_id, convo_title = _open_conversation(user_id, conversation_id, user_message)
+
+    # Job mode: answer in the chat worker pool, client polls or streams
+    if run_async:
+        job_id = chat_jobs.submit(user_id, convo_id, user_message, idempotency_key)
+        return 202, {
+            'job_id': job_id,
+            'status': 'pending',
+            'conversation_id': convo_id,
+            'conversation_title': convo_title,
+            'success': True
+        }
+
+    response = run_chat_turn(app, user_id, convo_id, user_message, idempotency_key)
+    return 200, {
+        'response': response,
+        'conversation_id': convo_id,
+        'conversation_title': convo_title,
+        'success': True
+    }
+
+
+def _stored_turn(user_id: int, idempotency_key: str):
+    """(question, answer) messages stored for this idempotency key, or None."""
+    asked = ChatMessage.query.filter_by(
+        user_id=user_id, role='user', idempotency_key=idempotency_key
+    ).first()
+    if not asked:
+        return None
+    answer = ChatMessage.query.filter(
+        ChatMessage.conversation_id == asked.conversation_id,
+        ChatMessage.role == 'assistant',
+        ChatMessage.id > asked.id,
+    ).order_by(ChatMessage.id).first()
+    return asked, answer
+
+
+def _stored_chat_result(user_id: int, idempotency_key: str):
+    """(status, payload) already produced for this idempotency key, or None."""
+    job = ChatJob.query.filter_by(user_id=user_id, idempotency_key=idempotency_key).first()
+    if job:
+        convo = db.session.get(ChatConversation, job.conversation_id)
+        return 202, {**job.to_dict(), 'conversation_title': convo.title if convo else None,
+                     'success': True}
+
+    turn = _stored_turn(user_id, idempotency_key)
+    if not turn:
+        return None
+    asked, answer = turn
+    return 200, {
+        'response': answer.content if answer else '',
+        'conversation_id': asked.conversation_id,
+        'conversation_title': asked.conversation.title if asked.conversation else None,
+        'success': True
+    }
+
+
+def run_chat_turn(app, user_id: int, convo_id: int, user_message: str,
+                  idempotency_key: str = None) -> str:
+    """
+    Answer one message and store the turn. Used by the chat endpoint and by
+    chat_jobs workers. Keeps transactions short: nothing may hold a DB
+    transaction open while the LLM call runs (SQLite would block every
+    other writer, Postgres would pin an idle-in-transaction connection).
+    """
+    # Generate outside any transaction. The medical context loads in
+    # parallel with retrieval; answer_question only waits for it when
+    # assembling the prompt
+    medical_context = _context_pool.submit(_load_medical_context, app, user_id, convo_id)
+    response = answer_question(user_message, medical_context=medical_context)
+
+    # Persist both messages and the title atomically
+    try:
+        db.session.add(ChatMessage(user_id=user_id, conversation_id=convo_id,
+                                   role='user', content=user_message,
+                                   idempotency_key=idempotency_key))
+        db.session.add(ChatMessage(user_id=user_id, conversation_id=convo_id,
+                                   role='assistant', content=response))
+        ChatConversation.query.filter_by(id=convo_id, title='New Chat').update(
+            {'title': user_message[:60]}, synchronize_session=False
+        )
+        ChatConversation.query.filter_by(id=convo_id).update(
+            {'updated_at': datetime.utcnow()}, synchronize_session=False
+        )
+        db.session.commit()
+    except IntegrityError:
+        # Another process stored a turn with this key first: this was a replay
+        db.session.rollback()
+        turn = _stored_turn(user_id, idempotency_key) if idempotency_key else None
+        if not turn:
+            raise
+        return turn[1].content if turn[1] else ''
+
+    # Fold older turns into the conversation summary off the request path
+    schedule_summary_update(convo_id)
+    return response
+
+
 @assistant_bp.route('/')
 @login_required
 def assistant_page():
@@ -145,42 +259,43 @@ def chat():
         return jsonify({'error': 'Message too long (max 1000 characters)', 'success': False}), 400
 
     conversation_id = data.get('conversation_id')
+    user_id = current_user.id
+    run_async = _flag(data.get('async'), current_app.config.get('CHAT_ASYNC_DEFAULT', False))
+    idempotency_key = (request.headers.get('Idempotency-Key')
+                       or data.get('idempotency_key') or '').strip()[:64] or None
 
     try:
-        # Resolve or create conversation
-        convo = None
-        if conversation_id:
-            convo = ChatConversation.query.filter_by(
-                id=conversation_id, user_id=current_user.id
-            ).first()
-        if not convo:
-            convo = ChatConversation(user_id=current_user.id, title=user_message[:60])
-            db.session.add(convo)
-            db.session.flush()
-
-        # Auto-title: if conversation still has default title, use first message
-        if convo.title == 'New Chat':
-            convo.title = user_message[:60]
-
-        # Build user medical context
-        medical_context = _build_user_medical_context(current_user.id, convo.id)
-
-        # Get answer from RAG engine with medical context
-        response = answer_question(user_message, medical_context=medical_context)
-
-        # Save messages
-        db.session.add(ChatMessage(user_id=current_user.id, conversation_id=convo.id,
-                                   role='user', content=user_message))
-        db.session.add(ChatMessage(user_id=current_user.id, conversation_id=convo.id,
-                                   role='assistant', content=response))
-        db.session.commit()
-
-        return jsonify({
-            'response': response,
-            'conversation_id': convo.id,
-            'conversation_title': convo.title,
-            'success': True
+        # A retried POST with a known idempotency key gets the stored result
+        stored = _stored_chat_result(user_id, idempotency_key) if idempotency_key else None
+        if stored:
+            status, payload = stored
+        else:
+            # Concurrent identical requests (double-click, client retry, two
+            # tabs) share one computation instead of each calling the LLM
+            if idempotency_key:
+                flight_key = request_key(user_id, 'idempotency', idempotency_key)
+            else:
+                flight_key = request_key(user_id, conversation_id or 'new', user_message, bool(run_async))
+            status, payload = _chat_flight.do(
+                flight_key, _process_chat, current_app._get_current_object(),
+                user_id, conversation_id, user_message, run_async, idempotency_key
+            )
+
+        resp = jsonify(payload)
+        if status == 202:
+            resp.headers['Location'] = url_for('assistant.get_chat_job', job_id=payload['job_id'])
+        return resp, status
+
+    except SchedulerSaturated as e:
+        db.session.rollback()
+        resp = jsonify({
+            'error': t('assistant_busy', seconds=e.retry_after),
+            'response': t('assistant_busy', seconds=e.retry_after),
+            'retry_after': e.retry_after,
+            'success': False
         })
+        resp.headers['Retry-After'] = str(e.retry_after)
+        return resp, 429
 
     except Exception as e:
         logger.error(f"Error in chat: {str(e)}")
@@ -192,6 +307,50 @@ def chat():
         }), 500
 
 
+@assistant_bp.route('/api/chat/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_chat_job(job_id):
+    """Status (and answer, once done) of an async chat job"""
+    job = ChatJob.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    return jsonify({**job.to_dict(), 'success': job.status != 'failed'})
+
+
+@assistant_bp.route('/api/chat/jobs/<job_id>/stream', methods=['GET'])
+@login_required
+def stream_chat_job(job_id):
+    """Server-sent events: a 'status' event on each change, then 'done' or 'failed'"""
+    user_id = current_user.id
+    ChatJob.query.filter_by(id=job_id, user_id=user_id).first_or_404()
+    db.session.commit()
+
+    def events():
+        last_status = None
+        for _ in range(JOB_STREAM_MAX_WAITS):
+            job = db.session.get(ChatJob, job_id)
+            payload = job.to_dict()
+            db.session.commit()
+            if payload['status'] in ('done', 'failed'):
+                yield f"event: {payload['status']}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                return
+            if payload['status'] != last_status:
+                last_status = payload['status']
+                yield f"event: status\ndata: {json.dumps({'status': last_status})}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            chat_jobs.wait(job_id, JOB_STREAM_HEARTBEAT)
+        yield "event: timeout\ndata: {}\n\n"
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@assistant_bp.route('/api/llm-stats', methods=['GET'])
+@login_required
+def llm_stats():
+    """LLM scheduler queue depth, admissions/rejections and wait times"""
+    return jsonify(llm_scheduler.stats())
+
+
 @assistant_bp.route('/api/clear-history', methods=['POST'])
 @login_required
 def clear_history():
@@ -5,6 +5,7 @@ Handles: anatomy data API, pharmacy page, anatomy viewer, medication search
 from flask import Blueprint, render_template, request, jsonify
 
 from main.models import db, Organ, Disease, Medication, Pharmacy, PharmacyStock, MedicationCategory
+from main.utils import med_search, med_suggest, price_history
 
 medical_bp = Blueprint('medical', __name__)
 
@@ -100,7 +101,7 @@ def api_medications_by_letter():
 
 @medical_bp.route('/api/medications/search', methods=['GET'])
 def api_search_medications():
-    """Search medications by name or generic name."""
+    """Search medications by name, generic name or active ingredient, best match first."""
     query = request.args.get('q', '').strip()
     page = request.args.get('page', 1, type=int)
     per_page = 20
@@ -108,17 +109,26 @@ def api_search_medications():
     if not query or len(query) < 2:
         return jsonify({"error": "Search query too short", "medications": []}), 400
 
-    medications = Medication.query.filter(
-        (Medication.name.ilike(f'%{query}%')) |
-        (Medication.generic_name.ilike(f'%{query}%'))
-    ).order_by(Medication.name).paginate(page=page, per_page=per_page)
+    items, total, pages = med_search.paginate(med_search.search(query), page, per_page)
 
     return jsonify({
         "query": query,
         "page": page,
-        "total": medications.total,
-        "pages": medications.pages,
-        "medications": [_serialize_med(m) for m in medications.items]
+        "total": total,
+        "pages": pages,
+        "medications": [_serialize_med(m) for m in items]
+    })
+
+
+@medical_bp.route('/api/medications/suggest', methods=['GET'])
+def api_suggest_medications():
+    """Typeahead: medications whose name, generic name or ingredient start with q (either script)."""
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 20)
+
+    return jsonify({
+        "query": query,
+        "suggestions": med_suggest.suggest(query, limit) if query else [],
     })
 
 
@@ -164,6 +174,20 @@ def api_get_medication(med_id):
     })
 
 
+@medical_bp.route('/api/medications/<int:med_id>/price-history', methods=['GET'])
+def api_medication_price_history(med_id):
+    """Price statistics over time per city: ?city=Almaty&days=365 (from precomputed rollups)."""
+    Medication.query.get_or_404(med_id)
+    city = request.args.get('city', '').strip()
+    days = min(max(request.args.get('days', 365, type=int), 1), 10 * 365)
+
+    return jsonify({
+        "medication_id": med_id,
+        "days": days,
+        "series": price_history.history(med_id, city or None, days),
+    })
+
+
 @medical_bp.route('/api/medications', methods=['GET'])
 def api_get_all_medications():
     """Get all medications with optional filters: q, category_id, city, pharmacy_id."""
@@ -176,12 +200,6 @@ def api_get_all_medications():
 
     query = Medication.query
 
-    if q:
-        query = query.filter(
-            (Medication.name.ilike(f'%{q}%')) |
-            (Medication.generic_name.ilike(f'%{q}%'))
-        )
-
     if category_id:
         query = query.filter_by(category_id=category_id)
 
@@ -193,13 +211,18 @@ def api_get_all_medications():
             query = query.filter(Pharmacy.id == pharmacy_id)
         query = query.distinct()
 
-    medications = query.order_by(Medication.name).paginate(page=page, per_page=per_page)
+    if q:
+        filtered = query if (category_id or city or pharmacy_id) else None
+        items, total, pages = med_search.paginate(med_search.search(q), page, per_page, within=filtered)
+    else:
+        medications = query.order_by(Medication.name).paginate(page=page, per_page=per_page)
+        items, total, pages = medications.items, medications.total, medications.pages
 
     return jsonify({
         "page": page,
-        "total": medications.total,
-        "pages": medications.pages,
-        "medications": [_serialize_med(m) for m in medications.items]
+        "total": total,
+        "pages": pages,
+        "medications": [_serialize_med(m) for m in items]
     })
 
 
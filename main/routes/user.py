@@ -3,7 +3,7 @@ User profile and account routes blueprint
 """
 import os
 import hashlib
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
@@ -11,6 +11,7 @@ from werkzeug.utils import secure_filename
 from main.models import db, User, MedicalMetrics, MedicalDocument, LabResult
 from main.forms import UpdateProfileForm, MedicalMetricsForm, MedicalDocumentUploadForm, ChangePasswordForm
 from main.i18n import t
+from main.utils.singleflight import Group
 
 user_bp = Blueprint('user', __name__)
 
@@ -267,6 +268,66 @@ def lab_upload():
     return render_template('lab_upload.html', form=form, documents=documents)
 
 
+_lab_flight = Group('lab-extraction')
+EXTRACTION_STALE_AFTER = timedelta(minutes=5)
+
+
+def _extract_document(doc_id):
+    """
+    Claim a pending document and extract its lab values.
+    Returns the extract_lab_values() result, or None if another request
+    holds the claim.
+    """
+    from main.utils.groq_client import extract_lab_values
+
+    stale = datetime.utcnow() - EXTRACTION_STALE_AFTER
+    claimed = MedicalDocument.query.filter(
+        MedicalDocument.id == doc_id,
+        db.or_(MedicalDocument.status == 'pending',
+               db.and_(MedicalDocument.status == 'extracting',
+                       MedicalDocument.extraction_started_at < stale)),
+    ).update({'status': 'extracting', 'extraction_started_at': datetime.utcnow()},
+             synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        return None
+
+    doc = db.session.get(MedicalDocument, doc_id)
+    raw_text = doc.raw_text
+    db.session.commit()
+
+    # LLM call outside any transaction
+    result = extract_lab_values(raw_text)
+
+    if result.get('retry_after'):
+        doc.status = 'pending'
+    elif result.get('error'):
+        doc.status = 'failed'
+        doc.error_message = result['error']
+    else:
+        doc.ai_summary = result.get('summary', '')
+        doc.status = 'extracted'
+
+        for lr_data in result.get('lab_results', []):
+            lab = LabResult(
+                document_id=doc.id,
+                user_id=doc.user_id,
+                test_name=lr_data.get('test_name', ''),
+                test_name_ru=lr_data.get('test_name_ru', ''),
+                value=lr_data.get('value'),
+                unit=lr_data.get('unit', ''),
+                reference_range_low=lr_data.get('reference_range_low'),
+                reference_range_high=lr_data.get('reference_range_high'),
+                reference_range_text=lr_data.get('reference_range_text', ''),
+                status=lr_data.get('status', 'normal'),
+                category=lr_data.get('category', 'other'),
+            )
+            db.session.add(lab)
+
+    db.session.commit()
+    return result
+
+
 @user_bp.route('/lab-results/<int:doc_id>', methods=['GET', 'POST'])
 @login_required
 def lab_results(doc_id):
@@ -276,38 +337,21 @@ def lab_results(doc_id):
         flash(t('flash_access_denied'), 'danger')
         return redirect(url_for('user.lab_upload'))
 
-    # Extract lab values if still pending
-    if doc.status == 'pending':
-        from main.utils.groq_client import extract_lab_values
-
-        result = extract_lab_values(doc.raw_text)
-
-        if result.get('error'):
-            doc.status = 'failed'
-            doc.error_message = result['error']
-            db.session.commit()
+    # Extract lab values if still pending. Concurrent requests for the same
+    # document (two tabs, reloads) share one extraction in this process;
+    # the atomic status claim keeps other processes from running it twice.
+    if doc.status in ('pending', 'extracting'):
+        db.session.commit()  # don't sit in a transaction while waiting
+        result = _lab_flight.do(f"{doc.user_id}:lab:{doc.id}", _extract_document, doc.id)
+        db.session.refresh(doc)
+
+        if result is None:
+            flash(t('flash_extraction_in_progress'), 'info')
+        elif result.get('retry_after'):
+            # LLM scheduler saturated: the document stays pending, extract on a later visit
+            flash(t('flash_llm_busy'), 'warning')
+        elif result.get('error'):
             flash(result['error'], 'warning')
-        else:
-            doc.ai_summary = result.get('summary', '')
-            doc.status = 'extracted'
-
-            for lr_data in result.get('lab_results', []):
-                lab = LabResult(
-                    document_id=doc.id,
-                    user_id=current_user.id,
-                    test_name=lr_data.get('test_name', ''),
-                    test_name_ru=lr_data.get('test_name_ru', ''),
-                    value=lr_data.get('value'),
-                    unit=lr_data.get('unit', ''),
-                    reference_range_low=lr_data.get('reference_range_low'),
-                    reference_range_high=lr_data.get('reference_range_high'),
-                    reference_range_text=lr_data.get('reference_range_text', ''),
-                    status=lr_data.get('status', 'normal'),
-                    category=lr_data.get('category', 'other'),
-                )
-                db.session.add(lab)
-
-            db.session.commit()
 
     # Handle user confirmation (POST)
     if request.method == 'POST' and doc.status == 'extracted':
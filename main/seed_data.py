@@ -1405,6 +1405,7 @@ def seed_database(db):
 
         med_objects = []
         for med_data in MEDICATIONS:
+            med_data = dict(med_data)  # keep MEDICATIONS intact for later seeding
             cat_idx = med_data.pop("cat")
             med_data["category_id"] = categories[cat_idx].id
             med_objects.append(Medication(**med_data))
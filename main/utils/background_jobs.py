@@ -0,0 +1,118 @@
+"""
+Background jobs run by the leader-elected scheduler (main/utils/job_scheduler.py).
+
+    iteka_sync         every 12 h   medications/pharmacies from i-teka.kz; each run
+                     / shards     takes the next ITEKA_CITIES_PER_RUN cities
+    rag_index_rebuild  daily        chunk → embed → index → publish (ai_engine/pipeline.py)
+                                    when the scraped corpus changed
+    cache_warm         every 15 min medical-context snapshots of active chat users
+                                    (per process: each worker has its own cache)
+    price_retention    daily        prune/downsample price history (main/utils/price_history.py)
+    suggest_refresh    every 5 min  merge changed medications into the typeahead index
+                                    (per process, like cache_warm; main/utils/med_suggest.py)
+"""
+import logging
+import math
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ITEKA_SYNC_INTERVAL = 12 * 60 * 60
+INDEX_REBUILD_INTERVAL = 24 * 60 * 60
+INDEX_REBUILD_TIMEOUT = 2 * 60 * 60
+CACHE_WARM_INTERVAL = 15 * 60
+CACHE_WARM_WINDOW = timedelta(days=1)
+CACHE_WARM_MAX_USERS = 200
+PRICE_RETENTION_INTERVAL = 24 * 60 * 60
+SUGGEST_REFRESH_INTERVAL = 5 * 60
+
+
+def iteka_sync(app):
+    from main.utils import med_suggest
+    from main.utils.iteka_scraper import sync_iteka_data
+    result = sync_iteka_data(app)
+    # This worker's typeahead sees the sync at once; the others within SUGGEST_REFRESH_INTERVAL
+    med_suggest.refresh()
+    return result
+
+
+def _iteka_sync_interval(app):
+    """Run often enough that every configured city is synced once per ITEKA_SYNC_INTERVAL."""
+    from main.utils.iteka_scraper import CITY_SLUGS
+    cities = len(app.config.get('ITEKA_CITIES') or CITY_SLUGS)
+    runs = math.ceil(cities / max(1, app.config.get('ITEKA_CITIES_PER_RUN', 4)))
+    return ITEKA_SYNC_INTERVAL // max(1, runs)
+
+
+def _corpus_dirs():
+    with open(os.path.join(ROOT, 'config.yaml'), encoding='utf-8') as f:
+        data = yaml.safe_load(f)['data']
+    return os.path.join(ROOT, data['scraped_dir']), os.path.join(ROOT, data['docs_dir'])
+
+
+def rag_index_rebuild(app):
+    """
+    Run the knowledge pipeline (without scraping) in a subprocess. Stages
+    whose inputs did not change are skipped, so an unchanged corpus costs
+    a few file hashes. Workers serve the new generation after a restart.
+    """
+    if not any(os.path.isdir(d) and os.listdir(d) for d in _corpus_dirs()):
+        return 'skipped: no corpus'
+
+    # A subprocess keeps the embedding model and FAISS training memory out of the web worker
+    proc = subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'ai_engine', 'pipeline.py'), '--skip', 'scrape'],
+        cwd=os.path.join(ROOT, 'ai_engine'), capture_output=True, text=True,
+        timeout=INDEX_REBUILD_TIMEOUT,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"pipeline exited with {proc.returncode}: {proc.stdout[-500:]}{proc.stderr[-1000:]}")
+    return proc.stdout.strip().splitlines()[-1]
+
+
+def cache_warm(app):
+    """Pre-build medical context snapshots for users who chatted recently."""
+    from main.models import db, ChatMessage
+    from main.utils import medical_context
+
+    since = datetime.utcnow() - CACHE_WARM_WINDOW
+    user_ids = [uid for (uid,) in db.session.query(ChatMessage.user_id)
+                .filter(ChatMessage.created_at >= since)
+                .distinct().limit(CACHE_WARM_MAX_USERS)]
+    for user_id in user_ids:
+        medical_context.get_medical_context(user_id)
+    db.session.commit()
+    return f"{len(user_ids)} users"
+
+
+def price_retention(app):
+    from main.models import db
+    from main.utils import price_history
+    result = price_history.apply_retention(app.config)
+    db.session.commit()
+    return result
+
+
+def suggest_refresh(app):
+    from main.utils import med_suggest
+    return f"{med_suggest.refresh()} changed"
+
+
+def register_jobs(scheduler, app):
+    scheduler.register('iteka_sync', iteka_sync, _iteka_sync_interval(app), initial_delay=10,
+                       lease=30 * 60)
+    scheduler.register('rag_index_rebuild', rag_index_rebuild, INDEX_REBUILD_INTERVAL,
+                       initial_delay=60, lease=30 * 60)
+    scheduler.register('cache_warm', cache_warm, CACHE_WARM_INTERVAL, initial_delay=30,
+                       exclusive=False)
+    scheduler.register('price_retention', price_retention, PRICE_RETENTION_INTERVAL,
+                       initial_delay=120)
+    scheduler.register('suggest_refresh', suggest_refresh, SUGGEST_REFRESH_INTERVAL, initial_delay=20,
+                       exclusive=False)
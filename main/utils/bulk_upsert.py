@@ -0,0 +1,58 @@
+"""
+Batched INSERT ... ON CONFLICT for PostgreSQL and SQLite.
+
+    upsert(PharmacyStock, rows, ('pharmacy_id', 'medication_id'), update=('price', 'quantity'))
+
+Rows are plain dicts with the same keys. Each batch is one executemany
+that SQLAlchemy sends as multi-row VALUES statements, so N rows cost
+about N / batch_size round trips instead of a SELECT plus an INSERT or
+UPDATE per row. The conflict target must be backed by a unique
+constraint or index.
+"""
+import logging
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from main.models import db
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 2000
+KEY_CHUNK = 500      # values per IN (...) when preloading keys
+
+_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def _insert(model):
+    dialect = db.session.get_bind().dialect.name
+    try:
+        return _INSERTS[dialect](model.__table__)
+    except KeyError:
+        raise NotImplementedError(f"Bulk upsert is not supported on {dialect}")
+
+
+def upsert(model, rows, conflict, update=(), batch_size=BATCH_SIZE):
+    """
+    Insert `rows` into model's table; rows that hit the unique key
+    `conflict` update the `update` columns instead (or are skipped when
+    `update` is empty). Runs in the current session's transaction.
+    """
+    if not rows:
+        return
+    stmt = _insert(model)
+    if update:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(conflict),
+            set_={col: stmt.excluded[col] for col in update},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=list(conflict))
+
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(stmt, rows[start:start + batch_size])
+
+
+def chunks(values, size=KEY_CHUNK):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
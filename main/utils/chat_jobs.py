@@ -0,0 +1,133 @@
+"""
+Asynchronous chat jobs for the AI assistant.
+
+In job mode POST /assistant/api/chat stores a ChatJob row and returns its
+id at once; a local worker pool runs the RAG answer and writes the result
+back to the row. Clients poll GET /assistant/api/chat/jobs/<id> or
+subscribe to its SSE stream. Web workers are no longer tied up for the
+whole LLM call, and assistant throughput scales with CHAT_JOB_WORKERS.
+
+Jobs live in the database, so pending work survives a restart:
+resume_unfinished() (run by the server entry point, not on every import
+of main.app) re-queues pending jobs and running jobs whose worker went
+away. A job is
+claimed with a conditional UPDATE, so it runs once even when several
+processes resume the same table.
+"""
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from main.models import db, ChatJob
+
+logger = logging.getLogger(__name__)
+
+STALE_AFTER = timedelta(minutes=10)   # a 'running' job older than this is re-queued
+POLL_INTERVAL = 0.5                    # seconds, for jobs finished in another process
+
+_app = None
+_handler = None
+_executor = None
+_done_events = {}          # job_id -> threading.Event, for jobs run in this process
+_events_lock = threading.Lock()
+
+
+def init_app(app, handler):
+    """
+    Set up the worker pool that runs submitted jobs.
+
+    handler(app, user_id, conversation_id, message, idempotency_key) ->
+    response text; it runs inside an app context and persists the chat
+    messages itself.
+    """
+    global _app, _handler, _executor
+    _app = app
+    _handler = handler
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config.get('CHAT_JOB_WORKERS', 4),
+            thread_name_prefix='chat-job',
+        )
+
+
+def resume_unfinished():
+    """Re-queue pending and stale running jobs. Call inside an app context, after init_app."""
+    stale = datetime.utcnow() - STALE_AFTER
+    ChatJob.query.filter(
+        ChatJob.status == 'running', ChatJob.started_at < stale
+    ).update({'status': 'pending'}, synchronize_session=False)
+    db.session.commit()
+
+    pending = [job_id for (job_id,) in
+               db.session.query(ChatJob.id).filter_by(status='pending').order_by(ChatJob.created_at)]
+    db.session.commit()
+    for job_id in pending:
+        _enqueue(job_id)
+    if pending:
+        logger.info(f"Resumed {len(pending)} pending chat jobs")
+
+
+def _enqueue(job_id):
+    with _events_lock:
+        _done_events.setdefault(job_id, threading.Event())
+    _executor.submit(_run, job_id)
+
+
+def submit(user_id, conversation_id, message, idempotency_key=None):
+    """Persist a new job and queue it. Returns the job id."""
+    job = ChatJob(id=uuid.uuid4().hex, user_id=user_id, conversation_id=conversation_id,
+                  message=message, idempotency_key=idempotency_key, status='pending')
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.id
+    _enqueue(job_id)
+    return job_id
+
+
+def _run(job_id):
+    try:
+        with _app.app_context():
+            claimed = ChatJob.query.filter_by(id=job_id, status='pending').update(
+                {'status': 'running', 'started_at': datetime.utcnow()}, synchronize_session=False
+            )
+            db.session.commit()
+            if not claimed:
+                return  # another worker/process took it
+
+            job = db.session.get(ChatJob, job_id)
+            args = (job.user_id, job.conversation_id, job.message, job.idempotency_key)
+            db.session.commit()
+
+            try:
+                response = _handler(_app, *args)
+                result = {'status': 'done', 'response': response}
+            except Exception as e:
+                logger.error(f"Chat job {job_id} failed: {e}")
+                db.session.rollback()
+                result = {'status': 'failed', 'error': str(e)}
+
+            result['finished_at'] = datetime.utcnow()
+            ChatJob.query.filter_by(id=job_id).update(result, synchronize_session=False)
+            db.session.commit()
+    except Exception as e:
+        logger.error(f"Chat job {job_id} could not be processed: {e}")
+    finally:
+        with _events_lock:
+            event = _done_events.pop(job_id, None)
+        if event:
+            event.set()
+
+
+def wait(job_id, timeout):
+    """
+    Block until the job may have changed state or `timeout` passes.
+    Jobs run by this process wake the caller immediately; others are polled.
+    """
+    with _events_lock:
+        event = _done_events.get(job_id)
+    if event:
+        event.wait(timeout)
+    else:
+        threading.Event().wait(min(timeout, POLL_INTERVAL))
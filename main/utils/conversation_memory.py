@@ -0,0 +1,167 @@
+"""
+Rolling conversation memory for the AI assistant.
+
+Each ChatConversation keeps a compact `summary` of its older messages and
+`summary_message_count`, the number of messages already folded into it.
+A prompt carries that summary plus every message not yet folded in - the
+latest user/assistant turn, and more while the summary lags behind - so
+its size stays bounded however long the conversation grows.
+
+The summary is updated on a small shared executor after each assistant
+reply (LLM summary via groq_client, extractive fallback when no LLM
+answers); an update still waiting for a worker covers later replies too.
+"""
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from main.models import db, ChatConversation, ChatMessage
+
+logger = logging.getLogger(__name__)
+
+_app = None
+
+SUMMARY_MAX_CHARS = 1200
+LAST_TURN_MESSAGES = 2     # the latest user + assistant pair stays verbatim
+MESSAGE_MAX_CHARS = 300    # per verbatim message in the prompt
+SUMMARY_WORKERS = 2
+
+_ROLE_LABELS = {'user': 'Пациент', 'assistant': 'Ассистент'}
+
+
+def set_app(app):
+    """Set the Flask app for use in background threads"""
+    global _app
+    _app = app
+
+
+def _format(messages, limit=MESSAGE_MAX_CHARS):
+    lines = []
+    for m in messages:
+        content = m.content[:limit] + "..." if len(m.content) > limit else m.content
+        lines.append(f"{_ROLE_LABELS.get(m.role, m.role)}: {content}")
+    return "\n".join(lines)
+
+
+def build_history(conversation_id):
+    """
+    Prompt block with the conversation summary and the messages it does not
+    cover yet: the last turn, plus any the background update has not
+    folded in ('' if empty).
+    """
+    convo = db.session.get(ChatConversation, conversation_id)
+    if not convo:
+        return ""
+
+    total = ChatMessage.query.filter_by(conversation_id=conversation_id).count()
+    start = min(convo.summary_message_count or 0, max(total - LAST_TURN_MESSAGES, 0))
+    recent = ChatMessage.query.filter_by(
+        conversation_id=conversation_id
+    ).order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc()).offset(start).all()
+
+    parts = []
+    if convo.summary:
+        parts.append(f"Краткое содержание беседы:\n{convo.summary}")
+    if recent:
+        parts.append("Последние сообщения:\n" + _format(recent))
+    return "\n".join(parts)
+
+
+def extractive_summary(summary, messages, max_chars=SUMMARY_MAX_CHARS):
+    """
+    LLM-free fallback: append the first sentence of each new patient message
+    to the existing summary and keep the most recent `max_chars`.
+    """
+    points = []
+    for m in messages:
+        if m.role != 'user':
+            continue
+        first = re.split(r'(?<=[.!?])\s+', m.content.strip(), maxsplit=1)[0]
+        if first:
+            points.append(f"- {first[:200]}")
+    if not points:
+        return summary or ""
+
+    text = "\n".join(filter(None, [summary or "", *points]))
+    if len(text) <= max_chars:
+        return text
+    # Drop whole lines from the front so the newest context survives
+    lines = text.split("\n")
+    while lines and len("\n".join(lines)) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def update_summary(conversation_id):
+    """
+    Fold every message older than the last turn into the conversation summary.
+    Must run inside an app context. Returns True if the summary changed.
+    """
+    from main.utils.groq_client import summarize_conversation
+
+    convo = db.session.get(ChatConversation, conversation_id)
+    if not convo:
+        return False
+
+    done = convo.summary_message_count or 0
+    total = ChatMessage.query.filter_by(conversation_id=conversation_id).count()
+    upto = total - LAST_TURN_MESSAGES
+    if upto <= done:
+        return False
+
+    new_messages = ChatMessage.query.filter_by(
+        conversation_id=conversation_id
+    ).order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc()).offset(done).limit(upto - done).all()
+
+    summary = summarize_conversation(convo.summary or "", _format(new_messages, limit=1000),
+                                     max_chars=SUMMARY_MAX_CHARS)
+    if not summary:
+        summary = extractive_summary(convo.summary, new_messages)
+
+    # Compare-and-set on the counter: a concurrent update for the same
+    # conversation that got there first wins, ours is dropped.
+    counter = ChatConversation.summary_message_count
+    updated = ChatConversation.query.filter(
+        ChatConversation.id == conversation_id,
+        counter.is_(None) if convo.summary_message_count is None else counter == done,
+    ).update({'summary': summary, 'summary_message_count': upto}, synchronize_session=False)
+    db.session.commit()
+    return bool(updated)
+
+
+def _update_summary_bg(conversation_id):
+    try:
+        if not _app:
+            logger.error("Conversation memory: Flask app not set")
+            return
+        with _app.app_context():
+            update_summary(conversation_id)
+    except Exception as e:
+        logger.error(f"Conversation summary update failed for {conversation_id}: {e}")
+
+
+_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix='ConvoSummary')
+_pending = {}   # conversation id -> Future of its queued or running update
+_pending_lock = threading.Lock()
+
+
+def _forget(conversation_id, future):
+    with _pending_lock:
+        if _pending.get(conversation_id) is future:
+            del _pending[conversation_id]
+
+
+def schedule_summary_update(conversation_id):
+    """
+    Update the conversation summary on the shared executor; returns its
+    Future immediately. An update still queued for this conversation is
+    reused, since it will read the newest messages anyway.
+    """
+    with _pending_lock:
+        future = _pending.get(conversation_id)
+        if future is not None and not future.running() and not future.done():
+            return future
+        future = _pending[conversation_id] = _executor.submit(_update_summary_bg, conversation_id)
+    future.add_done_callback(lambda f: _forget(conversation_id, f))
+    return future
@@ -1,11 +1,15 @@
 """
 Groq LLM client for medical document analysis.
-Extracts structured lab values from medical text and generates health tips.
+Extracts structured lab values from medical text, generates health tips
+and condenses chat history into a rolling summary.
 """
 import os
 import json
 import logging
 
+from main.utils import llm_scheduler
+from main.utils.llm_scheduler import SchedulerSaturated, estimate_tokens
+
 logger = logging.getLogger(__name__)
 
 # Load .env from the project root (not the cwd) so the key is always found
@@ -82,6 +86,16 @@ Rules:
 6. For nutrition tips, mention specific foods
 7. If lab results are all normal, provide general wellness tips"""
 
+SUMMARY_PROMPT = """You maintain a short running memory of a conversation between a patient and a medical assistant.
+
+Current memory (may be empty):
+{summary}
+
+New messages:
+{transcript}
+
+Rewrite the memory so it also covers the new messages. Keep symptoms, durations, medications, allergies, diagnoses mentioned, advice already given and open questions. Drop greetings and repetition. Write in the language the patient uses, at most {max_chars} characters, plain text, no preamble."""
+
 
 def extract_lab_values(text):
     """Extract lab values from medical text using Groq LLM.
@@ -104,14 +118,16 @@ def extract_lab_values(text):
         client = Groq(api_key=GROQ_API_KEY)
         prompt = EXTRACTION_PROMPT.replace("{text}", text[:8000])
 
-        response = client.chat.completions.create(
-            model=os.environ.get('GROQ_MODEL', 'llama-3.3-70b-versatile'),
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
-            max_tokens=4000,
-            response_format={"type": "json_object"},
-            timeout=1.0,
-        )
+        with llm_scheduler.admit('groq', llm_scheduler.EXTRACTION, estimate_tokens(prompt, 4000)) as ticket:
+            response = client.chat.completions.create(
+                model=os.environ.get('GROQ_MODEL', 'llama-3.3-70b-versatile'),
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.1,
+                max_tokens=4000,
+                response_format={"type": "json_object"},
+                timeout=1.0,
+            )
+            ticket.used_tokens = _total_tokens(response)
 
         content = response.choices[0].message.content
     except Exception as e:
@@ -122,14 +138,25 @@ def extract_lab_values(text):
                 base_url="https://models.inference.ai.azure.com",
                 api_key=os.environ.get("GITHUB_TOKEN", "paste_your_github_token_here")
             )
-            fallback_response = github_fallback_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1,
-                max_tokens=4000,
-                response_format={"type": "json_object"},
-            )
+            with llm_scheduler.admit('github', llm_scheduler.EXTRACTION, estimate_tokens(prompt, 4000)):
+                fallback_response = github_fallback_client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.1,
+                    max_tokens=4000,
+                    response_format={"type": "json_object"},
+                )
             content = fallback_response.choices[0].message.content
+        except SchedulerSaturated as busy:
+            logger.warning(f"Lab extraction deferred: {busy}")
+            return {
+                "error": "AI service is busy, try again shortly.",
+                "error_ru": "Сервис ИИ перегружен, попробуйте чуть позже.",
+                "retry_after": busy.retry_after,
+                "lab_results": [],
+                "summary": "",
+                "summary_ru": "",
+            }
         except Exception as fallback_e:
             logger.error(f"GitHub extraction fallback failed: {fallback_e}")
             return {
@@ -232,14 +259,16 @@ def generate_health_tips(lab_results, metrics=None):
         client = Groq(api_key=GROQ_API_KEY)
         prompt = HEALTH_TIPS_PROMPT.replace("{lab_json}", lab_json).replace("{vitals_json}", vitals_json)
 
-        response = client.chat.completions.create(
-            model=os.environ.get('GROQ_MODEL', 'llama-3.3-70b-versatile'),
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-            max_tokens=3000,
-            response_format={"type": "json_object"},
-            timeout=1.0,
-        )
+        with llm_scheduler.admit('groq', llm_scheduler.TIPS, estimate_tokens(prompt, 3000)) as ticket:
+            response = client.chat.completions.create(
+                model=os.environ.get('GROQ_MODEL', 'llama-3.3-70b-versatile'),
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.3,
+                max_tokens=3000,
+                response_format={"type": "json_object"},
+                timeout=1.0,
+            )
+            ticket.used_tokens = _total_tokens(response)
 
         content = response.choices[0].message.content
     except Exception as e:
@@ -250,14 +279,18 @@ def generate_health_tips(lab_results, metrics=None):
                 base_url="https://models.inference.ai.azure.com",
                 api_key=os.environ.get("GITHUB_TOKEN", "paste_your_github_token_here")
             )
-            fallback_response = github_fallback_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=3000,
-                response_format={"type": "json_object"},
-            )
+            with llm_scheduler.admit('github', llm_scheduler.TIPS, estimate_tokens(prompt, 3000)):
+                fallback_response = github_fallback_client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.3,
+                    max_tokens=3000,
+                    response_format={"type": "json_object"},
+                )
             content = fallback_response.choices[0].message.content
+        except SchedulerSaturated as busy:
+            logger.warning(f"Health tips skipped: {busy}")
+            return {"tips": [], "error": str(busy), "retry_after": busy.retry_after}
         except Exception as fallback_e:
             logger.error(f"GitHub health tips fallback failed: {fallback_e}")
             return {"tips": [], "error": str(fallback_e)}
@@ -274,6 +307,67 @@ def generate_health_tips(lab_results, metrics=None):
         return {"tips": [], "error": str(e)}
 
 
+def summarize_conversation(summary, transcript, max_chars=1200):
+    """Fold new chat messages into a running conversation summary.
+
+    Args:
+        summary: current summary text ('' for a new conversation)
+        transcript: new messages as "Role: text" lines
+
+    Returns the updated summary, or '' if no LLM is reachable (callers
+    fall back to an extractive summary).
+    """
+    prompt = (SUMMARY_PROMPT
+              .replace("{summary}", summary or "—")
+              .replace("{transcript}", transcript[:6000])
+              .replace("{max_chars}", str(max_chars)))
+
+    content = None
+    if GROQ_AVAILABLE:
+        try:
+            from groq import Groq
+
+            client = Groq(api_key=GROQ_API_KEY)
+            with llm_scheduler.admit('groq', llm_scheduler.EXTRACTION, estimate_tokens(prompt, 600)) as ticket:
+                response = client.chat.completions.create(
+                    model='llama-3.1-8b-instant',
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.1,
+                    max_tokens=600,
+                    timeout=5.0,
+                )
+                ticket.used_tokens = _total_tokens(response)
+            content = response.choices[0].message.content
+        except Exception as e:
+            logger.warning(f"Groq summary failed or timed out ({e}). Switching to GitHub fallback.")
+
+    if content is None and os.environ.get("GITHUB_TOKEN"):
+        try:
+            from openai import OpenAI
+            github_fallback_client = OpenAI(
+                base_url="https://models.inference.ai.azure.com",
+                api_key=os.environ.get("GITHUB_TOKEN")
+            )
+            with llm_scheduler.admit('github', llm_scheduler.EXTRACTION, estimate_tokens(prompt, 600)):
+                fallback_response = github_fallback_client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.1,
+                    max_tokens=600,
+                )
+            content = fallback_response.choices[0].message.content
+        except Exception as fallback_e:
+            logger.error(f"GitHub summary fallback failed: {fallback_e}")
+
+    return (content or "").strip()[:max_chars]
+
+
+def _total_tokens(response):
+    """Tokens billed for a completion, if the provider reports usage."""
+    usage = getattr(response, 'usage', None)
+    return getattr(usage, 'total_tokens', None)
+
+
 def _compute_status(value, low, high):
     """Compute status from value and reference range."""
     if low is None or high is None:
@@ -0,0 +1,243 @@
+"""
+Concurrent HTTP fetcher for the i-teka.kz sync.
+
+One pooled keep-alive requests.Session is shared by a thread pool, so a
+sync reuses a handful of TLS connections instead of opening one per
+request. Each host gets a concurrency cap and a request-rate cap, and
+transient failures (connection errors, timeouts, 429 and 5xx) are retried
+with exponential backoff, honouring Retry-After.
+
+    fetcher = ItekaFetcher(workers=8, per_host=4, rate=4)
+    for result in fetcher.map(lambda term: search_medications(term, fetcher=fetcher), terms):
+        ...
+
+Record/replay: mode='record' stores every response as JSON in
+cassette_dir; mode='replay' serves responses from there without touching
+the network (optionally sleeping replay_latency seconds per request), so
+throughput can be benchmarked offline (scripts/bench_iteka_fetch.py).
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_BACKOFF = 30.0   # seconds
+MODES = ('live', 'record', 'replay')
+
+
+class CassetteMiss(requests.RequestException):
+    """Replay mode has no recorded response for the request."""
+
+
+class RecordedResponse:
+    """The parts of requests.Response the scraper uses, loaded from a cassette."""
+
+    def __init__(self, url, status_code, headers, text):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} for url: {self.url}", response=self)
+
+
+class _HostLimiter:
+    """At most `concurrency` requests in flight and `rate` request starts per second."""
+
+    def __init__(self, concurrency, rate):
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def __enter__(self):
+        self._slots.acquire()
+        if self._interval:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_start)
+                self._next_start = start + self._interval
+            if start > now:
+                time.sleep(start - now)
+        return self
+
+    def __exit__(self, *exc):
+        self._slots.release()
+        return False
+
+
+class ItekaFetcher:
+
+    def __init__(self, workers=8, per_host=4, rate=4.0, retries=3, backoff=0.5,
+                 timeout=15, mode='live', cassette_dir=None, replay_latency=0.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown fetch mode '{mode}'. Known: {list(MODES)}")
+        if mode != 'live' and not cassette_dir:
+            raise ValueError(f"Fetch mode '{mode}' needs a cassette_dir")
+        self.workers = workers
+        self.per_host = per_host
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.mode = mode
+        self.cassette_dir = cassette_dir
+        self.replay_latency = replay_latency
+
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": USER_AGENT})
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(workers, per_host))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._limiters = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'bytes': 0,
+                      'recorded': 0, 'replayed': 0}
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Build from the ITEKA_FETCH_* settings in main/config.py."""
+        return cls(
+            workers=cfg.get('ITEKA_FETCH_WORKERS', 8),
+            per_host=cfg.get('ITEKA_FETCH_PER_HOST', 4),
+            rate=cfg.get('ITEKA_FETCH_RATE', 4.0),
+            retries=cfg.get('ITEKA_FETCH_RETRIES', 3),
+            mode=cfg.get('ITEKA_FETCH_MODE', 'live'),
+            cassette_dir=cfg.get('ITEKA_CASSETTE_DIR') or None,
+        )
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _limiter(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = _HostLimiter(self.per_host, self.rate)
+        return limiter
+
+    # ── Cassettes ────────────────────────────────────────────────────────────
+
+    def _cassette_path(self, url, params, cookies):
+        full_url = requests.Request('GET', url, params=params).prepare().url
+        key = full_url + '|' + json.dumps(cookies or {}, sort_keys=True)
+        return os.path.join(self.cassette_dir, hashlib.sha1(key.encode('utf-8')).hexdigest()[:20] + '.json')
+
+    def _replay(self, path, url):
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            raise CassetteMiss(f"No recorded response for {url}")
+        self._count('replayed')
+        return RecordedResponse(data['url'], data['status'], data['headers'], data['text'])
+
+    def store(self, url, text, params=None, cookies=None, status=200, headers=None):
+        """Write a cassette entry (used by record mode, tests and synthetic benchmarks)."""
+        path = self._cassette_path(url, params, cookies)
+        os.makedirs(self.cassette_dir, exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'url': url, 'status': status, 'headers': dict(headers or {}), 'text': text},
+                      f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    # ── Requests ─────────────────────────────────────────────────────────────
+
+    def get(self, url, params=None, cookies=None, headers=None, timeout=None):
+        """
+        GET with per-host limits and retries. Returns the last response (the
+        caller decides on raise_for_status); raises the last RequestException
+        if every attempt failed at the connection level.
+        """
+        self._count('requests')
+        limiter = self._limiter(url)
+        if self.mode == 'replay':
+            with limiter:   # keep the per-host limits so offline throughput is realistic
+                if self.replay_latency:
+                    time.sleep(self.replay_latency)
+            return self._replay(self._cassette_path(url, params, cookies), url)
+
+        for attempt in range(self.retries + 1):
+            error = response = None
+            try:
+                with limiter:
+                    response = self.session.get(url, params=params, cookies=cookies, headers=headers,
+                                                timeout=timeout or self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+
+            retryable = error is not None or response.status_code in RETRY_STATUSES
+            if not retryable or attempt == self.retries:
+                break
+            self._count('retries')
+            delay = self._backoff_delay(attempt, response)
+            logger.info(f"i-teka fetch retry {attempt + 1}/{self.retries} for {url} in {delay:.1f}s "
+                        f"({error or response.status_code})")
+            time.sleep(delay)
+
+        if error is not None:
+            self._count('failures')
+            raise error
+        self._count('bytes', len(response.content))
+        if response.status_code >= 400:
+            self._count('failures')
+        # 304s answer a conditional request; a replayed plain GET must not get one
+        if self.mode == 'record' and response.status_code not in RETRY_STATUSES | {304}:
+            self.store(url, response.text, params, cookies, response.status_code, response.headers)
+            self._count('recorded')
+        return response
+
+    def _backoff_delay(self, attempt, response):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(MAX_BACKOFF, float(retry_after))
+        return min(MAX_BACKOFF, self.backoff * 2 ** attempt) * (0.5 + random.random() / 2)
+
+    def map(self, fn, items):
+        """fn(item) for every item on the worker pool; results in input order."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='iteka-fetch')
+        return self._pool.map(fn, items)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        self.session.close()
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_fetcher():
+    """Process-wide live fetcher used when the scraper is called without one."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = ItekaFetcher()
+        return _default
@@ -0,0 +1,132 @@
+"""
+Bulk ingestion of i-teka.kz sync results.
+
+sync_iteka_data stages everything a phase produced (medication names,
+pharmacies, per-pharmacy prices) and writes it with a handful of batched
+statements instead of a SELECT/INSERT/UPDATE per row:
+
+    ingest = StockIngest(category_id, city)
+    ingest.add_stock(med_name, pharmacy_name, address, price)
+    counts = ingest.flush()      # caller commits
+
+Existing keys are preloaded into dicts with chunked IN queries, new
+medications and pharmacies are inserted with ON CONFLICT DO NOTHING
+(pharmacies are keyed on name, address and city), and stocks are upserted on (pharmacy_id, medication_id). Their prices
+also go to the price history (main/utils/price_history.py).
+"""
+import logging
+from datetime import datetime
+
+from main.models import db, Medication, Pharmacy, PharmacyStock
+from main.utils import price_history
+from main.utils.bulk_upsert import upsert, chunks
+from main.utils.iteka_scraper import CITY_NAMES
+
+logger = logging.getLogger(__name__)
+
+
+class StockIngest:
+
+    def __init__(self, category_id, city):
+        self.category_id = category_id
+        self.city = city
+        self.city_names = CITY_NAMES.get(city, (city.capitalize(),) * 3)
+        self.medications = set()   # names
+        self.pharmacies = set()    # (name, address, city)
+        self.stocks = {}           # (pharmacy key, medication name) -> price
+        self.price_stats = {}      # medication name -> i-teka price_stats
+
+    def add_medication(self, name):
+        self.medications.add(name)
+
+    def add_stock(self, med_name, pharmacy_name, address, price):
+        # i-teka addresses carry no city: same name and street in two cities are two pharmacies
+        key = (pharmacy_name, address, self.city_names[0])
+        self.medications.add(med_name)
+        self.pharmacies.add(key)
+        self.stocks[(key, med_name)] = price    # last price on the page wins
+
+    def add_price_stats(self, med_name, stats):
+        if stats:
+            self.medications.add(med_name)
+            self.price_stats[med_name] = stats
+
+    # ── Key maps ─────────────────────────────────────────────────────────────
+
+    def _medication_ids(self):
+        ids = {}
+        for names in chunks(self.medications):
+            ids.update(db.session.query(Medication.name, Medication.id).filter(Medication.name.in_(names)))
+        return ids
+
+    def _pharmacy_ids(self):
+        ids = {}
+        for names in chunks({name for name, _, _ in self.pharmacies}):
+            rows = (db.session.query(Pharmacy.name, Pharmacy.address, Pharmacy.city, Pharmacy.id)
+                    .filter(Pharmacy.name.in_(names), Pharmacy.city == self.city_names[0]))
+            ids.update({(name, address, city): pid for name, address, city, pid in rows})
+        return ids
+
+    def _existing_stock_keys(self, med_ids):
+        keys = set()
+        for ids in chunks(med_ids):
+            keys.update(db.session.query(PharmacyStock.pharmacy_id, PharmacyStock.medication_id)
+                        .filter(PharmacyStock.medication_id.in_(ids)))
+        return keys
+
+    # ── Write ────────────────────────────────────────────────────────────────
+
+    def flush(self):
+        """Write staged rows in the current transaction. Returns new/updated counts."""
+        now = datetime.utcnow()
+        counts = {'medications_new': 0, 'pharmacies_new': 0, 'stocks_new': 0, 'stocks_updated': 0}
+
+        med_ids = self._medication_ids()
+        new_meds = sorted(self.medications - med_ids.keys())
+        upsert(Medication, [
+            {'name': name, 'category_id': self.category_id, 'is_otc': True,
+             'created_at': now, 'updated_at': now}
+            for name in new_meds
+        ], conflict=('name',))
+        if new_meds:
+            med_ids = self._medication_ids()
+        counts['medications_new'] = len(new_meds)
+
+        pharm_ids = self._pharmacy_ids()
+        new_pharms = sorted(self.pharmacies - pharm_ids.keys())
+        upsert(Pharmacy, [
+            {'name': name, 'name_ru': name, 'address': address,
+             'city': city, 'city_ru': self.city_names[1], 'city_kz': self.city_names[2],
+             'created_at': now, 'updated_at': now}
+            for name, address, city in new_pharms
+        ], conflict=('name', 'address', 'city'))
+        if new_pharms:
+            pharm_ids = self._pharmacy_ids()
+        counts['pharmacies_new'] = len(new_pharms)
+
+        existing = self._existing_stock_keys(set(med_ids.values()))
+        rows = []
+        for (pharm_key, med_name), price in self.stocks.items():
+            row = {'pharmacy_id': pharm_ids[pharm_key], 'medication_id': med_ids[med_name],
+                   'quantity': 1 if price else 0, 'price': price, 'currency': 'KZT',
+                   'last_restocked': now, 'created_at': now, 'updated_at': now}
+            if (row['pharmacy_id'], row['medication_id']) in existing:
+                counts['stocks_updated'] += 1
+            else:
+                counts['stocks_new'] += 1
+            rows.append(row)
+        upsert(PharmacyStock, rows, conflict=('pharmacy_id', 'medication_id'),
+               update=('price', 'quantity', 'updated_at'))
+        price_history.record(
+            {(row['pharmacy_id'], row['medication_id']): row['price'] for row in rows},
+            self.city_names[0],
+            {med_ids[name]: stats for name, stats in self.price_stats.items()},
+            now.date(),
+        )
+
+        logger.info(f"i-teka ingest: {counts}")
+        self.medications.clear()
+        self.pharmacies.clear()
+        self.stocks.clear()
+        self.price_stats.clear()
+        return counts
@@ -0,0 +1,242 @@
+"""
+HTML extraction for i-teka.kz pages with interchangeable parser backends.
+
+    parse_detail(html)   -> name, price statistics, pharmacies, characteristics, instruction sections
+    parse_search(html)   -> search result items (name, href, price text)
+
+Backends, fastest first:
+
+    selectolax   lexbor C parser (pip install selectolax)
+    lxml         BeautifulSoup on the lxml C parser
+    html.parser  BeautifulSoup on the pure-Python parser (always available)
+
+get_backend() picks ITEKA_HTML_PARSER if set, else the fastest installed
+one. All backends produce identical output; tests/test_iteka_parser.py
+checks them against saved pages in tests/fixtures/iteka.
+
+Instruction sections are read in one walk over the .instruction-full
+subtree: each <strong> starts a new heading and the text after it, up to
+the next <strong>, is its content.
+"""
+import logging
+import os
+import re
+
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+logger = logging.getLogger(__name__)
+
+_PRICE_RE = re.compile(r"([\d\s\u2009\u00a0]+)\s*тг")
+
+
+def _price(text):
+    """Integer tenge amount from text like 'от 1 200 тг.', or None."""
+    m = _PRICE_RE.search(text)
+    digits = re.sub(r"\D", "", m.group(1)) if m else ""
+    return int(digits) if digits else None
+
+
+# ── Backends ──────────────────────────────────────────────────────────────────
+#
+# A backend exposes the handful of DOM operations the extractors need:
+# parse, select, select_one, text, attr, and children() yielding
+# (tag name, node) pairs with tag None for text nodes.
+
+class Bs4Backend:
+
+    def __init__(self, features="html.parser"):
+        self.features = features
+        self.name = features
+
+    def parse(self, html):
+        return BeautifulSoup(html, self.features)
+
+    def select(self, node, css):
+        return node.select(css)
+
+    def select_one(self, node, css):
+        return node.select_one(css)
+
+    def text(self, node, separator=""):
+        return node.get_text(separator=separator, strip=True)
+
+    def attr(self, node, name):
+        return node.get(name, "")
+
+    def children(self, node):
+        for child in node.children:
+            if isinstance(child, Tag):
+                yield child.name, child
+            elif type(child) is NavigableString:   # not comments, CDATA, doctype
+                yield None, str(child)
+
+
+class SelectolaxBackend:
+    name = "selectolax"
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self._parser = LexborHTMLParser
+
+    def parse(self, html):
+        return self._parser(html)
+
+    def select(self, node, css):
+        return node.css(css)
+
+    def select_one(self, node, css):
+        return node.css_first(css)
+
+    def text(self, node, separator=""):
+        if not separator:
+            return node.text(deep=True, strip=True)
+        # node.text() keeps empty parts between separators; match bs4
+        parts = (n.text_content.strip() for n in node.traverse(include_text=True) if n.tag == "-text")
+        return separator.join(p for p in parts if p)
+
+    def attr(self, node, name):
+        return node.attributes.get(name) or ""
+
+    def children(self, node):
+        for child in node.iter(include_text=True):
+            if child.tag == "-text":
+                yield None, child.text_content
+            elif not child.tag.startswith(("-", "!")):   # comments, doctype
+                yield child.tag, child
+
+
+def _available():
+    """Installed backends, fastest first."""
+    backends = []
+    try:
+        backends.append(SelectolaxBackend())
+    except ImportError:
+        pass
+    try:
+        import lxml  # noqa: F401
+        backends.append(Bs4Backend("lxml"))
+    except ImportError:
+        pass
+    backends.append(Bs4Backend("html.parser"))
+    return backends
+
+
+BACKENDS = {b.name: b for b in _available()}
+_default = None
+
+
+def get_backend(name=None):
+    """Backend by name, else ITEKA_HTML_PARSER, else the fastest installed one."""
+    global _default
+    name = name or os.environ.get("ITEKA_HTML_PARSER")
+    if name:
+        if name not in BACKENDS:
+            raise ValueError(f"HTML parser backend '{name}' is not available. Installed: {list(BACKENDS)}")
+        return BACKENDS[name]
+    if _default is None:
+        _default = next(iter(BACKENDS.values()))
+        logger.info(f"i-teka HTML parser backend: {_default.name}")
+    return _default
+
+
+# ── Extraction ────────────────────────────────────────────────────────────────
+
+def _sections(b, root):
+    """{heading: content} from one walk over root; text before the first heading is dropped."""
+    sections = {}
+    heading, content = None, []
+
+    def flush():
+        if heading and content:
+            sections[heading] = " ".join(content)
+
+    def walk(node):
+        nonlocal heading, content
+        for tag, child in b.children(node):
+            if tag is None:
+                text = child.strip()
+                if text and heading is not None:
+                    content.append(text)
+            elif tag == "strong":
+                flush()
+                heading, content = b.text(child), []
+            elif tag not in ("script", "style"):
+                walk(child)
+
+    walk(root)
+    flush()
+    return sections
+
+
+def parse_detail(html, backend=None):
+    b = backend or get_backend()
+    doc = b.parse(html)
+
+    name_el = b.select_one(doc, ".container-drug-item .name")
+
+    price_stats = {}
+    stat_table = b.select_one(doc, ".price-statistic")
+    if stat_table:
+        for row in b.select(stat_table, "tr"):
+            text = b.text(row)
+            price_val = _price(text)
+            if "Самая низкая" in text and price_val is not None:
+                price_stats["min"] = price_val
+            elif "Самая высокая" in text and price_val is not None:
+                price_stats["max"] = price_val
+            elif "Средняя" in text and price_val is not None:
+                price_stats["avg"] = price_val
+            elif "Продают аптек" in text:
+                count_match = re.search(r"(\d+)", text)
+                if count_match:
+                    price_stats["pharmacy_count"] = int(count_match.group(1))
+
+    pharmacies = []
+    for row in b.select(doc, ".list-item.gtm_block_apteka"):
+        fields = {}
+        for field in ("title", "address", "status", "price"):
+            el = b.select_one(row, f".{field}")
+            fields[field] = b.text(el) if el else ""
+        if fields["title"]:
+            pharmacies.append({
+                "name": fields["title"],
+                "address": fields["address"],
+                "status": fields["status"],
+                "price": _price(fields["price"]),
+            })
+
+    characteristics = {}
+    feat_table = b.select_one(doc, ".feature-modal table")
+    if feat_table:
+        for tr in b.select(feat_table, "tr"):
+            cells = b.select(tr, "td")
+            if len(cells) >= 2:
+                characteristics[b.text(cells[0])] = b.text(cells[1])
+
+    instr_el = b.select_one(doc, ".instruction-full")
+
+    return {
+        "name": b.text(name_el) if name_el else None,
+        "price_stats": price_stats,
+        "pharmacies": pharmacies,
+        "characteristics": characteristics,
+        "instruction_sections": _sections(b, instr_el) if instr_el else {},
+    }
+
+
+def parse_search(html, backend=None):
+    b = backend or get_backend()
+    doc = b.parse(html)
+    items = []
+    for item in b.select(doc, ".multi-item"):
+        link = b.select_one(item, "a[href*=medicaments]")
+        name_el = b.select_one(item, ".multi-content a")
+        if not link or not name_el:
+            continue
+        price_el = b.select_one(item, ".multi-price")
+        items.append({
+            "name": b.text(name_el),
+            "href": b.attr(link, "href"),
+            "price_text": b.text(price_el) if price_el else "",
+        })
+    return items
@@ -2,24 +2,52 @@
 Batch scraper for i-teka.kz — Kazakhstan pharmacy price aggregator.
 
 Fetches medication data and stores it in the local database.
-Designed to run periodically (every 12 hours) via scheduler.
+Designed to run periodically via scheduler: each run syncs the next few
+cities (every city is refreshed every 12 hours). Pages are fetched
+concurrently through a pooled, rate-limited ItekaFetcher
+(main/utils/iteka_fetcher.py) shared by all cities of a run.
 
 Provides:
     sync_iteka_data(app) — main entry point: scrape and upsert DB records
     search_medications(query, city) — search via JSON API
     get_medication_detail(slug, city) — per-pharmacy pricing from HTML
+HTML is parsed by main/utils/iteka_parser.py (selectolax/lxml when installed).
+
+Change detection: the sync keeps per-URL validators in the fetch_states
+table (ETag / Last-Modified when the server sends them, and always a hash
+of the relevant part of the page). Pages that come back 304 or hash the
+same as last time are reported as unchanged and are neither parsed nor
+written to the DB.
+
+Medication names come from the search phase, run once per sync (search
+results do not depend on the city); pharmacies and stock come from the
+per-city detail phase. Progress is checkpointed per city, and for the
+search phase (iteka_sync_checkpoints table): a round interrupted by a
+crash or deploy continues from the last written batch of pages instead
+of starting over, and a lease keeps two processes from syncing the same
+city.
 """
 
+import hashlib
+import json
 import logging
+import os
 import re
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import requests
-from bs4 import BeautifulSoup
+
+from main.utils import iteka_parser
+from main.utils.iteka_fetcher import ItekaFetcher, default_fetcher
 
 logger = logging.getLogger(__name__)
 
 _TIMEOUT = 15
+_DETAIL_TIMEOUT = 20
 _BASE = "https://i-teka.kz"
-_UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
 
 CITY_SLUGS = {
     "almaty": "almaty",
@@ -48,6 +76,34 @@ CITY_SLUGS = {
     "zhetysai": "zhetysai",
 }
 
+# i-teka slug -> (city, city_ru, city_kz) as stored on Pharmacy rows
+CITY_NAMES = {
+    "almaty": ("Almaty", "Алматы", "Алматы"),
+    "astana": ("Astana", "Астана", "Астана"),
+    "shymkent": ("Shymkent", "Шымкент", "Шымкент"),
+    "karaganda": ("Karaganda", "Караганда", "Қарағанды"),
+    "aktobe": ("Aktobe", "Актобе", "Ақтөбе"),
+    "atyrau": ("Atyrau", "Атырау", "Атырау"),
+    "aktau": ("Aktau", "Актау", "Ақтау"),
+    "pavlodar": ("Pavlodar", "Павлодар", "Павлодар"),
+    "kostanai": ("Kostanay", "Костанай", "Қостанай"),
+    "semei": ("Semey", "Семей", "Семей"),
+    "oral": ("Oral", "Уральск", "Орал"),
+    "taldykorgan": ("Taldykorgan", "Талдыкорган", "Талдықорған"),
+    "kokshetau": ("Kokshetau", "Кокшетау", "Көкшетау"),
+    "kyzylorda": ("Kyzylorda", "Кызылорда", "Қызылорда"),
+    "taraz": ("Taraz", "Тараз", "Тараз"),
+    "petropavlovsk": ("Petropavl", "Петропавловск", "Петропавл"),
+    "temirtau": ("Temirtau", "Темиртау", "Теміртау"),
+    "turkestan": ("Turkestan", "Туркестан", "Түркістан"),
+    "ekibastuz": ("Ekibastuz", "Экибастуз", "Екібастұз"),
+    "rudny": ("Rudny", "Рудный", "Рудный"),
+    "zhanaozen": ("Zhanaozen", "Жанаозен", "Жаңаөзен"),
+    "balkhash": ("Balkhash", "Балхаш", "Балқаш"),
+    "jezkazgan": ("Zhezkazgan", "Жезказган", "Жезқазған"),
+    "zhetysai": ("Zhetysai", "Жетысай", "Жетісай"),
+}
+
 # Common medication search terms for batch scraping
 SEARCH_TERMS = [
     "парацетамол", "ибупрофен", "аспирин", "амоксициллин", "цефтриаксон",
@@ -63,57 +119,100 @@ SEARCH_TERMS = [
 ]
 
 
-def _session() -> requests.Session:
-    s = requests.Session()
-    s.headers.update({"User-Agent": _UA})
-    return s
+# Markup that changes between requests without the data changing
+_VOLATILE_RE = re.compile(
+    r"<script\b.*?</script>|<style\b.*?</style>|<!--.*?-->|<input\b[^>]*>|<meta\b[^>]*>",
+    re.S | re.I,
+)
+
+
+def search_state_key(query: str, city: str) -> str:
+    """fetch_states key of a search (the city travels in a cookie, not the URL)."""
+    return f"{_BASE}/global-search/run?query={query}&city={city}"
+
+
+def detail_url(slug: str, city: str) -> str:
+    return f"{_BASE}/{city}/medicaments/{slug}"
+
 
+def _detail_fragment(html: str) -> str:
+    """Drug card and pharmacy list, without header chrome, scripts, tokens and whitespace noise."""
+    start = html.find("container-drug-item")
+    body = html[start:] if start >= 0 else html
+    return re.sub(r"\s+", " ", _VOLATILE_RE.sub("", body))
 
-def search_medications(query: str, city: str = "almaty") -> dict:
-    """Search medications via i-teka.kz global search API."""
+
+def _conditional_get(fetcher, url, state, fragment, **kwargs):
+    """
+    GET with the validators stored in `state` (a fetch_states row as dict).
+
+    Returns (response, validators, unchanged): response is None and
+    unchanged is "not_modified" (HTTP 304) or "same_hash" when the page
+    has not changed since `state` was saved.
+    """
+    headers = {}
+    if state:
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+
+    r = fetcher.get(url, headers=headers or None, **kwargs)
+    if r.status_code == 304 and state:
+        return None, state, "not_modified"
+    r.raise_for_status()
+
+    validators = {
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "content_hash": hashlib.sha256(fragment(r.text).encode("utf-8")).hexdigest(),
+    }
+    if state and state.get("content_hash") == validators["content_hash"]:
+        return None, validators, "same_hash"
+    return r, validators, None
+
+
+def search_medications(query: str, city: str = "almaty", fetcher: ItekaFetcher = None,
+                       state: dict = None) -> dict:
+    """Search medications via i-teka.kz global search API.
+
+    With `state` (saved validators) an unchanged response returns
+    {"ok": True, "unchanged": <reason>, "results": []} without parsing.
+    """
     city = city.lower()
     if city not in CITY_SLUGS:
         city = "almaty"
 
     try:
-        s = _session()
-        s.cookies.set("new_city_id", city, domain="i-teka.kz")
-
-        r = s.get(
+        r, validators, unchanged = _conditional_get(
+            fetcher or default_fetcher(),
             f"{_BASE}/global-search/run",
+            state,
+            lambda text: text,
             params={"query": query},
+            cookies={"new_city_id": city},
             timeout=_TIMEOUT,
         )
-        r.raise_for_status()
+        if unchanged:
+            return {"ok": True, "unchanged": unchanged, "validators": validators, "results": [], "error": None}
         data = r.json()
 
         if not data.get("result") or not data.get("data", {}).get("status"):
-            return {"ok": True, "results": [], "error": None}
-
-        soup = BeautifulSoup(data["data"]["html"], "html.parser")
-        items = soup.select(".multi-item")
+            return {"ok": True, "unchanged": None, "validators": validators, "results": [], "error": None}
 
         results = []
-        for item in items:
-            link = item.select_one("a[href*=medicaments]")
-            name_el = item.select_one(".multi-content a")
-            price_el = item.select_one(".multi-price")
-
-            if not link or not name_el:
-                continue
-
-            href = link.get("href", "")
-            slug_match = re.search(r"/medicaments/([^?]+)", href)
+        for item in iteka_parser.parse_search(data["data"]["html"]):
+            slug_match = re.search(r"/medicaments/([^?]+)", item["href"])
             slug = slug_match.group(1) if slug_match else ""
 
             results.append({
-                "name": name_el.get_text(strip=True),
-                "price_text": price_el.get_text(strip=True) if price_el else "",
+                "name": item["name"],
+                "price_text": item["price_text"],
                 "slug": slug,
                 "url": f"{_BASE}/{city}/medicaments/{slug}",
             })
 
-        return {"ok": True, "results": results, "error": None}
+        return {"ok": True, "unchanged": None, "validators": validators, "results": results, "error": None}
 
     except requests.RequestException as e:
         return {"ok": False, "results": [], "error": str(e)}
@@ -121,85 +220,31 @@ def search_medications(query: str, city: str = "almaty") -> dict:
         return {"ok": False, "results": [], "error": f"Parse error: {e}"}
 
 
-def get_medication_detail(slug: str, city: str = "almaty") -> dict:
-    """Get detailed medication info with per-pharmacy pricing."""
+def get_medication_detail(slug: str, city: str = "almaty", fetcher: ItekaFetcher = None,
+                          state: dict = None) -> dict:
+    """Get detailed medication info with per-pharmacy pricing.
+
+    With `state` (saved validators) an unchanged page returns
+    {"ok": True, "unchanged": <reason>, "medication": None} without parsing.
+    """
     city = city.lower()
     if city not in CITY_SLUGS:
         city = "almaty"
 
     try:
-        s = _session()
-        r = s.get(f"{_BASE}/{city}/medicaments/{slug}", timeout=20)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "html.parser")
-
-        name_el = soup.select_one(".container-drug-item .name")
-        med_name = name_el.get_text(strip=True) if name_el else slug
-
-        price_stats = {}
-        stat_table = soup.select_one(".price-statistic")
-        if stat_table:
-            rows = stat_table.select("tr")
-            for row in rows:
-                text = row.get_text(strip=True)
-                price_match = re.search(r"([\d\s\u2009\u00a0]+)\s*тг", text)
-                price_val = re.sub(r'\D', '', price_match.group(1)) if price_match else None
-                if "Самая низкая" in text and price_val:
-                    price_stats["min"] = int(price_val)
-                elif "Самая высокая" in text and price_val:
-                    price_stats["max"] = int(price_val)
-                elif "Средняя" in text and price_val:
-                    price_stats["avg"] = int(price_val)
-                elif "Продают аптек" in text:
-                    count_match = re.search(r"(\d+)", text)
-                    if count_match:
-                        price_stats["pharmacy_count"] = int(count_match.group(1))
-
-        pharmacies = []
-        rows = soup.select(".list-item.gtm_block_apteka")
-        for row in rows:
-            title_el = row.select_one(".title")
-            addr_el = row.select_one(".address")
-            status_el = row.select_one(".status")
-            price_el = row.select_one(".price")
-
-            pharmacy_name = title_el.get_text(strip=True) if title_el else ""
-            address = addr_el.get_text(strip=True) if addr_el else ""
-            status = status_el.get_text(strip=True) if status_el else ""
-
-            price = None
-            if price_el:
-                pm = re.search(r"([\d\s\u2009\u00a0]+)\s*тг", price_el.get_text(strip=True))
-                if pm:
-                    price = int(re.sub(r'\D', '', pm.group(1)))
-
-            if pharmacy_name:
-                pharmacies.append({
-                    "name": pharmacy_name,
-                    "address": address,
-                    "status": status,
-                    "price": price,
-                })
-
-        # --- Characteristics table (from .feature-modal) ---
-        characteristics = {}
-        feat_table = soup.select_one(".feature-modal table")
-        if feat_table:
-            for tr in feat_table.find_all("tr"):
-                cells = tr.find_all("td")
-                if len(cells) >= 2:
-                    characteristics[cells[0].get_text(strip=True)] = cells[1].get_text(strip=True)
-
-        # --- Instruction sections (from .instruction-full) ---
-        instruction_sections = {}
-        instr_el = soup.select_one(".instruction-full")
-        if instr_el:
-            parts = re.split(r"<strong[^>]*>(.*?)</strong>", str(instr_el))
-            for i in range(1, len(parts) - 1, 2):
-                heading = BeautifulSoup(parts[i], "html.parser").get_text(strip=True)
-                content = BeautifulSoup(parts[i + 1], "html.parser").get_text(separator=" ", strip=True)
-                if heading and content:
-                    instruction_sections[heading] = content
+        r, validators, unchanged = _conditional_get(
+            fetcher or default_fetcher(), detail_url(slug, city), state, _detail_fragment,
+            timeout=_DETAIL_TIMEOUT,
+        )
+        if unchanged:
+            return {"ok": True, "unchanged": unchanged, "validators": validators, "medication": None,
+                    "slug": slug, "pharmacies": [], "price_stats": {}, "error": None}
+        page = iteka_parser.parse_detail(r.text)
+        med_name = page["name"] or slug
+        price_stats = page["price_stats"]
+        pharmacies = page["pharmacies"]
+        characteristics = page["characteristics"]
+        instruction_sections = page["instruction_sections"]
 
         # Map to structured fields
         med_info = _extract_med_info(characteristics, instruction_sections)
@@ -213,6 +258,8 @@ def get_medication_detail(slug: str, city: str = "almaty") -> dict:
             "price_stats": price_stats,
             "pharmacies": pharmacies,
             "med_info": med_info,
+            "unchanged": None,
+            "validators": validators,
             "error": None,
         }
 
@@ -330,18 +377,268 @@ _POPULAR_SLUGS = [
 ]
 
 
-def sync_iteka_data(app, max_details_per_term=0):
+_CHECKPOINT_LEASE = timedelta(minutes=30)
+_PHASES = ("search", "detail")
+
+# Search results only carry medication names, so one city's search serves
+# all; its checkpoint row sits beside the cities' under this key
+SEARCH_SHARD = "global-search"
+_SEARCH_CITY = "almaty"
+
+# City shards fetch side by side; their DB writes take turns
+_write_lock = threading.Lock()
+
+
+def _new_stats() -> dict:
+    return {"fetched": 0, "unchanged": 0, "updated": 0, "failed": 0}
+
+
+def _add_stats(total: dict, counts: dict) -> None:
+    for key, value in counts.items():
+        total[key] = total.get(key, 0) + value
+
+
+def _fetch_state_rows(states: dict, now) -> list:
+    return [
+        {"url": key, "etag": v.get("etag"), "last_modified": v.get("last_modified"),
+         "content_hash": v.get("content_hash"), "checked_at": now, "changed_at": now}
+        for key, v in states.items()
+    ]
+
+
+def _write_phase(db, ingest, new_states: dict, phase: dict, unchanged_keys=(), checkpoint=None) -> dict:
+    """
+    Flush a batch of staged rows together with the validators of its pages
+    and the city checkpoint, in one transaction: if the write fails, the
+    pages count as failed and are fetched in full next time.
+    """
+    from main.models import FetchState, ItekaSyncCheckpoint
+    from main.utils.bulk_upsert import upsert
+
+    try:
+        now = datetime.utcnow()
+        counts = ingest.flush()
+        upsert(FetchState, _fetch_state_rows(new_states, now), conflict=("url",),
+               update=("etag", "last_modified", "content_hash", "checked_at", "changed_at"))
+        if unchanged_keys:
+            FetchState.query.filter(FetchState.url.in_(unchanged_keys)).update(
+                {"checked_at": now}, synchronize_session=False
+            )
+        if checkpoint:
+            city, owner = checkpoint.pop("city"), checkpoint.pop("owner")
+            ItekaSyncCheckpoint.query.filter_by(city=city, lease_owner=owner).update(
+                dict(checkpoint, updated_at=now, lease_expires_at=now + _CHECKPOINT_LEASE),
+                synchronize_session=False,
+            )
+        db.session.commit()
+        return counts
+    except Exception as e:
+        logger.error(f"i-teka sync write failed: {e}")
+        print(f"  ERROR: {e}")
+        db.session.rollback()
+        phase["failed"] += phase["updated"]
+        phase["updated"] = 0
+        return {}
+
+
+# ── City shards ──────────────────────────────────────────────────────────────
+
+def due_cities(cities: list, limit: int) -> list:
+    """
+    The `limit` cities to sync next: rounds interrupted by a crash first,
+    then cities never synced, then the least recently completed.
+    """
+    from main.models import ItekaSyncCheckpoint
+
+    rows = {row.city: row for row in ItekaSyncCheckpoint.query.filter(ItekaSyncCheckpoint.city.in_(cities))}
+
+    def order(city):
+        row = rows.get(city)
+        if row is None:
+            return (1, datetime.min)
+        return (0 if row.phase in _PHASES else 1, row.completed_at or datetime.min)
+
+    return sorted(cities, key=order)[:limit]
+
+
+def _claim_city(db, city: str, owner: str) -> bool:
+    """Take the city's (or SEARCH_SHARD's) checkpoint lease unless another live process holds it."""
+    from sqlalchemy import or_
+    from main.models import ItekaSyncCheckpoint
+    from main.utils.bulk_upsert import upsert
+
+    now = datetime.utcnow()
+    upsert(ItekaSyncCheckpoint, [{"city": city, "position": 0}], conflict=("city",))
+    claimed = ItekaSyncCheckpoint.query.filter(
+        ItekaSyncCheckpoint.city == city,
+        or_(ItekaSyncCheckpoint.lease_owner.is_(None),
+            ItekaSyncCheckpoint.lease_owner == owner,
+            ItekaSyncCheckpoint.lease_expires_at < now),
+    ).update({"lease_owner": owner, "lease_expires_at": now + _CHECKPOINT_LEASE},
+             synchronize_session=False)
+    db.session.commit()
+    return bool(claimed)
+
+
+def _stage_search(ingest, result) -> bool:
+    for item in result["results"]:
+        med_name = _clean_med_name(item.get("name", ""))
+        if med_name:
+            ingest.add_medication(med_name)
+    return True
+
+
+def _stage_detail(ingest, detail) -> bool:
+    if not detail.get("medication"):
+        return False
+    med_name = _clean_med_name(detail["medication"])
+    ingest.add_medication(med_name)
+    ingest.add_price_stats(med_name, detail.get("price_stats"))
+    for pharm_data in detail.get("pharmacies", []):
+        pharm_name = pharm_data.get("name", "").strip()
+        if pharm_name:
+            ingest.add_stock(med_name, pharm_name, pharm_data.get("address", "").strip(),
+                             pharm_data.get("price"))
+    return True
+
+
+def _sync_shard(app, shard: str, city: str, work: dict, category_id, owner: str, batch_size: int, fetcher):
+    """
+    One full round of the phases in `work` ({phase: (items, key_of, fetch,
+    stage)}, in order) under the checkpoint row `shard`.
+
+    Pages are fetched `batch_size` at a time; each batch is written with
+    the checkpoint (phase, pages done, counts so far) in one transaction,
+    so after a crash the round continues from the last written batch.
+    Returns (page counts, new row counts), or None if another process
+    holds the shard.
+    """
+    from main.models import db, FetchState, ItekaSyncCheckpoint
+    from main.utils.iteka_ingest import StockIngest
+
+    phases = list(work)
+    totals = {}
+
+    with app.app_context():
+        with _write_lock:
+            if not _claim_city(db, shard, owner):
+                logger.info(f"i-teka sync: {shard} is being synced by another process, skipping")
+                return None
+            cp = db.session.get(ItekaSyncCheckpoint, shard)
+            if cp.phase in phases:
+                stats = json.loads(cp.stats) if cp.stats else {name: _new_stats() for name in phases}
+                start_phase, start_pos = cp.phase, cp.position or 0
+                print(f"[{shard}] resuming at {start_phase} {start_pos}")
+            else:
+                stats = {name: _new_stats() for name in phases}
+                start_phase, start_pos = phases[0], 0
+                cp.phase, cp.position, cp.stats = start_phase, 0, json.dumps(stats)
+                cp.round_started_at = datetime.utcnow()
+            db.session.commit()
+
+        try:
+            ingest = StockIngest(category_id, city)
+            for name in phases[phases.index(start_phase):]:
+                items, key_of, fetch, stage = work[name]
+                start = start_pos if name == start_phase else 0
+                for offset in range(start, len(items), batch_size):
+                    batch = items[offset:offset + batch_size]
+                    keys = {item: key_of(item) for item in batch}
+                    # Validators from the previous sync, as plain dicts for the fetch threads
+                    states = {
+                        row.url: row.validators()
+                        for row in FetchState.query.filter(FetchState.url.in_(list(keys.values())))
+                    }
+                    db.session.commit()
+
+                    results = fetcher.map(lambda item: fetch(item, states.get(keys[item])), batch)
+                    counts, new_states, unchanged_keys = _new_stats(), {}, []
+                    for item, result in zip(batch, results):
+                        counts["fetched"] += 1
+                        if not result.get("ok"):
+                            counts["failed"] += 1
+                        elif result.get("unchanged"):
+                            counts["unchanged"] += 1
+                            unchanged_keys.append(keys[item])
+                        elif stage(ingest, result):
+                            new_states[keys[item]] = result["validators"]
+                            counts["updated"] += 1
+                        else:
+                            counts["failed"] += 1
+
+                    done = dict(stats, **{name: dict(stats[name])})
+                    _add_stats(done[name], counts)
+                    with _write_lock:
+                        written = _write_phase(db, ingest, new_states, counts, unchanged_keys, checkpoint={
+                            "city": shard, "owner": owner, "phase": name,
+                            "position": offset + len(batch), "stats": json.dumps(done),
+                        })
+                    _add_stats(stats[name], counts)
+                    _add_stats(totals, written)
+                    print(f"[{shard}] {name} {offset + len(batch)}/{len(items)}: {counts}")
+
+            with _write_lock:
+                ItekaSyncCheckpoint.query.filter_by(city=shard, lease_owner=owner).update({
+                    "phase": "done", "position": 0, "stats": json.dumps(stats),
+                    "completed_at": datetime.utcnow(), "updated_at": datetime.utcnow(),
+                }, synchronize_session=False)
+                db.session.commit()
+        finally:
+            # Keep phase/position (an unfinished round resumes), give up the lease
+            with _write_lock:
+                db.session.rollback()
+                ItekaSyncCheckpoint.query.filter_by(city=shard, lease_owner=owner).update(
+                    {"lease_owner": None, "lease_expires_at": None}, synchronize_session=False
+                )
+                db.session.commit()
+
+    return stats, totals
+
+
+def _sync_search(app, fetcher: ItekaFetcher, category_id, owner: str, batch_size: int):
+    """Medication names from every search term; they are the same in every city, so searched in one."""
+    work = {
+        "search": (SEARCH_TERMS, lambda term: search_state_key(term, _SEARCH_CITY),
+                   lambda term, state: search_medications(term, _SEARCH_CITY, fetcher, state), _stage_search),
+    }
+    return _sync_shard(app, SEARCH_SHARD, _SEARCH_CITY, work, category_id, owner, batch_size, fetcher)
+
+
+def _sync_city(app, city: str, fetcher: ItekaFetcher, category_id, owner: str, batch_size: int):
+    """Pharmacies, stock and prices of a city from the popular detail pages."""
+    work = {
+        "detail": (_POPULAR_SLUGS, lambda slug: detail_url(slug, city),
+                   lambda slug, state: get_medication_detail(slug, city, fetcher, state), _stage_detail),
+    }
+    return _sync_shard(app, city, city, work, category_id, owner, batch_size, fetcher)
+
+
+def sync_iteka_data(app, max_details_per_term=0, fetcher: ItekaFetcher = None, cities: list = None):
     """Batch-sync medication data from i-teka.kz into the local database.
 
-    Phase 1: Search API (fast) — adds medication names from all search terms.
-    Phase 2: Detail pages (slow) — fetches pharmacy data for popular slugs only.
+    Phase 1: Search API (fast) — adds medication names from all search
+             terms, once per run (names do not depend on the city).
+    Phase 2: Detail pages (slow) — per city, fetches pharmacy data for
+             popular slugs only.
+
+    `cities` defaults to the ITEKA_CITIES_PER_RUN most due of ITEKA_CITIES
+    (all of CITY_SLUGS when unset), so successive scheduler runs rotate
+    through every city. Up to ITEKA_SYNC_SHARDS cities run at once; they
+    share `fetcher` (default: built from the ITEKA_FETCH_* config), whose
+    per-host cap and rate limit therefore bound the total request rate.
+    Progress is checkpointed per city and for the search phase
+    (iteka_sync_checkpoints, SEARCH_SHARD) every
+    ITEKA_CHECKPOINT_PAGES pages and rows are written in bulk
+    (main/utils/iteka_ingest.py); pages unchanged since the last sync are
+    skipped. Returns per-phase fetched/unchanged/updated/failed page counts
+    (detail summed over the synced cities), and per city under "cities".
     """
-    from main.models import db, Medication, Pharmacy, PharmacyStock, MedicationCategory
+    from main.models import db, MedicationCategory
 
-    city = "almaty"
-    seen_names = set()
-    total_meds = 0
-    total_stocks = 0
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = ItekaFetcher.from_config(app.config)
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
 
     with app.app_context():
         # Get or create a category for i-teka medications
@@ -350,108 +647,44 @@ def sync_iteka_data(app, max_details_per_term=0):
             iteka_cat = MedicationCategory(name="i-teka.kz", name_ru="i-teka.kz", name_kz="i-teka.kz")
             db.session.add(iteka_cat)
             db.session.commit()
+        category_id = iteka_cat.id
 
-        # ---- Phase 1: Fast search to populate medication names ----
-        print("=== Phase 1: Searching medication names ===")
-        for idx, term in enumerate(SEARCH_TERMS, 1):
-            try:
-                print(f"[{idx}/{len(SEARCH_TERMS)}] {term}...", end=" ")
-                result = search_medications(term, city)
-                if not result.get("ok") or not result.get("results"):
-                    print("0 results")
-                    continue
-
-                count = 0
-                for item in result["results"]:
-                    med_name = _clean_med_name(item.get("name", ""))
-                    if not med_name or med_name in seen_names:
-                        continue
-                    seen_names.add(med_name)
-
-                    if not Medication.query.filter_by(name=med_name).first():
-                        price = _parse_price_text(item.get("price_text", ""))
-                        db.session.add(Medication(
-                            name=med_name,
-                            category_id=iteka_cat.id,
-                            is_otc=True,
-                        ))
-                        total_meds += 1
-                        count += 1
+        if cities is None:
+            configured = [c for c in app.config.get("ITEKA_CITIES") or CITY_SLUGS if c in CITY_SLUGS]
+            cities = due_cities(configured, app.config.get("ITEKA_CITIES_PER_RUN", 4))
+        db.session.commit()
 
-                db.session.commit()
-                print(f"{len(result['results'])} found, {count} new")
+    cities = [c.lower() for c in cities if c.lower() in CITY_SLUGS]
+    shards = max(1, min(app.config.get("ITEKA_SYNC_SHARDS", 1), len(cities)))
+    batch_size = max(1, app.config.get("ITEKA_CHECKPOINT_PAGES", 10))
+    print(f"=== i-teka sync: {', '.join(cities)} ({shards} at a time) ===")
 
-            except Exception as e:
-                print(f"ERROR: {e}")
-                db.session.rollback()
-
-        # ---- Phase 2: Detail pages for popular medications ----
-        print(f"\n=== Phase 2: Fetching pharmacy data for {len(_POPULAR_SLUGS)} popular medications ===")
-        for idx, slug in enumerate(_POPULAR_SLUGS, 1):
-            try:
-                print(f"[{idx}/{len(_POPULAR_SLUGS)}] {slug}...", end=" ")
-                detail = get_medication_detail(slug, city)
-                if not detail.get("ok") or not detail.get("medication"):
-                    print("FAILED")
-                    continue
-
-                med_name = _clean_med_name(detail["medication"])
-                pharmacies = detail.get("pharmacies", [])
-                print(f"{med_name} ({len(pharmacies)} pharmacies)")
-
-                # Upsert Medication
-                med = Medication.query.filter_by(name=med_name).first()
-                if not med:
-                    med = Medication(name=med_name, category_id=iteka_cat.id, is_otc=True)
-                    db.session.add(med)
-                    db.session.flush()
-                    total_meds += 1
-
-                # Process pharmacies
-                for pharm_data in pharmacies:
-                    pharm_name = pharm_data.get("name", "").strip()
-                    pharm_addr = pharm_data.get("address", "").strip()
-                    if not pharm_name:
-                        continue
-
-                    # Upsert Pharmacy by name + address
-                    pharm = Pharmacy.query.filter_by(name=pharm_name, address=pharm_addr).first()
-                    if not pharm:
-                        pharm = Pharmacy(
-                            name=pharm_name,
-                            name_ru=pharm_name,
-                            address=pharm_addr,
-                            city=city.capitalize(),
-                            city_ru=city.capitalize(),
-                        )
-                        db.session.add(pharm)
-                        db.session.flush()
-
-                    # Upsert PharmacyStock
-                    stock = PharmacyStock.query.filter_by(
-                        pharmacy_id=pharm.id, medication_id=med.id
-                    ).first()
-                    price = pharm_data.get("price")
-                    if stock:
-                        stock.price = price
-                        stock.quantity = 1 if price else 0
-                    else:
-                        stock = PharmacyStock(
-                            pharmacy_id=pharm.id,
-                            medication_id=med.id,
-                            quantity=1 if price else 0,
-                            price=price,
-                            currency="KZT",
-                        )
-                        db.session.add(stock)
-                        total_stocks += 1
-
-                db.session.commit()
-
-            except Exception as e:
-                print(f"  ERROR: {e}")
-                db.session.rollback()
-                continue
-
-        print(f"\ni-teka sync complete: {total_meds} new medications, {total_stocks} new stock entries")
-        logger.info(f"i-teka sync complete: {total_meds} new medications, {total_stocks} new stock entries")
+    try:
+        search = _sync_search(app, fetcher, category_id, owner, batch_size)
+        with ThreadPoolExecutor(max_workers=shards, thread_name_prefix="iteka-city") as pool:
+            results = list(pool.map(
+                lambda city: _sync_city(app, city, fetcher, category_id, owner, batch_size), cities
+            ))
+    finally:
+        if own_fetcher:
+            fetcher.close()
+
+    stats = {**{phase: _new_stats() for phase in _PHASES}, "cities": {}}
+    totals = {}
+    for shard, result in [(None, search), *zip(cities, results)]:
+        if result is None:
+            continue
+        shard_stats, shard_totals = result
+        if shard:
+            stats["cities"][shard] = shard_stats
+        for phase, counts in shard_stats.items():
+            _add_stats(stats[phase], counts)
+        _add_stats(totals, shard_totals)
+
+    total_meds = totals.get("medications_new", 0)
+    total_stocks = totals.get("stocks_new", 0)
+    print(f"\ni-teka sync complete: {total_meds} new medications, {total_stocks} new stock entries")
+    print(f"Pages: {stats}")
+    logger.info(f"i-teka sync complete ({', '.join(stats['cities'])}): {total_meds} new medications, "
+                f"{total_stocks} new stock entries; pages {stats}; fetch stats {fetcher.stats}")
+    return stats
@@ -0,0 +1,237 @@
+"""
+Leader-elected background job scheduler.
+
+Replaces the per-process threading.Timer loop: every web worker runs a
+scheduler thread, but each job runs on one instance at a time. Job state
+lives in the scheduled_jobs table; an instance that finds a job due takes
+a lease on its row with a conditional UPDATE (due, and no live lease) and
+renews the lease while the job runs. If the instance dies, the lease
+expires and another instance picks the job up on its next tick.
+
+    scheduler = JobScheduler(app)
+    scheduler.register('iteka_sync', sync, interval=12 * 3600, initial_delay=10)
+    scheduler.start()
+
+next_run_at survives restarts, so a deploy no longer triggers a fresh
+sync in every worker. Runs missed while nothing was up are coalesced into
+one catch-up run (JobRun.missed_runs records how many were skipped) and
+the schedule continues from that run, plus a random jitter so instances
+do not wake in lock step. Every run is recorded in job_runs.
+
+Jobs registered with exclusive=False (per-process cache warmers) skip the
+lease and run in each process, keeping their schedule in memory.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from main.models import db, ScheduledJob, JobRun
+
+logger = logging.getLogger(__name__)
+
+TICK_SECONDS = 15
+DEFAULT_LEASE = 10 * 60   # seconds; renewed every tick while the job runs
+
+
+class _Job:
+    def __init__(self, name, fn, interval, jitter, lease, initial_delay, exclusive):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.jitter = jitter
+        self.lease = lease
+        self.initial_delay = initial_delay
+        self.exclusive = exclusive
+
+
+class JobScheduler:
+
+    def __init__(self, app, owner=None, tick=TICK_SECONDS, workers=2):
+        self.app = app
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.tick = tick
+        self._jobs = {}
+        self._local_next = {}      # name -> next run, for non-exclusive jobs
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+
+    def register(self, name, fn, interval, jitter=0.1, lease=DEFAULT_LEASE,
+                 initial_delay=0, exclusive=True):
+        """
+        Schedule fn(app) every `interval` seconds (plus up to jitter*interval).
+        fn runs inside an app context; its return value is stored with the run.
+        initial_delay only applies the first time the job is seen.
+        """
+        self._jobs[name] = _Job(name, fn, interval, jitter, lease, initial_delay, exclusive)
+        if not exclusive:
+            self._local_next[name] = datetime.utcnow() + timedelta(seconds=initial_delay)
+
+    # ── Lifecycle ────────────────────────────────────────────────────────────
+
+    def start(self):
+        with self.app.app_context():
+            self._ensure_rows()
+        self._thread = threading.Thread(target=self._loop, name='job-scheduler', daemon=True)
+        self._thread.start()
+        logger.info(f"Job scheduler {self.owner} started: {', '.join(self._jobs)}")
+
+    def stop(self, wait=True):
+        self._stop.set()
+        self._pool.shutdown(wait=wait)
+
+    def _loop(self):
+        while not self._stop.wait(self.tick):
+            try:
+                self.run_pending()
+            except Exception as e:
+                logger.error(f"Job scheduler tick failed: {e}")
+
+    def _ensure_rows(self):
+        now = datetime.utcnow()
+        for job in self._jobs.values():
+            if not job.exclusive:
+                continue
+            row = db.session.get(ScheduledJob, job.name)
+            if row is None:
+                db.session.add(ScheduledJob(
+                    name=job.name, interval_seconds=job.interval, enabled=True,
+                    next_run_at=now + timedelta(seconds=job.initial_delay),
+                ))
+            elif row.interval_seconds != job.interval:
+                row.interval_seconds = job.interval
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()   # another instance created it first
+
+    # ── Ticks ────────────────────────────────────────────────────────────────
+
+    def run_pending(self, wait=False):
+        """Start every job that is due and not leased elsewhere. Returns their names."""
+        now = datetime.utcnow()
+        started = []
+        with self.app.app_context():
+            self._renew_leases(now)
+            for job in self._jobs.values():
+                with self._lock:
+                    if job.name in self._running:
+                        continue
+                missed = self._claim(job, now)
+                if missed is None:
+                    continue
+                with self._lock:
+                    self._running.add(job.name)
+                started.append((job.name, self._pool.submit(self._execute, job, missed)))
+        if wait:
+            for _, future in started:
+                future.result()
+        return [name for name, _ in started]
+
+    def _claim(self, job, now):
+        """Take the job if it is due. Returns the number of missed runs, or None."""
+        if not job.exclusive:
+            due = self._local_next[job.name]
+            return self._missed(job, due, now) if due <= now else None
+
+        row = db.session.get(ScheduledJob, job.name)
+        due = row.next_run_at if row is not None and row.enabled else None
+        db.session.commit()
+        if due is None or due > now:
+            return None
+
+        claimed = ScheduledJob.query.filter(
+            ScheduledJob.name == job.name,
+            ScheduledJob.enabled.is_(True),
+            ScheduledJob.next_run_at <= now,
+            or_(ScheduledJob.lease_expires_at.is_(None), ScheduledJob.lease_expires_at < now),
+        ).update({
+            'lease_owner': self.owner,
+            'lease_expires_at': now + timedelta(seconds=job.lease),
+        }, synchronize_session=False)
+        db.session.commit()
+        return self._missed(job, due, now) if claimed else None
+
+    @staticmethod
+    def _missed(job, due, now):
+        return int((now - due).total_seconds() // job.interval)
+
+    def _renew_leases(self, now):
+        with self._lock:
+            running = [self._jobs[name] for name in self._running if self._jobs[name].exclusive]
+        for job in running:
+            ScheduledJob.query.filter_by(name=job.name, lease_owner=self.owner).update(
+                {'lease_expires_at': now + timedelta(seconds=job.lease)}, synchronize_session=False
+            )
+        db.session.commit()
+
+    def _next_run(self, job, after):
+        return after + timedelta(seconds=job.interval * (1 + random.uniform(0, job.jitter)))
+
+    def _execute(self, job, missed):
+        try:
+            with self.app.app_context():
+                if missed:
+                    logger.info(f"Job {job.name}: catching up {missed} missed run(s) with one run")
+                started_at = datetime.utcnow()
+                run = JobRun(job_name=job.name, owner=self.owner, status='running',
+                             missed_runs=missed, started_at=started_at)
+                db.session.add(run)
+                db.session.commit()
+                run_id = run.id
+
+                start = time.perf_counter()
+                try:
+                    result = job.fn(self.app)
+                    status, error = 'ok', None
+                except Exception as e:
+                    logger.exception(f"Job {job.name} failed")
+                    db.session.rollback()
+                    result, status, error = None, 'failed', str(e)
+                duration = round(time.perf_counter() - start, 3)
+                finished_at = datetime.utcnow()
+                next_run = self._next_run(job, finished_at)
+
+                JobRun.query.filter_by(id=run_id).update({
+                    'status': status, 'error': error, 'finished_at': finished_at,
+                    'duration_s': duration,
+                    'result': str(result)[:2000] if result is not None else None,
+                }, synchronize_session=False)
+                if job.exclusive:
+                    updated = ScheduledJob.query.filter_by(name=job.name, lease_owner=self.owner).update({
+                        'last_run_at': started_at, 'next_run_at': next_run,
+                        'last_status': status, 'last_error': error, 'last_duration_s': duration,
+                        'lease_owner': None, 'lease_expires_at': None,
+                    }, synchronize_session=False)
+                    if not updated:
+                        logger.warning(f"Job {job.name}: lease was lost while running")
+                else:
+                    self._local_next[job.name] = next_run
+                db.session.commit()
+                logger.info(f"Job {job.name} {status} in {duration}s; next run {next_run:%Y-%m-%d %H:%M:%S}")
+        except Exception as e:
+            logger.error(f"Job {job.name} could not be recorded: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(job.name)
+
+
+def start_scheduler(app):
+    """Register the app's background jobs and start this process's scheduler."""
+    from main.utils.background_jobs import register_jobs
+
+    scheduler = JobScheduler(app, tick=app.config.get('SCHEDULER_TICK', TICK_SECONDS))
+    register_jobs(scheduler, app)
+    scheduler.start()
+    return scheduler
@@ -0,0 +1,269 @@
+"""
+Client-side admission control for LLM providers.
+
+Every LLM call (assistant chat, health tips, lab extraction, conversation
+summaries) asks the scheduler for a slot before it hits a provider:
+
+    with llm_scheduler.admit('groq', 'tips', estimate_tokens(prompt, 3000)) as ticket:
+        response = client.chat.completions.create(...)
+        ticket.used_tokens = response.usage.total_tokens
+
+Each provider has token buckets for requests/minute and tokens/minute,
+so we stay under Groq's limits instead of discovering them as 429s and
+timeouts. Waiting callers are served strictly by priority class
+(chat > tips > extraction; background summaries also use the
+extraction class), FIFO within a class. Each class has a bounded
+queue and a maximum wait; when either would be exceeded admit() raises
+SchedulerSaturated at once with a Retry-After estimate, and the chat
+endpoint turns that into a fast HTTP 429.
+"""
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+CHAT = 'chat'
+TIPS = 'tips'
+EXTRACTION = 'extraction'
+PRIORITIES = {CHAT: 0, TIPS: 1, EXTRACTION: 2}
+
+DEFAULT_LIMITS = {
+    'groq':   {'rpm': 30, 'tpm': 6000},
+    'github': {'rpm': 15, 'tpm': 0},     # 0 = not limited
+}
+DEFAULT_QUEUE_LIMITS = {CHAT: 32, TIPS: 16, EXTRACTION: 8}
+DEFAULT_MAX_WAIT = {CHAT: 10.0, TIPS: 20.0, EXTRACTION: 60.0}   # seconds
+
+
+class SchedulerSaturated(Exception):
+    """No slot available within the class's queue/wait budget."""
+
+    def __init__(self, provider, priority, retry_after):
+        self.provider = provider
+        self.priority = priority
+        self.retry_after = retry_after
+        super().__init__(f"LLM provider '{provider}' saturated for {priority} requests; "
+                         f"retry after {retry_after}s")
+
+
+def estimate_tokens(prompt, max_tokens=0):
+    """Rough prompt + completion token count (~3 chars per token for ru/en text)."""
+    return len(prompt) // 3 + max_tokens
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute, holding at most `capacity`."""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity or per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, n, now):
+        """Seconds until `n` units are available (0 if they are now)."""
+        self._refill(now)
+        n = min(n, self.capacity)
+        return 0.0 if self.tokens >= n else (n - self.tokens) / self.rate
+
+    def take(self, n):
+        self.tokens -= min(n, self.capacity)
+
+    def adjust(self, n):
+        """Give back (n > 0) or charge extra (n < 0) after the real usage is known."""
+        self.tokens = min(self.capacity, self.tokens + n)
+
+
+class _Provider:
+    def __init__(self, rpm, tpm):
+        self.rpm, self.tpm = rpm, tpm
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.waiting = []   # heap of (priority, seq)
+
+    def wait_time(self, tokens, now):
+        waits = [0.0]
+        if self.requests:
+            waits.append(self.requests.wait_time(1, now))
+        if self.tokens and tokens:
+            waits.append(self.tokens.wait_time(tokens, now))
+        return max(waits)
+
+    def take(self, tokens):
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens and tokens:
+            self.tokens.take(tokens)
+
+
+class Ticket:
+    """An admitted call. Set `used_tokens` once the response reports usage."""
+
+    def __init__(self, scheduler, provider, priority, tokens):
+        self._scheduler = scheduler
+        self.provider = provider
+        self.priority = priority
+        self.tokens = tokens
+        self.used_tokens = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._scheduler._release(self)
+        return False
+
+
+class LLMScheduler:
+
+    def __init__(self, limits=None, queue_limits=None, max_wait=None):
+        self._cond = threading.Condition()
+        self._providers = {
+            name: _Provider(cfg.get('rpm', 0), cfg.get('tpm', 0))
+            for name, cfg in (limits or DEFAULT_LIMITS).items()
+        }
+        self.queue_limits = {**DEFAULT_QUEUE_LIMITS, **(queue_limits or {})}
+        self.max_wait = {**DEFAULT_MAX_WAIT, **(max_wait or {})}
+        self._seq = itertools.count()
+        self._metrics = {
+            p: {'queued': 0, 'in_flight': 0, 'admitted': 0, 'rejected': 0,
+                'waits': deque(maxlen=500)}
+            for p in PRIORITIES
+        }
+
+    def _retry_after(self, provider):
+        p = self._providers[provider]
+        if not p.requests:
+            return 1
+        ahead = len(p.waiting) + 1
+        return max(1, math.ceil(ahead / p.requests.rate))
+
+    def _reject(self, provider, priority):
+        self._metrics[priority]['rejected'] += 1
+        retry_after = self._retry_after(provider)
+        logger.warning(f"LLM scheduler: rejecting {priority} request to {provider} "
+                       f"(retry after {retry_after}s)")
+        return SchedulerSaturated(provider, priority, retry_after)
+
+    def admit(self, provider, priority=CHAT, tokens=0, max_wait=None):
+        """
+        Block until `provider` has capacity for one request of ~`tokens`
+        tokens, serving higher priority classes first. Returns a Ticket
+        (use as a context manager). Raises SchedulerSaturated instead of
+        queueing past the class's queue limit or maximum wait.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown LLM priority class '{priority}'. Known: {list(PRIORITIES)}")
+        metrics = self._metrics[priority]
+        start = time.monotonic()
+
+        with self._cond:
+            p = self._providers.get(provider)
+            if p is None:                     # unlimited provider (e.g. local)
+                metrics['admitted'] += 1
+                metrics['in_flight'] += 1
+                metrics['waits'].append(0.0)
+                return Ticket(self, provider, priority, tokens)
+
+            if metrics['queued'] >= self.queue_limits[priority]:
+                raise self._reject(provider, priority)
+
+            waiter = (PRIORITIES[priority], next(self._seq))
+            heapq.heappush(p.waiting, waiter)
+            metrics['queued'] += 1
+            deadline = start + (self.max_wait[priority] if max_wait is None else max_wait)
+            try:
+                while True:
+                    now = time.monotonic()
+                    remaining = deadline - now
+                    if p.waiting[0] == waiter:
+                        wait_s = p.wait_time(tokens, now)
+                        if wait_s == 0:
+                            heapq.heappop(p.waiting)
+                            p.take(tokens)
+                            self._cond.notify_all()
+                            metrics['admitted'] += 1
+                            metrics['in_flight'] += 1
+                            metrics['waits'].append(now - start)
+                            return Ticket(self, provider, priority, tokens)
+                        if wait_s > remaining:
+                            raise self._reject(provider, priority)   # fail fast, don't sit out the wait
+                        self._cond.wait(wait_s)
+                    else:
+                        if remaining <= 0:
+                            raise self._reject(provider, priority)
+                        self._cond.wait(remaining)
+            except BaseException:
+                if waiter in p.waiting:
+                    p.waiting.remove(waiter)
+                    heapq.heapify(p.waiting)
+                    self._cond.notify_all()
+                raise
+            finally:
+                metrics['queued'] -= 1
+
+    def _release(self, ticket):
+        with self._cond:
+            self._metrics[ticket.priority]['in_flight'] -= 1
+            p = self._providers.get(ticket.provider)
+            if p and p.tokens and ticket.used_tokens is not None:
+                p.tokens.adjust(ticket.tokens - ticket.used_tokens)
+                self._cond.notify_all()
+
+    def stats(self):
+        """Queue depth, admissions, rejections and wait times per class; bucket levels per provider."""
+        now = time.monotonic()
+        with self._cond:
+            classes = {}
+            for name, m in self._metrics.items():
+                waits = sorted(m['waits'])
+                classes[name] = {
+                    'queued': m['queued'],
+                    'in_flight': m['in_flight'],
+                    'admitted': m['admitted'],
+                    'rejected': m['rejected'],
+                    'wait_ms_mean': round(1000 * sum(waits) / len(waits), 1) if waits else 0.0,
+                    'wait_ms_p95': round(1000 * waits[int(0.95 * (len(waits) - 1))], 1) if waits else 0.0,
+                }
+            providers = {}
+            for name, p in self._providers.items():
+                p.wait_time(0, now)   # refill before reporting
+                providers[name] = {
+                    'rpm': p.rpm,
+                    'tpm': p.tpm,
+                    'waiting': len(p.waiting),
+                    'requests_available': round(p.requests.tokens, 1) if p.requests else None,
+                    'tokens_available': round(p.tokens.tokens) if p.tokens else None,
+                }
+        return {'classes': classes, 'providers': providers}
+
+
+_scheduler = LLMScheduler()
+
+
+def init_app(app):
+    """Configure the process-wide scheduler from LLM_RATE_LIMITS / LLM_QUEUE_LIMITS / LLM_MAX_WAIT."""
+    global _scheduler
+    _scheduler = LLMScheduler(
+        limits=app.config.get('LLM_RATE_LIMITS'),
+        queue_limits=app.config.get('LLM_QUEUE_LIMITS'),
+        max_wait=app.config.get('LLM_MAX_WAIT'),
+    )
+
+
+def admit(provider, priority=CHAT, tokens=0, max_wait=None):
+    return _scheduler.admit(provider, priority, tokens, max_wait)
+
+
+def stats():
+    return _scheduler.stats()
@@ -7,6 +7,7 @@ Handles missing FAISS index and other import errors
 import sys
 import os
 import logging
+from concurrent.futures import Future
 
 logger = logging.getLogger('med_bot_wrapper')
 
@@ -41,10 +42,39 @@ def _safe_import_rag():
 # Try to load RAG engine
 _answer_question_orig = _safe_import_rag()
 
-def answer_question(question: str, medical_context: str = "") -> str:
+# LLM admission control: every provider call made by the RAG engine goes
+# through the shared rate-limit scheduler as an interactive (chat) request
+_AdmissionRejected = ()   # exception type(s) translated to SchedulerSaturated
+
+def _install_admission_hook():
+    global _AdmissionRejected
+    from main.utils import llm_scheduler
+    try:
+        import model
+    except Exception as e:
+        logger.warning(f"LLM admission hook not installed: {e}")
+        return
+
+    def hook(provider, prompt, max_tokens):
+        try:
+            return llm_scheduler.admit(provider, llm_scheduler.CHAT,
+                                       llm_scheduler.estimate_tokens(prompt, max_tokens))
+        except llm_scheduler.SchedulerSaturated as e:
+            raise model.AdmissionRejected(provider, e.retry_after) from e
+
+    model.set_admission_hook(hook)
+    _AdmissionRejected = model.AdmissionRejected
+
+if _answer_question_orig:
+    _install_admission_hook()
+
+def answer_question(question: str, medical_context: "str | Future" = "") -> str:
     """
     Answer medical questions using RAG engine with graceful fallback.
-    medical_context: optional string with user's medical card info.
+    medical_context: optional string with user's medical card info, or a
+    Future resolving to it (resolved by rag_engine right before prompting).
+    Raises llm_scheduler.SchedulerSaturated when every LLM provider is at
+    its rate limit (the chat endpoint answers 429).
     """
     if not _answer_question_orig:
         return (
@@ -57,6 +87,9 @@ def answer_question(question: str, medical_context: str = "") -> str:
     
     try:
         return _answer_question_orig(question, medical_context=medical_context)
+    except _AdmissionRejected as e:
+        from main.utils.llm_scheduler import SchedulerSaturated, CHAT
+        raise SchedulerSaturated(e.provider, CHAT, e.retry_after) from e
     except TypeError:
         # Fallback if rag_engine doesn't accept medical_context yet
         return _answer_question_orig(question)
@@ -0,0 +1,287 @@
+"""
+Indexed medication search over name, generic_name and active_ingredient.
+
+    ids = med_search.search('парацетамол')                  # ranked medication ids
+    items, total, pages = med_search.paginate(ids, page, 20)  # one page of Medication rows
+
+Substring matches are answered from a trigram index picked per database
+by setup() (run in create_app):
+
+    pg_trgm   PostgreSQL: GIN trigram index on the normalized concatenation
+              of the three columns, used by LIKE '%q%'
+    fts5      SQLite: medication_search FTS5 table with the trigram
+              tokenizer, kept in sync with medications by triggers
+    memory    in-process trigram index rebuilt when medications change;
+              for tests and databases that have neither
+
+MEDICATION_SEARCH_BACKEND forces one. If the index cannot be created (no
+privilege for CREATE EXTENSION, SQLite without the trigram tokenizer) the
+memory backend is used instead.
+
+Queries are matched in both scripts (translit.variants), so 'paracetamol'
+finds Парацетамол and 'аспирин' finds Aspirin. Matches are ranked: exact
+name, name prefix, word prefix inside the name, name substring, then
+generic name / active ingredient only; ties go to the shorter name.
+"""
+import heapq
+import logging
+import re
+import threading
+from array import array
+
+from flask import current_app
+from sqlalchemy import case, false, func, or_, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from main.models import db, Medication
+from main.utils import translit
+from main.utils.bulk_upsert import chunks
+
+logger = logging.getLogger(__name__)
+
+MIN_TRIGRAM = 3                 # shorter queries have no trigram to look up
+FTS_TABLE = 'medication_search'
+_AUTO = {'postgresql': 'pg_trgm', 'sqlite': 'fts5'}
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _rank(variants, name):
+    """Sort key of a match by its normalized name."""
+    tier = 4
+    for v in variants:
+        at = name.find(v)
+        if at < 0:
+            continue
+        if at == 0:
+            tier = min(tier, 0 if len(name) == len(v) else 1)
+        elif not name[at - 1].isalnum() or re.search(r'(?<!\w)' + re.escape(v), name):
+            tier = min(tier, 2)
+        else:
+            tier = min(tier, 3)
+    return tier, len(name), name
+
+
+def _ranked_rows(variants, rows, limit):
+    """Ids of (id, name) rows, best first. Rows must already match one of the variants."""
+    ranked = heapq.nsmallest(limit, ((_rank(variants, translit.normalize(name)), med_id)
+                                     for med_id, name in rows))
+    return [med_id for _, med_id in ranked]
+
+
+def _scan(variants, limit):
+    """Plain LIKE scan, for queries too short for a trigram index."""
+    patterns = set()
+    for v in variants:
+        # SQLite's LIKE folds ASCII case only; names are usually capitalized
+        patterns |= {f'%{_escape_like(v)}%', f'%{_escape_like(v.capitalize())}%'}
+    columns = (Medication.name, Medication.generic_name, Medication.active_ingredient)
+    rows = db.session.query(Medication.id, Medication.name) \
+        .filter(or_(*(col.ilike(p, escape='\\') for col in columns for p in patterns)))
+    return _ranked_rows(variants, rows, limit)
+
+
+# ── Backends ──────────────────────────────────────────────────────────────────
+
+class PgTrgmBackend:
+    name = 'pg_trgm'
+    index = 'ix_medications_search_trgm'
+    # The query must repeat this expression verbatim for the planner to use the index
+    expr = ("translate(lower(coalesce(name, '') || ' ' || coalesce(generic_name, '') || ' ' "
+            "|| coalesce(active_ingredient, '')), 'ё', 'е')")
+    name_expr = "translate(lower(name), 'ё', 'е')"
+
+    def setup(self):
+        with db.engine.begin() as conn:
+            conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+            conn.execute(text(f'CREATE INDEX IF NOT EXISTS {self.index} ON medications '
+                              f'USING gin (({self.expr}) gin_trgm_ops)'))
+
+    def search(self, variants, limit):
+        params = {'limit': limit}
+        for i, v in enumerate(variants):
+            like = _escape_like(v)
+            params.update({f'v{i}': v, f'p{i}': f'{like}%', f'w{i}': f'% {like}%', f'h{i}': f'%-{like}%',
+                           f'c{i}': f'%{like}%'})
+
+        def any_of(template):
+            return ' OR '.join(template.format(i=i) for i in range(len(variants)))
+
+        sql = f"""
+            SELECT id FROM medications
+            WHERE {any_of(f'{self.expr} LIKE :c{{i}}')}
+            ORDER BY CASE WHEN {any_of(f'{self.name_expr} = :v{{i}}')} THEN 0
+                          WHEN {any_of(f'{self.name_expr} LIKE :p{{i}}')} THEN 1
+                          WHEN {any_of(f'{self.name_expr} LIKE :w{{i}} OR {self.name_expr} LIKE :h{{i}}')} THEN 2
+                          WHEN {any_of(f'{self.name_expr} LIKE :c{{i}}')} THEN 3
+                          ELSE 4 END,
+                     length(name), name
+            LIMIT :limit"""
+        return [med_id for (med_id,) in db.session.execute(text(sql), params)]
+
+
+def _fold(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+class Fts5Backend:
+    name = 'fts5'
+    columns = 'name, generic_name, active_ingredient'
+    values = ', '.join(_fold(f'new.{c}') for c in ('name', 'generic_name', 'active_ingredient'))
+    triggers = (
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON medications BEGIN
+              INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {values});
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON medications BEGIN
+              DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+            AFTER UPDATE OF name, generic_name, active_ingredient ON medications BEGIN
+              DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+              INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {values});
+            END""",
+    )
+
+    def setup(self):
+        with db.engine.begin() as conn:
+            conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                              f"USING fts5({self.columns}, tokenize='trigram')"))
+            for trigger in self.triggers:
+                conn.execute(text(trigger))
+            indexed = conn.execute(text(f'SELECT count(*) FROM {FTS_TABLE}')).scalar()
+            total = conn.execute(text('SELECT count(*) FROM medications')).scalar()
+            if indexed != total:
+                logger.info(f"Rebuilding {FTS_TABLE} ({indexed} indexed, {total} medications)")
+                conn.execute(text(f'DELETE FROM {FTS_TABLE}'))
+                folded = ', '.join(_fold(c) for c in ('name', 'generic_name', 'active_ingredient'))
+                conn.execute(text(f'INSERT INTO {FTS_TABLE}(rowid, {self.columns}) '
+                                  f'SELECT id, {folded} FROM medications'))
+
+    def search(self, variants, limit):
+        if min(len(v) for v in variants) < MIN_TRIGRAM:
+            return _scan(variants, limit)
+        match = ' OR '.join('"{}"'.format(v.replace('"', '""')) for v in variants)
+        rows = db.session.execute(
+            text(f'SELECT rowid, name FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match'),
+            {'match': match},
+        ).all()
+        return _ranked_rows(variants, rows, limit)
+
+
+class TrigramIndex:
+    """Trigram -> array of row positions over normalized medication texts."""
+
+    def __init__(self, rows, signature=None):
+        self.signature = signature
+        self.ids = array('q')
+        self.names, self.texts = [], []
+        self.postings = {}
+        for pos, (med_id, name, generic, ingredient) in enumerate(rows):
+            name = translit.normalize(name)
+            # Newlines keep a match from spanning two fields
+            doc = f'{name}\n{translit.normalize(generic)}\n{translit.normalize(ingredient)}'
+            self.ids.append(med_id)
+            self.names.append(name)
+            self.texts.append(doc)
+            for gram in _trigrams(doc):
+                self.postings.setdefault(gram, array('l')).append(pos)
+
+    def search(self, variants, limit):
+        matches = set()
+        for v in variants:
+            grams = _trigrams(v)
+            if grams:
+                # Every match contains every trigram: verify the rarest one's rows
+                candidates = min((self.postings.get(g, ()) for g in grams), key=len)
+            else:
+                candidates = range(len(self.texts))
+            matches.update(pos for pos in candidates if v in self.texts[pos])
+        ranked = heapq.nsmallest(limit, matches, key=lambda pos: _rank(variants, self.names[pos]))
+        return [self.ids[pos] for pos in ranked]
+
+
+class MemoryBackend:
+    name = 'memory'
+
+    def __init__(self):
+        self._indexes = {}      # database URL -> TrigramIndex
+        self._lock = threading.Lock()
+
+    def setup(self):
+        pass
+
+    def _index(self):
+        signature = tuple(db.session.query(func.count(Medication.id), func.max(Medication.id),
+                                           func.max(Medication.updated_at)).one())
+        key = str(db.engine.url)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None or index.signature != signature:
+                rows = db.session.query(Medication.id, Medication.name, Medication.generic_name,
+                                        Medication.active_ingredient)
+                index = self._indexes[key] = TrigramIndex(rows, signature)
+            return index
+
+    def search(self, variants, limit):
+        return self._index().search(variants, limit)
+
+
+BACKENDS = {b.name: b for b in (PgTrgmBackend(), Fts5Backend(), MemoryBackend())}
+
+
+def setup(app):
+    """Create the search index for app's database and pick its backend. Needs an app context."""
+    name = app.config.get('MEDICATION_SEARCH_BACKEND') or _AUTO.get(db.engine.dialect.name, 'memory')
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown MEDICATION_SEARCH_BACKEND '{name}'. Allowed: {list(BACKENDS)}")
+    try:
+        BACKENDS[name].setup()
+    except SQLAlchemyError as e:
+        logger.warning(f"Medication search backend {name} unavailable, using the in-process index: {e}")
+        name = 'memory'
+    app.extensions['med_search'] = name
+    logger.info(f"Medication search backend: {name}")
+
+
+def get_backend():
+    return BACKENDS[current_app.extensions.get('med_search', 'memory')]
+
+
+def search(query, limit=None):
+    """Medication ids matching `query`, best first, at most MEDICATION_SEARCH_LIMIT."""
+    variants = translit.variants(query)
+    if not variants:
+        return []
+    return get_backend().search(variants, limit or current_app.config.get('MEDICATION_SEARCH_LIMIT', 1000))
+
+
+def ranked(query, ids):
+    """Restrict a Medication query to `ids`, ordered as given."""
+    if not ids:
+        return query.filter(false())
+    order = case({med_id: pos for pos, med_id in enumerate(ids)}, value=Medication.id)
+    return query.filter(Medication.id.in_(ids)).order_by(order)
+
+
+def paginate(ids, page, per_page, within=None):
+    """
+    (medications on `page`, total, pages) of ranked `ids`. `within` is an
+    optional filtered Medication query the results must also match. Only
+    the page's rows are loaded; ordering stays in Python.
+    """
+    if within is not None and ids:
+        allowed = set()
+        for chunk in chunks(ids):
+            allowed.update(med_id for (med_id,) in
+                           within.filter(Medication.id.in_(chunk)).with_entities(Medication.id))
+        ids = [med_id for med_id in ids if med_id in allowed]
+    page = max(page, 1)
+    window = ids[(page - 1) * per_page:page * per_page]
+    items = ranked(Medication.query, window).all() if window else []
+    return items, len(ids), -(-len(ids) // per_page)
@@ -0,0 +1,260 @@
+"""
+Medication typeahead from an in-process prefix index.
+
+    suggest('парац')   -> [{'id': 1, 'name': 'Парацетамол', 'generic_name': 'Paracetamol'}, ...]
+
+Keys are the normalized name, generic name and active ingredient of each
+medication, each also spelled in the other script (translit), and again
+from every later word ('Но-шпа форте' is found by 'шпа' and 'форте').
+They are bucketed by rank: match tier, then the length of the name they
+lead to. Each bucket is a sorted list of keys with a parallel array of
+medication ids, and a lookup bisects to the keys starting with the query
+bucket by bucket, best first, until it has `limit` medications, so an
+exact or short name is found however many keys share its prefix. It
+never touches the database.
+
+refresh() reads only medications added or changed since the last build
+(id / updated_at high-water marks) and merges their keys in. A renamed
+medication's old keys stay behind and are dropped at lookup; once they
+make up a quarter of the index, or medications were deleted, it is
+rebuilt from scratch. Building takes seconds on a large catalogue, so it
+never runs on the request path: start_build() runs it in a thread at
+startup (start_background_workers) or on the first lookup, which is
+answered by med_search meanwhile. refresh() runs after every i-teka sync
+and as the per-process suggest_refresh job, so each worker's copy stays
+current.
+"""
+import heapq
+import logging
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import func, or_
+
+from main.models import db, Medication
+from main.utils import med_search, translit
+
+logger = logging.getLogger(__name__)
+
+MAX_WORDS = 4          # name suffixes indexed per field ('форте' in 'Но-шпа форте')
+MAX_SCAN = 256         # keys walked per lookup, script and bucket
+MAX_LENGTH = 64        # longer names share one bucket per tier
+STALE_RATIO = 0.25     # rebuild when this share of keys belongs to old names
+
+
+def _forms(text):
+    """Normalized text plus its spelling in the other script."""
+    text = translit.normalize(text)
+    if not text:
+        return ()
+    forms = [text]
+    if translit.has_cyrillic(text):
+        forms.append(translit.to_latin(text))
+    if translit.has_latin(text):
+        forms.append(translit.to_cyrillic(text))
+    return tuple(dict.fromkeys(forms))
+
+
+def _word_starts(form):
+    """form and its suffixes that start a later word, at most MAX_WORDS in all."""
+    starts = [form]
+    for i in range(1, len(form)):
+        if len(starts) == MAX_WORDS:
+            break
+        if form[i].isalnum() and not form[i - 1].isalnum():
+            starts.append(form[i:])
+    return starts
+
+
+def _keys(name, generic_name, active_ingredient):
+    """{key: tier}: 0 whole name, 1 later word of the name, 2 generic name / ingredient."""
+    keys = {}
+    for tier, fields in ((0, (name,)), (2, (generic_name, active_ingredient))):
+        for form in (f for text in fields for f in _forms(text)):
+            for i, start in enumerate(_word_starts(form)):
+                t = 1 if tier == 0 and i else tier
+                keys[start] = min(t, keys.get(start, t))
+    return keys
+
+
+def _length(name):
+    return min(len(name), MAX_LENGTH)
+
+
+def _buckets(pairs_by_bucket):
+    """{(tier, length): (sorted keys, ids)} in rank order."""
+    return {bucket: ([k for k, _ in pairs], array('q', (m for _, m in pairs)))
+            for bucket, pairs in sorted(pairs_by_bucket.items())}
+
+
+class PrefixIndex:
+
+    def __init__(self):
+        # One tuple, swapped whole, so lookups never see a half-merged index:
+        # (tier, name length) -> (sorted keys, medication ids), id -> (name,
+        # generic name, ingredient), id -> current keys of medications renamed in place
+        self._state = ({}, {}, {})
+        self.max_id = 0
+        self.updated_at = None
+        self.stale = 0
+        self.built = False
+        self.building = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(keys) for keys, _ in self._state[0].values())
+
+    def lookup(self, query, limit=10):
+        buckets, entries, changed = self._state
+        # Keys already hold both scripts; the query's other spelling catches
+        # prefixes cut mid-digraph ('amok' for амоксициллин -> 'amox...')
+        prefixes = translit.variants(query)
+        tiers = {}
+        for (tier, length), (keys, ids) in buckets.items():
+            # Later buckets rank below every medication already found
+            if len(tiers) >= limit:
+                break
+            for prefix in prefixes:
+                start = bisect_left(keys, prefix)
+                end = bisect_left(keys, prefix + '\uffff', start, min(start + MAX_SCAN, len(keys)))
+                for i in range(start, end):
+                    med_id = ids[i]
+                    if med_id in tiers:
+                        continue
+                    # Keys of an old name stay in the index until the next rebuild
+                    if changed and med_id in changed and (changed[med_id].get(keys[i]) != tier
+                                                          or _length(entries[med_id][0]) != length):
+                        continue
+                    tiers[med_id] = tier
+        ranked = heapq.nsmallest(limit, ((tier, len(entries[m][0]), entries[m][0], m)
+                                         for m, tier in tiers.items()))
+        return [{'id': m, 'name': entries[m][0], 'generic_name': entries[m][1]} for *_, m in ranked]
+
+    def _rows(self, query):
+        for med_id, name, generic, ingredient, updated_at in query:
+            self.max_id = max(self.max_id, med_id)
+            if updated_at and (self.updated_at is None or updated_at > self.updated_at):
+                self.updated_at = updated_at
+            yield med_id, (name, generic, ingredient)
+
+    def _query(self):
+        return db.session.query(Medication.id, Medication.name, Medication.generic_name,
+                                Medication.active_ingredient, Medication.updated_at)
+
+    @staticmethod
+    def _add_pairs(pairs_by_bucket, med_id, name, keys):
+        for key, tier in keys.items():
+            pairs_by_bucket[(tier, _length(name))].append((sys.intern(key), med_id))
+
+    def _rebuild(self):
+        self.max_id, self.updated_at, self.stale = 0, None, 0
+        entries = dict(self._rows(self._query()))
+        pairs_by_bucket = defaultdict(list)
+        for med_id, entry in entries.items():
+            self._add_pairs(pairs_by_bucket, med_id, entry[0], _keys(*entry))
+        for pairs in pairs_by_bucket.values():
+            pairs.sort()
+        self._state = (_buckets(pairs_by_bucket), entries, {})
+        self.built = True
+        logger.info(f"Medication suggest index: {len(entries)} medications, {len(self)} keys")
+        return len(entries)
+
+    def rebuild(self):
+        with self._lock:
+            return self._rebuild()
+
+    def refresh(self):
+        """Merge medications added or changed since the last build (building it first). Returns how many changed."""
+        with self._lock:
+            if not self.built:
+                return self._rebuild()
+            buckets, entries, changed = self._state
+            total = db.session.query(func.count(Medication.id)).scalar()
+            rows = self._query().filter(or_(Medication.id > self.max_id,
+                                            Medication.updated_at >= self.updated_at))
+            updated, changed = {}, dict(changed)
+            new_pairs = defaultdict(list)
+            for med_id, entry in self._rows(rows):
+                old = entries.get(med_id)
+                if old == entry:
+                    continue    # re-read at the updated_at watermark
+                new_keys = _keys(*entry)
+                if old:
+                    old_keys = _keys(*old)
+                    # Keys of a name of another length sit in another bucket
+                    moved = _length(old[0]) != _length(entry[0])
+                    self.stale += sum(1 for k, t in old_keys.items() if moved or new_keys.get(k) != t)
+                    changed[med_id] = new_keys
+                    if not moved:
+                        new_keys = {k: t for k, t in new_keys.items() if old_keys.get(k) != t}
+                self._add_pairs(new_pairs, med_id, entry[0], new_keys)
+                updated[med_id] = entry
+            if not updated and total == len(entries):
+                return 0
+            entries = {**entries, **updated}
+            if new_pairs:
+                merged = {bucket: list(heapq.merge(zip(*buckets.get(bucket, ([], []))), sorted(pairs)))
+                          for bucket, pairs in new_pairs.items()}
+                buckets = dict(sorted({**buckets, **_buckets(merged)}.items()))
+            self._state = (buckets, entries, changed)
+            # Deleted medications leave a count mismatch and nothing to merge
+            if len(entries) != total or self.stale > STALE_RATIO * len(self):
+                self._rebuild()
+        return len(updated)
+
+
+_indexes = {}           # database URL -> PrefixIndex
+_indexes_lock = threading.Lock()
+
+
+def get_index():
+    """This database's index; empty until built (start_build / refresh)."""
+    key = str(db.engine.url)
+    with _indexes_lock:
+        return _indexes.setdefault(key, PrefixIndex())
+
+
+def start_build(app):
+    """Build the index in a thread unless it is built or being built. Returns the thread."""
+    with app.app_context():
+        index = get_index()
+    with _indexes_lock:
+        if index.built or index.building:
+            return None
+        index.building = True
+
+    def run():
+        try:
+            with app.app_context():
+                index.refresh()
+        except Exception:
+            logger.exception("Medication suggest index build failed")
+        finally:
+            index.building = False
+
+    thread = threading.Thread(target=run, name='med-suggest-build', daemon=True)
+    thread.start()
+    return thread
+
+
+def _search(query, limit):
+    """Suggestions from med_search, while the index is being built."""
+    ids = med_search.search(query, limit)
+    rows = med_search.ranked(db.session.query(Medication.id, Medication.name, Medication.generic_name), ids)
+    return [{'id': med_id, 'name': name, 'generic_name': generic} for med_id, name, generic in rows]
+
+
+def suggest(query, limit=10):
+    index = get_index()
+    if not index.built:
+        start_build(current_app._get_current_object())
+        return _search(query, limit)
+    return index.lookup(query, limit)
+
+
+def refresh():
+    return get_index().refresh()
@@ -0,0 +1,168 @@
+"""
+Per-user medical context snapshot for the AI assistant.
+
+The medical card (metrics, active conditions, recent diagnoses and
+prescriptions) changes rarely but is read on every chat message, so the
+rendered context string is cached in each process and rebuilt only after
+a write. SQLAlchemy mapper events on MedicalMetrics, UserHealthCondition,
+Visit, Diagnosis and Prescription bump the owner's
+users.medical_context_version in the writing transaction, and every read
+checks the cached snapshot against it (one primary-key lookup instead of
+the three card queries), so a write on any worker is seen by all of them
+once committed. The version is read before the build: a snapshot built
+while a write commits carries the older version and is rebuilt next time.
+
+Bulk query.update()/delete() bypass mapper events; call invalidate() in
+the same transaction after those. The TTL only bounds staleness from
+writes that bypass both.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import joinedload, selectinload
+
+from main.models import (db, User, MedicalMetrics, UserHealthCondition, Visit,
+                         Diagnosis, Prescription)
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = 60 * 60     # seconds
+CACHE_MAX_USERS = 2048
+
+_cache = OrderedDict()  # user_id -> (built_at, medical_context_version, context)
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+# ── Snapshot ─────────────────────────────────────────────────────────────────
+
+def build_medical_context(user_id):
+    """Render the medical card as prompt text with three eager-loaded queries."""
+    parts = []
+
+    # 1. Medical metrics (allergies, chronic conditions, current medications)
+    metrics = MedicalMetrics.query.filter_by(user_id=user_id).first()
+    if metrics:
+        if metrics.allergies:
+            parts.append(f"Аллергии пациента: {metrics.allergies}")
+        if metrics.chronic_conditions:
+            parts.append(f"Хронические заболевания: {metrics.chronic_conditions}")
+        if metrics.medications:
+            parts.append(f"Текущие лекарства: {metrics.medications}")
+        if metrics.blood_type:
+            parts.append(f"Группа крови: {metrics.blood_type}")
+
+    # 2. Active health conditions
+    conditions = UserHealthCondition.query.options(
+        joinedload(UserHealthCondition.disease)
+    ).filter_by(user_id=user_id, status='active').all()
+    cond_names = [c.disease.name for c in conditions if c.disease]
+    if cond_names:
+        parts.append(f"Активные заболевания: {', '.join(cond_names)}")
+
+    # 3. Recent diagnoses and prescriptions (last 5 visits)
+    recent_visits = Visit.query.options(
+        selectinload(Visit.diagnoses), selectinload(Visit.prescriptions)
+    ).filter_by(user_id=user_id).order_by(Visit.visit_date.desc()).limit(5).all()
+    diag_names = []
+    rx_items = []
+    for v in recent_visits:
+        for d in v.diagnoses:
+            diag_names.append(d.disease_name)
+        for p in v.prescriptions:
+            rx_items.append(f"{p.medication_name} ({p.dosage or ''} {p.frequency or ''})".strip())
+    if diag_names:
+        parts.append(f"Недавние диагнозы: {', '.join(diag_names[:10])}")
+    if rx_items:
+        parts.append(f"Назначенные препараты: {', '.join(rx_items[:10])}")
+
+    return "\n".join(parts)
+
+
+def _version(user_id):
+    return db.session.execute(
+        select(User.medical_context_version).where(User.id == user_id)
+    ).scalar() or 0
+
+
+def get_medical_context(user_id):
+    """Cached medical context for user_id; builds (and caches) it on a miss."""
+    now = time.monotonic()
+    version = _version(user_id)
+    with _lock:
+        entry = _cache.get(user_id)
+        if entry and entry[1] == version and now - entry[0] < CACHE_TTL:
+            _cache.move_to_end(user_id)
+            _stats['hits'] += 1
+            return entry[2]
+        _stats['misses'] += 1
+
+    context = build_medical_context(user_id)
+
+    with _lock:
+        _cache[user_id] = (now, version, context)
+        _cache.move_to_end(user_id)
+        while len(_cache) > CACHE_MAX_USERS:
+            _cache.popitem(last=False)
+    return context
+
+
+def _drop(user_id):
+    with _lock:
+        if _cache.pop(user_id, None) is not None:
+            _stats['invalidations'] += 1
+
+
+def _bump(connection, user_id):
+    connection.execute(
+        update(User).where(User.id == user_id)
+        .values(medical_context_version=func.coalesce(User.medical_context_version, 0) + 1)
+    )
+
+
+def invalidate(user_id):
+    """Mark user_id's snapshot stale in every process (takes effect when the caller commits)."""
+    _bump(db.session, user_id)
+    _drop(user_id)
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+
+
+def stats():
+    with _lock:
+        return {**_stats, 'cached_users': len(_cache)}
+
+
+# ── Write-through invalidation ───────────────────────────────────────────────
+
+def _owner_id(connection, target):
+    """User id owning a changed row; Diagnosis/Prescription resolve via their visit."""
+    user_id = getattr(target, 'user_id', None)
+    if user_id is not None:
+        return user_id
+    visit_id = getattr(target, 'visit_id', None)
+    if visit_id is None:
+        return None
+    return connection.execute(
+        select(Visit.user_id).where(Visit.id == visit_id)
+    ).scalar()
+
+
+def _on_change(mapper, connection, target):
+    user_id = _owner_id(connection, target)
+    if user_id is None:
+        return
+    # Same connection as the flush: the bump commits or rolls back with the write
+    _bump(connection, user_id)
+    _drop(user_id)
+
+
+for _model in (MedicalMetrics, UserHealthCondition, Visit, Diagnosis, Prescription):
+    for _name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _name, _on_change)
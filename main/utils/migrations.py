@@ -0,0 +1,159 @@
+"""
+Unique keys of existing databases.
+
+create_all() only creates missing tables, so unique constraints added to
+models later are created as unique indexes (SQLite cannot ALTER TABLE ADD
+CONSTRAINT; both databases accept an index as an ON CONFLICT target):
+
+    create_missing_unique_keys()    # run by create_app; never touches rows
+    migrate()                       # one-off, scripts/migrate_db.py
+
+create_app only adds indexes whose table holds no duplicate keys, with
+IF NOT EXISTS so processes starting together don't race. migrate()
+merges duplicate rows first: the newest row of each group (max
+updated_at, then id) is kept, rows referencing the others are pointed at
+it, and referencing rows that would then collide keep their newest too.
+Keys in RELEASED_KEYS only tag a row (a chat message's idempotency key):
+there the oldest row keeps the key and the others drop it, not the row.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import UniqueConstraint, and_, delete, func, inspect, select, text, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from main.models import db
+
+logger = logging.getLogger(__name__)
+
+# constraint name -> nullable tag column cleared on duplicates instead of merging rows
+RELEASED_KEYS = {'uq_chat_message_user_idempotency': 'idempotency_key'}
+
+
+def _unique_constraints(table):
+    return [c for c in table.constraints if isinstance(c, UniqueConstraint) and c.name]
+
+
+def _database_unique_keys(inspector, table_name):
+    """Names of the unique constraints and indexes a table has in the database."""
+    keys = {u['name'] for u in inspector.get_unique_constraints(table_name)}
+    keys |= {i['name'] for i in inspector.get_indexes(table_name) if i.get('unique')}
+    return keys
+
+
+def missing_unique_keys():
+    """(table, constraint) pairs declared by the models but absent from the database."""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = _database_unique_keys(inspector, table.name)
+        missing += [(table, c) for c in _unique_constraints(table) if c.name not in present]
+    return missing
+
+
+def _create_unique_index(table, constraint):
+    columns = ', '.join(c.name for c in constraint.columns)
+    with db.engine.begin() as conn:
+        conn.execute(text(f'CREATE UNIQUE INDEX IF NOT EXISTS {constraint.name} ON {table.name} ({columns})'))
+    logger.info(f"Added unique index {constraint.name} on {table.name} ({columns})")
+
+
+def create_missing_unique_keys():
+    """Add missing unique indexes; tables with duplicate keys are left for migrate()."""
+    for table, constraint in missing_unique_keys():
+        try:
+            _create_unique_index(table, constraint)
+        except SQLAlchemyError as e:
+            logger.warning(f"Unique index {constraint.name} not created on {table.name} "
+                           f"(duplicate keys?); run scripts/migrate_db.py: {e}")
+
+
+# ── Migration ────────────────────────────────────────────────────────────────
+
+def _newest_first(table, row, keep_parent=None, ref_col=None):
+    """Sort key: newest row first (updated_at, then pointing at the kept parent, then id)."""
+    updated = row._mapping.get('updated_at') if 'updated_at' in table.c else None
+    on_keep = ref_col is not None and row._mapping[ref_col.name] == keep_parent
+    return (updated or datetime.min, on_keep, row._mapping.get('id') or 0)
+
+
+def _row_filter(table, row):
+    return and_(*(col == row._mapping[col.name] for col in table.primary_key.columns))
+
+
+def _repoint(conn, ref_table, ref_col, dup_ids, keep):
+    """Point ref_table rows at `keep`, first dropping those that would break one of its unique keys."""
+    group = [*dup_ids, keep]
+    keys = [list(c.columns) for c in _unique_constraints(ref_table)] + [list(ref_table.primary_key.columns)]
+    for key in keys:
+        if ref_col not in key or len(key) < 2:
+            continue
+        others = [c for c in key if c is not ref_col]
+        wanted = {*others, *ref_table.primary_key.columns, ref_col}
+        if 'updated_at' in ref_table.c:
+            wanted.add(ref_table.c.updated_at)
+        if 'id' in ref_table.c:
+            wanted.add(ref_table.c.id)
+        clashes = {}
+        for row in conn.execute(select(*wanted).where(ref_col.in_(group))):
+            clashes.setdefault(tuple(row._mapping[c.name] for c in others), []).append(row)
+        for rows in clashes.values():
+            rows.sort(key=lambda r: _newest_first(ref_table, r, keep, ref_col), reverse=True)
+            for row in rows[1:]:
+                conn.execute(delete(ref_table).where(_row_filter(ref_table, row)))
+    conn.execute(update(ref_table).where(ref_col.in_(dup_ids)).values({ref_col.name: keep}))
+
+
+def merge_duplicate_rows(table, columns):
+    """Keep the newest row of each group sharing `columns`. Returns the number of groups merged."""
+    key = [table.c[name] for name in columns]
+    referencing = [(t, fk.parent) for t in db.metadata.sorted_tables
+                   for fk in t.foreign_keys if fk.column.table is table]
+    wanted = [table.c.id] + ([table.c.updated_at] if 'updated_at' in table.c else [])
+    with db.engine.begin() as conn:
+        groups = [tuple(values) for values in conn.execute(
+            select(*key).group_by(*key).having(func.count() > 1))
+            if None not in tuple(values)]      # NULLs never collide in a unique index
+        for values in groups:
+            rows = conn.execute(select(*wanted).where(
+                and_(*(col == value for col, value in zip(key, values))))).all()
+            rows.sort(key=lambda r: _newest_first(table, r), reverse=True)
+            keep, dup_ids = rows[0].id, [r.id for r in rows[1:]]
+            for ref_table, ref_col in referencing:
+                _repoint(conn, ref_table, ref_col, dup_ids, keep)
+            conn.execute(delete(table).where(table.c.id.in_(dup_ids)))
+    if groups:
+        logger.info(f"Merged {len(groups)} duplicate key groups in {table.name}")
+    return len(groups)
+
+
+def release_duplicate_keys(table, columns, column):
+    """Clear `column` on all but the oldest row of each group sharing `columns`. Returns the number of groups."""
+    key = [table.c[name] for name in columns]
+    with db.engine.begin() as conn:
+        groups = [tuple(values) for values in conn.execute(
+            select(*key, func.min(table.c.id)).group_by(*key).having(func.count() > 1))
+            if None not in tuple(values)]
+        for *values, keep in groups:
+            conn.execute(update(table).where(
+                and_(*(col == value for col, value in zip(key, values)), table.c.id != keep)
+            ).values({column: None}))
+    if groups:
+        logger.info(f"Released {column} of {len(groups)} duplicate key groups in {table.name}")
+    return len(groups)
+
+
+def migrate():
+    """Merge (or release) duplicates and add the missing unique indexes."""
+    merged = {}
+    for table, constraint in missing_unique_keys():
+        columns = [c.name for c in constraint.columns]
+        if constraint.name in RELEASED_KEYS:
+            merged[constraint.name] = release_duplicate_keys(table, columns, RELEASED_KEYS[constraint.name])
+        else:
+            merged[constraint.name] = merge_duplicate_rows(table, columns)
+        _create_unique_index(table, constraint)
+    return merged
@@ -0,0 +1,197 @@
+"""
+Medication price history from the i-teka.kz sync.
+
+    price_observations   (medication, pharmacy, day) -> integer KZT price,
+                         written only when the price differs from the
+                         pharmacy's last observation (at most one per day)
+    price_rollups        (medication, city, day) -> min/max/avg/pharmacy
+                         count of our stocks plus i-teka's own statistics
+
+StockIngest.flush() calls record() with the prices it just wrote, in the
+same transaction. The price-history API reads rollups only; raw
+observations are never scanned to answer a request.
+
+apply_retention() (the daily price_retention job) keeps both tables
+bounded: raw observations older than PRICE_RAW_RETENTION_DAYS are dropped
+except the one still in effect, daily rollups older than
+PRICE_DAILY_RETENTION_DAYS are merged into one row per month, and monthly
+rows older than PRICE_ROLLUP_RETENTION_DAYS are deleted.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, exists, func
+
+from main.models import db, Pharmacy, PharmacyStock, PriceObservation, PriceRollup
+from main.utils.bulk_upsert import upsert, chunks
+
+logger = logging.getLogger(__name__)
+
+_SITE_FIELDS = {'min': 'site_min', 'max': 'site_max', 'avg': 'site_avg', 'pharmacy_count': 'site_pharmacy_count'}
+_VALUE_COLUMNS = ('period', 'samples', 'min_price', 'max_price', 'avg_price', 'pharmacy_count') + tuple(_SITE_FIELDS.values())
+
+
+def _last_prices(medication_ids):
+    """{(pharmacy_id, medication_id): price} of the latest observation of each pair."""
+    prices = {}
+    for ids in chunks(medication_ids):
+        latest = (db.session.query(PriceObservation.pharmacy_id, PriceObservation.medication_id,
+                                   func.max(PriceObservation.day).label('day'))
+                  .filter(PriceObservation.medication_id.in_(ids))
+                  .group_by(PriceObservation.pharmacy_id, PriceObservation.medication_id)
+                  .subquery())
+        rows = db.session.query(PriceObservation.pharmacy_id, PriceObservation.medication_id, PriceObservation.price) \
+            .join(latest, and_(PriceObservation.pharmacy_id == latest.c.pharmacy_id,
+                               PriceObservation.medication_id == latest.c.medication_id,
+                               PriceObservation.day == latest.c.day))
+        prices.update({(pharmacy_id, med_id): price for pharmacy_id, med_id, price in rows})
+    return prices
+
+
+def record(prices, city, site_stats=None, day=None):
+    """
+    Record the prices just written to pharmacy_stocks and refresh the
+    day's rollups for their medications in `city`. Runs in the caller's
+    transaction.
+
+    prices: {(pharmacy_id, medication_id): price or None}
+    site_stats: {medication_id: i-teka price_stats dict}
+    Returns the number of observations written.
+    """
+    day = day or datetime.utcnow().date()
+    site_stats = site_stats or {}
+    medication_ids = {med_id for _, med_id in prices} | set(site_stats)
+    last = _last_prices(medication_ids)
+
+    rows = []
+    for (pharmacy_id, med_id), price in prices.items():
+        if price is None:
+            continue
+        price = int(round(price))
+        if last.get((pharmacy_id, med_id)) != price:
+            rows.append({'medication_id': med_id, 'pharmacy_id': pharmacy_id, 'day': day, 'price': price})
+    upsert(PriceObservation, rows, conflict=('medication_id', 'pharmacy_id', 'day'), update=('price',))
+
+    refresh_rollups(medication_ids, city, day, site_stats)
+    return len(rows)
+
+
+def refresh_rollups(medication_ids, city, day, site_stats=None):
+    """Recompute the day's rollup of each medication in `city` from current stock prices."""
+    site_stats = site_stats or {}
+    rollups = {}
+    for ids in chunks(medication_ids):
+        rows = (db.session.query(PharmacyStock.medication_id, func.min(PharmacyStock.price),
+                                 func.max(PharmacyStock.price), func.avg(PharmacyStock.price),
+                                 func.count(PharmacyStock.id))
+                .join(Pharmacy, PharmacyStock.pharmacy_id == Pharmacy.id)
+                .filter(Pharmacy.city == city, PharmacyStock.medication_id.in_(ids),
+                        PharmacyStock.price.isnot(None))
+                .group_by(PharmacyStock.medication_id))
+        for med_id, lo, hi, avg, count in rows:
+            rollups[med_id] = {'min_price': int(round(lo)), 'max_price': int(round(hi)),
+                               'avg_price': int(round(avg)), 'pharmacy_count': count}
+
+    with_site, without_site = [], []
+    for med_id in medication_ids:
+        stats = site_stats.get(med_id)
+        if med_id not in rollups and not stats:
+            continue
+        row = {'medication_id': med_id, 'city': city, 'day': day, 'period': 'day', 'samples': 1,
+               'min_price': None, 'max_price': None, 'avg_price': None, 'pharmacy_count': None}
+        row.update(rollups.get(med_id, {}))
+        row.update({column: (stats or {}).get(field) for field, column in _SITE_FIELDS.items()})
+        (with_site if stats else without_site).append(row)
+    # i-teka statistics come with detail pages only; keep the day's values otherwise
+    upsert(PriceRollup, with_site, conflict=('medication_id', 'city', 'day'), update=_VALUE_COLUMNS)
+    upsert(PriceRollup, without_site, conflict=('medication_id', 'city', 'day'),
+           update=_VALUE_COLUMNS[:-len(_SITE_FIELDS)])
+
+
+def history(medication_id, city=None, days=365):
+    """{city: [rollup dicts, oldest first]} for the last `days` days."""
+    since = datetime.utcnow().date() - timedelta(days=days)
+    query = PriceRollup.query.filter(PriceRollup.medication_id == medication_id, PriceRollup.day >= since)
+    if city:
+        query = query.filter(PriceRollup.city == city)
+    series = defaultdict(list)
+    for row in query.order_by(PriceRollup.city, PriceRollup.day):
+        series[row.city].append(row.to_dict())
+    return dict(series)
+
+
+# ── Retention ────────────────────────────────────────────────────────────────
+
+def _merge(target, row):
+    """Fold a rollup row (dict) into a monthly one, weighting averages by samples."""
+    for lo, hi in (('min_price', 'max_price'), ('site_min', 'site_max')):
+        if row[lo] is not None:
+            target[lo] = row[lo] if target[lo] is None else min(target[lo], row[lo])
+        if row[hi] is not None:
+            target[hi] = row[hi] if target[hi] is None else max(target[hi], row[hi])
+    for avg, count in (('avg_price', 'pharmacy_count'), ('site_avg', 'site_pharmacy_count')):
+        if row[avg] is not None:
+            weight = target['_' + avg]
+            target[avg] = round(((target[avg] or 0) * weight + row[avg] * row['samples']) / (weight + row['samples']))
+            target['_' + avg] = weight + row['samples']
+        if row[count] is not None:
+            target[count] = max(target[count] or 0, row[count])
+    target['samples'] += row['samples']
+
+
+def _downsample(cutoff):
+    """Merge daily rollups older than `cutoff` into monthly rows. Returns daily rows merged."""
+    daily = PriceRollup.query.filter(PriceRollup.period == 'day', PriceRollup.day < cutoff).all()
+    if not daily:
+        return 0
+
+    months = {}
+    for row in daily:
+        key = (row.medication_id, row.city, row.day.replace(day=1))
+        months.setdefault(key, []).append(row)
+
+    merged = []
+    for (med_id, city, month), rows in months.items():
+        existing = db.session.get(PriceRollup, (med_id, city, month))
+        target = {'medication_id': med_id, 'city': city, 'day': month, 'period': 'month', 'samples': 0,
+                  '_avg_price': 0, '_site_avg': 0}
+        target.update({column: None for column in _VALUE_COLUMNS[2:]})
+        sources = list(rows)
+        if existing is not None and existing.period == 'month':
+            sources.append(existing)
+        for r in sources:
+            _merge(target, {c: getattr(r, c) for c in _VALUE_COLUMNS})
+        merged.append({k: v for k, v in target.items() if not k.startswith('_')})
+
+    for row in daily:
+        db.session.delete(row)
+    db.session.flush()
+    upsert(PriceRollup, merged, conflict=('medication_id', 'city', 'day'), update=_VALUE_COLUMNS)
+    return len(daily)
+
+
+def apply_retention(config, today=None):
+    """Drop superseded raw observations, downsample and expire rollups. Caller commits."""
+    today = today or datetime.utcnow().date()
+    raw_cutoff = today - timedelta(days=config.get('PRICE_RAW_RETENTION_DAYS', 90))
+    daily_cutoff = today - timedelta(days=config.get('PRICE_DAILY_RETENTION_DAYS', 180))
+    rollup_cutoff = today - timedelta(days=config.get('PRICE_ROLLUP_RETENTION_DAYS', 3 * 365))
+
+    # An old observation goes once a newer one, also before the cutoff, supersedes it
+    newer = db.aliased(PriceObservation)
+    raw_deleted = PriceObservation.query.filter(
+        PriceObservation.day < raw_cutoff,
+        exists().where(and_(newer.pharmacy_id == PriceObservation.pharmacy_id,
+                            newer.medication_id == PriceObservation.medication_id,
+                            newer.day > PriceObservation.day,
+                            newer.day <= raw_cutoff)),
+    ).delete(synchronize_session=False)
+
+    downsampled = _downsample(daily_cutoff)
+    expired = PriceRollup.query.filter(PriceRollup.day < rollup_cutoff.replace(day=1)) \
+        .delete(synchronize_session=False)
+
+    result = {'observations_deleted': raw_deleted, 'daily_merged': downsampled, 'rollups_expired': expired}
+    logger.info(f"Price history retention: {result}")
+    return result
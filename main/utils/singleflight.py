@@ -0,0 +1,75 @@
+"""
+In-flight deduplication ("singleflight") for expensive AI calls.
+
+Concurrent callers asking for the same key share one computation: the
+first caller runs it, the others block until it finishes and receive the
+same result (or the same exception). Nothing is cached afterwards — a
+later call with the same key computes again.
+
+    chat_flight = Group('chat')
+    payload = chat_flight.do(request_key(user_id, conversation_id, message), compute)
+
+This only deduplicates within one process; cross-process duplicates are
+handled by the callers (atomic status claims, idempotency keys).
+"""
+import hashlib
+import logging
+import re
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text):
+    """Case- and whitespace-insensitive form of user input."""
+    return re.sub(r'\s+', ' ', (text or '').strip()).lower()
+
+
+def request_key(user_id, *parts):
+    """Key for (user, normalized input): sha256 over the parts, scoped to the user."""
+    digest = hashlib.sha256(
+        '\x1f'.join(normalize(str(p)) for p in parts).encode('utf-8')
+    ).hexdigest()
+    return f"{user_id}:{digest}"
+
+
+class Group:
+    """A namespace of in-flight computations keyed by string."""
+
+    def __init__(self, name=''):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}   # key -> Future
+        self.stats = {'calls': 0, 'shared': 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) once for all concurrent callers with `key`."""
+        with self._lock:
+            self.stats['calls'] += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.stats['shared'] += 1
+
+        if not leader:
+            logger.info(f"singleflight[{self.name}]: joining in-flight call {key[:24]}")
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
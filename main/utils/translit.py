@@ -0,0 +1,87 @@
+"""
+Text normalization and Cyrillic <-> Latin transliteration for medication search.
+
+    normalize('Парацетамол  Таб.')   -> 'парацетамол таб.'
+    to_latin('амоксициллин')         -> 'amoxicillin'
+    to_cyrillic('paracetamol')       -> 'парацетамол'
+    variants('аспирин')              -> ['аспирин', 'aspirin']
+
+The tables follow how drug names are spelled rather than a passport
+standard: ц/кс map to c/x (paracetamol, amoxicillin), Latin c is read
+as ц before e/i/y and as к elsewhere, and a final e after a consonant
+is silent (metamizole -> метамизол). The result only has to land
+close enough for a substring match, not be a correct spelling.
+"""
+import re
+
+_SPACES = re.compile(r'\s+')
+
+_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p',
+    'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'c', 'ч': 'ch',
+    'ш': 'sh', 'щ': 'sch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+    # Kazakh letters
+    'ә': 'a', 'ғ': 'g', 'қ': 'k', 'ң': 'n', 'ө': 'o', 'ұ': 'u', 'ү': 'u', 'һ': 'h', 'і': 'i',
+}
+
+# Longest match first; single letters after digraphs
+_TO_CYRILLIC = [
+    ('sch', 'щ'), ('chl', 'хл'), ('chr', 'хр'), ('sh', 'ш'), ('ch', 'ч'), ('zh', 'ж'), ('kh', 'х'), ('ts', 'ц'),
+    ('ph', 'ф'), ('th', 'т'), ('ck', 'к'), ('qu', 'кв'), ('ya', 'я'), ('yu', 'ю'),
+    ('yo', 'е'), ('ja', 'я'), ('ju', 'ю'), ('x', 'кс'),
+    ('a', 'а'), ('b', 'б'), ('d', 'д'), ('e', 'е'), ('f', 'ф'), ('g', 'г'), ('h', 'х'),
+    ('i', 'и'), ('j', 'й'), ('k', 'к'), ('l', 'л'), ('m', 'м'), ('n', 'н'), ('o', 'о'),
+    ('p', 'п'), ('q', 'к'), ('r', 'р'), ('s', 'с'), ('t', 'т'), ('u', 'у'), ('v', 'в'),
+    ('w', 'в'), ('y', 'и'), ('z', 'з'), ('c', 'к'),
+]
+_TO_CYRILLIC_RE = re.compile('|'.join(latin for latin, _ in _TO_CYRILLIC))
+_TO_CYRILLIC_MAP = dict(_TO_CYRILLIC)
+
+
+def normalize(text):
+    """Lowercase, ё -> е, collapsed whitespace."""
+    text = (text or '').lower().replace('ё', 'е')
+    # Most names need no whitespace fix-up; skip the regex for them
+    return _SPACES.sub(' ', text).strip() if '  ' in text or not text.isprintable() else text.strip()
+
+
+def has_cyrillic(text):
+    return any('а' <= ch <= 'я' or ch in _TO_LATIN for ch in text)
+
+
+def has_latin(text):
+    return any('a' <= ch <= 'z' for ch in text)
+
+
+def to_latin(text):
+    """Latin spelling of normalized text (other characters are kept)."""
+    return ''.join(_TO_LATIN.get(ch, ch) for ch in text.replace('кс', 'x'))
+
+
+def to_cyrillic(text):
+    """Cyrillic spelling of normalized text (other characters are kept)."""
+    def letter(m):
+        latin = m.group(0)
+        if latin == 'c' and text[m.end():m.end() + 1] in ('e', 'i', 'y'):
+            return 'ц'
+        # A leading e is usually э: ephedrine -> эфедрин, enalapril -> эналаприл
+        if latin == 'e' and (m.start() == 0 or not text[m.start() - 1].isalpha()):
+            return 'э'
+        # ...and a final one after a consonant is silent: metamizole -> метамизол
+        if latin == 'e' and m.start() > 2 and not text[m.end():m.end() + 1].isalpha() \
+                and text[m.start() - 1] not in 'aeiouy':
+            return ''
+        return _TO_CYRILLIC_MAP[latin]
+    return _TO_CYRILLIC_RE.sub(letter, text)
+
+
+def variants(query):
+    """Normalized query plus its spelling in the other script, without duplicates."""
+    query = normalize(query)
+    result = [query]
+    if has_cyrillic(query):
+        result.append(to_latin(query))
+    if has_latin(query):
+        result.append(to_cyrillic(query))
+    return [v for i, v in enumerate(result) if v and v not in result[:i]]
@@ -8,7 +8,8 @@ import sys
 # Add the project root to the Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from main.app import app
+from main.app import app, start_background_workers
 
 if __name__ == '__main__':
+    start_background_workers(app)
     app.run(host="0.0.0.0", port=5000, debug=False)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Benchmark the chat pipeline: medical context loading and RAG retrieval run
+one after the other (old behaviour) vs concurrently (assistant_route.chat).
+
+Each iteration starts with a cold medical-context cache, so the DB work is
+measured every time.  LLM generation is skipped unless --with-llm is given,
+so the numbers isolate the context + retrieval stages.
+
+Usage:
+    python scripts/bench_chat_pipeline.py                         # in-memory DB, synthetic card
+    python scripts/bench_chat_pipeline.py --env development -n 50 # DATABASE_URL from .env
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'ai_engine'))
+
+QUESTIONS = [
+    'Болит живот после еды, изжога и тошнота',
+    'Как лечить бронхиальную астму у взрослых?',
+    'Что такое гипертоническая болезнь?',
+    'Температура 38, кашель и боль в горле третий день',
+    'Какие препараты назначают при сахарном диабете 2 типа?',
+]
+
+
+def _seed_user(db, models, visits: int) -> int:
+    user = models.User(username='bench_user', email='bench@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(models.MedicalMetrics(user_id=user.id, allergies='пенициллин',
+                                         chronic_conditions='гастрит', medications='омепразол'))
+    for i in range(visits):
+        visit = models.Visit(user_id=user.id, doctor_id=1,
+                             visit_date=datetime(2025, 1, 1) + timedelta(days=i))
+        db.session.add(visit)
+        db.session.flush()
+        db.session.add(models.Diagnosis(visit_id=visit.id, disease_name=f'Диагноз {i}'))
+        db.session.add(models.Prescription(visit_id=visit.id, medication_name=f'Препарат {i}',
+                                           dosage='10 мг', frequency='2 раза в день'))
+    db.session.commit()
+    return user.id
+
+
+def _p(values, q):
+    return sorted(values)[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=30, help='iterations per mode')
+    parser.add_argument('--env', default='testing', help='Flask config (testing = in-memory SQLite)')
+    parser.add_argument('--user-id', type=int, default=0, help='existing user (default: seed a synthetic one)')
+    parser.add_argument('--visits', type=int, default=20, help='visits on the synthetic medical card')
+    parser.add_argument('--with-llm', action='store_true', help='include LLM generation')
+    args = parser.parse_args()
+
+    os.environ['FLASK_ENV'] = args.env
+    from main.app import app
+    from main import models
+    from main.models import db
+    from main.routes import assistant_route
+    from main.utils import medical_context
+
+    import rag_engine
+    if not args.with_llm:
+        rag_engine._generate = lambda *a, **kw: ''
+
+    pool = ThreadPoolExecutor(max_workers=2)
+
+    with app.app_context():
+        user_id = args.user_id or _seed_user(db, models, args.visits)
+
+        def sequential(q):
+            ctx = assistant_route._build_user_medical_context(user_id)
+            return rag_engine.answer_question(q, medical_context=ctx)
+
+        def concurrent(q):
+            ctx = pool.submit(assistant_route._load_medical_context, app, user_id, None)
+            return rag_engine.answer_question(q, medical_context=ctx)
+
+        # Warm up the embedding model and FAISS index
+        rag_engine.answer_question(QUESTIONS[0])
+
+        results = {}
+        for name, fn in (('sequential', sequential), ('concurrent', concurrent)):
+            timings = []
+            for i in range(args.n):
+                medical_context.clear()
+                start = time.perf_counter()
+                fn(QUESTIONS[i % len(QUESTIONS)])
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = timings
+
+    print(f"{'mode':<12}{'p50 ms':>10}{'p90 ms':>10}{'mean ms':>10}")
+    for name, timings in results.items():
+        print(f"{name:<12}{_p(timings, 0.5):>10.1f}{_p(timings, 0.9):>10.1f}{statistics.mean(timings):>10.1f}")
+    base, new = _p(results['sequential'], 0.5), _p(results['concurrent'], 0.5)
+    print(f"\np50 reduction: {base - new:.1f} ms ({(base - new) / base:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Benchmark the i-teka.kz fetch phase of sync_iteka_data: every search term
+and popular slug fetched and parsed one after another (old behaviour) vs
+through the concurrent ItekaFetcher.
+
+Runs offline from recorded responses.  Without --cassettes a synthetic set
+is generated; --replay-latency stands in for the network round trip, and
+the per-host concurrency/rate caps apply as in a live sync.
+
+Usage:
+    python scripts/bench_iteka_fetch.py                                # synthetic, 150 ms latency
+    python scripts/bench_iteka_fetch.py --record data/iteka_cassettes  # record a live sync once
+    python scripts/bench_iteka_fetch.py --cassettes data/iteka_cassettes --workers 8 --rate 6
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main.utils import iteka_scraper
+from main.utils.iteka_fetcher import ItekaFetcher
+
+CITY = 'almaty'
+
+
+def _synthetic_cassettes(path):
+    """One search response per term and one detail page per popular slug."""
+    fetcher = ItekaFetcher(mode='replay', cassette_dir=path)
+    for i, term in enumerate(iteka_scraper.SEARCH_TERMS):
+        items = ''.join(
+            f'<div class="multi-item"><a href="/{CITY}/medicaments/{term}-{j}"></a>'
+            f'<div class="multi-content"><a>{term.capitalize()} {j} - цена в Алматы</a></div>'
+            f'<div class="multi-price">от {100 + j} тг.</div></div>'
+            for j in range(20)
+        )
+        fetcher.store(f"{iteka_scraper._BASE}/global-search/run",
+                      json.dumps({'result': True, 'data': {'status': True, 'html': items}}, ensure_ascii=False),
+                      params={'query': term}, cookies={'new_city_id': CITY})
+    for slug in iteka_scraper._POPULAR_SLUGS:
+        pharmacies = ''.join(
+            f'<div class="list-item gtm_block_apteka"><div class="title">Аптека {k}</div>'
+            f'<div class="address">ул. Абая {k}</div><div class="status">в наличии</div>'
+            f'<div class="price">{200 + k} тг</div></div>'
+            for k in range(60)
+        )
+        fetcher.store(f"{iteka_scraper._BASE}/{CITY}/medicaments/{slug}",
+                      f'<div class="container-drug-item"><div class="name">{slug}</div></div>{pharmacies}')
+
+
+def _fetch_all(fetcher):
+    searches = list(fetcher.map(lambda term: iteka_scraper.search_medications(term, CITY, fetcher),
+                                iteka_scraper.SEARCH_TERMS))
+    details = list(fetcher.map(lambda slug: iteka_scraper.get_medication_detail(slug, CITY, fetcher),
+                               iteka_scraper._POPULAR_SLUGS))
+    return sum(r['ok'] for r in searches + details)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cassettes', help='directory of recorded responses (default: synthetic)')
+    parser.add_argument('--record', metavar='DIR', help='fetch live from i-teka.kz and record into DIR')
+    parser.add_argument('--replay-latency', type=float, default=0.15, help='simulated seconds per request')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--per-host', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=0, help='requests/second per host (0 = unlimited)')
+    args = parser.parse_args()
+
+    if args.record:
+        fetcher = ItekaFetcher(workers=args.workers, per_host=args.per_host, rate=args.rate or 4,
+                               mode='record', cassette_dir=args.record)
+        start = time.perf_counter()
+        ok = _fetch_all(fetcher)
+        print(f"Recorded {fetcher.stats['recorded']} responses ({ok} ok) in "
+              f"{time.perf_counter() - start:.1f}s → {args.record}")
+        return
+
+    tmp = None
+    path = args.cassettes
+    if not path:
+        tmp = tempfile.TemporaryDirectory()
+        path = tmp.name
+        _synthetic_cassettes(path)
+
+    runs = {
+        'sequential': dict(workers=1, per_host=1, rate=0),
+        'concurrent': dict(workers=args.workers, per_host=args.per_host, rate=args.rate),
+    }
+    results = {}
+    for name, opts in runs.items():
+        fetcher = ItekaFetcher(mode='replay', cassette_dir=path, replay_latency=args.replay_latency, **opts)
+        start = time.perf_counter()
+        ok = _fetch_all(fetcher)
+        elapsed = time.perf_counter() - start
+        fetcher.close()
+        results[name] = elapsed
+        print(f"{name:<12}{elapsed:>8.2f}s  {fetcher.stats['requests'] / elapsed:>7.1f} req/s  "
+              f"({ok}/{fetcher.stats['requests']} ok)")
+
+    print(f"\nspeed-up: {results['sequential'] / results['concurrent']:.1f}x")
+    if tmp:
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Benchmark writing i-teka.kz sync results: the old per-row ORM path (a
+SELECT for every medication, pharmacy and stock, commit per page) vs the
+bulk StockIngest path (preloaded keys + batched ON CONFLICT upserts).
+
+Each path runs on a fresh database twice: an initial load (all inserts)
+and a re-sync with new prices (all updates).
+
+Usage:
+    python scripts/bench_iteka_ingest.py                          # 100k stocks, temp SQLite file
+    python scripts/bench_iteka_ingest.py --stocks 20000
+    python scripts/bench_iteka_ingest.py --database-url postgresql://user:pw@localhost/bench
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+
+def _pages(n_stocks, pharmacies_per_page, price_offset):
+    """Synthetic detail pages: (medication name, [(pharmacy, address, price), ...])."""
+    n_meds = max(1, n_stocks // pharmacies_per_page)
+    for m in range(n_meds):
+        yield (f'Препарат {m} таблетки {m % 50 + 1}0 мг',
+               [(f'Аптека {p % 400}', f'ул. Абая {p}', 100 + (m * 7 + p) % 900 + price_offset)
+                for p in range(pharmacies_per_page)])
+
+
+def _orm_write(db, models, pages, city='almaty'):
+    """The per-row path sync_iteka_data used before bulk ingestion."""
+    for med_name, pharmacies in pages:
+        med = models.Medication.query.filter_by(name=med_name).first()
+        if not med:
+            med = models.Medication(name=med_name, is_otc=True)
+            db.session.add(med)
+            db.session.flush()
+        for pharm_name, pharm_addr, price in pharmacies:
+            pharm = models.Pharmacy.query.filter_by(name=pharm_name, address=pharm_addr).first()
+            if not pharm:
+                pharm = models.Pharmacy(name=pharm_name, name_ru=pharm_name, address=pharm_addr,
+                                        city=city.capitalize(), city_ru=city.capitalize())
+                db.session.add(pharm)
+                db.session.flush()
+            stock = models.PharmacyStock.query.filter_by(pharmacy_id=pharm.id, medication_id=med.id).first()
+            if stock:
+                stock.price = price
+                stock.quantity = 1 if price else 0
+            else:
+                db.session.add(models.PharmacyStock(pharmacy_id=pharm.id, medication_id=med.id,
+                                                    quantity=1 if price else 0, price=price, currency='KZT'))
+        db.session.commit()
+
+
+def _bulk_write(db, ingest, pages):
+    for med_name, pharmacies in pages:
+        for pharm_name, pharm_addr, price in pharmacies:
+            ingest.add_stock(med_name, pharm_name, pharm_addr, price)
+    ingest.flush()
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stocks', type=int, default=100_000, help='stock rows per pass')
+    parser.add_argument('--per-page', type=int, default=250, help='pharmacies per detail page')
+    parser.add_argument('--database-url', help='run against this database (tables are created and emptied)')
+    parser.add_argument('--skip-orm', action='store_true', help='only time the bulk path')
+    args = parser.parse_args()
+
+    from main.app import create_app
+    from main.config import config, TestingConfig
+    from main import models
+    from main.models import db
+    from main.utils.iteka_ingest import StockIngest
+
+    tmp = tempfile.TemporaryDirectory()
+    results = {}
+    paths = ['bulk'] if args.skip_orm else ['orm', 'bulk']
+    for path in paths:
+        url = args.database_url or f"sqlite:///{os.path.join(tmp.name, f'{path}.db')}"
+
+        class BenchConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = url
+
+        config['bench'] = BenchConfig
+        app = create_app('bench')
+        with app.app_context():
+            if args.database_url:
+                db.drop_all()
+                db.create_all()
+            timings = []
+            for offset in (0, 5):
+                pages = list(_pages(args.stocks, args.per_page, offset))
+                start = time.perf_counter()
+                if path == 'orm':
+                    _orm_write(db, models, pages)
+                else:
+                    _bulk_write(db, StockIngest(None, 'almaty'), pages)
+                timings.append(time.perf_counter() - start)
+            results[path] = timings
+            db.engine.dispose()
+
+    print(f"{args.stocks} stock rows, {args.per_page} pharmacies per page")
+    print(f"{'path':<8}{'insert s':>10}{'update s':>10}{'rows/s':>12}")
+    for path, (insert_s, update_s) in results.items():
+        print(f"{path:<8}{insert_s:>10.2f}{update_s:>10.2f}{2 * args.stocks / (insert_s + update_s):>12.0f}")
+    if 'orm' in results:
+        print(f"\nspeed-up: {sum(results['orm']) / sum(results['bulk']):.1f}x")
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Benchmark i-teka.kz detail page parsing: the old BeautifulSoup path (a
+regex split of the instruction block with a fresh soup per section) vs
+iteka_parser.parse_detail on every installed backend.
+
+Pages come from tests/fixtures/iteka, or from a directory of saved detail
+pages (e.g. a record-mode cassette dir with --pages).
+
+Usage:
+    python scripts/bench_iteka_parse.py
+    python scripts/bench_iteka_parse.py --repeat 200
+    python scripts/bench_iteka_parse.py --pages data/iteka_pages
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _legacy_detail(html):
+    """The extraction get_medication_detail did before iteka_parser."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    name_el = soup.select_one(".container-drug-item .name")
+    name = name_el.get_text(strip=True) if name_el else None
+
+    pharmacies = []
+    for row in soup.select(".list-item.gtm_block_apteka"):
+        fields = {}
+        for field in ("title", "address", "status", "price"):
+            el = row.select_one(f".{field}")
+            fields[field] = el.get_text(strip=True) if el else ""
+        pm = re.search(r"([\d\s\u2009\u00a0]+)\s*тг", fields["price"])
+        if fields["title"]:
+            pharmacies.append((fields["title"], fields["address"], int(re.sub(r"\D", "", pm.group(1))) if pm else None))
+
+    characteristics = {}
+    feat_table = soup.select_one(".feature-modal table")
+    if feat_table:
+        for tr in feat_table.find_all("tr"):
+            cells = tr.find_all("td")
+            if len(cells) >= 2:
+                characteristics[cells[0].get_text(strip=True)] = cells[1].get_text(strip=True)
+
+    sections = {}
+    instr_el = soup.select_one(".instruction-full")
+    if instr_el:
+        parts = re.split(r"<strong[^>]*>(.*?)</strong>", str(instr_el))
+        for i in range(1, len(parts) - 1, 2):
+            heading = BeautifulSoup(parts[i], "html.parser").get_text(strip=True)
+            content = BeautifulSoup(parts[i + 1], "html.parser").get_text(separator=" ", strip=True)
+            if heading and content:
+                sections[heading] = content
+    return name, pharmacies, characteristics, sections
+
+
+def _time(fn, pages, repeat):
+    fn(pages[0])    # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for html in pages:
+            fn(html)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', default=os.path.join(ROOT, 'tests', 'fixtures', 'iteka'),
+                        help='directory of saved detail pages (*.html)')
+    parser.add_argument('--repeat', type=int, default=50, help='passes over the page set')
+    args = parser.parse_args()
+
+    from main.utils import iteka_parser
+
+    pages = []
+    for path in sorted(glob.glob(os.path.join(args.pages, '*.html'))):
+        with open(path, encoding='utf-8') as f:
+            pages.append(f.read())
+    if not pages:
+        sys.exit(f"No *.html pages in {args.pages}")
+    n = len(pages) * args.repeat
+    mb = sum(len(p.encode('utf-8')) for p in pages) * args.repeat / 1e6
+
+    runs = {'legacy bs4': _legacy_detail}
+    for name, backend in iteka_parser.BACKENDS.items():
+        runs[name] = lambda html, b=backend: iteka_parser.parse_detail(html, b)
+
+    print(f"{len(pages)} pages x {args.repeat} passes ({mb:.1f} MB)")
+    print(f"{'parser':<14}{'seconds':>10}{'pages/s':>10}{'ms/page':>10}{'speed-up':>10}")
+    baseline = None
+    for name, fn in runs.items():
+        elapsed = _time(fn, pages, args.repeat)
+        baseline = baseline or elapsed
+        print(f"{name:<14}{elapsed:>10.2f}{n / elapsed:>10.0f}{1000 * elapsed / n:>10.2f}{baseline / elapsed:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
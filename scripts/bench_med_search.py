@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+Benchmark medication search: the old ILIKE '%q%' scan over name and
+generic_name vs the indexed backends of main/utils/med_search.py
+(fts5 on SQLite, pg_trgm on PostgreSQL, and the in-process index).
+
+A synthetic catalog of Cyrillic trade names with Latin generic names
+(10% carry one of a dozen real INNs, the rest one of 2000 made-up ones)
+is loaded once; every path then answers the same queries: full names,
+prefixes, mid-word fragments and Latin spellings of Cyrillic names.
+Typeahead lookups (main/utils/med_suggest.py) are timed on prefixes of
+the same queries.
+
+Usage:
+    python scripts/bench_med_search.py                          # 100k medications, temp SQLite file
+    python scripts/bench_med_search.py --medications 20000
+    python scripts/bench_med_search.py --database-url postgresql://user:pw@localhost/bench
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from main.utils import translit
+
+_STEMS = ['парацетамол', 'ибупрофен', 'амоксициллин', 'аторвастатин', 'метформин', 'лоратадин',
+          'омепразол', 'дротаверин', 'цетиризин', 'азитромицин', 'диклофенак', 'эналаприл']
+_LATIN = ['paracetamol', 'ibuprofen', 'amoxicillin', 'atorvastatin', 'metformin', 'loratadine',
+          'omeprazole', 'drotaverine', 'cetirizine', 'azithromycin', 'diclofenac', 'enalapril']
+_FORMS = ['таблетки', 'капсулы', 'сироп', 'раствор', 'суспензия', 'гель', 'мазь']
+_SYLLABLES = ['ра', 'ко', 'ми', 'тен', 'зол', 'вит', 'лан', 'фер', 'бу', 'стат', 'цин', 'дол', 'нор', 'пи']
+
+QUERIES = ['парацетамол', 'ибупроф', 'оксицил', 'metformin', 'loratadin', 'стат', 'таблетки 500',
+           'azithro', 'ношпа', 'enalapril']
+
+
+def _catalog(n, real_share=0.1):
+    """Trade names built from syllables; `real_share` of them carry one of the real INNs above."""
+    rng = random.Random(0)
+    synthetic = [''.join(rng.choice(_SYLLABLES) for _ in range(3)) + rng.choice(['ин', 'ол', 'ам', 'ид'])
+                 for _ in range(2000)]
+    for i in range(n):
+        if rng.random() < real_share:
+            k = rng.randrange(len(_STEMS))
+            stem, latin = _STEMS[k], _LATIN[k]
+        else:
+            stem = rng.choice(synthetic)
+            latin = translit.to_latin(stem)
+        brand = ''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+        name = f'{brand} {rng.choice(_FORMS)} {rng.choice([5, 10, 20, 50, 100, 250, 500])} мг №{i}'
+        if rng.random() < 0.2:
+            name = f'{stem.capitalize()} {name}'
+        yield {'name': name, 'generic_name': latin.capitalize(), 'active_ingredient': stem, 'is_otc': True}
+
+
+def _time(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--medications', type=int, default=100_000, help='catalog size')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per query (median is reported)')
+    parser.add_argument('--database-url', help='run against this database (tables are created and emptied)')
+    args = parser.parse_args()
+
+    from main.app import create_app
+    from main.config import config, TestingConfig
+    from main.models import db, Medication
+    from main.utils import med_search, med_suggest
+    from main.utils.bulk_upsert import upsert
+
+    tmp = tempfile.TemporaryDirectory()
+    url = args.database_url or f"sqlite:///{os.path.join(tmp.name, 'search.db')}"
+
+    class BenchConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = url
+
+    config['bench'] = BenchConfig
+    app = create_app('bench')
+    with app.app_context():
+        if args.database_url:
+            db.drop_all()
+            db.create_all()
+        start = time.perf_counter()
+        upsert(Medication, list(_catalog(args.medications)), conflict=('name',))
+        db.session.commit()
+        print(f"{args.medications} medications loaded in {time.perf_counter() - start:.1f}s "
+              f"(indexed backend: {app.extensions['med_search']})")
+
+        # Both paths do what the search endpoint does: count + first page of 20
+        def ilike(q):
+            return lambda: [m.id for m in Medication.query.filter(
+                (Medication.name.ilike(f'%{q}%')) | (Medication.generic_name.ilike(f'%{q}%'))
+            ).order_by(Medication.name).paginate(page=1, per_page=20, error_out=False).items]
+
+        def indexed(search):
+            return lambda q: lambda: [m.id for m in med_search.paginate(search(q), 1, 20)[0]]
+
+        paths = {'ilike': ilike, app.extensions['med_search']: indexed(med_search.search)}
+        if 'memory' not in paths:
+            start = time.perf_counter()
+            med_search.BACKENDS['memory'].search(['x'], 1)         # build the in-process index
+            print(f"in-process index built in {time.perf_counter() - start:.1f}s")
+            paths['memory'] = indexed(lambda q: med_search.BACKENDS['memory'].search(translit.variants(q), 1000))
+
+        print(f"\n{'query':<16}" + ''.join(f'{p + " ms":>12}' for p in paths) + f"{'hits':>8}")
+        totals = {p: 0.0 for p in paths}
+        for q in QUERIES:
+            row = f'{q:<16}'
+            for path, make in paths.items():
+                seconds = _time(make(q), args.repeat)
+                totals[path] += seconds
+                row += f'{seconds * 1000:>12.1f}'
+            hits = len(med_search.search(q))
+            print(row + f'{hits:>8}')
+        print(f"{'total':<16}" + ''.join(f'{totals[p] * 1000:>12.1f}' for p in paths))
+        print('\nspeed-up vs ilike: ' + ', '.join(f'{p} {totals["ilike"] / totals[p]:.1f}x'
+                                                    for p in paths if p != 'ilike'))
+
+        start = time.perf_counter()
+        med_suggest.refresh()
+        print(f"\ntypeahead index built in {time.perf_counter() - start:.1f}s")
+        print(f"{'prefix':<16}{'suggest us':>12}")
+        for q in QUERIES:
+            for prefix in (q[:2], q[:4]):
+                seconds = _time(lambda: med_suggest.suggest(prefix), args.repeat * 20)
+                print(f'{prefix:<16}{seconds * 1e6:>12.0f}')
+        db.engine.dispose()
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Benchmark two-stage reduced-dimension search (ai_engine/refine.py).
+
+For each compression level, reports the RAM-resident first-stage size,
+single-query QPS and recall@k against exact float32 search at several
+candidate oversampling factors (candidates are always re-scored exactly).
+
+Usage:
+    python scripts/bench_refine.py                      # data/embeddings/embeddings.npy
+    python scripts/bench_refine.py --synthetic 50000    # random corpus, no data needed
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import faiss
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'ai_engine'))
+
+import refine
+
+
+def _load_corpus(args) -> np.ndarray:
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        # Low-rank structure + noise, roughly like sentence embeddings
+        basis = rng.standard_normal((64, args.dim)).astype('float32')
+        emb = rng.standard_normal((args.synthetic, 64)).astype('float32') @ basis
+        emb += 0.3 * rng.standard_normal(emb.shape).astype('float32')
+    else:
+        path = os.path.join(ROOT, 'data', 'embeddings', 'embeddings.npy')
+        if not os.path.exists(path):
+            sys.exit(f"{path} not found — run ai_engine/embed.py or pass --synthetic N")
+        emb = np.load(path).astype('float32')
+    faiss.normalize_L2(emb)
+    return np.ascontiguousarray(emb)
+
+
+def _queries(emb: np.ndarray, n: int) -> np.ndarray:
+    """Perturbed corpus vectors: realistic 'paraphrase' queries with known neighbours."""
+    rng = np.random.default_rng(1)
+    q = emb[rng.choice(len(emb), n, replace=False)]
+    q = q + 0.05 * rng.standard_normal(q.shape).astype('float32')
+    faiss.normalize_L2(q)
+    return np.ascontiguousarray(q)
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def _bench(search, queries: np.ndarray, k: int) -> tuple[np.ndarray, float]:
+    results = []
+    start = time.perf_counter()
+    for q in queries:
+        _, I = search(q[None, :], k)
+        results.append(I[0])
+    elapsed = time.perf_counter() - start
+    return np.vstack(results), len(queries) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--synthetic', type=int, default=0, help='use N random vectors instead of the corpus')
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=15)
+    args = parser.parse_args()
+
+    emb = _load_corpus(args)
+    queries = _queries(emb, min(args.queries, len(emb)))
+    k = args.k
+    print(f"Corpus: {emb.shape[0]} × {emb.shape[1]}  queries: {len(queries)}  k={k}\n")
+
+    flat = faiss.IndexFlatIP(emb.shape[1])
+    flat.add(emb)
+    truth, flat_qps = _bench(flat.search, queries, k)
+    flat_mb = emb.nbytes / 1_048_576
+
+    print(f"{'config':<22}{'RAM MB':>9}{'QPS':>10}{'recall@k':>10}")
+    print(f"{'flat float32':<22}{flat_mb:>9.2f}{flat_qps:>10.0f}{1.0:>10.3f}")
+
+    levels = [('sq8', {}), ('sq4', {}),
+              ('pca', {'pca_dim': 192}), ('pca', {'pca_dim': 128}),
+              ('pca', {'pca_dim': 64}), ('pca', {'pca_dim': 32})]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, opts in levels:
+            coarse, proj = refine.build_coarse(emb, mode, **opts)
+            refine.save(tmp, emb, coarse, proj)
+            ram_mb = (faiss.serialize_index(coarse).nbytes
+                      + (proj.nbytes if proj is not None else 0)) / 1_048_576
+            label = mode if mode != 'pca' else f"pca{opts['pca_dim']}"
+
+            for oversample in (1, 4, 8):
+                searcher = refine.RefinedSearcher.load(tmp, oversample)
+                found, qps = _bench(searcher.search, queries, k)
+                name = f"{label} ×{oversample}" + (" (no oversample)" if oversample == 1 else "")
+                print(f"{name:<22}{ram_mb:>9.2f}{qps:>10.0f}{_recall(found, truth):>10.3f}")
+            del searcher
+
+    print("\nRAM MB counts the first stage only; refinement reads candidate rows from "
+          "the memory-mapped vectors.npy (page cache, not process heap).")
+
+
+if __name__ == '__main__':
+    main()
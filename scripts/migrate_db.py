@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+"""
+One-off migration of an existing database to the unique keys the models
+declare (create_app only adds those it can add without touching rows).
+
+Merges duplicate rows (the newest of each group is kept, references are
+pointed at it; duplicate chat idempotency keys are cleared instead, see
+migrations.RELEASED_KEYS) and creates the missing unique indexes. Back up
+the database first.
+
+Usage:
+    FLASK_ENV=production python scripts/migrate_db.py
+    python scripts/migrate_db.py --dry-run      # list what would change
+"""
+import argparse
+import logging
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help='only list missing unique keys')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s:%(name)s: %(message)s')
+
+    from main.app import app
+    from main.utils import migrations
+
+    with app.app_context():
+        for table, constraint in migrations.missing_unique_keys():
+            print(f"missing:  {table.name}.{constraint.name} ({', '.join(c.name for c in constraint.columns)})")
+        if args.dry_run:
+            return
+        for name, groups in migrations.migrate().items():
+            print(f"created:  {name} ({groups} duplicate groups merged or released)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Shared pytest fixtures
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture
+def file_app():
+    """App on a file-based SQLite DB: real write locks, unlike :memory:."""
+    import main.app
+    from main.config import config, TestingConfig
+    from main.models import db, User
+    from main.routes import assistant_route
+    from main.utils import chat_jobs, conversation_memory, email_otp
+
+    tmp = tempfile.TemporaryDirectory()
+
+    class FileSQLiteConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp.name, 'chat.db')}"
+        SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 1}}   # fail fast on locks
+
+    config['testing_file'] = FileSQLiteConfig
+    app = main.app.create_app('testing_file')
+    with app.app_context():
+        user = User(username='chat_user', email='chat@example.com', password_hash='x')
+        other = User(username='other_user', email='other@example.com', password_hash='x')
+        db.session.add_all([user, other])
+        db.session.commit()
+        app.user_ids = (user.id, other.id)
+    yield app
+
+    with app.app_context():
+        db.engine.dispose()
+    del config['testing_file']
+    # Background helpers keep a module-level app; point them back at the default one
+    conversation_memory.set_app(main.app.app)
+    email_otp.set_app(main.app.app)
+    chat_jobs.init_app(main.app.app, assistant_route.run_chat_turn)
+    tmp.cleanup()
+
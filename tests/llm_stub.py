@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Tiny OpenAI-compatible chat server for tests and local development.
+
+Answers POST /v1/chat/completions with a canned reply.  Counts TCP
+connections so tests can check that clients reuse keep-alive connections.
+
+    python tests/llm_stub.py --port 11434      # stand-in for Ollama
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "Это тестовый ответ локальной модели."
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'     # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        if self.path != '/v1/chat/completions':
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        with self.server.lock:
+            self.server.requests.append(body)
+        reply = self.server.reply
+
+        payload = json.dumps({
+            'choices': [{'message': {'role': 'assistant', 'content': reply}}],
+            'model': body.get('model'),
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class StubLLMServer:
+    """Context manager running the stub on 127.0.0.1 in a background thread."""
+
+    def __init__(self, port: int = 0, reply: str = DEFAULT_REPLY):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.reply = reply
+        self.httpd.requests = []
+        self.httpd.connections = 0
+        self.httpd.lock = threading.Lock()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self) -> list:
+        return self.httpd.requests
+
+    @property
+    def connections(self) -> int:
+        return self.httpd.connections
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='OpenAI-compatible stub LLM server')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--reply', default=DEFAULT_REPLY)
+    args = parser.parse_args()
+    with StubLLMServer(args.port, args.reply) as stub:
+        print(f"Stub LLM listening on {stub.url}")
+        threading.Event().wait()
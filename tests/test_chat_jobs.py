@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Test async chat jobs: 202 + job id, polling, SSE delivery and restart resume
+"""
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+from main.models import db, ChatConversation, ChatJob, ChatMessage
+from main.routes import assistant_route
+from main.utils import chat_jobs
+
+
+def _client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+    return client
+
+
+def _poll(client, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        body = client.get(f'/assistant/api/chat/jobs/{job_id}').get_json()
+        if body['status'] in ('done', 'failed'):
+            return body
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def _fake_rag(monkeypatch, answer='Ответ из очереди'):
+    monkeypatch.setattr(assistant_route, 'answer_question', lambda q, medical_context='': answer)
+    monkeypatch.setattr(assistant_route, 'schedule_summary_update', lambda convo_id: None)
+
+
+def test_async_chat_returns_job_and_stores_answer(file_app, monkeypatch):
+    _fake_rag(monkeypatch)
+    client = _client(file_app, file_app.user_ids[0])
+
+    resp = client.post('/assistant/api/chat', json={'message': 'Болит горло', 'async': True})
+    assert resp.status_code == 202
+    body = resp.get_json()
+    assert resp.headers['Location'].endswith(f"/assistant/api/chat/jobs/{body['job_id']}")
+
+    done = _poll(client, body['job_id'])
+    assert done['status'] == 'done'
+    assert done['response'] == 'Ответ из очереди'
+    with file_app.app_context():
+        assert ChatMessage.query.filter_by(conversation_id=body['conversation_id']).count() == 2
+
+    # Other users cannot see the job
+    other = _client(file_app, file_app.user_ids[1])
+    assert other.get(f"/assistant/api/chat/jobs/{body['job_id']}").status_code == 404
+
+
+def test_async_flag_strings_are_parsed(file_app, monkeypatch):
+    _fake_rag(monkeypatch)
+    client = _client(file_app, file_app.user_ids[0])
+    for value, status in (('false', 200), ('0', 200), ('true', 202), ('1', 202), (False, 200)):
+        resp = client.post('/assistant/api/chat', json={'message': f'Насморк {value!r}', 'async': value})
+        assert resp.status_code == status, value
+
+
+def test_sse_stream_delivers_result(file_app, monkeypatch):
+    _fake_rag(monkeypatch)
+    client = _client(file_app, file_app.user_ids[0])
+    job_id = client.post('/assistant/api/chat', json={'message': 'Кашель', 'async': True}).get_json()['job_id']
+
+    stream = client.get(f'/assistant/api/chat/jobs/{job_id}/stream')
+    assert stream.mimetype == 'text/event-stream'
+    text = stream.get_data(as_text=True)
+    assert 'event: done' in text
+    assert 'Ответ из очереди' in text
+
+
+def test_pending_jobs_resume_on_startup(file_app, monkeypatch):
+    _fake_rag(monkeypatch, answer='После перезапуска')
+    user_id = file_app.user_ids[0]
+    with file_app.app_context():
+        convo = ChatConversation(user_id=user_id, title='New Chat')
+        db.session.add(convo)
+        db.session.flush()
+        job_id = uuid.uuid4().hex
+        db.session.add(ChatJob(id=job_id, user_id=user_id, conversation_id=convo.id,
+                               message='Температура 38', status='pending'))
+        db.session.commit()
+
+    chat_jobs.init_app(file_app, assistant_route.run_chat_turn)
+    with file_app.app_context():
+        chat_jobs.resume_unfinished()
+    done = _poll(_client(file_app, user_id), job_id)
+    assert done['response'] == 'После перезапуска'
+
+
+def test_failed_generation_marks_job_failed(file_app, monkeypatch):
+    def broken(question, medical_context=''):
+        raise RuntimeError('LLM down')
+
+    monkeypatch.setattr(assistant_route, 'answer_question', broken)
+    client = _client(file_app, file_app.user_ids[0])
+    job_id = client.post('/assistant/api/chat', json={'message': 'Сыпь', 'async': True}).get_json()['job_id']
+    done = _poll(client, job_id)
+    assert done['status'] == 'failed'
+    assert 'LLM down' in done['error']
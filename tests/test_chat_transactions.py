@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Test that /assistant/api/chat holds no DB transaction during LLM generation
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+from main.models import db, ChatConversation, ChatMessage
+from main.routes import assistant_route
+
+
+def _client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+    return client
+
+
+def test_other_writers_not_blocked_during_generation(file_app, monkeypatch):
+    user_id, other_id = file_app.user_ids
+    writes = []
+
+    def concurrent_write():
+        with file_app.app_context():
+            db.session.add(ChatConversation(user_id=other_id, title='parallel'))
+            db.session.commit()
+            writes.append('ok')
+
+    def slow_answer(question, medical_context=''):
+        medical_context.result(timeout=5)
+        writer = threading.Thread(target=concurrent_write)
+        writer.start()
+        writer.join(timeout=10)
+        return 'Ответ ассистента'
+
+    monkeypatch.setattr(assistant_route, 'answer_question', slow_answer)
+    monkeypatch.setattr(assistant_route, 'schedule_summary_update', lambda convo_id: None)
+
+    client = _client(file_app, user_id)
+    resp = client.post('/assistant/api/chat', json={'message': 'Болит голова'})
+    assert resp.status_code == 200, resp.get_json()
+    assert writes == ['ok']
+
+    convo_id = resp.get_json()['conversation_id']
+    with file_app.app_context():
+        roles = [m.role for m in ChatMessage.query.filter_by(conversation_id=convo_id)
+                 .order_by(ChatMessage.id)]
+        assert roles == ['user', 'assistant']
+
+
+def test_default_title_is_set_with_the_messages(file_app, monkeypatch):
+    user_id, _ = file_app.user_ids
+    monkeypatch.setattr(assistant_route, 'answer_question', lambda q, medical_context='': 'Ответ')
+    monkeypatch.setattr(assistant_route, 'schedule_summary_update', lambda convo_id: None)
+
+    client = _client(file_app, user_id)
+    convo_id = client.post('/assistant/api/conversations').get_json()['id']
+    resp = client.post('/assistant/api/chat', json={'message': 'Что такое мигрень?',
+                                                    'conversation_id': convo_id})
+    assert resp.get_json()['conversation_title'] == 'Что такое мигрень?'
+    with file_app.app_context():
+        assert db.session.get(ChatConversation, convo_id).title == 'Что такое мигрень?'
+        assert ChatMessage.query.filter_by(conversation_id=convo_id).count() == 2
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Test that the chat medical context loads while retrieval runs, and that a
+late or failing context degrades to an empty one
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'ai_engine'))
+os.environ['FLASK_ENV'] = 'testing'
+
+from deferred import resolve
+from main.models import db, ChatConversation
+from main.routes import assistant_route
+
+DELAY = 0.3
+
+
+def test_context_build_overlaps_retrieval(file_app, monkeypatch):
+    user_id, _ = file_app.user_ids
+    started = threading.Event()
+
+    def slow_context(app, uid, convo_id):
+        started.set()
+        time.sleep(DELAY)
+        return 'Аллергии пациента: пенициллин'
+
+    def answer(question, medical_context=''):
+        assert started.wait(timeout=5)       # building before retrieval starts
+        time.sleep(DELAY)                    # retrieval
+        return f"Ответ ({resolve(medical_context, timeout=5)})"
+
+    monkeypatch.setattr(assistant_route, '_load_medical_context', slow_context)
+    monkeypatch.setattr(assistant_route, 'answer_question', answer)
+    monkeypatch.setattr(assistant_route, 'schedule_summary_update', lambda convo_id: None)
+
+    with file_app.app_context():
+        convo = ChatConversation(user_id=user_id, title='New Chat')
+        db.session.add(convo)
+        db.session.commit()
+        start = time.perf_counter()
+        response = assistant_route.run_chat_turn(file_app, user_id, convo.id, 'Болит горло')
+        elapsed = time.perf_counter() - start
+
+    assert response == 'Ответ (Аллергии пациента: пенициллин)'
+    assert elapsed < 2 * DELAY * 0.9
+
+
+def test_late_or_failing_context_degrades_to_empty():
+    assert resolve('карта', timeout=1) == 'карта'
+    assert resolve(None, timeout=1) == ''
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        late = pool.submit(time.sleep, 1)
+        start = time.perf_counter()
+        assert resolve(late, timeout=0.05) == ''
+        assert time.perf_counter() - start < 0.5
+
+    failed = Future()
+    failed.set_exception(RuntimeError('db down'))
+    assert resolve(failed, timeout=1) == ''
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Test rolling conversation summary memory for the assistant
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+import pytest
+
+from main.app import app
+from main.models import db, User, ChatConversation, ChatMessage
+from main.utils import conversation_memory, groq_client
+
+
+@pytest.fixture
+def convo_id(monkeypatch):
+    monkeypatch.setattr(groq_client, 'summarize_conversation', lambda *a, **kw: '')
+    with app.app_context():
+        user = User(username='memory_user', email='memory@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        convo = ChatConversation(user_id=user.id, title='Гастрит')
+        db.session.add(convo)
+        db.session.flush()
+        turns = [
+            ('user', 'Болит живот после еды уже неделю. Что это может быть?'),
+            ('assistant', 'Возможен гастрит.'),
+            ('user', 'У меня аллергия на пенициллин.'),
+            ('assistant', 'Учту аллергию.'),
+            ('user', 'Что можно есть при гастрите?'),
+            ('assistant', 'Щадящая диета.'),
+        ]
+        for role, content in turns:
+            db.session.add(ChatMessage(user_id=user.id, conversation_id=convo.id,
+                                       role=role, content=content))
+        db.session.commit()
+        yield convo.id
+
+        db.session.delete(db.session.get(ChatConversation, convo.id))
+        db.session.delete(db.session.get(User, user.id))
+        db.session.commit()
+
+
+def test_summary_covers_everything_but_the_last_turn(convo_id):
+    with app.app_context():
+        assert conversation_memory.update_summary(convo_id)
+        convo = db.session.get(ChatConversation, convo_id)
+        assert convo.summary_message_count == 4
+        assert 'Болит живот после еды уже неделю.' in convo.summary
+        assert 'пенициллин' in convo.summary
+        assert 'Что можно есть' not in convo.summary
+
+        # Nothing new to fold in
+        assert not conversation_memory.update_summary(convo_id)
+
+        history = conversation_memory.build_history(convo_id)
+        assert history.startswith('Краткое содержание беседы:')
+        assert 'Пациент: Что можно есть при гастрите?' in history
+        assert 'Ассистент: Щадящая диета.' in history
+        assert 'Возможен гастрит' not in history
+
+
+def test_history_keeps_messages_the_summary_has_not_caught_up_with(convo_id):
+    with app.app_context():
+        # No summary yet: everything is verbatim
+        history = conversation_memory.build_history(convo_id)
+        assert 'Болит живот' in history and 'Щадящая диета.' in history
+
+        # Summary covers only the first turn: the second must not fall in the gap
+        convo = db.session.get(ChatConversation, convo_id)
+        convo.summary, convo.summary_message_count = '- Болит живот после еды уже неделю.', 2
+        db.session.commit()
+        history = conversation_memory.build_history(convo_id)
+        assert 'Пациент: У меня аллергия на пенициллин.' in history
+        assert 'Пациент: Что можно есть при гастрите?' in history
+        assert 'Возможен гастрит' not in history
+
+
+def test_background_update(convo_id):
+    conversation_memory.schedule_summary_update(convo_id).result(timeout=10)
+    with app.app_context():
+        assert db.session.get(ChatConversation, convo_id).summary_message_count == 4
+
+
+def test_extractive_summary_keeps_newest_lines():
+    class Msg:
+        def __init__(self, content):
+            self.role, self.content = 'user', content
+
+    msgs = [Msg(f'Вопрос номер {i}. Подробности.') for i in range(100)]
+    summary = conversation_memory.extractive_summary('', msgs, max_chars=200)
+    assert len(summary) <= 200
+    assert summary.endswith('- Вопрос номер 99.')
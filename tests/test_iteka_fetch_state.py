@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Test change detection in the i-teka sync: ETag/304 and fragment hashes
+skip parsing and DB writes for unchanged pages
+"""
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+from main.utils import iteka_parser, iteka_scraper
+from main.utils.iteka_fetcher import ItekaFetcher
+
+SLUG = 'paracetamol-tabletki-500-mg-10'
+
+
+def _detail_page(price, script='var t = 1;'):
+    return (f'<html><head><meta name="csrf-token" content="{script}"><script>{script}</script></head><body>'
+            f'<div class="cart">{script}</div>'
+            '<div class="container-drug-item"><div class="name">Парацетамол таблетки 500 мг</div></div>'
+            '<div class="list-item gtm_block_apteka"><div class="title">Аптека 1</div>'
+            f'<div class="address">ул. Абая 1</div><div class="price">{price} тг</div></div></body></html>')
+
+
+def _store_pages(fetcher, price, script='var t = 1;'):
+    search_html = (f'<div class="multi-item"><a href="/almaty/medicaments/{SLUG}"></a>'
+                   '<div class="multi-content"><a>Парацетамол - цена в Алматы</a></div></div>')
+    fetcher.store(f"{iteka_scraper._BASE}/global-search/run",
+                  json.dumps({'result': True, 'data': {'status': True, 'html': search_html}}),
+                  params={'query': 'парацетамол'}, cookies={'new_city_id': 'almaty'})
+    fetcher.store(iteka_scraper.detail_url(SLUG, 'almaty'), _detail_page(price, script))
+
+
+def _stock(app, price=None):
+    from main.models import db, Medication, PharmacyStock
+    with app.app_context():
+        med = Medication.query.filter_by(name='Парацетамол таблетки 500 мг').one()
+        stock = PharmacyStock.query.filter_by(medication_id=med.id).one()
+        if price is not None:
+            stock.price = price
+            db.session.commit()
+        return stock.price
+
+
+def test_unchanged_pages_skip_parsing_and_writes(file_app, tmp_path, monkeypatch):
+    fetcher = ItekaFetcher(mode='replay', cassette_dir=str(tmp_path), rate=0)
+    _store_pages(fetcher, 150)
+
+    stats = iteka_scraper.sync_iteka_data(file_app, fetcher=fetcher, cities=['almaty'])
+    assert stats['detail'] == {'fetched': 20, 'unchanged': 0, 'updated': 1, 'failed': 19}
+    assert stats['search']['updated'] == 1
+    assert _stock(file_app) == 150
+
+    # A local edit survives: the unchanged page is neither parsed nor upserted
+    _stock(file_app, price=999)
+    parsed = []
+    for name in ('parse_detail', 'parse_search'):
+        real = getattr(iteka_parser, name)
+        monkeypatch.setattr(iteka_parser, name, lambda *a, _real=real, **kw: parsed.append(1) or _real(*a, **kw))
+    _store_pages(fetcher, 150, script='var t = 2;')       # only volatile markup differs
+
+    stats = iteka_scraper.sync_iteka_data(file_app, fetcher=fetcher, cities=['almaty'])
+    assert stats['detail'] == {'fetched': 20, 'unchanged': 1, 'updated': 0, 'failed': 19}
+    assert stats['search'] == {'fetched': 50, 'unchanged': 1, 'updated': 0, 'failed': 49}
+    assert parsed == []
+    assert _stock(file_app) == 999
+
+    _store_pages(fetcher, 175)
+    stats = iteka_scraper.sync_iteka_data(file_app, fetcher=fetcher, cities=['almaty'])
+    assert stats['detail']['updated'] == 1
+    assert _stock(file_app) == 175
+
+
+class _ETagHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.server.bodies += 1
+        body = _detail_page(150).encode('utf-8')
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_etag_revalidation_returns_not_modified():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _ETagHandler)
+    httpd.bodies = 0
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://{httpd.server_address[0]}:{httpd.server_address[1]}/almaty/medicaments/{SLUG}"
+    fetcher = ItekaFetcher(rate=0)
+    try:
+        r, validators, unchanged = iteka_scraper._conditional_get(fetcher, url, None,
+                                                                  iteka_scraper._detail_fragment)
+        assert r.status_code == 200 and unchanged is None
+        assert validators['etag'] == '"v1"' and len(validators['content_hash']) == 64
+
+        r, _, unchanged = iteka_scraper._conditional_get(fetcher, url, validators,
+                                                         iteka_scraper._detail_fragment)
+        assert r is None and unchanged == 'not_modified'
+        assert httpd.bodies == 1
+    finally:
+        fetcher.close()
+        httpd.shutdown()
+        httpd.server_close()
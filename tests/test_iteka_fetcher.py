@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Test the concurrent i-teka fetcher: shared keep-alive pool, per-host caps,
+retry with backoff, record/replay, and a replayed sync into the DB
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+import pytest
+
+from main.utils import iteka_scraper
+from main.utils.iteka_fetcher import ItekaFetcher, CassetteMiss
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        srv = self.server
+        with srv.lock:
+            srv.in_flight += 1
+            srv.max_in_flight = max(srv.max_in_flight, srv.in_flight)
+            srv.hits += 1
+            fail = srv.hits <= srv.fail_first
+        time.sleep(srv.delay)
+        status, body = (503, b'busy') if fail else (200, f'page {self.path}'.encode('utf-8'))
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with srv.lock:
+            srv.in_flight -= 1
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.connections = httpd.in_flight = httpd.max_in_flight = httpd.hits = 0
+    httpd.fail_first = 0
+    httpd.delay = 0.0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    host, port = httpd.server_address
+    httpd.url = f"http://{host}:{port}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_concurrent_fetches_respect_per_host_cap_and_reuse_connections(server):
+    server.delay = 0.05
+    fetcher = ItekaFetcher(workers=8, per_host=2, rate=0)
+    pages = list(fetcher.map(lambda i: fetcher.get(f"{server.url}/p/{i}").text, range(12)))
+    fetcher.close()
+
+    assert pages == [f'page /p/{i}' for i in range(12)]
+    assert server.max_in_flight == 2
+    assert server.connections <= 2
+    assert fetcher.stats['requests'] == 12 and fetcher.stats['failures'] == 0
+
+
+def test_rate_cap_spaces_request_starts(server):
+    fetcher = ItekaFetcher(workers=4, per_host=4, rate=20)
+    start = time.monotonic()
+    list(fetcher.map(lambda i: fetcher.get(f"{server.url}/p/{i}"), range(6)))
+    fetcher.close()
+    assert time.monotonic() - start >= 5 / 20 - 0.01
+
+
+def test_transient_errors_are_retried_with_backoff(server):
+    server.fail_first = 2
+    fetcher = ItekaFetcher(retries=3, backoff=0.01, rate=0)
+    r = fetcher.get(f"{server.url}/search")
+    assert r.status_code == 200
+    assert fetcher.stats['retries'] == 2
+
+    server.fail_first = server.hits + 5
+    r = fetcher.get(f"{server.url}/search")
+    assert r.status_code == 503
+    assert fetcher.stats['failures'] == 1
+
+
+def test_record_then_replay_offline(server, tmp_path):
+    recorder = ItekaFetcher(mode='record', cassette_dir=str(tmp_path), rate=0)
+    recorded = recorder.get(f"{server.url}/global-search/run", params={'query': 'парацетамол'},
+                            cookies={'new_city_id': 'almaty'}).text
+    assert recorder.stats['recorded'] == 1
+    server.shutdown()
+
+    replayer = ItekaFetcher(mode='replay', cassette_dir=str(tmp_path))
+    r = replayer.get(f"{server.url}/global-search/run", params={'query': 'парацетамол'},
+                     cookies={'new_city_id': 'almaty'})
+    assert r.status_code == 200 and r.text == recorded
+
+    with pytest.raises(CassetteMiss):
+        replayer.get(f"{server.url}/global-search/run", params={'query': 'парацетамол'},
+                     cookies={'new_city_id': 'astana'})
+
+
+def test_sync_from_replayed_responses(file_app, tmp_path):
+    from main.models import Medication, PharmacyStock
+
+    fetcher = ItekaFetcher(mode='replay', cassette_dir=str(tmp_path), rate=0)
+    search_html = ('<div class="multi-item"><a href="/almaty/medicaments/paracetamol-tabletki-500-mg-10">'
+                   '</a><div class="multi-content"><a>Парацетамол - цена в Алматы</a></div>'
+                   '<div class="multi-price">от 120 тг.</div></div>')
+    fetcher.store("https://i-teka.kz/global-search/run",
+                  json.dumps({'result': True, 'data': {'status': True, 'html': search_html}}),
+                  params={'query': 'парацетамол'}, cookies={'new_city_id': 'almaty'})
+    detail_html = ('<div class="container-drug-item"><div class="name">Парацетамол таблетки 500 мг</div></div>'
+                   '<div class="list-item gtm_block_apteka"><div class="title">Аптека 1</div>'
+                   '<div class="address">ул. Абая 1</div><div class="price">150 тг</div></div>')
+    fetcher.store("https://i-teka.kz/almaty/medicaments/paracetamol-tabletki-500-mg-10", detail_html)
+
+    iteka_scraper.sync_iteka_data(file_app, fetcher=fetcher, cities=['almaty'])
+
+    with file_app.app_context():
+        names = {m.name for m in Medication.query.all()}
+        assert {'Парацетамол', 'Парацетамол таблетки 500 мг'} <= names
+        med = Medication.query.filter_by(name='Парацетамол таблетки 500 мг').one()
+        assert [s.price for s in PharmacyStock.query.filter_by(medication_id=med.id)] == [150]
+    # every search term and popular slug was requested; those without a cassette are skipped
+    assert fetcher.stats['requests'] == len(iteka_scraper.SEARCH_TERMS) + len(iteka_scraper._POPULAR_SLUGS)
+    assert fetcher.stats['replayed'] == 2
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""
+Test bulk ingestion of i-teka sync results: ON CONFLICT upserts in a few
+batched statements, and the unique-key migration for existing databases
+(main.utils.migrations)
+"""
+import os
+import re
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+from sqlalchemy import event, inspect, text
+
+from main.models import db, ChatMessage, Medication, Pharmacy, PharmacyStock
+from main.utils.iteka_ingest import StockIngest
+
+
+def _stage(ingest, price):
+    for p in range(50):
+        for m in range(20):
+            ingest.add_stock(f'Препарат {m}', f'Аптека {p}', f'ул. Абая {p}', price + m)
+
+
+def _count_statements():
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.append(a[2]))
+    return statements
+
+
+def test_flush_inserts_then_updates_in_batches(file_app):
+    with file_app.app_context():
+        stocks_before = PharmacyStock.query.count()
+        statements = _count_statements()
+
+        ingest = StockIngest(category_id=None, city='almaty')
+        _stage(ingest, 100)
+        counts = ingest.flush()
+        db.session.commit()
+
+        assert counts == {'medications_new': 20, 'pharmacies_new': 50, 'stocks_new': 1000, 'stocks_updated': 0}
+        assert PharmacyStock.query.count() == stocks_before + 1000
+        assert len(statements) < 20
+
+        _stage(ingest, 200)
+        counts = ingest.flush()
+        db.session.commit()
+
+        assert counts == {'medications_new': 0, 'pharmacies_new': 0, 'stocks_new': 0, 'stocks_updated': 1000}
+        assert PharmacyStock.query.count() == stocks_before + 1000
+        med = Medication.query.filter_by(name='Препарат 3').one()
+        pharm = Pharmacy.query.filter_by(name='Аптека 7', address='ул. Абая 7').one()
+        stock = PharmacyStock.query.filter_by(pharmacy_id=pharm.id, medication_id=med.id).one()
+        assert (stock.price, stock.quantity, stock.currency) == (203, 1, 'KZT')
+        assert stock.created_at is not None and med.is_otc and pharm.city == 'Almaty'
+
+
+def test_same_pharmacy_address_in_two_cities(file_app):
+    from main.models import PriceRollup
+
+    with file_app.app_context():
+        # i-teka addresses carry no city
+        for city, price in (('almaty', 100), ('astana', 200)):
+            ingest = StockIngest(None, city)
+            ingest.add_stock('Препарат', 'Europharma', 'ул. Абая, 57', price)
+            assert ingest.flush()['pharmacies_new'] == 1
+            db.session.commit()
+
+        med = Medication.query.filter_by(name='Препарат').one()
+        prices = {s.pharmacy.city: s.price for s in PharmacyStock.query.filter_by(medication_id=med.id)}
+        assert prices == {'Almaty': 100, 'Astana': 200}
+        rollups = {r.city: r.min_price for r in PriceRollup.query.filter_by(medication_id=med.id)}
+        assert rollups == {'Almaty': 100, 'Astana': 200}
+
+        # A re-sync of one city updates only its own pharmacy
+        ingest = StockIngest(None, 'astana')
+        ingest.add_stock('Препарат', 'Europharma', 'ул. Абая, 57', 210)
+        assert ingest.flush() == {'medications_new': 0, 'pharmacies_new': 0, 'stocks_new': 0, 'stocks_updated': 1}
+        db.session.commit()
+        prices = {s.pharmacy.city: s.price for s in PharmacyStock.query.filter_by(medication_id=med.id)}
+        assert prices == {'Almaty': 100, 'Astana': 210}
+
+
+def _drop_constraints(table):
+    """Recreate `table` as an older database had it, without unique constraints."""
+    ddl = db.session.execute(text("SELECT sql FROM sqlite_master WHERE name = :t"), {'t': table}).scalar()
+    ddl = re.sub(r',\s*CONSTRAINT uq_\w+ UNIQUE \([^)]*\)', '', ddl)
+    db.session.execute(text(f'ALTER TABLE {table} RENAME TO old_{table}'))
+    db.session.execute(text(ddl))
+    db.session.execute(text(f'INSERT INTO {table} SELECT * FROM old_{table}'))
+    db.session.execute(text(f'DROP TABLE old_{table}'))
+    db.session.commit()
+
+
+def _unique_indexes(*tables):
+    return {i['name'] for t in tables for i in inspect(db.engine).get_indexes(t) if i['unique']}
+
+
+def test_migration_keeps_the_newest_duplicate_and_adds_unique_indexes(file_app):
+    from main.utils import migrations
+
+    with file_app.app_context():
+        # An older database: no unique keys, duplicate pharmacies and stocks
+        _drop_constraints('pharmacies')
+        _drop_constraints('pharmacy_stocks')
+        med = Medication(name='Дубль', is_otc=True)
+        a = Pharmacy(name='Аптека', address='ул. 1', city='Almaty', updated_at=datetime(2026, 3, 1))
+        b = Pharmacy(name='Аптека', address='ул. 1', city='Almaty', updated_at=datetime(2026, 1, 1))
+        db.session.add_all([med, a, b])
+        db.session.flush()
+        db.session.add_all([
+            PharmacyStock(pharmacy_id=a.id, medication_id=med.id, quantity=1, price=10, updated_at=datetime(2026, 1, 1)),
+            PharmacyStock(pharmacy_id=b.id, medication_id=med.id, quantity=1, price=12, updated_at=datetime(2026, 2, 1)),
+        ])
+        db.session.commit()
+
+        # create_app never touches rows: only the stock key, free of duplicates, is added
+        migrations.create_missing_unique_keys()
+        migrations.create_missing_unique_keys()
+        assert _unique_indexes('pharmacies', 'pharmacy_stocks') == {'uq_stock_pharmacy_medication'}
+        assert Pharmacy.query.filter_by(name='Аптека').count() == 2
+
+        # Merging the pharmacies makes their stocks collide on the stock key
+        assert migrations.migrate() == {'uq_pharmacy_name_address_city': 1}
+        db.session.expire_all()
+        assert _unique_indexes('pharmacies', 'pharmacy_stocks') == {'uq_pharmacy_name_address_city',
+                                                                    'uq_stock_pharmacy_medication'}
+        # The most recently updated pharmacy and the current price survive
+        assert [p.id for p in Pharmacy.query.filter_by(name='Аптека')] == [a.id]
+        assert [(s.pharmacy_id, s.price) for s in PharmacyStock.query.filter_by(medication_id=med.id)] == [(a.id, 12)]
+        assert migrations.missing_unique_keys() == [] and migrations.migrate() == {}
+
+
+def test_migration_releases_duplicate_idempotency_keys(file_app):
+    from main.utils import migrations
+
+    user_id = file_app.user_ids[0]
+    with file_app.app_context():
+        _drop_constraints('chat_messages')
+        db.session.add_all([ChatMessage(user_id=user_id, role='user', content=f'Кашель {i}',
+                                        idempotency_key='retry-1') for i in range(3)])
+        db.session.commit()
+
+        assert migrations.migrate() == {'uq_chat_message_user_idempotency': 1}
+        db.session.expire_all()
+        # Every message stays; only the first keeps the key a replay looks up
+        assert [(m.content, m.idempotency_key) for m in ChatMessage.query.order_by(ChatMessage.id)] == [
+            ('Кашель 0', 'retry-1'), ('Кашель 1', None), ('Кашель 2', None)]
+        assert 'uq_chat_message_user_idempotency' in _unique_indexes('chat_messages')
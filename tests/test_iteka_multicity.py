@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Test the multi-city i-teka sync: cities rotate across runs, run side by
+side on one fetcher after a single search phase, and an interrupted round
+resumes from its checkpoint
+"""
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+from main.utils import iteka_scraper
+from main.utils.iteka_fetcher import ItekaFetcher
+
+SLUG = 'paracetamol-tabletki-500-mg-10'
+SEARCH_PAGES = len(iteka_scraper.SEARCH_TERMS)
+DETAIL_PAGES = len(iteka_scraper._POPULAR_SLUGS)
+
+
+def _replay(tmp_path, cities):
+    fetcher = ItekaFetcher(mode='replay', cassette_dir=str(tmp_path), rate=0)
+    for i, city in enumerate(cities):
+        search_html = (f'<div class="multi-item"><a href="/{city}/medicaments/{SLUG}"></a>'
+                       '<div class="multi-content"><a>Парацетамол - цена</a></div></div>')
+        fetcher.store(f"{iteka_scraper._BASE}/global-search/run",
+                      json.dumps({'result': True, 'data': {'status': True, 'html': search_html}}),
+                      params={'query': 'парацетамол'}, cookies={'new_city_id': city})
+        fetcher.store(iteka_scraper.detail_url(SLUG, city),
+                      '<div class="container-drug-item"><div class="name">Парацетамол таблетки 500 мг</div></div>'
+                      f'<div class="list-item gtm_block_apteka"><div class="title">Аптека {city}</div>'
+                      f'<div class="address">ул. Абая {i}</div><div class="price">{150 + i} тг</div></div>')
+    return fetcher
+
+
+def _checkpoint(app, city):
+    from main.models import db, ItekaSyncCheckpoint
+    with app.app_context():
+        return db.session.get(ItekaSyncCheckpoint, city).to_dict()
+
+
+def test_runs_rotate_through_cities(file_app, tmp_path):
+    from main.models import Pharmacy
+
+    file_app.config.update(ITEKA_CITIES=['almaty', 'astana', 'oral'], ITEKA_CITIES_PER_RUN=2, ITEKA_SYNC_SHARDS=2)
+    fetcher = _replay(tmp_path, ['almaty', 'astana', 'oral'])
+
+    stats = iteka_scraper.sync_iteka_data(file_app, fetcher=fetcher)
+    assert list(stats['cities']) == ['almaty', 'astana']
+    # search terms are fetched once for both cities, detail pages per city
+    assert stats['detail']['updated'] == 2 and stats['search']['fetched'] == SEARCH_PAGES
+    assert fetcher.stats['requests'] == SEARCH_PAGES + 2 * DETAIL_PAGES
+    assert set(stats['cities']['almaty']) == {'detail'}
+
+    # the city never synced goes next, then the least recently completed
+    oldest = min(['almaty', 'astana'], key=lambda c: _checkpoint(file_app, c)['completed_at'])
+    assert list(iteka_scraper.sync_iteka_data(file_app, fetcher=fetcher)['cities']) == ['oral', oldest]
+
+    with file_app.app_context():
+        oral = Pharmacy.query.filter_by(name='Аптека oral').one()
+        assert (oral.city, oral.city_ru, oral.city_kz) == ('Oral', 'Уральск', 'Орал')
+    assert _checkpoint(file_app, 'astana')['phase'] == 'done'
+
+
+def test_interrupted_round_resumes_from_checkpoint(file_app, tmp_path, monkeypatch):
+    file_app.config.update(ITEKA_CHECKPOINT_PAGES=10)
+    fetcher = _replay(tmp_path, ['almaty'])
+    real_detail = iteka_scraper.get_medication_detail
+    crash_at = iteka_scraper._POPULAR_SLUGS[12]
+
+    def crashing_detail(slug, *args, **kwargs):
+        if slug == crash_at:
+            raise RuntimeError('worker killed')
+        return real_detail(slug, *args, **kwargs)
+
+    monkeypatch.setattr(iteka_scraper, 'get_medication_detail', crashing_detail)
+    with pytest.raises(RuntimeError):
+        iteka_scraper.sync_iteka_data(file_app, fetcher=fetcher, cities=['almaty'])
+    cp = _checkpoint(file_app, 'almaty')
+    assert (cp['phase'], cp['position'], cp['lease_owner']) == ('detail', 10, None)
+
+    monkeypatch.setattr(iteka_scraper, 'get_medication_detail', real_detail)
+    requests_before = fetcher.stats['requests']
+    stats = iteka_scraper.sync_iteka_data(file_app, fetcher=fetcher, cities=['almaty'])
+
+    # a new search round, then only the unwritten detail pages; counts cover the whole round
+    assert fetcher.stats['requests'] - requests_before == SEARCH_PAGES + DETAIL_PAGES - 10
+    assert stats['search']['fetched'] == SEARCH_PAGES
+    assert stats['detail']['fetched'] == DETAIL_PAGES
+    assert _checkpoint(file_app, 'almaty')['phase'] == 'done'
+
+
+def test_city_leased_by_another_process_is_skipped(file_app, tmp_path):
+    from main.models import db, ItekaSyncCheckpoint
+
+    with file_app.app_context():
+        db.session.add(ItekaSyncCheckpoint(city='almaty', phase='detail', position=0, lease_owner='other-host:1',
+                                           lease_expires_at=datetime.utcnow() + timedelta(minutes=5)))
+        db.session.commit()
+    fetcher = _replay(tmp_path, ['almaty'])
+
+    stats = iteka_scraper.sync_iteka_data(file_app, fetcher=fetcher, cities=['almaty'])
+    assert stats['cities'] == {} and fetcher.stats['requests'] == SEARCH_PAGES
+    assert _checkpoint(file_app, 'almaty')['lease_owner'] == 'other-host:1'
+
+
+def test_search_leased_by_another_process_is_skipped(file_app, tmp_path):
+    from main.models import db, ItekaSyncCheckpoint
+
+    with file_app.app_context():
+        db.session.add(ItekaSyncCheckpoint(city=iteka_scraper.SEARCH_SHARD, phase='search', position=0,
+                                           lease_owner='other-host:1',
+                                           lease_expires_at=datetime.utcnow() + timedelta(minutes=5)))
+        db.session.commit()
+    fetcher = _replay(tmp_path, ['almaty'])
+
+    stats = iteka_scraper.sync_iteka_data(file_app, fetcher=fetcher, cities=['almaty'])
+    assert stats['search']['fetched'] == 0 and stats['detail']['fetched'] == DETAIL_PAGES
+    assert fetcher.stats['requests'] == DETAIL_PAGES
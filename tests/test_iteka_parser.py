@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Test i-teka HTML extraction: every installed parser backend reproduces the
+output of the original BeautifulSoup code on saved pages
+"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+from main.utils import iteka_parser, iteka_scraper
+from main.utils.iteka_fetcher import ItekaFetcher
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'iteka')
+SLUG = 'paracetamol-tabletki-500-mg-10'
+
+
+def _load(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return json.load(f) if name.endswith('.json') else f.read()
+
+
+@pytest.mark.parametrize('backend', list(iteka_parser.BACKENDS))
+@pytest.mark.parametrize('page', ['detail_paracetamol', 'detail_no_shpa'])
+def test_detail_matches_expected(backend, page):
+    expected = _load(f'{page}.expected.json')
+    parsed = iteka_parser.parse_detail(_load(f'{page}.html'), iteka_parser.get_backend(backend))
+
+    assert parsed['price_stats'] == expected['price_stats']
+    assert parsed['pharmacies'] == expected['pharmacies']
+    assert parsed['characteristics'] == expected['characteristics']
+    assert parsed['instruction_sections'] == expected['instruction_sections']
+    assert parsed['name'] == expected['medication']
+
+
+@pytest.mark.parametrize('backend', list(iteka_parser.BACKENDS))
+def test_search_matches_expected(backend):
+    html = _load('search_paracetamol.json')['data']['html']
+    expected = _load('search_paracetamol.expected.json')['results']
+    items = iteka_parser.parse_search(html, iteka_parser.get_backend(backend))
+
+    assert [i['name'] for i in items] == [e['name'] for e in expected]
+    assert [i['price_text'] for i in items] == [e['price_text'] for e in expected]
+    assert all(e['slug'] in i['href'] for i, e in zip(items, expected))
+
+
+def test_scraper_detail_through_default_backend(tmp_path):
+    fetcher = ItekaFetcher(mode='replay', cassette_dir=str(tmp_path), rate=0)
+    fetcher.store(iteka_scraper.detail_url(SLUG, 'almaty'), _load('detail_paracetamol.html'))
+    expected = _load('detail_paracetamol.expected.json')
+
+    detail = iteka_scraper.get_medication_detail(SLUG, 'almaty', fetcher=fetcher)
+
+    assert detail['ok'] and detail['medication'] == expected['medication']
+    assert detail['pharmacies'] == expected['pharmacies']
+    assert detail['med_info'] == expected['med_info']
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        iteka_parser.get_backend('html5lib-not-installed')
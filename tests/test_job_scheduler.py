@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Test the leader-elected job scheduler: one run per due job across
+instances, lease takeover, missed-run catch-up and run history
+"""
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+from main.models import db, ScheduledJob, JobRun
+from main.utils.job_scheduler import JobScheduler
+
+HOUR = 60 * 60
+
+
+def _schedulers(app, fn, n=2, **kwargs):
+    schedulers = []
+    for i in range(n):
+        s = JobScheduler(app, owner=f'instance-{i}')
+        s.register('sync', fn, HOUR, **kwargs)
+        with app.app_context():
+            s._ensure_rows()
+        schedulers.append(s)
+    return schedulers
+
+
+def test_due_job_runs_on_one_instance(file_app):
+    calls = []
+    barrier = threading.Barrier(2)
+
+    def job(app):
+        calls.append(threading.current_thread().name)
+        return 'synced'
+
+    a, b = _schedulers(file_app, job)
+
+    def tick(s, out):
+        barrier.wait()
+        out.extend(s.run_pending(wait=True))
+
+    ran = []
+    threads = [threading.Thread(target=tick, args=(s, ran)) for s in (a, b)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+
+    assert ran == ['sync']
+    assert len(calls) == 1
+
+    with file_app.app_context():
+        row = db.session.get(ScheduledJob, 'sync')
+        assert row.last_status == 'ok'
+        assert row.lease_owner is None
+        assert row.next_run_at > datetime.utcnow() + timedelta(minutes=59)
+        runs = JobRun.query.filter_by(job_name='sync').all()
+        assert [(r.status, r.result, r.missed_runs) for r in runs] == [('ok', 'synced', 0)]
+
+    # Not due again until the next interval
+    assert a.run_pending(wait=True) == [] and b.run_pending(wait=True) == []
+
+
+def test_live_lease_blocks_and_expired_lease_is_taken_over(file_app):
+    calls = []
+    a, = _schedulers(file_app, lambda app: calls.append(1), n=1)
+
+    with file_app.app_context():
+        row = db.session.get(ScheduledJob, 'sync')
+        row.lease_owner = 'crashed-instance'
+        row.lease_expires_at = datetime.utcnow() + timedelta(minutes=5)
+        db.session.commit()
+    assert a.run_pending(wait=True) == []
+
+    with file_app.app_context():
+        db.session.get(ScheduledJob, 'sync').lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+    assert a.run_pending(wait=True) == ['sync']
+    assert calls == [1]
+
+
+def test_missed_runs_are_caught_up_once(file_app):
+    calls = []
+    a, = _schedulers(file_app, lambda app: calls.append(1), n=1)
+
+    with file_app.app_context():
+        db.session.get(ScheduledJob, 'sync').next_run_at = datetime.utcnow() - timedelta(hours=5, minutes=30)
+        db.session.commit()
+
+    assert a.run_pending(wait=True) == ['sync']
+    assert a.run_pending(wait=True) == []
+    assert calls == [1]
+    with file_app.app_context():
+        run = JobRun.query.filter_by(job_name='sync').one()
+        assert run.missed_runs == 5
+        assert db.session.get(ScheduledJob, 'sync').next_run_at > datetime.utcnow()
+
+
+def test_failed_run_is_recorded_and_rescheduled(file_app):
+    def job(app):
+        raise RuntimeError('i-teka is down')
+
+    a, = _schedulers(file_app, job, n=1)
+    assert a.run_pending(wait=True) == ['sync']
+
+    with file_app.app_context():
+        row = db.session.get(ScheduledJob, 'sync')
+        assert row.last_status == 'failed' and 'i-teka is down' in row.last_error
+        assert row.lease_owner is None and row.next_run_at > datetime.utcnow()
+        assert JobRun.query.filter_by(job_name='sync').one().status == 'failed'
+
+
+def test_non_exclusive_job_runs_in_every_process(file_app):
+    calls = []
+    a, b = _schedulers(file_app, lambda app: calls.append(1), exclusive=False)
+
+    assert a.run_pending(wait=True) == ['sync']
+    assert b.run_pending(wait=True) == ['sync']
+    assert a.run_pending(wait=True) == []
+    assert len(calls) == 2
+    with file_app.app_context():
+        assert db.session.get(ScheduledJob, 'sync') is None
+        assert JobRun.query.filter_by(job_name='sync').count() == 2
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Test LLM admission control: token buckets, priority classes and 429 backpressure
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+import pytest
+
+from main.utils.llm_scheduler import LLMScheduler, SchedulerSaturated, CHAT, TIPS, EXTRACTION
+
+
+def _drain(scheduler, provider, n):
+    for _ in range(n):
+        with scheduler.admit(provider, CHAT):
+            pass
+
+
+def test_request_bucket_rejects_fast_when_wait_exceeds_budget():
+    scheduler = LLMScheduler(limits={'groq': {'rpm': 60, 'tpm': 0}}, max_wait={CHAT: 0.2})
+    _drain(scheduler, 'groq', 60)
+
+    start = time.monotonic()
+    with pytest.raises(SchedulerSaturated) as exc:
+        scheduler.admit('groq', CHAT)
+    assert time.monotonic() - start < 0.1          # rejected without sitting out the wait
+    assert exc.value.retry_after >= 1
+
+    # Refill is 1 request/s: a caller willing to wait gets in
+    with scheduler.admit('groq', CHAT, max_wait=2):
+        pass
+    stats = scheduler.stats()['classes'][CHAT]
+    assert stats['admitted'] == 61 and stats['rejected'] == 1
+
+
+def test_token_bucket_charges_actual_usage():
+    scheduler = LLMScheduler(limits={'groq': {'rpm': 0, 'tpm': 1000}})
+    with scheduler.admit('groq', TIPS, tokens=900) as ticket:
+        ticket.used_tokens = 100                    # estimate was far too high
+    with scheduler.admit('groq', TIPS, tokens=800, max_wait=0.05):
+        pass
+
+
+def test_chat_overtakes_queued_batch_work():
+    scheduler = LLMScheduler(limits={'groq': {'rpm': 120, 'tpm': 0}})
+    _drain(scheduler, 'groq', 120)                  # next slot in ~0.5 s
+    order = []
+
+    def call(priority):
+        with scheduler.admit('groq', priority, max_wait=5):
+            order.append(priority)
+
+    batch = threading.Thread(target=call, args=(EXTRACTION,))
+    batch.start()
+    time.sleep(0.05)
+    chat = threading.Thread(target=call, args=(CHAT,))
+    chat.start()
+    batch.join(5)
+    chat.join(5)
+    assert order == [CHAT, EXTRACTION]
+
+
+def test_bounded_queue_and_unlimited_providers():
+    scheduler = LLMScheduler(limits={'groq': {'rpm': 60, 'tpm': 0}}, queue_limits={EXTRACTION: 0})
+    with pytest.raises(SchedulerSaturated):
+        scheduler.admit('groq', EXTRACTION)
+    with scheduler.admit('local', EXTRACTION):     # no limits configured
+        pass
+
+
+def test_chat_endpoint_answers_429_with_retry_after(file_app, monkeypatch):
+    from main.routes import assistant_route
+
+    def saturated(question, medical_context=''):
+        raise SchedulerSaturated('groq', CHAT, 7)
+
+    monkeypatch.setattr(assistant_route, 'answer_question', saturated)
+    client = file_app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(file_app.user_ids[0])
+
+    resp = client.post('/assistant/api/chat', json={'message': 'Болит спина'})
+    assert resp.status_code == 429
+    assert resp.headers['Retry-After'] == '7'
+    assert resp.get_json()['retry_after'] == 7
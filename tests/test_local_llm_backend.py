@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+Test the local OpenAI-compatible LLM backend against the stub server
+"""
+import contextlib
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TESTS_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'ai_engine'))
+
+import pytest
+
+import model
+from llm_stub import StubLLMServer, DEFAULT_REPLY
+
+
+class _Failing(model.Backend):
+    name = 'failing'
+
+    def generate(self, prompt, model=None):
+        raise ConnectionError('provider unreachable')
+
+
+def test_local_backend_generate_reuses_connection():
+    with StubLLMServer() as stub:
+        backend = model.LocalBackend(stub.url, model='mistral', timeout=5)
+        assert backend.generate('Что такое гастрит?') == DEFAULT_REPLY
+        assert backend.generate('Как лечить гастрит?') == DEFAULT_REPLY
+
+        assert stub.requests[0]['model'] == 'mistral'
+        assert stub.requests[0]['messages'][0]['content'] == 'Что такое гастрит?'
+        assert stub.connections == 1
+
+
+def test_local_backend_maps_the_routed_model():
+    with StubLLMServer() as stub:
+        backend = model.LocalBackend(stub.url, model='mistral', timeout=5,
+                                     models={'llama-3.1-8b-instant': 'llama3.1:8b'})
+        backend.generate('вопрос', 'llama-3.1-8b-instant')
+        backend.generate('вопрос', 'gemma2-9b-it')
+        assert [r['model'] for r in stub.requests] == ['llama3.1:8b', 'mistral']
+
+
+def test_unknown_model_is_rejected(monkeypatch):
+    monkeypatch.setattr(model, 'BACKENDS', {'failing': _Failing()})
+    monkeypatch.setattr(model, 'BACKEND_ORDER', ['failing'])
+    with pytest.raises(ValueError):
+        model.generate_answer('вопрос', 'gpt-5')
+    with pytest.raises(ValueError):
+        model.set_model('gpt-5')
+
+
+def test_chain_falls_back_to_local(monkeypatch):
+    with StubLLMServer() as stub:
+        monkeypatch.setattr(model, 'BACKENDS', {
+            'failing': _Failing(),
+            'local': model.LocalBackend(stub.url, timeout=5),
+        })
+        monkeypatch.setattr(model, 'BACKEND_ORDER', ['failing', 'local'])
+
+        assert model.generate_answer('вопрос') == DEFAULT_REPLY
+
+
+def test_attempts_are_reported_per_backend(monkeypatch):
+    def hook(provider, prompt, max_tokens):
+        if provider == 'saturated':
+            raise model.AdmissionRejected(provider, 3)
+        return contextlib.nullcontext()
+
+    with StubLLMServer() as stub:
+        saturated, failing = _Failing(), _Failing()
+        saturated.name = 'saturated'
+        monkeypatch.setattr(model, 'BACKENDS', {
+            'saturated': saturated,
+            'failing': failing,
+            'local': model.LocalBackend(stub.url, timeout=5),
+        })
+        monkeypatch.setattr(model, 'BACKEND_ORDER', ['saturated', 'failing', 'local'])
+        monkeypatch.setattr(model, '_admission_hook', hook)
+
+        attempts = []
+        assert model.generate_answer('вопрос', on_attempt=lambda *a: attempts.append(a)) == DEFAULT_REPLY
+        # The refused backend made no call; the others report their own time and outcome
+        assert [(name, type(error)) for name, _, error in attempts] == [
+            ('failing', ConnectionError), ('local', type(None))]
+        assert all(seconds >= 0 for _, seconds, _ in attempts)
+
+
+def test_admission_rejection_falls_through_then_propagates(monkeypatch):
+    def hook(provider, prompt, max_tokens):
+        if provider == 'failing' or prompt == 'занято':
+            raise model.AdmissionRejected(provider, 3)
+        return contextlib.nullcontext()
+
+    with StubLLMServer() as stub:
+        monkeypatch.setattr(model, 'BACKENDS', {
+            'failing': _Failing(),
+            'local': model.LocalBackend(stub.url, timeout=5),
+        })
+        monkeypatch.setattr(model, 'BACKEND_ORDER', ['failing', 'local'])
+        monkeypatch.setattr(model, '_admission_hook', hook)
+
+        assert model.generate_answer('вопрос') == DEFAULT_REPLY
+        with pytest.raises(model.AdmissionRejected):
+            model.generate_answer('занято')
+
+
+def test_rejection_wins_over_a_backend_that_is_down(monkeypatch):
+    # groq and github saturated, local server down: still a 429, not a generic failure
+    def hook(provider, prompt, max_tokens):
+        if provider != 'down':
+            raise model.AdmissionRejected(provider, {'groq': 7, 'github': 2}[provider])
+        return contextlib.nullcontext()
+
+    backends = {}
+    for name in ('groq', 'github', 'down'):
+        backends[name] = _Failing()
+        backends[name].name = name
+    monkeypatch.setattr(model, 'BACKENDS', backends)
+    monkeypatch.setattr(model, 'BACKEND_ORDER', ['groq', 'github', 'down'])
+    monkeypatch.setattr(model, '_admission_hook', hook)
+
+    with pytest.raises(model.AdmissionRejected) as exc:
+        model.generate_answer('вопрос')
+    assert (exc.value.provider, exc.value.retry_after) == ('github', 2)
+
+    # Nothing rejected: the backend's own error propagates
+    monkeypatch.setattr(model, '_admission_hook', None)
+    with pytest.raises(ConnectionError):
+        model.generate_answer('вопрос')
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Test indexed medication search: transliteration, FTS5 and in-process
+trigram backends, ranking, index sync and the search endpoints
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+from main.utils import med_search, translit
+
+
+def test_transliteration_variants():
+    assert translit.to_cyrillic('paracetamol') == 'парацетамол'
+    assert translit.to_cyrillic('amoxicillin') == 'амоксициллин'
+    assert translit.to_cyrillic('no-shpa') == 'но-шпа'
+    assert translit.to_latin('амоксициллин') == 'amoxicillin'
+    assert translit.variants('  Ёжевика ') == ['ежевика', 'ezhevika']
+    assert translit.variants('500') == ['500']
+
+
+def _add_medications(app):
+    from main.models import db, Medication
+    with app.app_context():
+        db.session.add_all([
+            Medication(name='Парацетамол', generic_name='Paracetamol'),
+            Medication(name='Парацетамол таблетки 500 мг', generic_name='Paracetamol'),
+            Medication(name='Цитрамон П', active_ingredient='Ацетилсалициловая кислота + парацетамол'),
+            Medication(name='Эффералган с витамином С', generic_name='Парацетамол'),
+            Medication(name='Но-шпа форте', generic_name='Дротаверин'),
+            Medication(name='Ношпалгин', generic_name='Дротаверин'),
+        ])
+        db.session.commit()
+
+
+def _names(app, query):
+    from main.models import db, Medication
+    with app.app_context():
+        ids = med_search.search(query)
+        return [db.session.get(Medication, i).name for i in ids]
+
+
+@pytest.mark.parametrize('backend', ['fts5', 'memory'])
+def test_search_ranks_matches_in_both_scripts(file_app, backend):
+    file_app.config['MEDICATION_SEARCH_BACKEND'] = backend
+    with file_app.app_context():
+        med_search.setup(file_app)
+    assert file_app.extensions['med_search'] == backend
+    _add_medications(file_app)
+
+    # Exact name, then name prefixes (shorter first), then generic name / ingredient only
+    expected = ['Парацетамол', 'Paracetamol 500mg', 'Парацетамол таблетки 500 мг',
+                'Цитрамон П', 'Fervex Powder', 'Эффералган с витамином С']
+    assert _names(file_app, 'парацетамол') == expected
+    assert _names(file_app, 'PARACETAMOL') == expected
+    assert _names(file_app, 'шпа') == ['Но-шпа форте', 'Drotaverine 40mg (No-shpa)',
+                                       'Ношпалгин', 'Noshpa Forte 80mg']
+    assert _names(file_app, 'ёж') == []
+
+    # Index follows inserts, renames and deletes
+    from main.models import db, Medication
+    with file_app.app_context():
+        med = Medication.query.filter_by(name='Ношпалгин').one()
+        med.name = 'Спазмалгон'
+        db.session.add(Medication(name='Панадол', generic_name='Paracetamol'))
+        db.session.delete(Medication.query.filter_by(name='Цитрамон П').one())
+        db.session.commit()
+    assert 'Ношпалгин' not in _names(file_app, 'шпа')
+    assert _names(file_app, 'спазм') == ['Спазмалгон']
+    names = _names(file_app, 'paracetamol')
+    assert 'Панадол' in names and 'Цитрамон П' not in names
+
+
+def test_fts5_index_is_rebuilt_when_out_of_sync(file_app):
+    from main.models import db
+    from sqlalchemy import text
+    _add_medications(file_app)
+    with file_app.app_context():
+        db.session.execute(text(f'DELETE FROM {med_search.FTS_TABLE}'))
+        db.session.commit()
+        assert med_search.search('парацетамол') == []
+        med_search.setup(file_app)
+    assert _names(file_app, 'парацетамол')[0] == 'Парацетамол'
+
+
+def test_search_endpoints_use_ranking(file_app):
+    from main.models import db, Medication, Pharmacy, PharmacyStock
+    _add_medications(file_app)
+    with file_app.app_context():
+        pharmacy = Pharmacy(name='Аптека 1', address='ул. Абая 1', city='Turkistan')
+        db.session.add(pharmacy)
+        db.session.flush()
+        for name in ('Парацетамол таблетки 500 мг', 'Эффералган с витамином С'):
+            med = Medication.query.filter_by(name=name).one()
+            db.session.add(PharmacyStock(pharmacy_id=pharmacy.id, medication_id=med.id, quantity=1, price=500))
+        db.session.commit()
+
+    client = file_app.test_client()
+    data = client.get('/api/medications/search?q=paracetamol').get_json()
+    assert data['total'] == 6
+    assert data['medications'][0]['name'] == 'Парацетамол'
+
+    data = client.get('/api/medications?q=парацетамол&city=Turkistan').get_json()
+    assert [m['name'] for m in data['medications']] == ['Парацетамол таблетки 500 мг', 'Эффералган с витамином С']
+
+    assert client.get('/api/medications/search?q=а').status_code == 400
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+Test the medication typeahead: prefix index over both scripts, ranking,
+incremental refresh, lookups without queries, building off the request
+path and the suggest endpoint
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+from sqlalchemy import event
+
+from main.utils import med_suggest
+
+
+def _add_medications(app):
+    from main.models import db, Medication
+    with app.app_context():
+        db.session.add_all([
+            Medication(name='Парацетамол', generic_name='Paracetamol'),
+            Medication(name='Парацетамол таблетки 500 мг', generic_name='Paracetamol'),
+            Medication(name='Панадол', generic_name='Paracetamol'),
+            Medication(name='Но-шпа форте', generic_name='Дротаверин'),
+            Medication(name='Амоксициллин', generic_name='Amoxicillin'),
+        ])
+        db.session.commit()
+
+
+def _names(query, limit=10):
+    return [s['name'] for s in med_suggest.suggest(query, limit)]
+
+
+def test_suggest_prefixes_in_both_scripts(file_app):
+    _add_medications(file_app)
+    with file_app.app_context():
+        med_suggest.refresh()
+        # Name prefix first (shorter first), then generic name only
+        assert _names('парац') == ['Парацетамол', 'Paracetamol 500mg', 'Парацетамол таблетки 500 мг',
+                                   'Панадол', 'Fervex Powder']
+        assert _names('PARAC')[:3] == ['Парацетамол', 'Paracetamol 500mg', 'Парацетамол таблетки 500 мг']
+        assert _names('парац', limit=2) == ['Парацетамол', 'Paracetamol 500mg']
+        assert _names('amok') == ['Амоксициллин', 'Amoxicillin 500mg']
+        assert {'Mezim Forte', 'Но-шпа форте'} <= set(_names('форте'))     # later words, both scripts
+        assert 'Но-шпа форте' in _names('дротав')
+        assert _names('ёжик') == [] and _names('') == []
+
+
+def test_lookup_does_not_query_the_database(file_app):
+    from main.models import db
+    _add_medications(file_app)
+    with file_app.app_context():
+        med_suggest.refresh()                  # builds the index
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            assert _names('панад') == ['Панадол']
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert statements == []
+
+
+def test_refresh_merges_changes(file_app):
+    from main.models import db, Medication
+    _add_medications(file_app)
+    with file_app.app_context():
+        med_suggest.refresh()
+        assert _names('панад') == ['Панадол']
+        index = med_suggest.get_index()
+
+        med = Medication.query.filter_by(name='Панадол').one()
+        med.name = 'Калпол'
+        db.session.add(Medication(name='Спазмалгон', generic_name='Metamizole'))
+        db.session.commit()
+        assert _names('спазм') == []            # not refreshed yet
+        assert med_suggest.refresh() == 2
+        assert med_suggest.refresh() == 0
+        assert _names('spazm') == ['Спазмалгон']
+        assert _names('калп') == ['Калпол']
+        assert _names('панад') == []            # old key left behind, dropped at lookup
+        assert index.stale > 0
+
+        # Deletions force a rebuild
+        db.session.delete(Medication.query.filter_by(name='Калпол').one())
+        db.session.commit()
+        med_suggest.refresh()
+        assert index.stale == 0 and _names('калп') == []
+
+
+def test_best_matches_beyond_max_scan_are_found(file_app, monkeypatch):
+    from main.models import db, Medication
+    monkeypatch.setattr(med_suggest, 'MAX_SCAN', 4)
+    with file_app.app_context():
+        # Many longer names sort before the short and the exact one
+        db.session.add_all([Medication(name=f'Ромашка аптечная {n}') for n in range(20)]
+                           + [Medication(name='Ромашки цветки'), Medication(name='Ром')])
+        db.session.commit()
+        med_suggest.refresh()
+        assert _names('ром', limit=2) == ['Ром', 'Ромашки цветки']
+        assert _names('ромашки') == ['Ромашки цветки']
+
+
+def test_first_lookup_does_not_wait_for_the_build(file_app, monkeypatch):
+    _add_medications(file_app)
+    release = threading.Event()
+    builds = []
+    real_rebuild = med_suggest.PrefixIndex._rebuild
+
+    def slow_rebuild(self):
+        builds.append(1)
+        release.wait(10)
+        return real_rebuild(self)
+
+    monkeypatch.setattr(med_suggest.PrefixIndex, '_rebuild', slow_rebuild)
+    threads = []
+    real_start = med_suggest.start_build
+    monkeypatch.setattr(med_suggest, 'start_build', lambda app: threads.append(real_start(app)))
+    with file_app.app_context():
+        index = med_suggest.get_index()
+        # Answered by med_search while one build runs in the background
+        assert 'Панадол' in _names('панадол')
+        assert 'Панадол' in _names('панадол')
+        assert not index.built and threads[1] is None
+        release.set()
+        threads[0].join(10)
+        assert index.built and not index.building and builds == [1]
+        assert _names('панад') == ['Панадол']
+
+
+def test_concurrent_first_refreshes_build_once(file_app, monkeypatch):
+    _add_medications(file_app)
+    builds = []
+    real_rebuild = med_suggest.PrefixIndex._rebuild
+
+    def counting_rebuild(self):
+        builds.append(1)
+        return real_rebuild(self)
+
+    def refresh():
+        with file_app.app_context():
+            med_suggest.refresh()
+
+    monkeypatch.setattr(med_suggest.PrefixIndex, '_rebuild', counting_rebuild)
+    threads = [threading.Thread(target=refresh) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert builds == [1]
+
+
+def test_suggest_endpoint(file_app):
+    _add_medications(file_app)
+    with file_app.app_context():
+        med_suggest.refresh()
+    client = file_app.test_client()
+    data = client.get('/api/medications/suggest?q=paracetamol&limit=2').get_json()
+    assert data['query'] == 'paracetamol'
+    assert [s['name'] for s in data['suggestions']] == ['Парацетамол', 'Paracetamol 500mg']
+    assert set(data['suggestions'][0]) == {'id', 'name', 'generic_name'}
+    assert client.get('/api/medications/suggest?q=').get_json()['suggestions'] == []
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Test the cached medical context snapshot and its write-through invalidation
+"""
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+import pytest
+from sqlalchemy import event, text
+
+from main.app import app
+from main.models import db, User, MedicalMetrics, Visit, Prescription
+from main.utils import medical_context
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+@pytest.fixture
+def user_id():
+    with app.app_context():
+        medical_context.clear()
+        user = User(username='card_user', email='card@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(MedicalMetrics(user_id=user.id, allergies='пенициллин'))
+        visit = Visit(user_id=user.id, doctor_id=1, visit_date=datetime(2025, 3, 1))
+        db.session.add(visit)
+        db.session.flush()
+        db.session.add(Prescription(visit_id=visit.id, medication_name='Омепразол', dosage='20 мг'))
+        db.session.commit()
+        yield user.id
+
+        for row in Visit.query.filter_by(user_id=user.id).all() + \
+                MedicalMetrics.query.filter_by(user_id=user.id).all():
+            db.session.delete(row)
+        db.session.delete(db.session.get(User, user.id))
+        db.session.commit()
+
+
+def test_cache_hit_runs_only_the_version_check(user_id):
+    counter = _QueryCounter()
+    with app.app_context():
+        first = medical_context.get_medical_context(user_id)
+        assert 'Аллергии пациента: пенициллин' in first
+        assert 'Омепразол (20 мг' in first
+
+        event.listen(db.engine, 'before_cursor_execute', counter)
+        try:
+            assert medical_context.get_medical_context(user_id) == first
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', counter)
+    assert counter.count == 1       # users.medical_context_version
+
+
+def test_prescription_write_invalidates_owner(user_id):
+    with app.app_context():
+        assert 'Метформин' not in medical_context.get_medical_context(user_id)
+
+        visit = Visit.query.filter_by(user_id=user_id).first()
+        db.session.add(Prescription(visit_id=visit.id, medication_name='Метформин'))
+        db.session.commit()
+        assert 'Метформин' in medical_context.get_medical_context(user_id)
+
+        metrics = MedicalMetrics.query.filter_by(user_id=user_id).first()
+        metrics.allergies = 'нет'
+        db.session.commit()
+        assert 'Аллергии пациента: нет' in medical_context.get_medical_context(user_id)
+
+
+def test_write_on_another_worker_is_seen(user_id):
+    with app.app_context():
+        assert 'пенициллин' in medical_context.get_medical_context(user_id)
+        # Another process: its mapper events bump the shared version but can't touch our cache
+        db.session.execute(text("UPDATE medical_metrics SET allergies = 'латекс' WHERE user_id = :u"),
+                           {'u': user_id})
+        db.session.execute(text("UPDATE users SET medical_context_version = medical_context_version + 1 "
+                                "WHERE id = :u"), {'u': user_id})
+        db.session.commit()
+        assert 'Аллергии пациента: латекс' in medical_context.get_medical_context(user_id)
+
+
+def test_snapshot_built_while_a_write_commits_is_rebuilt(user_id, monkeypatch):
+    build = medical_context.build_medical_context
+
+    def racing_build(uid):
+        context = build(uid)
+        medical_context.invalidate(uid)     # a concurrent commit lands mid-build
+        db.session.commit()
+        return context
+
+    with app.app_context():
+        monkeypatch.setattr(medical_context, 'build_medical_context', racing_build)
+        medical_context.get_medical_context(user_id)
+        monkeypatch.setattr(medical_context, 'build_medical_context', build)
+        misses = medical_context.stats()['misses']
+        medical_context.get_medical_context(user_id)
+        medical_context.get_medical_context(user_id)
+        assert medical_context.stats()['misses'] == misses + 1
+
+
+def test_rolled_back_write_is_not_served(user_id):
+    with app.app_context():
+        medical_context.get_medical_context(user_id)
+        metrics = MedicalMetrics.query.filter_by(user_id=user_id).first()
+        metrics.allergies = 'черновик'
+        db.session.flush()
+        db.session.rollback()
+        assert 'черновик' not in medical_context.get_medical_context(user_id)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Test per-request model routing and its latency veto
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_engine'))
+
+from router import ModelRouter, Route, Rule
+
+BIG, SMALL = 'llama-3.3-70b-versatile', 'llama-3.1-8b-instant'
+ALLOWED = [BIG, SMALL]
+
+ROUTING = {
+    'default': BIG,
+    'rules': [
+        {'model': SMALL, 'intents': ['info'], 'langs': ['ru'],
+         'max_question_chars': 200, 'max_context_chars': 1500},
+        {'model': BIG, 'intents': ['symptoms']},
+    ],
+}
+
+
+def _route(intent='info', question_len=40, lang='ru', context_chars=900):
+    return Route(intent, question_len, lang, context_chars)
+
+
+def test_rules_match_on_intent_language_and_size():
+    router = ModelRouter.from_config(ROUTING, BIG, ALLOWED)
+    assert router.choose(_route()) == SMALL
+    assert router.choose(_route(context_chars=2500)) == BIG
+    assert router.choose(_route(question_len=500)) == BIG
+    assert router.choose(_route(lang='kz')) == BIG
+    assert router.choose(_route(intent='symptoms')) == BIG
+    assert router.choose(_route(intent='treatment')) == BIG
+
+
+def test_slow_small_model_falls_back_to_default():
+    router = ModelRouter.from_config(ROUTING, BIG, ALLOWED)
+    router.record(BIG, 1.0)
+    router.record(SMALL, 0.3)
+    assert router.choose(_route()) == SMALL
+
+    for _ in range(10):               # e.g. rate-limited: 8b turns slow
+        router.record(SMALL, 4.0)
+    assert router.choose(_route()) == BIG
+
+    report = router.report()
+    assert report['models'][SMALL]['calls'] == 11
+    assert report['latency_saved_s'] < 0
+
+
+def test_vetoed_model_is_probed_and_recovers():
+    router = ModelRouter.from_config({**ROUTING, 'probe_every': 5}, BIG, ALLOWED)
+    router.record(BIG, 1.0)
+    router.record(SMALL, 4.0)
+    picks = [router.choose(_route()) for _ in range(10)]
+    assert picks.count(SMALL) == 2 and picks[4] == SMALL
+
+    for _ in range(10):               # probes see it fast again
+        router.record(SMALL, 0.3)
+    assert router.choose(_route()) == SMALL
+
+
+def test_failures_count_as_penalty_latency():
+    router = ModelRouter.from_config({**ROUTING, 'failure_penalty_s': 8.0}, BIG, ALLOWED)
+    router.record(BIG, 1.0)
+    router.record(SMALL, 0.3)
+    router.record_failure(SMALL, 0.1)     # fast timeout still counts as a slow call
+    assert router.choose(_route()) == BIG
+
+    report = router.report()
+    assert report['models'][SMALL]['failures'] == 1
+    assert report['models'][SMALL]['calls'] == 1 and report['models'][SMALL]['total_s'] == 0.3
+
+    only_failed = ModelRouter.from_config(ROUTING, BIG, ALLOWED)
+    only_failed.record_failure(BIG, 1.0)
+    assert only_failed.report()['models'][BIG]['mean_s'] is None
+    assert only_failed.report()['latency_saved_s'] is None
+
+
+def test_unknown_rule_model_is_rejected():
+    with pytest.raises(ValueError):
+        ModelRouter(BIG, [Rule('gpt-5')], allowed=ALLOWED)
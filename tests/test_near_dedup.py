@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+Test MinHash/LSH near-duplicate clustering used by the embedding pipeline,
+and that exact duplicates keep every disease they belong to
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_engine'))
+
+import embed
+from dedup import near_duplicate_clusters
+
+
+BOILERPLATE = (
+    "Организационные аспекты протокола. Список разработчиков протокола с указанием "
+    "квалификационных данных. Указание на отсутствие конфликта интересов: нет. "
+    "Рецензенты протокола. Указание условий пересмотра протокола: пересмотр протокола "
+    "через 5 лет после его вступления в действие и/или при наличии новых методов "
+    "диагностики и лечения с уровнем доказательности."
+)
+
+
+def test_near_identical_texts_are_clustered():
+    texts = [
+        BOILERPLATE,
+        "Острая боль в эпигастрии, тошнота, рвота после приема пищи.",
+        BOILERPLATE.replace("5 лет", "3 года"),
+        BOILERPLATE + " Дата утверждения: 2019.",
+    ]
+    assert near_duplicate_clusters(texts, threshold=0.8) == [[0, 2, 3]]
+
+
+def test_distinct_texts_are_kept_apart():
+    texts = [
+        "Бронхиальная астма — хроническое воспалительное заболевание дыхательных путей.",
+        "Гастрит — воспаление слизистой оболочки желудка различной этиологии.",
+        "Пневмония — острое инфекционное заболевание легочной ткани.",
+    ]
+    assert near_duplicate_clusters(texts) == []
+
+
+def test_exact_duplicates_across_diseases_keep_every_disease(tmp_path, monkeypatch):
+    for name, title in (('gastritis.json', 'Гастрит'), ('ulcer.json', 'Язва желудка')):
+        doc = {'title': title, 'url': '', 'sections': {'general': BOILERPLATE,
+                                                      'symptoms': f'{title}: боль в эпигастрии. ' * 5}}
+        (tmp_path / name).write_text(json.dumps(doc, ensure_ascii=False), encoding='utf-8')
+    monkeypatch.setattr(embed, 'SCRAPED_DIR', str(tmp_path))
+    monkeypatch.setattr(embed, 'DOCS_DIR', str(tmp_path / 'missing'))
+
+    chunks = embed.load_all_chunks()
+    shared = [c for c in chunks if c.section == 'general']
+    assert len(shared) == 1 and shared[0].diseases == ['Гастрит', 'Язва желудка']
+    assert sorted(c.diseases for c in chunks if c.section == 'symptoms') == [['Гастрит'], ['Язва желудка']]
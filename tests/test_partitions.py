@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Test per-disease / per-section partitions used for filtered FAISS search
+"""
+import os
+import sys
+
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_engine'))
+
+from partitions import build_partitions, build_centroids, select_ids, search_params, top_diseases
+
+
+META = [
+    {"disease": "Гастрит", "section": "symptoms"},
+    {"disease": "Гастрит", "section": "treatment"},
+    {"disease": "Бронхиальная астма", "section": "treatment"},
+    {"disease": "Бронхиальная астма", "section": "symptoms"},
+    {"disease": "Острый гастрит", "section": "treatment"},
+]
+
+
+def test_build_partitions_groups_ids():
+    parts = build_partitions(META)
+    assert parts["disease"]["гастрит"].tolist() == [0, 1]
+    assert parts["section"]["treatment"].tolist() == [1, 2, 4]
+
+
+def test_select_ids_intersects_disease_and_section():
+    parts = build_partitions(META)
+    ids = select_ids(parts, diseases=["гастрит", "острый гастрит"], sections={"treatment"})
+    assert ids.tolist() == [1, 4]
+    assert select_ids(parts, diseases=["нет такой"]).size == 0
+
+
+def test_filtered_search_only_returns_selected_ids():
+    rng = np.random.default_rng(0)
+    vecs = rng.random((len(META), 16), dtype="float32")
+    index = faiss.IndexFlatIP(16)
+    index.add(vecs)
+
+    ids = select_ids(build_partitions(META), diseases=["бронхиальная астма"])
+    _, I = index.search(vecs[:1], 2, params=search_params(ids))
+    assert set(I[0].tolist()) == {2, 3}
+
+
+def test_centroids_pick_closest_diseases():
+    vecs = np.zeros((len(META), 4), dtype="float32")
+    vecs[[0, 1, 4], 0] = 1.0     # gastritis-like chunks
+    vecs[[2, 3], 1] = 1.0        # asthma chunks
+
+    centroids, names = build_centroids(vecs, META)
+    assert len(names) == 5       # one centroid per (disease, section)
+    assert np.allclose(np.linalg.norm(centroids, axis=1), 1.0)
+
+    cidx = faiss.IndexFlatIP(4)
+    cidx.add(centroids)
+    q = np.array([[0.0, 1.0, 0.0, 0.0]], dtype="float32")
+    assert top_diseases(cidx, names, q, 1) == ["бронхиальная астма"]
+    assert len(top_diseases(cidx, names, q, 3)) == 3
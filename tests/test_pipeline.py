@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""
+Test the knowledge refresh pipeline runner: content-addressed caching,
+resume after a failure, bounded parallelism, atomic publish and cleanup
+"""
+import os
+import pickle
+import sys
+import threading
+import time
+
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_engine'))
+
+import generation
+import pipeline
+from pipeline import Pipeline, Stage
+
+calls = []
+
+
+def _write(name, text):
+    def run(inputs, out_dir, previous):
+        calls.append(name)
+        upstream = ''.join(open(os.path.join(p, 'out.txt')).read() for p in inputs.values())
+        with open(os.path.join(out_dir, 'out.txt'), 'w') as f:
+            f.write(upstream + text[0])
+    return run
+
+
+def test_unchanged_stages_are_skipped_and_failures_resume(tmp_path):
+    calls.clear()
+    source = tmp_path / 'corpus'
+    source.mkdir()
+    (source / 'a.txt').write_text('v1')
+    text = {'b': ['b']}
+    broken = {'c': True}
+
+    def failing_c(inputs, out_dir, previous):
+        if broken['c']:
+            raise RuntimeError('boom')
+        return _write('c', ['c'])(inputs, out_dir, previous)
+
+    def stages():
+        return [
+            Stage('a', _write('a', ['a']), fingerprint=lambda: pipeline.tree_digest(str(source))),
+            Stage('b', _write('b', text['b']), deps=('a',)),
+            Stage('c', failing_c, deps=('b',)),
+            Stage('d', _write('d', ['d']), deps=('c',)),
+        ]
+
+    state_dir = str(tmp_path / 'state')
+    report = Pipeline(stages(), state_dir).run()
+    assert [e['status'] for e in report] == ['done', 'done', 'failed', 'blocked']
+    assert 'RuntimeError: boom' in report[2]['error']
+
+    # Resume: finished stages are reused, the failed one and its dependents run
+    broken['c'] = False
+    calls.clear()
+    report = Pipeline(stages(), state_dir).run()
+    assert [e['status'] for e in report] == ['cached', 'cached', 'done', 'done']
+    assert calls == ['c', 'd']
+    assert open(os.path.join(report[-1]['path'], 'out.txt')).read() == 'abcd'
+
+    # Nothing changed: nothing runs
+    calls.clear()
+    assert {e['status'] for e in Pipeline(stages(), state_dir).run()} == {'cached'}
+    assert calls == []
+
+    # A changed input re-runs its stage; identical output leaves the rest cached
+    (source / 'a.txt').write_text('v2')
+    calls.clear()
+    report = Pipeline(stages(), state_dir).run()
+    assert [e['status'] for e in report] == ['done', 'cached', 'cached', 'cached']
+
+    # --skip reuses the last output; --force re-runs a cached stage
+    text['b'][0] = 'B'
+    calls.clear()
+    report = Pipeline(stages(), state_dir).run(skip=('b',), force=('d',))
+    assert [e['status'] for e in report] == ['cached', 'skipped', 'cached', 'done']
+    assert calls == ['d']
+
+
+def test_stages_run_in_parallel_up_to_the_limit(tmp_path):
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def slow(inputs, out_dir, previous):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.2)
+        with lock:
+            active[0] -= 1
+        return {'slept': 0.2}
+
+    stages = [Stage(f's{i}', slow, fingerprint=lambda i=i: str(i)) for i in range(4)]
+    stages.append(Stage('join', slow, deps=tuple(s.name for s in stages)))
+    runner = Pipeline(stages, str(tmp_path), max_parallel=2)
+    start = time.perf_counter()
+    report = runner.run()
+
+    assert peak[0] == 2
+    assert time.perf_counter() - start < 0.75          # 3 waves of 0.2s, not 5
+    assert all(e['status'] == 'done' and e['seconds'] >= 0.2 for e in report)
+    assert report[0]['info'] == {'slept': 0.2}
+    assert 'join' in pipeline.format_report(report)
+    assert [s['stage'] for s in runner.state['runs'][-1]['stages']] == ['s0', 's1', 's2', 's3', 'join']
+
+
+def _toy_embed(seed):
+    def run(inputs, out_dir, previous):
+        emb = np.random.default_rng(seed()).standard_normal((40, 16)).astype('float32')
+        faiss.normalize_L2(emb)
+        np.save(os.path.join(out_dir, 'embeddings.npy'), emb)
+        meta = [{'disease': f'Болезнь {i % 5}', 'section': 'symptoms', 'text': f'текст {i}'} for i in range(40)]
+        with open(os.path.join(out_dir, 'metadata.pkl'), 'wb') as f:
+            pickle.dump(meta, f)
+    return run
+
+
+def test_publish_swaps_generation_pointer_and_keeps_it_on_cleanup(tmp_path):
+    index_dir = str(tmp_path / 'faiss_index')
+    assert generation.current_dir(index_dir) == index_dir
+
+    version = [1]
+
+    def stages():
+        return [
+            Stage('embed', _toy_embed(lambda: version[0]), fingerprint=lambda: str(version[0])),
+            Stage('index', pipeline._index, deps=('embed',)),
+            Stage('publish', lambda i, o, p: generation.publish(index_dir, i['index']) and None,
+                  deps=('index',), output=os.path.join(index_dir, generation.POINTER)),
+        ]
+
+    def run():
+        return Pipeline(stages(), str(tmp_path / 'state'), keep_generations=1,
+                        protected=lambda: [generation.current_dir(index_dir)]).run()
+
+    report = run()
+    first = generation.current_dir(index_dir)
+    assert first == report[1]['path']
+    assert faiss.read_index(os.path.join(first, 'index.faiss')).ntotal == 40
+    assert open(os.path.join(index_dir, 'CURRENT')).read().strip() == os.path.relpath(first, index_dir)
+    assert run()[-1]['status'] == 'cached'
+
+    version[0] = 2
+    report = run()
+    assert report[-1]['status'] == 'done'
+    second = generation.current_dir(index_dir)
+    assert second != first and os.path.isdir(second)
+    assert not os.path.exists(first)                   # older than keep_generations, not published
+    assert not [f for f in os.listdir(index_dir) if f.endswith('.tmp')]
+
+    assert generation.clear(index_dir)
+    assert generation.current_dir(index_dir) == index_dir
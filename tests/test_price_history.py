@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Test the price history: change-only observations, per-city rollups, the
+price-history endpoint, and retention/downsampling
+"""
+import os
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+from sqlalchemy import event
+
+from main.models import db, Medication, Pharmacy, PriceObservation, PriceRollup
+from main.utils import price_history
+from main.utils.iteka_ingest import StockIngest
+
+
+def _ingest(prices, city='almaty', site_stats=None):
+    ingest = StockIngest(category_id=None, city=city)
+    for i, price in enumerate(prices):
+        ingest.add_stock('Препарат', f'Аптека {city} {i}', f'ул. {i}', price)
+    ingest.add_price_stats('Препарат', site_stats)
+    ingest.flush()
+    db.session.commit()
+    return Medication.query.filter_by(name='Препарат').one().id
+
+
+def test_observations_only_on_change_and_rollups_per_city(file_app):
+    with file_app.app_context():
+        med_id = _ingest([100, 200, None], site_stats={'min': 90, 'max': 250, 'avg': 160, 'pharmacy_count': 12})
+        _ingest([100, 200, None])                    # unchanged: nothing new
+        assert PriceObservation.query.count() == 2
+        _ingest([120, 200, None])
+        _ingest([130, 200, None])                    # same day: one row per pharmacy and day
+        assert sorted(o.price for o in PriceObservation.query) == [130, 200]
+
+        _ingest([500], city='astana')
+        rollups = {r.city: r for r in PriceRollup.query.filter_by(medication_id=med_id)}
+        assert set(rollups) == {'Almaty', 'Astana'}
+        almaty = rollups['Almaty'].to_dict()
+        assert (almaty['min'], almaty['max'], almaty['avg'], almaty['pharmacies']) == (130, 200, 165, 2)
+        assert (almaty['site_min'], almaty['site_pharmacies']) == (90, 12)
+
+
+def test_endpoint_reads_rollups_only(file_app):
+    with file_app.app_context():
+        med_id = _ingest([100, 300])
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.append(a[2]))
+
+    client = file_app.test_client()
+    body = client.get(f'/api/medications/{med_id}/price-history?city=Almaty&days=30').get_json()
+    assert [(p['min'], p['max'], p['period']) for p in body['series']['Almaty']] == [(100, 300, 'day')]
+    assert not any('price_observations' in s for s in statements)
+    assert client.get('/api/medications/999999/price-history').status_code == 404
+
+
+def test_retention_prunes_and_downsamples(file_app):
+    today = date(2026, 10, 19)
+    with file_app.app_context():
+        med_id = _ingest([100])
+        PriceObservation.query.delete()
+        PriceRollup.query.delete()
+        pharmacy_id = Pharmacy.query.filter_by(name='Аптека almaty 0').one().id
+        for days_ago, price in ((400, 90), (200, 95), (100, 100), (10, 110)):
+            db.session.add(PriceObservation(medication_id=med_id, pharmacy_id=pharmacy_id,
+                                            day=today - timedelta(days=days_ago), price=price))
+        for day, lo, avg, hi in ((date(2026, 3, 1), 100, 110, 120), (date(2026, 3, 2), 80, 140, 200),
+                                 (date(2026, 9, 1), 100, 100, 100)):
+            db.session.add(PriceRollup(medication_id=med_id, city='Almaty', day=day, period='day', samples=1,
+                                       min_price=lo, avg_price=avg, max_price=hi, pharmacy_count=3))
+        db.session.add(PriceRollup(medication_id=med_id, city='Almaty', day=date(2022, 1, 1), period='month',
+                                   samples=30, min_price=1, avg_price=1, max_price=1))
+        db.session.commit()
+
+        result = price_history.apply_retention(file_app.config, today=today)
+        db.session.commit()
+
+        # 90 days raw: the 100-days-ago price is still in effect at the cutoff, older ones go
+        assert sorted(o.price for o in PriceObservation.query) == [100, 110]
+        assert result == {'observations_deleted': 2, 'daily_merged': 2, 'rollups_expired': 1}
+        rows = [(r.day, r.period, r.samples, r.min_price, r.avg_price, r.max_price)
+                for r in PriceRollup.query.order_by(PriceRollup.day)]
+        assert rows == [(date(2026, 3, 1), 'month', 2, 80, 125, 200),
+                        (date(2026, 9, 1), 'day', 1, 100, 100, 100)]
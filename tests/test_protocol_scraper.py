@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Test the clinical protocol scraper against a local fixture site: section
+mapping and junk filtering, a resumable frontier, and incremental
+re-crawl by content hash
+"""
+import glob
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'ai_engine'))
+
+from scraper import ProtocolScraper
+
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures', 'protocols')
+SITE = {
+    '/diseases?searched_data=diseases': 'list.html',
+    '/diseases?searched_data=diseases&page=2': 'list_page2.html',
+    '/disease/pnevmoniya/101': 'pnevmoniya.html',
+    '/disease/gastrit/102': 'gastrit.html',
+    '/disease/astma/103': 'astma.html',
+}
+
+
+class _SiteHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        body = self.server.overrides.get(self.path)
+        if body is None and self.path in SITE:
+            with open(os.path.join(FIXTURES, SITE[self.path]), encoding='utf-8') as f:
+                body = f.read()
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')      # no charset, like many real servers
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def site():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _SiteHandler)
+    httpd.hits, httpd.overrides = [], {}
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _scraper(site, tmp_path, workers=3):
+    with open(os.path.join(ROOT, 'config.yaml'), encoding='utf-8') as f:
+        cfg = yaml.safe_load(f)['scrape']
+    cfg.update(base_url=f"{site.url}/diseases?searched_data=diseases", page_pause=0, max_workers=workers)
+    return ProtocolScraper(cfg, out_dir=str(tmp_path / 'scraped'), state_path=str(tmp_path / 'crawl.sqlite'))
+
+
+def _docs(tmp_path):
+    docs = {}
+    for path in glob.glob(str(tmp_path / 'scraped' / '*.json')):
+        with open(path, encoding='utf-8') as f:
+            doc = json.load(f)
+        docs[doc['title']] = doc
+    return docs
+
+
+def test_crawl_maps_sections_and_drops_junk(site, tmp_path):
+    scraper = _scraper(site, tmp_path)
+    stats = scraper.crawl()
+    scraper.close()
+
+    assert stats['fetched'] == 5 and stats['written'] == 3 and stats['failed'] == 0
+    docs = _docs(tmp_path)
+    assert set(docs) == {'Пневмония у взрослых', 'Хронический гастрит', 'Бронхиальная астма'}
+
+    pneumonia = docs['Пневмония у взрослых']
+    assert pneumonia['url'] == f"{site.url}/disease/pnevmoniya/101"
+    sections = pneumonia['sections']
+    assert set(sections) == {'definition', 'classification', 'symptoms', 'diagnostics', 'treatment',
+                             'prevention', '_full'}
+    assert 'кашель с мокротой' in sections['symptoms'] and 'тахипноэ' in sections['symptoms']
+    assert 'Амоксициллин' in sections['treatment'] and 'Рентгенография' in sections['diagnostics']
+    assert 'ответственности' not in sections['_full']            # junk line
+    assert 'trackEvent' not in sections['_full']                 # script
+    assert 'Поделиться' not in sections['_full']                 # outside .disease-content
+
+    gastritis = docs['Хронический гастрит']['sections']        # <strong> headings, "article" root
+    assert 'Helicobacter' in gastritis['etiology'] and 'Эрадикационная' in gastritis['treatment']
+    assert 'приложение' not in gastritis['_full']
+    assert docs['Бронхиальная астма']['sections']['treatment'].startswith('Ингаляционные')
+
+
+def test_interrupted_crawl_resumes(site, tmp_path):
+    scraper = _scraper(site, tmp_path, workers=1)
+    assert scraper.crawl(max_pages=3)['pending'] > 0
+    scraper.close()
+    first_hits = list(site.hits)
+
+    scraper = _scraper(site, tmp_path, workers=1)
+    stats = scraper.crawl()
+    scraper.close()
+
+    assert stats['pending'] == 0
+    assert len(_docs(tmp_path)) == 3
+    assert not set(first_hits) & set(site.hits[len(first_hits):])     # nothing fetched twice
+    assert len(site.hits) == 5
+
+
+def test_recrawl_rewrites_only_changed_pages(site, tmp_path):
+    scraper = _scraper(site, tmp_path)
+    scraper.crawl()
+    mtimes = {p: os.path.getmtime(p) for p in glob.glob(str(tmp_path / 'scraped' / '*.json'))}
+
+    # volatile markup changes on one page, content changes on another
+    with open(os.path.join(FIXTURES, 'astma.html'), encoding='utf-8') as f:
+        site.overrides['/disease/astma/103'] = f.read().replace('<body>', '<body><script>t=2</script>')
+    with open(os.path.join(FIXTURES, 'gastrit.html'), encoding='utf-8') as f:
+        site.overrides['/disease/gastrit/102'] = f.read().replace('тошнота', 'тошнота, изжога')
+
+    stats = scraper.crawl()
+    scraper.close()
+
+    assert (stats['fetched'], stats['written'], stats['unchanged']) == (5, 1, 2)
+    changed = [p for p, mtime in mtimes.items() if os.path.getmtime(p) != mtime]
+    assert len(changed) == 1
+    assert 'изжога' in _docs(tmp_path)['Хронический гастрит']['sections']['symptoms']
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Test two-stage compressed search with exact refinement
+"""
+import os
+import sys
+
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_engine'))
+
+import refine
+from partitions import search_params
+
+
+def _corpus(n=500, d=64):
+    rng = np.random.default_rng(0)
+    emb = rng.standard_normal((n, d)).astype('float32')
+    faiss.normalize_L2(emb)
+    return emb
+
+
+def test_refined_search_matches_exact(tmp_path):
+    emb = _corpus()
+    exact = faiss.IndexFlatIP(emb.shape[1])
+    exact.add(emb)
+    _, truth = exact.search(emb[:5], 5)
+
+    for mode in ('sq8', 'pca'):
+        coarse, proj = refine.build_coarse(emb, mode, pca_dim=48)
+        refine.save(str(tmp_path), emb, coarse, proj)
+        searcher = refine.RefinedSearcher.load(str(tmp_path), oversample=8)
+        assert isinstance(searcher.vectors, np.memmap)
+
+        D, I = searcher.search(emb[:5], 5)
+        assert I[:, 0].tolist() == [0, 1, 2, 3, 4]
+        assert np.allclose(D[:, 0], 1.0, atol=1e-5)    # exact float32 scores
+        overlap = sum(len(set(a) & set(b)) for a, b in zip(I, truth)) / truth.size
+        assert overlap >= 0.9
+
+
+def test_refined_search_honours_id_selector(tmp_path):
+    emb = _corpus()
+    coarse, proj = refine.build_coarse(emb, 'sq8')
+    refine.save(str(tmp_path), emb, coarse, proj)
+    searcher = refine.RefinedSearcher.load(str(tmp_path))
+
+    allowed = np.arange(100, 120, dtype='int64')
+    _, I = searcher.search(emb[:1], 5, params=search_params(allowed))
+    assert all(100 <= i < 120 for i in I[0])
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+Test in-flight deduplication of AI calls and chat idempotency keys
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['FLASK_ENV'] = 'testing'
+
+import pytest
+
+from main.models import db, ChatConversation, ChatMessage, LabResult, MedicalDocument
+from main.routes import assistant_route
+from main.utils import groq_client
+from main.utils.singleflight import Group, request_key
+
+
+def _client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+    return client
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_concurrent_callers_share_one_call():
+    group = Group('test')
+    calls = []
+
+    def slow(x):
+        calls.append(x)
+        _wait_for(lambda: group.stats['shared'] == 4)
+        return x * 2
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(group.do('k', slow, 21)))
+               for _ in range(5)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join(5)
+    assert calls == [21]
+    assert results == [42] * 5
+    assert group.in_flight() == 0
+
+    with pytest.raises(ValueError):
+        group.do('k', lambda: int('x'))
+
+
+def test_request_key_normalizes_input():
+    assert request_key(1, 'Болит  голова ') == request_key(1, 'болит голова')
+    assert request_key(1, 'болит голова') != request_key(2, 'болит голова')
+
+
+def test_identical_concurrent_chats_call_llm_once(file_app, monkeypatch):
+    calls = []
+
+    def answer(question, medical_context=''):
+        calls.append(question)
+        _wait_for(lambda: assistant_route._chat_flight.stats['shared'] >= 1)
+        return 'Один ответ'
+
+    monkeypatch.setattr(assistant_route, 'answer_question', answer)
+    monkeypatch.setattr(assistant_route, 'schedule_summary_update', lambda convo_id: None)
+    monkeypatch.setattr(assistant_route, '_chat_flight', Group('chat'))
+
+    user_id = file_app.user_ids[0]
+    bodies = []
+
+    def post():
+        bodies.append(_client(file_app, user_id).post(
+            '/assistant/api/chat', json={'message': 'Болит голова'}).get_json())
+
+    threads = [threading.Thread(target=post) for _ in range(2)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join(10)
+
+    assert len(calls) == 1
+    assert [b['response'] for b in bodies] == ['Один ответ'] * 2
+    assert bodies[0]['conversation_id'] == bodies[1]['conversation_id']
+
+
+def test_idempotency_key_returns_stored_result(file_app, monkeypatch):
+    calls = []
+    monkeypatch.setattr(assistant_route, 'answer_question',
+                        lambda q, medical_context='': calls.append(q) or f'Ответ {len(calls)}')
+    monkeypatch.setattr(assistant_route, 'schedule_summary_update', lambda convo_id: None)
+
+    client = _client(file_app, file_app.user_ids[0])
+    headers = {'Idempotency-Key': 'retry-123'}
+    first = client.post('/assistant/api/chat', json={'message': 'Кашель'}, headers=headers).get_json()
+    again = client.post('/assistant/api/chat', json={'message': 'Кашель'}, headers=headers).get_json()
+
+    assert len(calls) == 1
+    assert again == first
+    with file_app.app_context():
+        assert ChatMessage.query.filter_by(conversation_id=first['conversation_id']).count() == 2
+
+
+def test_idempotency_key_stored_by_another_process_is_replayed(file_app, monkeypatch):
+    user_id = file_app.user_ids[0]
+    with file_app.app_context():
+        convo = ChatConversation(user_id=user_id, title='New Chat')
+        db.session.add(convo)
+        db.session.commit()
+        convo_id = convo.id
+
+    def answer(q, medical_context=''):
+        # Another worker finishes the same retried request while this one waits on the LLM
+        with db.engine.begin() as conn:
+            conn.execute(ChatMessage.__table__.insert(), [
+                {'user_id': user_id, 'conversation_id': convo_id, 'role': 'user', 'content': q,
+                 'idempotency_key': 'retry-456'},
+                {'user_id': user_id, 'conversation_id': convo_id, 'role': 'assistant',
+                 'content': 'Ответ другого процесса', 'idempotency_key': None},
+            ])
+        return 'Ответ этого процесса'
+
+    monkeypatch.setattr(assistant_route, 'answer_question', answer)
+    monkeypatch.setattr(assistant_route, 'schedule_summary_update', lambda convo_id: None)
+
+    resp = _client(file_app, user_id).post('/assistant/api/chat', json={'message': 'Кашель', 'conversation_id': convo_id},
+                                           headers={'Idempotency-Key': 'retry-456'})
+    assert resp.status_code == 200
+    assert resp.get_json()['response'] == 'Ответ другого процесса'
+    with file_app.app_context():
+        assert ChatMessage.query.filter_by(user_id=user_id, idempotency_key='retry-456').count() == 1
+        assert ChatMessage.query.filter_by(content='Ответ этого процесса').count() == 0
+
+
+def test_concurrent_lab_pages_extract_once(file_app, monkeypatch):
+    calls = []
+
+    def extract(text):
+        calls.append(text)
+        time.sleep(0.3)
+        return {'lab_results': [{'test_name': 'Glucose', 'value': 5.2, 'unit': 'mmol/L'}],
+                'summary': 'ok'}
+
+    monkeypatch.setattr(groq_client, 'extract_lab_values', extract)
+    user_id = file_app.user_ids[0]
+    with file_app.app_context():
+        doc = MedicalDocument(user_id=user_id, input_type='text', raw_text='Глюкоза 5.2 ммоль/л',
+                              status='pending')
+        db.session.add(doc)
+        db.session.commit()
+        doc_id = doc.id
+
+    codes = []
+    threads = [threading.Thread(target=lambda: codes.append(
+        _client(file_app, user_id).get(f'/lab-results/{doc_id}').status_code)) for _ in range(3)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join(10)
+
+    assert codes == [200] * 3
+    assert len(calls) == 1
+    with file_app.app_context():
+        assert LabResult.query.filter_by(document_id=doc_id).count() == 1
+        assert db.session.get(MedicalDocument, doc_id).status == 'extracted'
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Test token-aware chunking of the embedding pipeline: packing by budget,
+sentence overlap, over-long sentences, skipped prefixes and truncation stats
+"""
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_engine'))
+
+import embed
+
+
+def count_words(texts):
+    """One token per word stands in for the model tokenizer."""
+    return [len(t.split()) for t in texts]
+
+
+def _sentence(i, words=10):
+    return ' '.join([f'слово{i}'] * (words - 1)) + f' конец{i}.'
+
+
+def _chunks(text, max_tokens, disease='Гастрит', section='symptoms'):
+    return embed._chunk_by_tokens(text, disease, section, 'gastritis.json', 'https://example.kz',
+                                  count_words, max_tokens)
+
+
+def test_chunks_fit_the_budget_with_prefix():
+    text = ' '.join(_sentence(i) for i in range(10))
+    max_tokens = 40
+    chunks = _chunks(text, max_tokens)
+    assert len(chunks) > 1
+    for c in chunks:
+        # Same accounting as encode_texts: prefix + chunk + [CLS]/[SEP]
+        assert count_words([embed._prefix(c.disease, c.section) + c.text])[0] + 2 <= max_tokens
+    assert [c.chunk_id for c in chunks] == list(range(len(chunks)))
+    # Sentences are never cut when they fit
+    assert all(c.text.endswith('.') for c in chunks)
+
+
+def test_consecutive_chunks_overlap_by_trailing_sentences():
+    text = ' '.join(_sentence(i) for i in range(10))
+    chunks = _chunks(text, 50)
+    assert len(chunks) > 1
+    for prev, nxt in zip(chunks, chunks[1:]):
+        prev_sents, next_sents = embed._split_sentences(prev.text), embed._split_sentences(nxt.text)
+        shared = [s for s in next_sents if s in prev_sents]
+        # The shared sentences are prev's tail and next's head, within OVERLAP_TOKENS
+        assert shared and shared == prev_sents[-len(shared):] == next_sents[:len(shared)]
+        assert sum(count_words(shared)) <= embed.OVERLAP_TOKENS
+
+
+def test_long_sentence_is_split_on_words():
+    chunks = _chunks(_sentence(0, words=100), 40)
+    assert len(chunks) >= 3
+    assert all(count_words([c.text])[0] <= 40 for c in chunks)
+    assert ' '.join(c.text for c in chunks).split() == _sentence(0, words=100).split()
+
+
+def test_prefix_over_budget_is_logged_and_skipped(caplog):
+    disease = ' '.join(['очень-длинное-название'] * 20)
+    with caplog.at_level(logging.WARNING, logger='embed'):
+        assert _chunks(' '.join(_sentence(i) for i in range(3)), 20, disease=disease) == []
+    assert 'gastritis.json' in caplog.text
+
+
+def test_truncation_stats():
+    stats = embed.truncation_stats([10, 100, 130, 512, 600], 512)
+    assert stats['chunks'] == 5
+    assert stats['truncated'] == 1 and stats['tokens_dropped'] == 88
+    assert stats['truncated_pct'] == 20.0
+    assert stats['longest'] == 600 and stats['mean'] == 270.4
+    assert embed.truncation_stats([], 512)['truncated_pct'] == 0.0